@@ -0,0 +1,6 @@
+-- Scan Ingestion Migration
+-- Indexes for the write-behind scan buffer (src/lib/scan-ingestion.ts). Batched
+-- counter increments go through increment_scan_counters (20251102_sharded_scan_counters.sql).
+
+-- Covering index for batched inserts followed by per-code reads
+CREATE INDEX IF NOT EXISTS idx_qrcodescan_qrcode_scanned_at ON public."QrCodeScan"("qrCodeId", "scannedAt" DESC);
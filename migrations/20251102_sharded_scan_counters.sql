@@ -0,0 +1,118 @@
+-- Sharded Scan Counters Migration
+-- Spreads scan increments for hot QR codes across N counter rows so concurrent
+-- scans don't serialise on the QrCode row lock (src/lib/scan-counters.ts)
+
+CREATE TABLE IF NOT EXISTS public."QrCodeScanCounter" (
+  "qrCodeId" TEXT NOT NULL REFERENCES public."QrCode"(id) ON DELETE CASCADE,
+  "shard" SMALLINT NOT NULL,
+  "count" BIGINT NOT NULL DEFAULT 0,
+  "lastScannedAt" TIMESTAMP WITH TIME ZONE,
+  "updatedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY ("qrCodeId", "shard")
+);
+
+CREATE INDEX IF NOT EXISTS idx_qrcode_scan_counter_updated_at ON public."QrCodeScanCounter"("updatedAt");
+
+ALTER TABLE public."QrCodeScanCounter" ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own scan counters" ON public."QrCodeScanCounter"
+  FOR SELECT USING (
+    "qrCodeId" IN (
+      SELECT id FROM public."QrCode" WHERE "userId" = auth.uid()::text
+    )
+  );
+
+-- Atomically add per-QR deltas to a random shard.
+-- p_counts: [{ "qrCodeId": TEXT, "count": INTEGER, "lastScannedAt": TIMESTAMPTZ }, ...]
+CREATE OR REPLACE FUNCTION public.increment_scan_counters(
+  p_counts JSONB,
+  p_shards INTEGER DEFAULT 8
+) RETURNS void AS $$
+BEGIN
+  INSERT INTO public."QrCodeScanCounter" ("qrCodeId", "shard", "count", "lastScannedAt", "updatedAt")
+  SELECT
+    d.qr_code_id,
+    floor(random() * GREATEST(p_shards, 1))::SMALLINT,
+    d.scan_count,
+    d.last_scanned_at,
+    NOW()
+  FROM (
+    -- One row per QR code so ON CONFLICT never touches the same shard twice
+    SELECT
+      (e->>'qrCodeId')::TEXT AS qr_code_id,
+      SUM((e->>'count')::BIGINT) AS scan_count,
+      MAX((e->>'lastScannedAt')::TIMESTAMP WITH TIME ZONE) AS last_scanned_at
+    FROM jsonb_array_elements(p_counts) e
+    GROUP BY 1
+    -- Stable lock order across concurrent batches
+    ORDER BY 1
+  ) d
+  ON CONFLICT ("qrCodeId", "shard") DO UPDATE SET
+    "count" = public."QrCodeScanCounter"."count" + EXCLUDED."count",
+    "lastScannedAt" = GREATEST(
+      COALESCE(public."QrCodeScanCounter"."lastScannedAt", EXCLUDED."lastScannedAt"),
+      EXCLUDED."lastScannedAt"
+    ),
+    "updatedAt" = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Total scans per QR code: folded QrCode.scanCount plus unfolded shards
+CREATE OR REPLACE FUNCTION public.get_scan_counts(p_qr_code_ids TEXT[])
+RETURNS TABLE (
+  "qrCodeId" TEXT,
+  total BIGINT
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    q.id,
+    COALESCE(q."scanCount", 0)::BIGINT + COALESCE(SUM(c."count"), 0)::BIGINT
+  FROM public."QrCode" q
+  LEFT JOIN public."QrCodeScanCounter" c ON c."qrCodeId" = q.id
+  WHERE q.id = ANY(p_qr_code_ids)
+  GROUP BY q.id, q."scanCount";
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Move shard totals into QrCode.scanCount/lastScannedAt in one statement so
+-- readers of get_scan_counts never see a scan counted twice or not at all.
+-- Returns the number of QR codes updated.
+CREATE OR REPLACE FUNCTION public.fold_scan_counters(p_limit INTEGER DEFAULT 1000)
+RETURNS INTEGER AS $$
+DECLARE
+  v_folded INTEGER;
+BEGIN
+  WITH claimed AS (
+    SELECT c."qrCodeId", c."shard"
+    FROM public."QrCodeScanCounter" c
+    ORDER BY c."updatedAt" ASC
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ),
+  drained AS (
+    DELETE FROM public."QrCodeScanCounter" c
+    USING claimed
+    WHERE c."qrCodeId" = claimed."qrCodeId"
+      AND c."shard" = claimed."shard"
+    RETURNING c."qrCodeId", c."count", c."lastScannedAt"
+  ),
+  totals AS (
+    SELECT
+      d."qrCodeId",
+      SUM(d."count") AS scan_count,
+      MAX(d."lastScannedAt") AS last_scanned_at
+    FROM drained d
+    GROUP BY d."qrCodeId"
+  )
+  UPDATE public."QrCode" q
+  SET
+    "scanCount" = (COALESCE(q."scanCount", 0) + t.scan_count)::INTEGER,
+    "lastScannedAt" = GREATEST(COALESCE(q."lastScannedAt", t.last_scanned_at), t.last_scanned_at)
+  FROM totals t
+  WHERE q.id = t."qrCodeId";
+
+  GET DIAGNOSTICS v_folded = ROW_COUNT;
+  RETURN v_folded;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,49 @@
+-- Scan Analytics Migration
+-- Server-side aggregation for GET /api/qr-codes/[id]/scan (src/lib/scan-analytics.ts)
+
+-- Grouped scan counts for one QR code in a single pass over idx_qrcodescan_qrcode_scanned_at.
+-- Distinct counts are derived from the group cardinalities, so no extra scan is needed.
+-- Dates are UTC calendar days, matching the previous toISOString() bucketing.
+CREATE OR REPLACE FUNCTION public.get_qr_scan_analytics(p_qr_code_id TEXT)
+RETURNS JSONB AS $$
+DECLARE
+  v_result JSONB;
+BEGIN
+  WITH scans AS (
+    SELECT
+      ("scannedAt" AT TIME ZONE 'UTC')::DATE AS scan_date,
+      COALESCE(device, 'Unknown') AS device,
+      country,
+      city
+    FROM public."QrCodeScan"
+    WHERE "qrCodeId" = p_qr_code_id
+  ),
+  grouped AS (
+    SELECT
+      scan_date,
+      device,
+      country,
+      city,
+      GROUPING(scan_date) AS g_date,
+      GROUPING(device) AS g_device,
+      GROUPING(country) AS g_country,
+      GROUPING(city) AS g_city,
+      COUNT(*) AS scans
+    FROM scans
+    GROUP BY GROUPING SETS ((scan_date), (device), (country), (city), ())
+  )
+  SELECT jsonb_build_object(
+    'totalScans', COALESCE(MAX(scans) FILTER (WHERE g_date = 1 AND g_device = 1 AND g_country = 1 AND g_city = 1), 0),
+    'uniqueDevices', COUNT(*) FILTER (WHERE g_device = 0),
+    'uniqueCountries', COUNT(*) FILTER (WHERE g_country = 0 AND country IS NOT NULL),
+    'uniqueCities', COUNT(*) FILTER (WHERE g_city = 0 AND city IS NOT NULL),
+    'scansByDate', COALESCE(jsonb_object_agg(to_char(scan_date, 'YYYY-MM-DD'), scans) FILTER (WHERE g_date = 0 AND scan_date IS NOT NULL), '{}'::JSONB),
+    'scansByDevice', COALESCE(jsonb_object_agg(device, scans) FILTER (WHERE g_device = 0), '{}'::JSONB),
+    'scansByCountry', COALESCE(jsonb_object_agg(country, scans) FILTER (WHERE g_country = 0 AND country IS NOT NULL), '{}'::JSONB)
+  )
+  INTO v_result
+  FROM grouped;
+
+  RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE;
@@ -0,0 +1,277 @@
+-- Daily Scan Rollups Migration
+-- Per-QR, per-day scan aggregates maintained by the analytics_aggregate job
+-- (src/lib/scan-rollups.ts). Readers use rollups for days before the watermark
+-- and raw QrCodeScan rows from the watermark onwards.
+
+-- Written by the enhanced scan endpoint but never added by a migration
+ALTER TABLE public."QrCodeScan" ADD COLUMN IF NOT EXISTS "abTestVariant" TEXT;
+
+CREATE TABLE IF NOT EXISTS public."QrCodeScanDaily" (
+  "qrCodeId" TEXT NOT NULL REFERENCES public."QrCode"(id) ON DELETE CASCADE,
+  "date" DATE NOT NULL,
+  "totalScans" INTEGER NOT NULL DEFAULT 0,
+  "uniqueVisitors" INTEGER NOT NULL DEFAULT 0,
+  "devices" JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "countries" JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "cities" JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "browsers" JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "operatingSystems" JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "abTestVariants" JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "updatedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY ("qrCodeId", "date")
+);
+
+CREATE INDEX IF NOT EXISTS idx_qrcode_scan_daily_date ON public."QrCodeScanDaily"("date");
+
+ALTER TABLE public."QrCodeScanDaily" ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own scan rollups" ON public."QrCodeScanDaily"
+  FOR SELECT USING (
+    "qrCodeId" IN (
+      SELECT id FROM public."QrCode" WHERE "userId" = auth.uid()::text
+    )
+  );
+
+-- Rollup progress. "watermark" is always a UTC midnight: every day before it is rolled up.
+CREATE TABLE IF NOT EXISTS public."ScanRollupState" (
+  id TEXT PRIMARY KEY,
+  "watermark" TIMESTAMP WITH TIME ZONE NOT NULL,
+  "updatedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE public."ScanRollupState" ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.get_scan_rollup_watermark()
+RETURNS TIMESTAMP WITH TIME ZONE AS $$
+  SELECT COALESCE(
+    (SELECT "watermark" FROM public."ScanRollupState" WHERE id = 'daily'),
+    '-infinity'::TIMESTAMP WITH TIME ZONE
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Recompute rollups for UTC days [p_from, p_to), optionally for a subset of QR codes.
+-- Rows are rebuilt from QrCodeScan, so re-running a range is idempotent.
+CREATE OR REPLACE FUNCTION public.rollup_scan_days(
+  p_from DATE,
+  p_to DATE,
+  p_qr_code_ids TEXT[] DEFAULT NULL
+) RETURNS INTEGER AS $$
+DECLARE
+  v_rows INTEGER;
+BEGIN
+  DELETE FROM public."QrCodeScanDaily"
+  WHERE "date" >= p_from
+    AND "date" < p_to
+    AND (p_qr_code_ids IS NULL OR "qrCodeId" = ANY(p_qr_code_ids));
+
+  INSERT INTO public."QrCodeScanDaily" (
+    "qrCodeId", "date", "totalScans", "uniqueVisitors",
+    "devices", "countries", "cities", "browsers", "operatingSystems", "abTestVariants", "updatedAt"
+  )
+  WITH day_scans AS MATERIALIZED (
+    SELECT
+      s."qrCodeId" AS qr_code_id,
+      (s."scannedAt" AT TIME ZONE 'UTC')::DATE AS scan_date,
+      s."ipAddress" AS ip_address,
+      COALESCE(s.device, 'Unknown') AS device,
+      s.country,
+      s.city,
+      COALESCE(s.browser, 'Unknown') AS browser,
+      COALESCE(s.os, 'Unknown') AS os,
+      s."abTestVariant" AS variant
+    FROM public."QrCodeScan" s
+    WHERE s."scannedAt" >= (p_from::TIMESTAMP AT TIME ZONE 'UTC')
+      AND s."scannedAt" < (p_to::TIMESTAMP AT TIME ZONE 'UTC')
+      AND (p_qr_code_ids IS NULL OR s."qrCodeId" = ANY(p_qr_code_ids))
+  ),
+  totals AS (
+    SELECT qr_code_id, scan_date, COUNT(*) AS total_scans, COUNT(DISTINCT ip_address) AS unique_visitors
+    FROM day_scans
+    GROUP BY 1, 2
+  ),
+  breakdowns AS (
+    SELECT qr_code_id, scan_date, dim, jsonb_object_agg(key, scans) AS counts
+    FROM (
+      SELECT qr_code_id, scan_date, 'devices' AS dim, device AS key, COUNT(*) AS scans FROM day_scans GROUP BY 1, 2, 4
+      UNION ALL
+      SELECT qr_code_id, scan_date, 'countries', country, COUNT(*) FROM day_scans WHERE country IS NOT NULL GROUP BY 1, 2, 4
+      UNION ALL
+      SELECT qr_code_id, scan_date, 'cities', city, COUNT(*) FROM day_scans WHERE city IS NOT NULL GROUP BY 1, 2, 4
+      UNION ALL
+      SELECT qr_code_id, scan_date, 'browsers', browser, COUNT(*) FROM day_scans GROUP BY 1, 2, 4
+      UNION ALL
+      SELECT qr_code_id, scan_date, 'operatingSystems', os, COUNT(*) FROM day_scans GROUP BY 1, 2, 4
+      UNION ALL
+      SELECT qr_code_id, scan_date, 'abTestVariants', variant, COUNT(*) FROM day_scans WHERE variant IS NOT NULL GROUP BY 1, 2, 4
+    ) g
+    GROUP BY 1, 2, 3
+  ),
+  pivoted AS (
+    SELECT qr_code_id, scan_date, jsonb_object_agg(dim, counts) AS dims
+    FROM breakdowns
+    GROUP BY 1, 2
+  )
+  SELECT
+    t.qr_code_id,
+    t.scan_date,
+    t.total_scans,
+    t.unique_visitors,
+    COALESCE(p.dims->'devices', '{}'::JSONB),
+    COALESCE(p.dims->'countries', '{}'::JSONB),
+    COALESCE(p.dims->'cities', '{}'::JSONB),
+    COALESCE(p.dims->'browsers', '{}'::JSONB),
+    COALESCE(p.dims->'operatingSystems', '{}'::JSONB),
+    COALESCE(p.dims->'abTestVariants', '{}'::JSONB),
+    NOW()
+  FROM totals t
+  LEFT JOIN pivoted p ON p.qr_code_id = t.qr_code_id AND p.scan_date = t.scan_date
+  ON CONFLICT ("qrCodeId", "date") DO UPDATE SET
+    "totalScans" = EXCLUDED."totalScans",
+    "uniqueVisitors" = EXCLUDED."uniqueVisitors",
+    "devices" = EXCLUDED."devices",
+    "countries" = EXCLUDED."countries",
+    "cities" = EXCLUDED."cities",
+    "browsers" = EXCLUDED."browsers",
+    "operatingSystems" = EXCLUDED."operatingSystems",
+    "abTestVariants" = EXCLUDED."abTestVariants",
+    "updatedAt" = NOW();
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Roll up the next closed days after the watermark and advance it.
+-- A day counts as closed once p_grace has passed since UTC midnight, which
+-- leaves time for the scan ingestion buffer to flush late writes.
+CREATE OR REPLACE FUNCTION public.advance_scan_rollups(
+  p_max_days INTEGER DEFAULT 7,
+  p_grace INTERVAL DEFAULT INTERVAL '15 minutes'
+) RETURNS JSONB AS $$
+DECLARE
+  v_from DATE;
+  v_limit DATE;
+  v_to DATE;
+  v_rows INTEGER := 0;
+BEGIN
+  -- One runner at a time; concurrent calls queue behind the first
+  PERFORM pg_advisory_xact_lock(hashtext('scan_daily_rollups'));
+
+  SELECT ("watermark" AT TIME ZONE 'UTC')::DATE INTO v_from
+  FROM public."ScanRollupState"
+  WHERE id = 'daily';
+
+  -- First day that is not closed yet
+  v_limit := ((NOW() - p_grace) AT TIME ZONE 'UTC')::DATE;
+
+  IF v_from IS NULL THEN
+    SELECT MIN(("scannedAt" AT TIME ZONE 'UTC')::DATE) INTO v_from FROM public."QrCodeScan";
+    v_from := COALESCE(v_from, v_limit);
+  END IF;
+
+  v_to := LEAST(v_limit, v_from + GREATEST(p_max_days, 1));
+
+  IF v_to > v_from THEN
+    v_rows := public.rollup_scan_days(v_from, v_to);
+  END IF;
+
+  INSERT INTO public."ScanRollupState" (id, "watermark", "updatedAt")
+  VALUES ('daily', GREATEST(v_from, v_to)::TIMESTAMP AT TIME ZONE 'UTC', NOW())
+  ON CONFLICT (id) DO UPDATE SET
+    "watermark" = GREATEST(public."ScanRollupState"."watermark", EXCLUDED."watermark"),
+    "updatedAt" = NOW();
+
+  RETURN jsonb_build_object(
+    'from', v_from,
+    'to', GREATEST(v_from, v_to),
+    'rows', v_rows,
+    'caughtUp', v_to >= v_limit
+  );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Scan summaries per QR code: rollups for days before the watermark, raw scans after it.
+-- p_start_date / p_end_date are inclusive UTC days (NULL = unbounded).
+CREATE OR REPLACE FUNCTION public.get_scan_summaries(
+  p_qr_code_ids TEXT[],
+  p_start_date DATE DEFAULT NULL,
+  p_end_date DATE DEFAULT NULL
+) RETURNS TABLE (qr_code_id TEXT, summary JSONB) AS $$
+  WITH bounds AS (
+    SELECT
+      w AS watermark,
+      (w AT TIME ZONE 'UTC')::DATE AS boundary
+    FROM public.get_scan_rollup_watermark() w
+  ),
+  raw AS (
+    SELECT
+      s."qrCodeId" AS qr_code_id,
+      to_char((s."scannedAt" AT TIME ZONE 'UTC')::DATE, 'YYYY-MM-DD') AS scan_date,
+      COALESCE(s.device, 'Unknown') AS device,
+      s.country,
+      s.city,
+      COALESCE(s.browser, 'Unknown') AS browser,
+      COALESCE(s.os, 'Unknown') AS os,
+      s."abTestVariant" AS variant
+    FROM public."QrCodeScan" s, bounds b
+    WHERE s."qrCodeId" = ANY(p_qr_code_ids)
+      AND s."scannedAt" >= b.watermark
+      AND (p_start_date IS NULL OR s."scannedAt" >= (p_start_date::TIMESTAMP AT TIME ZONE 'UTC'))
+      AND (p_end_date IS NULL OR s."scannedAt" < ((p_end_date + 1)::TIMESTAMP AT TIME ZONE 'UTC'))
+  ),
+  rollups AS (
+    SELECT r.*
+    FROM public."QrCodeScanDaily" r, bounds b
+    WHERE r."qrCodeId" = ANY(p_qr_code_ids)
+      AND r."date" < b.boundary
+      AND (p_start_date IS NULL OR r."date" >= p_start_date)
+      AND (p_end_date IS NULL OR r."date" <= p_end_date)
+  ),
+  facts AS (
+    SELECT qr_code_id, 'date' AS dim, scan_date AS key, COUNT(*) AS scans FROM raw GROUP BY 1, 3
+    UNION ALL SELECT qr_code_id, 'device', device, COUNT(*) FROM raw GROUP BY 1, 3
+    UNION ALL SELECT qr_code_id, 'country', country, COUNT(*) FROM raw WHERE country IS NOT NULL GROUP BY 1, 3
+    UNION ALL SELECT qr_code_id, 'city', city, COUNT(*) FROM raw WHERE city IS NOT NULL GROUP BY 1, 3
+    UNION ALL SELECT qr_code_id, 'browser', browser, COUNT(*) FROM raw GROUP BY 1, 3
+    UNION ALL SELECT qr_code_id, 'os', os, COUNT(*) FROM raw GROUP BY 1, 3
+    UNION ALL SELECT qr_code_id, 'variant', variant, COUNT(*) FROM raw WHERE variant IS NOT NULL GROUP BY 1, 3
+    UNION ALL SELECT r."qrCodeId", 'date', to_char(r."date", 'YYYY-MM-DD'), r."totalScans"::BIGINT FROM rollups r
+    UNION ALL SELECT r."qrCodeId", 'device', e.key, e.value::BIGINT FROM rollups r, jsonb_each_text(r."devices") e
+    UNION ALL SELECT r."qrCodeId", 'country', e.key, e.value::BIGINT FROM rollups r, jsonb_each_text(r."countries") e
+    UNION ALL SELECT r."qrCodeId", 'city', e.key, e.value::BIGINT FROM rollups r, jsonb_each_text(r."cities") e
+    UNION ALL SELECT r."qrCodeId", 'browser', e.key, e.value::BIGINT FROM rollups r, jsonb_each_text(r."browsers") e
+    UNION ALL SELECT r."qrCodeId", 'os', e.key, e.value::BIGINT FROM rollups r, jsonb_each_text(r."operatingSystems") e
+    UNION ALL SELECT r."qrCodeId", 'variant', e.key, e.value::BIGINT FROM rollups r, jsonb_each_text(r."abTestVariants") e
+  ),
+  merged AS (
+    SELECT qr_code_id, dim, key, SUM(scans)::BIGINT AS scans
+    FROM facts
+    GROUP BY 1, 2, 3
+  )
+  SELECT
+    qr_code_id,
+    jsonb_build_object(
+      'totalScans', COALESCE(SUM(scans) FILTER (WHERE dim = 'date'), 0),
+      'uniqueDevices', COUNT(*) FILTER (WHERE dim = 'device'),
+      'uniqueCountries', COUNT(*) FILTER (WHERE dim = 'country'),
+      'uniqueCities', COUNT(*) FILTER (WHERE dim = 'city'),
+      'scansByDate', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'date'), '{}'::JSONB),
+      'scansByDevice', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'device'), '{}'::JSONB),
+      'scansByCountry', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'country'), '{}'::JSONB),
+      'scansByCity', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'city'), '{}'::JSONB),
+      'scansByBrowser', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'browser'), '{}'::JSONB),
+      'scansByOS', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'os'), '{}'::JSONB),
+      'abTestResults', COALESCE(jsonb_object_agg(key, scans) FILTER (WHERE dim = 'variant'), '{}'::JSONB)
+    )
+  FROM merged
+  GROUP BY qr_code_id;
+$$ LANGUAGE sql STABLE;
+
+-- GET /api/qr-codes/[id]/scan now reads through the rollups as well
+CREATE OR REPLACE FUNCTION public.get_qr_scan_analytics(p_qr_code_id TEXT)
+RETURNS JSONB AS $$
+  SELECT COALESCE(
+    (SELECT summary FROM public.get_scan_summaries(ARRAY[p_qr_code_id])),
+    '{}'::JSONB
+  );
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,59 @@
+-- Bulk Operation Results Migration
+-- Append-only per-item outcomes for QrCodeBulkGroup and a set-based bulk update
+-- (processBulkOperation in src/app/api/qr-codes/bulk/route.ts)
+
+CREATE TABLE IF NOT EXISTS public."QrCodeBulkResult" (
+  id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  "bulkGroupId" TEXT NOT NULL REFERENCES public."QrCodeBulkGroup"(id) ON DELETE CASCADE,
+  "qrCodeId" TEXT,
+  status TEXT NOT NULL CHECK (status IN ('succeeded', 'failed')),
+  error TEXT,
+  data JSONB,
+  "createdAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_qrcode_bulk_result_group ON public."QrCodeBulkResult"("bulkGroupId", id);
+
+ALTER TABLE public."QrCodeBulkResult" ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own bulk results" ON public."QrCodeBulkResult"
+  FOR SELECT USING (
+    "bulkGroupId" IN (
+      SELECT id FROM public."QrCodeBulkGroup" WHERE "userId" = auth.uid()::text
+    )
+  );
+
+-- Apply a batch of partial updates in one statement. Only keys present in an
+-- element are written (an explicit null clears the column); rows not owned by
+-- p_user_id are skipped. Returns the ids that were updated.
+-- p_updates: [{ "id": TEXT, "title": TEXT, ... }, ...]
+CREATE OR REPLACE FUNCTION public.bulk_update_qr_codes(p_user_id TEXT, p_updates JSONB)
+RETURNS TABLE (id TEXT) AS $$
+  UPDATE public."QrCode" q
+  SET
+    title = CASE WHEN u.data ? 'title' THEN u.data->>'title' ELSE q.title END,
+    url = CASE WHEN u.data ? 'url' THEN u.data->>'url' ELSE q.url END,
+    "dynamicContent" = CASE WHEN u.data ? 'dynamicContent' THEN NULLIF(u.data->'dynamicContent', 'null'::JSONB) ELSE q."dynamicContent" END,
+    "redirectUrl" = CASE WHEN u.data ? 'redirectUrl' THEN u.data->>'redirectUrl' ELSE q."redirectUrl" END,
+    "expiresAt" = CASE WHEN u.data ? 'expiresAt' THEN (u.data->>'expiresAt')::TIMESTAMP WITH TIME ZONE ELSE q."expiresAt" END,
+    "maxScans" = CASE WHEN u.data ? 'maxScans' THEN (u.data->>'maxScans')::INTEGER ELSE q."maxScans" END,
+    "foregroundColor" = CASE WHEN u.data ? 'foregroundColor' THEN u.data->>'foregroundColor' ELSE q."foregroundColor" END,
+    "backgroundColor" = CASE WHEN u.data ? 'backgroundColor' THEN u.data->>'backgroundColor' ELSE q."backgroundColor" END,
+    "dotType" = CASE WHEN u.data ? 'dotType' THEN u.data->>'dotType' ELSE q."dotType" END,
+    "cornerType" = CASE WHEN u.data ? 'cornerType' THEN u.data->>'cornerType' ELSE q."cornerType" END,
+    "hasWatermark" = CASE WHEN u.data ? 'hasWatermark' THEN (u.data->>'hasWatermark')::BOOLEAN ELSE q."hasWatermark" END,
+    "deviceRedirection" = CASE WHEN u.data ? 'deviceRedirection' THEN NULLIF(u.data->'deviceRedirection', 'null'::JSONB) ELSE q."deviceRedirection" END,
+    "geoRedirection" = CASE WHEN u.data ? 'geoRedirection' THEN NULLIF(u.data->'geoRedirection', 'null'::JSONB) ELSE q."geoRedirection" END,
+    "marketingPixels" = CASE WHEN u.data ? 'marketingPixels' THEN NULLIF(u.data->'marketingPixels', 'null'::JSONB) ELSE q."marketingPixels" END,
+    "abTestConfig" = CASE WHEN u.data ? 'abTestConfig' THEN NULLIF(u.data->'abTestConfig', 'null'::JSONB) ELSE q."abTestConfig" END,
+    "webhookUrl" = CASE WHEN u.data ? 'webhookUrl' THEN u.data->>'webhookUrl' ELSE q."webhookUrl" END,
+    "customDomain" = CASE WHEN u.data ? 'customDomain' THEN u.data->>'customDomain' ELSE q."customDomain" END,
+    "updatedAt" = NOW()
+  FROM (
+    SELECT e->>'id' AS qr_code_id, e AS data
+    FROM jsonb_array_elements(p_updates) e
+  ) u
+  WHERE q.id = u.qr_code_id
+    AND q."userId" = p_user_id
+  RETURNING q.id;
+$$ LANGUAGE sql;
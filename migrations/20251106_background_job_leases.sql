@@ -0,0 +1,146 @@
+-- Background Job Leases Migration
+-- Batch claiming with per-type slots, leases with heartbeats and re-queueing of
+-- jobs whose worker died (src/lib/job-worker.ts)
+
+ALTER TABLE public."BackgroundJob" ADD COLUMN IF NOT EXISTS "lockedBy" TEXT;
+ALTER TABLE public."BackgroundJob" ADD COLUMN IF NOT EXISTS "leaseExpiresAt" TIMESTAMP WITH TIME ZONE;
+
+-- Claim order for runnable jobs
+CREATE INDEX IF NOT EXISTS idx_background_job_claim
+  ON public."BackgroundJob"("priority" DESC, "runAfter", "createdAt")
+  WHERE "status" = 'pending';
+
+-- Expired lease sweep
+CREATE INDEX IF NOT EXISTS idx_background_job_lease
+  ON public."BackgroundJob"("leaseExpiresAt")
+  WHERE "status" = 'processing';
+
+-- Put jobs with an expired lease back in the queue (or fail them once out of retries)
+CREATE OR REPLACE FUNCTION public.requeue_expired_background_jobs()
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE public."BackgroundJob"
+  SET
+    "status" = CASE WHEN "retries" < "maxRetries" THEN 'pending' ELSE 'failed' END,
+    "retries" = "retries" + 1,
+    "error" = 'Lease expired (worker ' || COALESCE("lockedBy", 'unknown') || ' stopped responding)',
+    "runAfter" = NOW(),
+    "lockedBy" = NULL,
+    "leaseExpiresAt" = NULL,
+    "updatedAt" = NOW()
+  WHERE "status" = 'processing'
+    AND "leaseExpiresAt" < NOW();
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Claim up to p_batch_size runnable jobs for a worker.
+-- p_slots: { "<jobType>": <free slots>, ... }; types without free slots are skipped.
+-- Jobs are taken by priority, then runAfter, then age.
+CREATE OR REPLACE FUNCTION public.claim_background_jobs(
+  p_worker_id TEXT,
+  p_slots JSONB,
+  p_batch_size INTEGER DEFAULT 10,
+  p_lease_seconds INTEGER DEFAULT 60
+) RETURNS SETOF public."BackgroundJob" AS $$
+BEGIN
+  PERFORM public.requeue_expired_background_jobs();
+
+  RETURN QUERY
+  WITH locked AS (
+    SELECT bj.id, bj."jobType", bj."priority", bj."runAfter", bj."createdAt"
+    FROM public."BackgroundJob" bj
+    WHERE bj."status" = 'pending'
+      AND bj."runAfter" <= NOW()
+      AND COALESCE((p_slots->>bj."jobType")::INTEGER, 0) > 0
+    ORDER BY bj."priority" DESC, bj."runAfter" ASC, bj."createdAt" ASC
+    LIMIT GREATEST(p_batch_size, 1) * 4
+    FOR UPDATE SKIP LOCKED
+  ),
+  ranked AS (
+    SELECT
+      l.id,
+      ROW_NUMBER() OVER (PARTITION BY l."jobType" ORDER BY l."priority" DESC, l."runAfter", l."createdAt") AS type_rank,
+      ROW_NUMBER() OVER (ORDER BY l."priority" DESC, l."runAfter", l."createdAt") AS overall_rank,
+      (p_slots->>l."jobType")::INTEGER AS slots
+    FROM locked l
+  ),
+  chosen AS (
+    SELECT r.id
+    FROM ranked r
+    WHERE r.type_rank <= r.slots
+    ORDER BY r.overall_rank
+    LIMIT GREATEST(p_batch_size, 1)
+  )
+  UPDATE public."BackgroundJob" bj
+  SET
+    "status" = 'processing',
+    "startedAt" = NOW(),
+    "lockedBy" = p_worker_id,
+    "leaseExpiresAt" = NOW() + make_interval(secs => p_lease_seconds),
+    "updatedAt" = NOW()
+  FROM chosen c
+  WHERE bj.id = c.id
+  RETURNING bj.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Extend the lease on jobs a worker is still running; returns the ids it still holds
+CREATE OR REPLACE FUNCTION public.heartbeat_background_jobs(
+  p_worker_id TEXT,
+  p_job_ids TEXT[],
+  p_lease_seconds INTEGER DEFAULT 60
+) RETURNS SETOF TEXT AS $$
+  UPDATE public."BackgroundJob"
+  SET
+    "leaseExpiresAt" = NOW() + make_interval(secs => p_lease_seconds),
+    "updatedAt" = NOW()
+  WHERE id = ANY(p_job_ids)
+    AND "status" = 'processing'
+    AND "lockedBy" = p_worker_id
+  RETURNING id;
+$$ LANGUAGE sql;
+
+-- Finish a job. Only the lease holder may do so, so a job that was re-queued
+-- and picked up elsewhere isn't overwritten by a late worker.
+-- p_error NULL = completed; otherwise retried after p_retry_delay_seconds until maxRetries.
+CREATE OR REPLACE FUNCTION public.finish_background_job(
+  p_job_id TEXT,
+  p_worker_id TEXT,
+  p_result JSONB DEFAULT NULL,
+  p_error TEXT DEFAULT NULL,
+  p_retry_delay_seconds INTEGER DEFAULT 60
+) RETURNS TEXT AS $$
+DECLARE
+  v_status TEXT;
+BEGIN
+  UPDATE public."BackgroundJob"
+  SET
+    "status" = CASE
+      WHEN p_error IS NULL THEN 'completed'
+      WHEN "retries" < "maxRetries" THEN 'pending'
+      ELSE 'failed'
+    END,
+    "result" = CASE WHEN p_error IS NULL THEN p_result ELSE "result" END,
+    "error" = p_error,
+    "retries" = CASE WHEN p_error IS NULL THEN "retries" ELSE "retries" + 1 END,
+    "runAfter" = CASE
+      WHEN p_error IS NOT NULL THEN NOW() + make_interval(secs => p_retry_delay_seconds)
+      ELSE "runAfter"
+    END,
+    "completedAt" = CASE WHEN p_error IS NULL THEN NOW() ELSE "completedAt" END,
+    "lockedBy" = NULL,
+    "leaseExpiresAt" = NULL,
+    "updatedAt" = NOW()
+  WHERE id = p_job_id
+    AND "status" = 'processing'
+    AND "lockedBy" = p_worker_id
+  RETURNING "status" INTO v_status;
+
+  RETURN v_status;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,75 @@
+-- Webhook Outbox Dispatch Migration
+-- Batch claiming and batch completion for the webhook dispatcher
+-- (src/lib/webhook-outbox.ts): two round trips per batch instead of three per delivery
+
+-- Due deliveries, oldest first
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due
+  ON public."WebhookOutbox"("nextRetryAt")
+  WHERE "status" IN ('pending', 'failed', 'processing');
+
+-- Claim up to p_limit due deliveries. Claimed rows are marked processing with
+-- the attempt counted and nextRetryAt pushed out by p_lease_seconds, so rows
+-- held by a dispatcher that died become due again after the lease.
+-- Each row is returned as JSON with "dueAt" (its nextRetryAt before claiming)
+-- so the dispatcher can report lag.
+CREATE OR REPLACE FUNCTION public.claim_webhook_outbox(
+  p_limit INTEGER DEFAULT 500,
+  p_lease_seconds INTEGER DEFAULT 120
+) RETURNS SETOF JSONB AS $$
+  WITH due AS (
+    SELECT wo.id, wo."nextRetryAt"
+    FROM public."WebhookOutbox" wo
+    WHERE wo."status" IN ('pending', 'failed', 'processing')
+      AND wo."nextRetryAt" <= NOW()
+      AND wo.attempts < wo."maxAttempts"
+    ORDER BY wo."nextRetryAt" ASC
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE public."WebhookOutbox" wo
+  SET
+    "status" = 'processing',
+    "attempts" = wo.attempts + 1,
+    "lastAttemptAt" = NOW(),
+    "nextRetryAt" = NOW() + make_interval(secs => p_lease_seconds),
+    "updatedAt" = NOW()
+  FROM due
+  WHERE wo.id = due.id
+  RETURNING to_jsonb(wo.*) || jsonb_build_object('dueAt', due."nextRetryAt");
+$$ LANGUAGE sql;
+
+-- Record the outcome of a batch of deliveries in one statement.
+-- p_results: [{ "id", "status": "delivered" | "failed" | "deferred", "responseStatus",
+--               "responseBody", "error", "nextRetryAt" }]
+-- "deferred" rows were never sent (e.g. the host's circuit breaker was open):
+-- the claimed attempt is handed back and the row rescheduled.
+CREATE OR REPLACE FUNCTION public.complete_webhook_deliveries(p_results JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE public."WebhookOutbox" wo
+  SET
+    "status" = CASE WHEN r.status = 'deferred' THEN 'pending' ELSE r.status END,
+    "attempts" = CASE WHEN r.status = 'deferred' THEN GREATEST(wo.attempts - 1, 0) ELSE wo.attempts END,
+    "responseStatus" = COALESCE(r."responseStatus", wo."responseStatus"),
+    "responseBody" = COALESCE(r."responseBody", wo."responseBody"),
+    "lastError" = COALESCE(r.error, wo."lastError"),
+    "deliveredAt" = CASE WHEN r.status = 'delivered' THEN NOW() ELSE wo."deliveredAt" END,
+    "nextRetryAt" = COALESCE(r."nextRetryAt", wo."nextRetryAt"),
+    "updatedAt" = NOW()
+  FROM jsonb_to_recordset(p_results) AS r(
+    id TEXT,
+    status TEXT,
+    "responseStatus" INTEGER,
+    "responseBody" TEXT,
+    error TEXT,
+    "nextRetryAt" TIMESTAMP WITH TIME ZONE
+  )
+  WHERE wo.id = r.id
+    AND wo."status" = 'processing';
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,94 @@
+-- Webhook Batching Migration
+-- Opt-in coalescing of scan events into one delivery per destination, and
+-- per-event delivery status in QrCodeWebhookLog for the v1 webhook logs API
+
+-- { "enabled": true, "maxBatchSize": 100, "maxLingerMs": 5000 }; NULL = one delivery per event
+ALTER TABLE public."QrCode" ADD COLUMN IF NOT EXISTS "webhookBatchConfig" JSONB;
+
+ALTER TABLE public."QrCodeWebhookLog" ADD COLUMN IF NOT EXISTS "outboxId" TEXT;
+ALTER TABLE public."QrCodeWebhookLog" ADD COLUMN IF NOT EXISTS "eventId" TEXT;
+ALTER TABLE public."QrCodeWebhookLog" ADD COLUMN IF NOT EXISTS "status" TEXT; -- delivered, retrying, failed
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_qrcode_webhook_log_outbox_event
+  ON public."QrCodeWebhookLog"("outboxId", "eventId");
+CREATE INDEX IF NOT EXISTS idx_qrcode_webhook_log_qrcode_created
+  ON public."QrCodeWebhookLog"("qrCodeId", "createdAt" DESC);
+
+-- Same as before, plus one log row per event of every attempted delivery
+-- (a batch delivery logs each of its events with the batch's outcome)
+CREATE OR REPLACE FUNCTION public.complete_webhook_deliveries(p_results JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  WITH results AS (
+    SELECT *
+    FROM jsonb_to_recordset(p_results) AS r(
+      id TEXT,
+      status TEXT,
+      "responseStatus" INTEGER,
+      "responseBody" TEXT,
+      error TEXT,
+      "nextRetryAt" TIMESTAMP WITH TIME ZONE
+    )
+  ),
+  updated AS (
+    UPDATE public."WebhookOutbox" wo
+    SET
+      "status" = CASE WHEN r.status = 'deferred' THEN 'pending' ELSE r.status END,
+      "attempts" = CASE WHEN r.status = 'deferred' THEN GREATEST(wo.attempts - 1, 0) ELSE wo.attempts END,
+      "responseStatus" = COALESCE(r."responseStatus", wo."responseStatus"),
+      "responseBody" = COALESCE(r."responseBody", wo."responseBody"),
+      "lastError" = COALESCE(r.error, wo."lastError"),
+      "deliveredAt" = CASE WHEN r.status = 'delivered' THEN NOW() ELSE wo."deliveredAt" END,
+      "nextRetryAt" = COALESCE(r."nextRetryAt", wo."nextRetryAt"),
+      "updatedAt" = NOW()
+    FROM results r
+    WHERE wo.id = r.id
+      AND wo."status" = 'processing'
+    RETURNING wo.*, r.status AS outcome, r.error AS outcome_error
+  ),
+  logged AS (
+    INSERT INTO public."QrCodeWebhookLog" (
+      "qrCodeId", "webhookUrl", "payload", "responseStatus", "responseBody",
+      "attempts", "lastAttemptAt", "isSuccessful", "outboxId", "eventId", "status"
+    )
+    SELECT
+      u."qrCodeId",
+      u."webhookUrl",
+      e.event,
+      u."responseStatus",
+      COALESCE(u.outcome_error, u."responseBody"),
+      u.attempts,
+      NOW(),
+      u.outcome = 'delivered',
+      u.id,
+      COALESCE(e.event->>'eventId', e.event->>'scanId', u.id),
+      CASE
+        WHEN u.outcome = 'delivered' THEN 'delivered'
+        WHEN u.attempts < u."maxAttempts" THEN 'retrying'
+        ELSE 'failed'
+      END
+    FROM updated u
+    CROSS JOIN LATERAL (
+      SELECT jsonb_array_elements(u.payload->'events') AS event
+      WHERE u.payload->>'type' = 'scan.batch'
+      UNION ALL
+      SELECT u.payload
+      WHERE u.payload->>'type' IS DISTINCT FROM 'scan.batch'
+    ) e
+    WHERE u.outcome <> 'deferred'
+    ON CONFLICT ("outboxId", "eventId") DO UPDATE SET
+      "responseStatus" = EXCLUDED."responseStatus",
+      "responseBody" = EXCLUDED."responseBody",
+      "attempts" = EXCLUDED."attempts",
+      "lastAttemptAt" = EXCLUDED."lastAttemptAt",
+      "isSuccessful" = EXCLUDED."isSuccessful",
+      "status" = EXCLUDED."status"
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_count FROM updated;
+
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
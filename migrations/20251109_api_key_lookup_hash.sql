@@ -0,0 +1,32 @@
+-- API Key Lookup Hash Migration
+-- Verify API keys with one indexed lookup instead of bcrypt-comparing every active key
+
+-- Keyed SHA-256 of the full key (src/lib/api-keys.ts). Keys created before this
+-- migration (or hashed with a previous API_KEY_LOOKUP_SECRET) are matched once
+-- by keyPrefix and bcrypt, then get their lookup hash filled in on first use.
+ALTER TABLE public."ApiKey" ADD COLUMN IF NOT EXISTS "keyLookupHash" TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_apikey_lookup_hash
+  ON public."ApiKey"("keyLookupHash")
+  WHERE "keyLookupHash" IS NOT NULL;
+
+-- Fallback match for keys without a current lookup hash
+CREATE INDEX IF NOT EXISTS idx_apikey_prefix
+  ON public."ApiKey"("keyPrefix")
+  WHERE "isActive" = true;
+
+-- Apply batched lastUsedAt updates: p_usage = { "<apiKeyId>": "<timestamp>", ... }
+CREATE OR REPLACE FUNCTION public.touch_api_keys(p_usage JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE public."ApiKey" ak
+  SET "lastUsedAt" = GREATEST(COALESCE(ak."lastUsedAt", u.value::TIMESTAMPTZ), u.value::TIMESTAMPTZ)
+  FROM jsonb_each_text(p_usage) AS u(key, value)
+  WHERE ak.id = u.key;
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
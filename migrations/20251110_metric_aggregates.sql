@@ -0,0 +1,14 @@
+-- Metric Aggregates Migration
+-- Metric rows are written pre-aggregated by the in-process metrics registry
+-- (src/lib/metrics-registry.ts): one row per series per flush interval instead
+-- of one row per sample. Existing rows are single samples (count = 1).
+
+-- value = sum of the samples (latest value for gauges), count = number of samples
+ALTER TABLE public."Metric" ADD COLUMN IF NOT EXISTS "count" BIGINT NOT NULL DEFAULT 1;
+ALTER TABLE public."Metric" ADD COLUMN IF NOT EXISTS "min" NUMERIC;
+ALTER TABLE public."Metric" ADD COLUMN IF NOT EXISTS "max" NUMERIC;
+-- Per-bucket sample counts over HISTOGRAM_BOUNDS (plus a final overflow bucket), for histograms
+ALTER TABLE public."Metric" ADD COLUMN IF NOT EXISTS "histogram" JSONB;
+
+-- getMetrics filters on labels with @>
+CREATE INDEX IF NOT EXISTS idx_metric_labels ON public."Metric" USING GIN (labels);
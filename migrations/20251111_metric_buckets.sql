@@ -0,0 +1,278 @@
+-- Metric Buckets Migration
+-- Downsampled metrics: raw Metric rows are rolled up into 1-minute buckets,
+-- 1-minute into 1-hour and 1-hour into 1-day buckets (src/lib/metrics.ts).
+-- Every bucket keeps count/sum/min/max and the merged histogram, so averages
+-- and percentiles can be computed over any range without reading raw rows.
+
+CREATE TABLE IF NOT EXISTS public."MetricBucket" (
+  name TEXT NOT NULL,
+  resolution TEXT NOT NULL CHECK (resolution IN ('1m', '1h', '1d')),
+  "bucketStart" TIMESTAMP WITH TIME ZONE NOT NULL,
+  labels JSONB NOT NULL DEFAULT '{}'::JSONB,
+  "count" BIGINT NOT NULL DEFAULT 0,
+  "sum" NUMERIC NOT NULL DEFAULT 0,
+  "min" NUMERIC,
+  "max" NUMERIC,
+  histogram JSONB, -- Per-bucket sample counts over HISTOGRAM_BOUNDS, for histograms
+  "updatedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (name, resolution, "bucketStart", labels)
+);
+
+CREATE INDEX IF NOT EXISTS idx_metric_bucket_resolution_start
+  ON public."MetricBucket"(resolution, "bucketStart");
+
+ALTER TABLE public."MetricBucket" ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Admins can view metric buckets" ON public."MetricBucket"
+  FOR SELECT USING (
+    EXISTS (
+      SELECT 1 FROM public."User"
+      WHERE id = auth.uid() AND "role" = 'admin'
+    )
+  );
+
+-- Rollup progress per resolution. Every bucket before "watermark" is complete.
+CREATE TABLE IF NOT EXISTS public."MetricRollupState" (
+  resolution TEXT PRIMARY KEY,
+  "watermark" TIMESTAMP WITH TIME ZONE NOT NULL,
+  "updatedAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE public."MetricRollupState" ENABLE ROW LEVEL SECURITY;
+
+-- Element-wise sum of two histogram arrays (NULL-safe)
+CREATE OR REPLACE FUNCTION public.metric_histogram_add(a JSONB, b JSONB)
+RETURNS JSONB AS $$
+  SELECT CASE
+    WHEN a IS NULL THEN b
+    WHEN b IS NULL THEN a
+    ELSE (
+      SELECT jsonb_agg(COALESCE((a->>i)::BIGINT, 0) + COALESCE((b->>i)::BIGINT, 0) ORDER BY i)
+      FROM generate_series(0, GREATEST(jsonb_array_length(a), jsonb_array_length(b)) - 1) AS i
+    )
+  END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE AGGREGATE public.metric_histogram_sum(JSONB) (
+  SFUNC = public.metric_histogram_add,
+  STYPE = JSONB
+);
+
+-- Rebuild buckets of one resolution for [p_from, p_to) from the next finer
+-- level (raw Metric rows for 1m). Rebuilt from source, so re-running is idempotent.
+CREATE OR REPLACE FUNCTION public.rollup_metric_buckets(
+  p_resolution TEXT,
+  p_from TIMESTAMP WITH TIME ZONE,
+  p_to TIMESTAMP WITH TIME ZONE
+) RETURNS INTEGER AS $$
+DECLARE
+  v_unit TEXT := CASE p_resolution WHEN '1m' THEN 'minute' WHEN '1h' THEN 'hour' ELSE 'day' END;
+  v_rows INTEGER;
+BEGIN
+  DELETE FROM public."MetricBucket"
+  WHERE resolution = p_resolution
+    AND "bucketStart" >= p_from
+    AND "bucketStart" < p_to;
+
+  INSERT INTO public."MetricBucket" (
+    name, resolution, "bucketStart", labels, "count", "sum", "min", "max", histogram, "updatedAt"
+  )
+  SELECT
+    src.name,
+    p_resolution,
+    date_trunc(v_unit, src.ts, 'UTC'),
+    src.labels,
+    SUM(src."count"),
+    SUM(src."sum"),
+    MIN(src."min"),
+    MAX(src."max"),
+    public.metric_histogram_sum(src.histogram),
+    NOW()
+  FROM (
+    SELECT
+      m.name,
+      m.timestamp AS ts,
+      COALESCE(m.labels, '{}'::JSONB) AS labels,
+      m."count",
+      m.value AS "sum",
+      COALESCE(m."min", m.value) AS "min",
+      COALESCE(m."max", m.value) AS "max",
+      m.histogram
+    FROM public."Metric" m
+    WHERE p_resolution = '1m'
+      AND m.timestamp >= p_from
+      AND m.timestamp < p_to
+    UNION ALL
+    SELECT b.name, b."bucketStart", b.labels, b."count", b."sum", b."min", b."max", b.histogram
+    FROM public."MetricBucket" b
+    WHERE b.resolution = CASE p_resolution WHEN '1h' THEN '1m' WHEN '1d' THEN '1h' END
+      AND b."bucketStart" >= p_from
+      AND b."bucketStart" < p_to
+  ) src
+  GROUP BY src.name, date_trunc(v_unit, src.ts, 'UTC'), src.labels;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Roll up closed buckets after each watermark, finest level first. A minute
+-- counts as closed once p_grace has passed, leaving time for process flushes;
+-- hours and days close only when the finer level has caught up with them.
+CREATE OR REPLACE FUNCTION public.advance_metric_rollups(
+  p_grace INTERVAL DEFAULT INTERVAL '2 minutes'
+) RETURNS JSONB AS $$
+DECLARE
+  v_level RECORD;
+  v_from TIMESTAMP WITH TIME ZONE;
+  v_limit TIMESTAMP WITH TIME ZONE;
+  v_to TIMESTAMP WITH TIME ZONE;
+  v_finer_watermark TIMESTAMP WITH TIME ZONE;
+  v_rows INTEGER;
+  v_result JSONB := '{}'::JSONB;
+BEGIN
+  -- One runner at a time; concurrent calls queue behind the first
+  PERFORM pg_advisory_xact_lock(hashtext('metric_rollups'));
+
+  FOR v_level IN
+    SELECT * FROM (VALUES
+      (1, '1m', 'minute', INTERVAL '6 hours'),
+      (2, '1h', 'hour', INTERVAL '7 days'),
+      (3, '1d', 'day', INTERVAL '90 days')
+    ) AS l(ord, resolution, unit, max_span)
+    ORDER BY ord
+  LOOP
+    SELECT "watermark" INTO v_from
+    FROM public."MetricRollupState"
+    WHERE resolution = v_level.resolution;
+
+    IF v_level.resolution = '1m' THEN
+      v_limit := date_trunc('minute', NOW() - p_grace, 'UTC');
+    ELSE
+      v_limit := date_trunc(v_level.unit, v_finer_watermark, 'UTC');
+    END IF;
+
+    IF v_from IS NULL THEN
+      IF v_level.resolution = '1m' THEN
+        SELECT date_trunc('minute', MIN(timestamp), 'UTC') INTO v_from FROM public."Metric";
+      ELSE
+        SELECT date_trunc(v_level.unit, MIN("bucketStart"), 'UTC') INTO v_from
+        FROM public."MetricBucket"
+        WHERE resolution = CASE v_level.resolution WHEN '1h' THEN '1m' ELSE '1h' END;
+      END IF;
+      v_from := COALESCE(v_from, v_limit);
+    END IF;
+
+    v_to := LEAST(v_limit, date_trunc(v_level.unit, v_from + v_level.max_span, 'UTC'));
+    v_rows := 0;
+
+    IF v_to > v_from THEN
+      v_rows := public.rollup_metric_buckets(v_level.resolution, v_from, v_to);
+    END IF;
+
+    INSERT INTO public."MetricRollupState" (resolution, "watermark", "updatedAt")
+    VALUES (v_level.resolution, GREATEST(v_from, v_to), NOW())
+    ON CONFLICT (resolution) DO UPDATE SET
+      "watermark" = GREATEST(public."MetricRollupState"."watermark", EXCLUDED."watermark"),
+      "updatedAt" = NOW();
+
+    v_finer_watermark := GREATEST(v_from, v_to);
+    v_result := v_result || jsonb_build_object(
+      v_level.resolution,
+      jsonb_build_object('to', GREATEST(v_from, v_to), 'rows', v_rows, 'caughtUp', v_to >= v_limit)
+    );
+  END LOOP;
+
+  RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retention: drop raw rows and fine buckets once they are rolled up into the
+-- next level and older than their retention window. 1-day buckets are kept.
+CREATE OR REPLACE FUNCTION public.prune_metrics(
+  p_raw_retention INTERVAL DEFAULT INTERVAL '2 days',
+  p_minute_retention INTERVAL DEFAULT INTERVAL '7 days',
+  p_hour_retention INTERVAL DEFAULT INTERVAL '90 days'
+) RETURNS JSONB AS $$
+DECLARE
+  v_watermarks JSONB;
+  v_raw INTEGER;
+  v_minute INTEGER;
+  v_hour INTEGER;
+BEGIN
+  SELECT COALESCE(jsonb_object_agg(resolution, "watermark"), '{}'::JSONB) INTO v_watermarks
+  FROM public."MetricRollupState";
+
+  DELETE FROM public."Metric"
+  WHERE timestamp < LEAST(NOW() - p_raw_retention, COALESCE((v_watermarks->>'1m')::TIMESTAMPTZ, '-infinity'));
+  GET DIAGNOSTICS v_raw = ROW_COUNT;
+
+  DELETE FROM public."MetricBucket"
+  WHERE resolution = '1m'
+    AND "bucketStart" < LEAST(NOW() - p_minute_retention, COALESCE((v_watermarks->>'1h')::TIMESTAMPTZ, '-infinity'));
+  GET DIAGNOSTICS v_minute = ROW_COUNT;
+
+  DELETE FROM public."MetricBucket"
+  WHERE resolution = '1h'
+    AND "bucketStart" < LEAST(NOW() - p_hour_retention, COALESCE((v_watermarks->>'1d')::TIMESTAMPTZ, '-infinity'));
+  GET DIAGNOSTICS v_hour = ROW_COUNT;
+
+  RETURN jsonb_build_object('raw', v_raw, '1m', v_minute, '1h', v_hour);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Merge the segments of a query plan (src/lib/metrics.ts planMetricSegments)
+-- into one row per minute/hour/day bucket.
+-- p_segments: [{ "source": "1d" | "1h" | "1m" | "raw", "from", "to" }]
+CREATE OR REPLACE FUNCTION public.summarize_metric_buckets(
+  p_name TEXT,
+  p_segments JSONB,
+  p_labels JSONB DEFAULT NULL
+) RETURNS TABLE (
+  bucket_start TIMESTAMP WITH TIME ZONE,
+  "count" BIGINT,
+  "sum" NUMERIC,
+  "min" NUMERIC,
+  "max" NUMERIC,
+  histogram JSONB
+) AS $$
+  WITH segments AS (
+    SELECT *
+    FROM jsonb_to_recordset(p_segments) AS s(source TEXT, "from" TIMESTAMP WITH TIME ZONE, "to" TIMESTAMP WITH TIME ZONE)
+  ),
+  src AS (
+    SELECT b."bucketStart" AS bucket_start, b."count", b."sum", b."min", b."max", b.histogram
+    FROM segments s
+    JOIN public."MetricBucket" b
+      ON b.resolution = s.source
+      AND b.name = p_name
+      AND b."bucketStart" >= s."from"
+      AND b."bucketStart" < s."to"
+    WHERE p_labels IS NULL OR b.labels @> p_labels
+    UNION ALL
+    SELECT
+      date_trunc('minute', m.timestamp, 'UTC'),
+      m."count",
+      m.value,
+      COALESCE(m."min", m.value),
+      COALESCE(m."max", m.value),
+      m.histogram
+    FROM segments s
+    JOIN public."Metric" m
+      ON s.source = 'raw'
+      AND m.name = p_name
+      AND m.timestamp >= s."from"
+      AND m.timestamp < s."to"
+    WHERE p_labels IS NULL OR m.labels @> p_labels
+  )
+  SELECT
+    bucket_start,
+    SUM("count")::BIGINT,
+    SUM("sum"),
+    MIN("min"),
+    MAX("max"),
+    public.metric_histogram_sum(histogram)
+  FROM src
+  GROUP BY bucket_start
+  ORDER BY bucket_start;
+$$ LANGUAGE sql STABLE;
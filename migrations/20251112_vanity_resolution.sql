@@ -0,0 +1,22 @@
+-- Vanity URL Resolution Migration
+-- Resolve a custom domain path (vanity URL or custom slug) to its QR code in one indexed query
+
+CREATE INDEX IF NOT EXISTS idx_vanity_url_domain_vanity
+  ON public."QrCodeVanityUrl"("domainId", "vanityUrl");
+
+CREATE INDEX IF NOT EXISTS idx_vanity_url_domain_slug
+  ON public."QrCodeVanityUrl"("domainId", "customSlug")
+  WHERE "customSlug" IS NOT NULL;
+
+-- QR code a path on a custom domain points to; vanity URLs take precedence over
+-- custom slugs. The destination itself is picked per scan (device / geo / A/B
+-- rules, expiry, scan limits) from the cached servable projection.
+CREATE OR REPLACE FUNCTION public.resolve_vanity_qr_code(p_domain_id TEXT, p_slug TEXT)
+RETURNS TEXT AS $$
+  SELECT v."qrCodeId"
+  FROM public."QrCodeVanityUrl" v
+  WHERE v."domainId" = p_domain_id
+    AND (v."vanityUrl" = p_slug OR v."customSlug" = p_slug)
+  ORDER BY (v."vanityUrl" = p_slug) DESC
+  LIMIT 1
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,18 @@
+-- Bulk QR Render Migration
+-- Progress reporting for running background jobs and a private bucket for the
+-- ZIP archives written by bulk_qr_render jobs (src/lib/bulk-render.ts)
+
+-- Latest progress reported by the worker holding the job
+ALTER TABLE public."BackgroundJob" ADD COLUMN IF NOT EXISTS "progress" JSONB;
+
+-- Archives are only handed out through signed URLs
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('qr-renders', 'qr-renders', false)
+ON CONFLICT (id) DO NOTHING;
+
+-- Failure rows are keyed by job and item so a retried job overwrites the rows
+-- of its earlier attempts instead of appending duplicates. Rows written by the
+-- bulk route leave both NULL and never conflict.
+ALTER TABLE public."QrCodeBulkResult" ADD COLUMN IF NOT EXISTS "jobId" TEXT;
+ALTER TABLE public."QrCodeBulkResult" ADD COLUMN IF NOT EXISTS "itemIndex" INTEGER;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_qrcode_bulk_result_job_item ON public."QrCodeBulkResult"("jobId", "itemIndex");
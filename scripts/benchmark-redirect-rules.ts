@@ -0,0 +1,56 @@
+#!/usr/bin/env tsx
+/**
+ * Benchmark the compiled redirect-rule engine by simulating N scans
+ * Usage: npm run benchmark:redirects -- [scans]
+ */
+
+import { compileRedirectRules, simulateRedirects, type RedirectContext } from '@/lib/redirect-rules'
+
+const scans = parseInt(process.argv[2] || '1000000', 10)
+
+const rules = compileRedirectRules({
+  url: 'https://example.com',
+  redirectUrl: null,
+  deviceRedirection: {
+    ios: 'https://example.com/ios',
+    android: 'https://example.com/android',
+  },
+  geoRedirection: {
+    cities: { Berlin: 'https://example.com/de/berlin' },
+    countries: { DE: 'https://example.com/de', FR: 'https://example.com/fr' },
+  },
+  abTestConfig: {
+    variants: {
+      control: { weight: 70 },
+      a: { url: 'https://example.com/a', weight: 20 },
+      b: { url: 'https://example.com/b', weight: 10 },
+    },
+  },
+})
+
+const contexts: RedirectContext[] = [
+  { userAgent: 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)', country: 'US' },
+  { userAgent: 'Mozilla/5.0 (Linux; Android 14; Pixel 8)', country: 'DE', city: 'Berlin' },
+  { userAgent: 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)', country: 'FR' },
+  { userAgent: 'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_0)', country: 'DE', city: 'Munich' },
+]
+
+function main() {
+  // Warm up the UA classifier and JIT before measuring
+  simulateRedirects(rules, contexts, 10000)
+
+  const result = simulateRedirects(rules, contexts, scans)
+
+  console.log(`🚀 Simulated ${result.scans.toLocaleString()} scans in ${result.durationMs.toFixed(1)}ms`)
+  console.log(`   ${result.scansPerSecond.toLocaleString()} scans/sec`)
+  console.log('\n📊 Destinations:')
+  for (const [url, count] of Object.entries(result.urls)) {
+    console.log(`   ${url}: ${count} (${((count / result.scans) * 100).toFixed(1)}%)`)
+  }
+  console.log('\n🧪 Variants:')
+  for (const [variant, count] of Object.entries(result.variants)) {
+    console.log(`   ${variant}: ${count} (${((count / result.scans) * 100).toFixed(1)}%)`)
+  }
+}
+
+main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env tsx
+/**
+ * Standalone background job worker
+ * Usage: npm run worker
+ * Configure with JOB_WORKER_* (see env.example). SIGTERM/SIGINT stop claiming
+ * and wait for running jobs before exiting.
+ */
+
+import { JobWorker, jobWorkerOptionsFromEnv } from '@/lib/job-worker'
+import { backgroundJobProcessors } from '@/lib/job-processors'
+
+const shutdownTimeoutMs = parseInt(process.env.JOB_WORKER_SHUTDOWN_TIMEOUT_MS || '30000', 10)
+
+const worker = new JobWorker({
+  ...jobWorkerOptionsFromEnv(),
+  processors: backgroundJobProcessors,
+})
+
+let shuttingDown = false
+async function shutdown(signal: string) {
+  if (shuttingDown) return
+  shuttingDown = true
+
+  console.log(`${signal} received, waiting for ${worker.getStats().running} running job(s)...`)
+  await worker.stop(shutdownTimeoutMs)
+  console.log('Worker stopped', worker.getStats())
+  process.exit(0)
+}
+
+process.on('SIGTERM', () => shutdown('SIGTERM'))
+process.on('SIGINT', () => shutdown('SIGINT'))
+
+console.log(`Job worker ${worker.workerId} started`)
+worker.start()
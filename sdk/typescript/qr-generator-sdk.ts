@@ -192,6 +192,7 @@ export class QRGeneratorClient {
       qrCodeId: string;
       webhookUrl: string;
       regenerateSecret?: boolean;
+      batch?: { maxBatchSize?: number; maxLingerMs?: number } | false;
     }): Promise<{ qrCodeId: string; webhookUrl: string; secret: string }> => {
       return this.request('POST', '/webhooks', data);
     },
@@ -7,6 +7,8 @@ import { NextResponse } from "next/server"
 import { getServerSession } from "next-auth/next"
 import { authOptions } from "@/lib/auth"
 import { supabaseAdmin } from "@/lib/supabase"
+import { getWebhookDispatcherStats } from "@/lib/webhook-outbox"
+import { getMetricSummary } from "@/lib/metrics"
 
 /**
  * Check if user is admin
@@ -152,20 +154,24 @@ export async function GET() {
       .limit(10)
     
     // Get system metrics (last hour)
-    const oneHourAgo = new Date()
+    const now = new Date()
+    const oneHourAgo = new Date(now)
     oneHourAgo.setHours(oneHourAgo.getHours() - 1)
     
-    const { data: recentMetrics } = await supabaseAdmin!
-      .from('RequestMetric')
-      .select('statusCode, responseTime')
-      .gte('createdAt', oneHourAgo.toISOString())
+    // Read from the metric rollup buckets (raw rows only for the last few minutes)
+    const [requests, errors, latency] = await Promise.all([
+      getMetricSummary('request_count', oneHourAgo, now),
+      getMetricSummary('error_count', oneHourAgo, now),
+      getMetricSummary('response_time', oneHourAgo, now),
+    ])
     
     const metrics = {
-      requestCount: recentMetrics?.length || 0,
-      errorCount: recentMetrics?.filter((m: { statusCode: number }) => m.statusCode >= 500).length || 0,
-      avgResponseTime: recentMetrics?.length
-        ? recentMetrics.reduce((sum: number, m: { responseTime: number | null }) => sum + (m.responseTime || 0), 0) / recentMetrics.length
-        : 0,
+      requestCount: requests.sum,
+      errorCount: errors.sum,
+      avgResponseTime: latency.avg,
+      p50ResponseTime: latency.p50,
+      p95ResponseTime: latency.p95,
+      p99ResponseTime: latency.p99,
     }
     
     return NextResponse.json({
@@ -182,6 +188,7 @@ export async function GET() {
           depth: webhookOutbox.pending + webhookOutbox.processing,
           ...webhookOutboxStatus,
           failures24h: webhookFailures24h || 0,
+          dispatcher: getWebhookDispatcherStats(),
         },
       },
       domainVerification: domainVerificationStatus,
@@ -2,6 +2,7 @@ import { NextRequest, NextResponse } from 'next/server'
 import { getServerSession } from 'next-auth/next'
 import { authOptions } from '@/lib/auth'
 import { supabaseAdmin } from '@/lib/supabase'
+import { invalidateApiKey } from '@/lib/api-keys'
 
 // GET - Get API key details
 export async function GET(
@@ -157,6 +158,9 @@ export async function PATCH(
       return NextResponse.json({ error: 'Failed to update API key' }, { status: 500 })
     }
 
+    // Scopes, expiry or revocation must apply to the next request
+    await invalidateApiKey(apiKey)
+
     const safeApiKey = {
       id: updatedKey.id,
       name: updatedKey.name,
@@ -225,6 +229,8 @@ export async function DELETE(
       return NextResponse.json({ error: 'Failed to delete API key' }, { status: 500 })
     }
 
+    await invalidateApiKey(apiKey)
+
     return NextResponse.json({ success: true })
   } catch (error) {
     console.error('Error in DELETE /api/api-keys/[id]:', error)
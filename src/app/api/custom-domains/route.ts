@@ -5,6 +5,7 @@ import { supabaseAdmin } from "@/lib/supabase"
 import crypto from 'crypto'
 import { verifyDomainOwnership } from "@/lib/domain-verification"
 import { manageSSLCertificate } from "@/lib/ssl-management"
+import { invalidateCustomDomain } from "@/lib/domain-resolution"
 
 // Custom domains management
 export async function POST(request: NextRequest) {
@@ -37,23 +38,33 @@ export async function POST(request: NextRequest) {
       )
     }
 
+    let response: NextResponse
     switch (action) {
       case 'add':
-        return await addCustomDomain(domain, session.user.id, { routingConfig, custom404Page, customExpiryPage })
+        response = await addCustomDomain(domain, session.user.id, { routingConfig, custom404Page, customExpiryPage })
+        break
       case 'verify':
-        return await verifyCustomDomain(domain, session.user.id)
+        response = await verifyCustomDomain(domain, session.user.id)
+        break
       case 'remove':
-        return await removeCustomDomain(domain, session.user.id)
+        response = await removeCustomDomain(domain, session.user.id)
+        break
       case 'update':
-        return await updateCustomDomain(domain, session.user.id, { routingConfig, custom404Page, customExpiryPage })
+        response = await updateCustomDomain(domain, session.user.id, { routingConfig, custom404Page, customExpiryPage })
+        break
       case 'check-status':
-        return await checkDomainStatus(domain, session.user.id)
+        response = await checkDomainStatus(domain, session.user.id)
+        break
       default:
         return NextResponse.json(
           { error: "Invalid action" },
           { status: 400 }
         )
     }
+
+    // Custom domain routing caches lookups (including misses) per host
+    invalidateCustomDomain(domain)
+    return response
   } catch (error) {
     console.error("Error managing custom domain:", error)
     return NextResponse.json(
@@ -271,12 +282,21 @@ async function verifyCustomDomain(domain: string, userId: string) {
 
 // Remove custom domain
 async function removeCustomDomain(domain: string, userId: string) {
-  // Check if domain is being used by any QR codes
-  const { data: qrCodesUsingDomain } = await supabaseAdmin!
-    .from('QrCode')
-    .select('id, title')
-    .eq('customDomain', domain)
+  const { data: customDomain } = await supabaseAdmin!
+    .from('QrCodeCustomDomain')
+    .select('id')
+    .eq('domain', domain)
     .eq('userId', userId)
+    .maybeSingle()
+
+  // Check if domain is being used by any QR codes (QrCode.customDomain holds the domain id)
+  const { data: qrCodesUsingDomain } = customDomain
+    ? await supabaseAdmin!
+      .from('QrCode')
+      .select('id, title')
+      .eq('customDomain', customDomain.id)
+      .eq('userId', userId)
+    : { data: null }
 
   if (qrCodesUsingDomain && qrCodesUsingDomain.length > 0) {
     return NextResponse.json(
@@ -40,7 +40,7 @@ export async function GET(
       )
     }
 
-    // Build date range query
+    // The domain counters are already one row per day, so every day is read from them
     let analyticsQuery = supabaseAdmin!
       .from('QrCodeDomainAnalytics')
       .select('*')
@@ -0,0 +1,35 @@
+import { NextRequest, NextResponse } from "next/server"
+import { getMetricsRegistry } from "@/lib/metrics-registry"
+
+// The registry lives in the Node.js server process
+export const runtime = 'nodejs'
+
+/**
+ * GET - Prometheus scrape endpoint
+ * Cumulative counters, gauges and histograms for this server process.
+ * Disabled (404) unless METRICS_TOKEN is set; scrapers send
+ * "Authorization: Bearer <token>".
+ */
+export async function GET(request: NextRequest) {
+  const metricsToken = process.env.METRICS_TOKEN
+  if (!metricsToken) {
+    return NextResponse.json(
+      { error: "Not found" },
+      { status: 404 }
+    )
+  }
+
+  if (request.headers.get('authorization') !== `Bearer ${metricsToken}`) {
+    return NextResponse.json(
+      { error: "Unauthorized" },
+      { status: 401 }
+    )
+  }
+
+  return new NextResponse(getMetricsRegistry().renderPrometheus(), {
+    headers: {
+      'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+      'Cache-Control': 'no-store',
+    },
+  })
+}
@@ -0,0 +1,21 @@
+import { NextRequest, NextResponse } from "next/server"
+import { serveQrImage } from "@/lib/qr-image"
+
+export const runtime = 'nodejs'
+
+// GET - Rendered PNG of a QR code (redirects to its content-addressed version)
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const { id } = await params
+    return await serveQrImage(request, id, 'png')
+  } catch (error) {
+    console.error("Error rendering QR code image:", error)
+    return NextResponse.json(
+      { error: "Internal server error" },
+      { status: 500 }
+    )
+  }
+}
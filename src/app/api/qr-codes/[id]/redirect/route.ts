@@ -0,0 +1,75 @@
+import { NextRequest, NextResponse } from "next/server"
+import { getErrorPage } from "@/lib/error-pages"
+import { processScanRedirect, getScanRequestContext } from "@/lib/scan-redirect"
+
+export const runtime = 'nodejs'
+export const dynamic = 'force-dynamic'
+
+// GET - Scan redirect: answer with a 302 to the QR code's destination.
+// Custom domain paths are rewritten here by the middleware (with their domainId).
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const { id } = await params
+    const domainId = request.nextUrl.searchParams.get('domainId') || undefined
+    const result = await processScanRedirect(id, getScanRequestContext(request))
+
+    switch (result.outcome) {
+      case 'redirect': {
+        const response = NextResponse.redirect(result.url, 302)
+        // Every scan has to reach the server to be counted and routed
+        response.headers.set('Cache-Control', 'private, no-store')
+        return response
+      }
+      case 'not_found':
+        return htmlResponse(await getErrorPage('404', {
+          qrCodeId: id,
+          domainId,
+          title: 'QR Code Not Found',
+          message: 'The QR code you are looking for could not be found.'
+        }), 404)
+      case 'invalid_url':
+        // The code exists but its destination can't be turned into a URL
+        return htmlResponse(await getErrorPage('404', {
+          qrCodeId: id,
+          domainId: domainId || result.qrCode.customDomain || undefined,
+          title: result.qrCode.title || 'QR Code Destination Invalid',
+          message: 'The destination of this QR code is not a valid link.'
+        }), 422)
+      case 'rate_limited': {
+        const response = new NextResponse('Too Many Requests', { status: 429 })
+        if (result.retryAfter) {
+          response.headers.set('Retry-After', String(result.retryAfter))
+        }
+        return response
+      }
+      default: {
+        const messages = {
+          inactive: 'This QR code is currently inactive.',
+          expired: 'This QR code has expired and is no longer available.',
+          scan_limit: 'This QR code has reached its scan limit and is no longer available.',
+        }
+        return htmlResponse(await getErrorPage('expired', {
+          qrCodeId: id,
+          domainId: domainId || result.qrCode.customDomain || undefined,
+          title: result.qrCode.title || undefined,
+          message: messages[result.outcome],
+          showQRInfo: true,
+          redirectUrl: result.qrCode.url
+        }), 403)
+      }
+    }
+  } catch (error) {
+    console.error("Error processing QR code redirect:", error)
+    return new NextResponse('Internal Server Error', { status: 500 })
+  }
+}
+
+function htmlResponse(html: string, status: number) {
+  return new NextResponse(html, {
+    status,
+    headers: { 'Content-Type': 'text/html', 'Cache-Control': 'private, no-store' }
+  })
+}
@@ -2,6 +2,7 @@ import { NextRequest, NextResponse } from "next/server"
 import { getServerSession } from "next-auth/next"
 import { authOptions } from "@/lib/auth"
 import { supabaseAdmin } from "@/lib/supabase"
+import { invalidateServableQrCode } from "@/lib/qr-resolution"
 
 // GET - Fetch specific QR code details
 export async function GET(
@@ -124,6 +125,8 @@ export async function PUT(
       )
     }
 
+    await invalidateServableQrCode(id)
+
     return NextResponse.json(updatedQrCode)
   } catch (error) {
     console.error("Error updating QR code:", error)
@@ -164,6 +167,8 @@ export async function DELETE(
       )
     }
 
+    await invalidateServableQrCode(id)
+
     return NextResponse.json({ success: true })
   } catch (error) {
     console.error("Error deleting QR code:", error)
@@ -1,8 +1,12 @@
 import { NextRequest, NextResponse } from "next/server"
 import { supabaseAdmin } from "@/lib/supabase"
-import { rateLimit } from "@/lib/rate-limit"
+import { rateLimit, applyRateLimitHeaders } from "@/lib/rate-limit"
 import { assertWithinMonthlyScanQuota } from "@/lib/entitlements"
 import { getErrorPage } from "@/lib/error-pages"
+import { resolveServableQrCode } from "@/lib/qr-resolution"
+import { ingestScan, getPendingScanCount } from "@/lib/scan-ingestion"
+import { getScanCount } from "@/lib/scan-counters"
+import { getScanAnalytics, type ScanAnalytics } from "@/lib/scan-analytics"
 
 // Edge caching configuration for public scan endpoints
 export const runtime = 'nodejs'
@@ -31,17 +35,16 @@ export async function POST(
     const ip = (ipAddress || ipHeader || 'unknown').split(',')[0].trim()
     const limit = await rateLimit({ key: `ip:${ip}`, route: '/api/qr-codes/[id]/scan:POST', windowSeconds: 10, maxRequests: 30 })
     if (!limit.allowed) {
-      return NextResponse.json({ error: 'rate_limited', retryAfter: limit.retryAfter }, { status: 429 })
+      return applyRateLimitHeaders(
+        NextResponse.json({ error: 'rate_limited', retryAfter: limit.retryAfter }, { status: 429 }),
+        limit
+      )
     }
 
-    // First, check if the QR code exists and is active
-    const { data: qrCode, error: qrError } = await supabaseAdmin!
-      .from('QrCode')
-      .select('*')
-      .eq('id', id)
-      .single()
+    // First, check if the QR code exists and is active (served from the resolution cache)
+    const qrCode = await resolveServableQrCode(id)
 
-    if (qrError || !qrCode) {
+    if (!qrCode) {
       // Get custom 404 page or return default
       const notFoundPage = await getErrorPage('404', {
         qrCodeId: id,
@@ -81,22 +84,25 @@ export async function POST(
       })
     }
 
-    // Check if max scans limit has been reached
-    if (qrCode.maxScans && qrCode.scanCount >= qrCode.maxScans) {
-      // Get custom expiry page or return default
-      const expiryPage = await getErrorPage('expired', {
-        qrCodeId: id,
-        domainId: qrCode.customDomain || undefined,
-        title: qrCode.title || undefined,
-        message: 'This QR code has reached its scan limit and is no longer available.',
-        showQRInfo: true,
-        redirectUrl: qrCode.url
-      })
-      
-      return new NextResponse(expiryPage, {
-        status: 403,
-        headers: { 'Content-Type': 'text/html' }
-      })
+    // Check if max scans limit has been reached (sharded total plus locally buffered scans)
+    if (qrCode.maxScans) {
+      const totalScans = await getScanCount(id, qrCode.scanCount) + getPendingScanCount(id)
+      if (totalScans >= qrCode.maxScans) {
+        // Get custom expiry page or return default
+        const expiryPage = await getErrorPage('expired', {
+          qrCodeId: id,
+          domainId: qrCode.customDomain || undefined,
+          title: qrCode.title || undefined,
+          message: 'This QR code has reached its scan limit and is no longer available.',
+          showQRInfo: true,
+          redirectUrl: qrCode.url
+        })
+
+        return new NextResponse(expiryPage, {
+          status: 403,
+          headers: { 'Content-Type': 'text/html' }
+        })
+      }
     }
 
     // Check owner's monthly scan quota before recording
@@ -109,11 +115,14 @@ export async function POST(
       return NextResponse.json({ error: code, message }, { status })
     }
 
-    // Record the scan
-    const { data: scan, error: scanError } = await supabaseAdmin!
-      .from('QrCodeScan')
-      .insert({
+    // Record the scan through the write-behind buffer; the row and the
+    // counter increment are persisted in the next batch
+    const scanId = crypto.randomUUID()
+    try {
+      await ingestScan({
+        id: scanId,
         qrCodeId: id,
+        scannedAt: new Date().toISOString(),
         userAgent,
         ipAddress,
         country,
@@ -122,10 +131,7 @@ export async function POST(
         browser,
         os
       })
-      .select()
-      .single()
-
-    if (scanError) {
+    } catch (scanError) {
       console.error("Error recording scan:", scanError)
       return NextResponse.json(
         { error: "Failed to record scan" },
@@ -133,19 +139,6 @@ export async function POST(
       )
     }
 
-    // Update scan count and last scanned timestamp
-    const { error: updateError } = await supabaseAdmin!
-      .from('QrCode')
-      .update({
-        scanCount: qrCode.scanCount + 1,
-        lastScannedAt: new Date().toISOString()
-      })
-      .eq('id', id)
-
-    if (updateError) {
-      console.error("Error updating scan count:", updateError)
-    }
-
     // Check scan threshold (async, don't block response)
     try {
       const { checkScanThreshold } = await import('@/lib/threshold-monitoring')
@@ -162,7 +155,7 @@ export async function POST(
     const response = NextResponse.json({
       success: true,
       redirectUrl,
-      scanId: scan.id
+      scanId
     })
 
     // Add cache headers for edge caching
@@ -170,7 +163,7 @@ export async function POST(
     response.headers.set('CDN-Cache-Control', 'public, s-maxage=60')
     response.headers.set('Vercel-CDN-Cache-Control', 'public, s-maxage=60')
 
-    return response
+    return applyRateLimitHeaders(response, limit)
   } catch (error) {
     console.error("Error processing QR code scan:", error)
     return NextResponse.json(
@@ -201,48 +194,18 @@ export async function GET(
       )
     }
 
-    // Get scan analytics
-    const { data: scans, error: scansError } = await supabaseAdmin!
-      .from('QrCodeScan')
-      .select('*')
-      .eq('qrCodeId', id)
-      .order('scannedAt', { ascending: false })
-
-    if (scansError) {
-      console.error("Error fetching scans:", scansError)
+    // Aggregate scans in the database and fetch only the latest few rows
+    let analytics: ScanAnalytics
+    try {
+      analytics = await getScanAnalytics(id)
+    } catch (analyticsError) {
+      console.error("Error fetching scans:", analyticsError)
       return NextResponse.json(
         { error: "Failed to fetch analytics" },
         { status: 500 }
       )
     }
 
-    // Calculate analytics
-    const totalScans = scans.length
-    const uniqueDevices = new Set(scans.map(scan => scan.device)).size
-    const uniqueCountries = new Set(scans.map(scan => scan.country).filter(Boolean)).size
-    const uniqueCities = new Set(scans.map(scan => scan.city).filter(Boolean)).size
-
-    // Group scans by date
-    const scansByDate = scans.reduce((acc, scan) => {
-      const date = new Date(scan.scannedAt).toISOString().split('T')[0]
-      acc[date] = (acc[date] || 0) + 1
-      return acc
-    }, {} as Record<string, number>)
-
-    // Group scans by device
-    const scansByDevice = scans.reduce((acc, scan) => {
-      acc[scan.device || 'Unknown'] = (acc[scan.device || 'Unknown'] || 0) + 1
-      return acc
-    }, {} as Record<string, number>)
-
-    // Group scans by country
-    const scansByCountry = scans.reduce((acc, scan) => {
-      if (scan.country) {
-        acc[scan.country] = (acc[scan.country] || 0) + 1
-      }
-      return acc
-    }, {} as Record<string, number>)
-
     const normalizeColor = (color: string | null, fallback: string) => {
       if (!color) return fallback
       return color.startsWith('#') ? color : `#${color.replace(/^#/, '')}`
@@ -255,7 +218,7 @@ export async function GET(
         url: qrCode.url,
         isDynamic: qrCode.isDynamic,
         isActive: qrCode.isActive,
-        scanCount: qrCode.scanCount,
+        scanCount: await getScanCount(id, qrCode.scanCount),
         createdAt: qrCode.createdAt,
         lastScannedAt: qrCode.lastScannedAt,
         dynamicContent: qrCode.dynamicContent,
@@ -273,16 +236,7 @@ export async function GET(
         hasWatermark: qrCode.hasWatermark,
         logoUrl: qrCode.logoUrl
       },
-      analytics: {
-        totalScans,
-        uniqueDevices,
-        uniqueCountries,
-        uniqueCities,
-        scansByDate,
-        scansByDevice,
-        scansByCountry,
-        recentScans: scans.slice(0, 10)
-      }
+      analytics
     })
   } catch (error) {
     console.error("Error fetching QR code analytics:", error)
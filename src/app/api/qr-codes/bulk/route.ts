@@ -2,6 +2,10 @@ import { NextRequest, NextResponse } from "next/server"
 import { getServerSession } from "next-auth/next"
 import { authOptions } from "@/lib/auth"
 import { supabaseAdmin } from "@/lib/supabase"
+import { invalidateServableQrCode } from "@/lib/qr-resolution"
+import { getScanSummaries } from "@/lib/scan-analytics"
+import { createBackgroundJob } from "@/lib/background-jobs"
+import { bulkQrCodeUpdateSchema } from "@/lib/validation"
 
 // Bulk QR code operations
 export async function POST(request: NextRequest) {
@@ -17,13 +21,13 @@ export async function POST(request: NextRequest) {
 
     const body = await request.json()
     const { 
-      operation, // 'create', 'update', 'delete', 'export'
+      operation, // 'create', 'update', 'delete', 'export', 'render'
       qrCodes, // Array of QR code data
       groupName
     } = body
 
     // Validate operation type
-    const validOperations = ['create', 'update', 'delete', 'export']
+    const validOperations = ['create', 'update', 'delete', 'export', 'render']
     if (!validOperations.includes(operation)) {
       return NextResponse.json(
         { error: "Invalid operation type" },
@@ -52,13 +56,41 @@ export async function POST(request: NextRequest) {
       )
     }
 
+    // Rendering runs as a background job that writes a ZIP archive to storage
+    if (operation === 'render') {
+      const job = await createBackgroundJob('bulk_qr_render', {
+        userId: session.user.id,
+        bulkGroupId: bulkGroup.id,
+        qrCodeIds: (qrCodes as Array<{ id?: unknown }>)
+          .map(qrCode => qrCode.id)
+          .filter((id): id is string => typeof id === 'string'),
+        format: body.format === 'svg' ? 'svg' : 'png',
+        size: body.size,
+        scale: body.scale,
+        origin: request.nextUrl.origin,
+      })
+
+      return NextResponse.json({
+        success: true,
+        bulkGroupId: bulkGroup.id,
+        jobId: job.id,
+        message: `Bulk ${operation} operation queued`
+      })
+    }
+
+    // Items that can't be applied are reported now and recorded as failed outcomes
+    const { items, rejected } = operation === 'create'
+      ? { items: qrCodes, rejected: [] }
+      : prepareBulkItems(operation, qrCodes)
+
     // Process bulk operation asynchronously
-    processBulkOperation(bulkGroup.id, operation, qrCodes, session.user.id)
+    processBulkOperation(bulkGroup.id, operation, items, rejected, session.user.id)
 
     return NextResponse.json({
       success: true,
       bulkGroupId: bulkGroup.id,
-      message: `Bulk ${operation} operation started`
+      message: `Bulk ${operation} operation started`,
+      failedItems: rejected.map(({ index, qrCodeId, error }) => ({ index, qrCodeId, error }))
     })
   } catch (error) {
     console.error("Error processing bulk operation:", error)
@@ -100,6 +132,28 @@ export async function GET(request: NextRequest) {
         )
       }
 
+      // Per-item outcomes live in QrCodeBulkResult; page with ?includeResults=true&afterResultId=N
+      if (searchParams.get('includeResults') === 'true') {
+        const afterResultId = parseInt(searchParams.get('afterResultId') || '0', 10) || 0
+        const { data: itemResults, error: resultsError } = await supabaseAdmin!
+          .from('QrCodeBulkResult')
+          .select('id, qrCodeId, status, error, data, createdAt')
+          .eq('bulkGroupId', bulkGroupId)
+          .gt('id', afterResultId)
+          .order('id', { ascending: true })
+          .limit(1000)
+
+        if (resultsError) {
+          console.error("Error fetching bulk results:", resultsError)
+          return NextResponse.json(
+            { error: "Failed to fetch bulk results" },
+            { status: 500 }
+          )
+        }
+
+        return NextResponse.json({ ...bulkGroup, itemResults })
+      }
+
       return NextResponse.json(bulkGroup)
     } else {
       // Get all bulk groups for user
@@ -129,25 +183,85 @@ export async function GET(request: NextRequest) {
   }
 }
 
+// Items per set-based statement; progress is written once per chunk
+const BULK_CHUNK_SIZE = 500
+
+type BulkItemResult = {
+  qrCodeId: string | null
+  status: 'succeeded' | 'failed'
+  error?: string
+  data?: unknown
+}
+
+type BulkItem = Record<string, unknown> & { id: string }
+
+type RejectedBulkItem = BulkItemResult & { index: number; status: 'failed'; error: string }
+
+// Split update/delete/export items into ones to apply and ones rejected up front:
+// missing ids, ids listed more than once (which one should win is ambiguous) and
+// update values that would fail bulk_update_qr_codes' casts for the whole chunk
+function prepareBulkItems(operation: string, qrCodes: Array<Record<string, unknown>>) {
+  const occurrences = new Map<string, number>()
+  for (const qrCodeData of qrCodes) {
+    if (typeof qrCodeData.id === 'string') {
+      occurrences.set(qrCodeData.id, (occurrences.get(qrCodeData.id) || 0) + 1)
+    }
+  }
+
+  const items: BulkItem[] = []
+  const rejected: RejectedBulkItem[] = []
+  qrCodes.forEach((qrCodeData, index) => {
+    const reject = (error: string) => rejected.push({
+      index,
+      qrCodeId: typeof qrCodeData.id === 'string' ? qrCodeData.id : null,
+      status: 'failed',
+      error,
+      data: qrCodeData
+    })
+
+    if (typeof qrCodeData.id !== 'string') {
+      return reject(`QR code id is required for ${operation} operation`)
+    }
+    if (occurrences.get(qrCodeData.id)! > 1) {
+      return reject('Duplicate QR code id in request')
+    }
+    if (operation !== 'update') {
+      items.push(qrCodeData as BulkItem)
+      return
+    }
+
+    const parsed = bulkQrCodeUpdateSchema.safeParse(qrCodeData)
+    if (!parsed.success) {
+      return reject(parsed.error.issues
+        .map(issue => `${issue.path.join('.') || 'item'}: ${issue.message}`)
+        .join('; '))
+    }
+    items.push(parsed.data as BulkItem)
+  })
+
+  return { items, rejected }
+}
+
 // Process bulk operation asynchronously
 async function processBulkOperation(
   bulkGroupId: string, 
   operation: string, 
   qrCodes: Array<Record<string, unknown>>, 
+  rejected: RejectedBulkItem[],
   userId: string
 ) {
-  const results = {
-    successful: [] as Array<Record<string, unknown>>,
-    failed: [] as Array<Record<string, unknown>>,
-    errors: [] as Array<{ qrCode: Record<string, unknown>; error: string }>
-  }
-
   let processedCount = 0
-  let failedCount = 0
+  let failedCount = rejected.length
 
   try {
     // Handle bulk create with atomic transaction
     if (operation === 'create') {
+      const results = {
+        successful: [] as Array<Record<string, unknown>>,
+        failed: [] as Array<Record<string, unknown>>,
+        errors: [] as Array<{ qrCode: Record<string, unknown>; error: string }>
+      }
+
       try {
         // Use atomic transaction for all QR codes at once
         const { data: bulkResult, error: bulkError } = await supabaseAdmin!
@@ -200,52 +314,21 @@ async function processBulkOperation(
       }
     }
     
-    // Handle other operations one by one
-    for (const qrCodeData of qrCodes) {
-      try {
-        let result = null
-
-        switch (operation) {
-          case 'create':
-            // This case is already handled above
-            break
-          case 'update': {
-            if (typeof qrCodeData.id !== 'string') {
-              throw new Error('QR code id is required for update operation')
-            }
-            result = await updateBulkQRCode(qrCodeData as Record<string, unknown> & { id: string }, userId)
-            break
-          }
-          case 'delete': {
-            if (typeof qrCodeData.id !== 'string') {
-              throw new Error('QR code id is required for delete operation')
-            }
-            result = await deleteBulkQRCode(qrCodeData.id, userId)
-            break
-          }
-          case 'export': {
-            if (typeof qrCodeData.id !== 'string') {
-              throw new Error('QR code id is required for export operation')
-            }
-            result = await exportBulkQRCode(qrCodeData as Record<string, unknown> & { id: string }, userId)
-            break
-          }
-        }
+    await appendBulkResults(bulkGroupId, rejected)
+
+    // Handle other operations in set-based chunks
+    for (let start = 0; start < qrCodes.length; start += BULK_CHUNK_SIZE) {
+      const outcomes = await processBulkChunk(operation, qrCodes.slice(start, start + BULK_CHUNK_SIZE) as BulkItem[], userId)
 
-        if (result) {
-          results.successful.push(result)
+      // Per-item outcomes are appended, never rewritten
+      await appendBulkResults(bulkGroupId, outcomes)
+
+      for (const outcome of outcomes) {
+        if (outcome.status === 'succeeded') {
           processedCount++
         } else {
-          results.failed.push(qrCodeData)
           failedCount++
         }
-      } catch (error) {
-        results.failed.push(qrCodeData)
-        results.errors.push({
-          qrCode: qrCodeData,
-          error: error instanceof Error ? error.message : 'Unknown error'
-        })
-        failedCount++
       }
 
       // Update progress
@@ -254,7 +337,7 @@ async function processBulkOperation(
         .update({
           processedCount,
           failedCount,
-          results
+          updatedAt: new Date().toISOString()
         })
         .eq('id', bulkGroupId)
     }
@@ -266,12 +349,12 @@ async function processBulkOperation(
         status: 'completed',
         completedAt: new Date().toISOString(),
         processedCount,
-        failedCount,
-        results
+        failedCount
       })
       .eq('id', bulkGroupId)
 
-  } catch {
+  } catch (error) {
+    console.error("Error processing bulk operation:", error)
     // Mark as failed
     await supabaseAdmin!
       .from('QrCodeBulkGroup')
@@ -279,106 +362,148 @@ async function processBulkOperation(
         status: 'failed',
         completedAt: new Date().toISOString(),
         processedCount,
-        failedCount,
-        results
+        failedCount
       })
       .eq('id', bulkGroupId)
   }
 }
 
+// Run one chunk of update/delete/export as a single statement and report per-item outcomes
+async function processBulkChunk(
+  operation: string,
+  items: BulkItem[],
+  userId: string
+): Promise<BulkItemResult[]> {
+  if (items.length === 0) {
+    return []
+  }
+
+  const ids = items.map(item => item.id)
+  try {
+    let succeeded: Map<string, unknown>
+
+    switch (operation) {
+      case 'update':
+        succeeded = await updateBulkQRCodes(items, userId)
+        break
+      case 'delete':
+        succeeded = await deleteBulkQRCodes(ids, userId)
+        break
+      case 'export':
+        succeeded = await exportBulkQRCodes(ids, userId)
+        break
+      default:
+        throw new Error(`Unsupported bulk operation: ${operation}`)
+    }
+
+    return ids.map((id): BulkItemResult => succeeded.has(id)
+      ? { qrCodeId: id, status: 'succeeded', data: succeeded.get(id) }
+      : { qrCodeId: id, status: 'failed', error: 'QR code not found or access denied' })
+  } catch (error) {
+    // A statement that still fails is retried item by item so only the offending items fail
+    if (operation === 'update' && items.length > 1) {
+      const outcomes: BulkItemResult[] = []
+      for (const item of items) {
+        outcomes.push(...await processBulkChunk(operation, [item], userId))
+      }
+      return outcomes
+    }
+
+    const message = error instanceof Error ? error.message : 'Unknown error'
+    return ids.map((id): BulkItemResult => ({ qrCodeId: id, status: 'failed', error: message }))
+  }
+}
+
+// Append per-item outcomes for a chunk
+async function appendBulkResults(bulkGroupId: string, outcomes: BulkItemResult[]) {
+  if (outcomes.length === 0) return
+
+  const { error } = await supabaseAdmin!
+    .from('QrCodeBulkResult')
+    .insert(outcomes.map(outcome => ({
+      bulkGroupId,
+      qrCodeId: outcome.qrCodeId,
+      status: outcome.status,
+      error: outcome.error || null,
+      data: outcome.data ?? null
+    })))
+
+  if (error) {
+    // Outcomes are informational; the operation itself already ran
+    console.error("Error recording bulk results:", error)
+  }
+}
+
 // Note: Bulk create now uses atomic transaction function
 // See: bulk_create_qr_codes_with_credits in migrations/20250111_atomic_qr_creation.sql
 
-// Bulk update QR codes
-async function updateBulkQRCode(qrCodeData: Record<string, unknown> & { id: string }, userId: string) {
-  const { data: qrCode, error } = await supabaseAdmin!
-    .from('QrCode')
-    .update({
-      title: qrCodeData.title,
-      url: qrCodeData.url,
-      dynamicContent: qrCodeData.dynamicContent,
-      redirectUrl: qrCodeData.redirectUrl,
-      expiresAt: qrCodeData.expiresAt,
-      maxScans: qrCodeData.maxScans,
-      foregroundColor: qrCodeData.foregroundColor,
-      backgroundColor: qrCodeData.backgroundColor,
-      dotType: qrCodeData.dotType,
-      cornerType: qrCodeData.cornerType,
-      hasWatermark: qrCodeData.hasWatermark,
-      deviceRedirection: qrCodeData.deviceRedirection,
-      geoRedirection: qrCodeData.geoRedirection,
-      marketingPixels: qrCodeData.marketingPixels,
-      abTestConfig: qrCodeData.abTestConfig,
-      webhookUrl: qrCodeData.webhookUrl,
-      customDomain: qrCodeData.customDomain,
-      updatedAt: new Date().toISOString()
+// Bulk update QR codes (one statement per chunk, see bulk_update_qr_codes)
+// Items are already reduced to the updatable fields by bulkQrCodeUpdateSchema
+async function updateBulkQRCodes(updates: BulkItem[], userId: string) {
+  const { data, error } = await supabaseAdmin!
+    .rpc('bulk_update_qr_codes', {
+      p_user_id: userId,
+      p_updates: updates
     })
-    .eq('id', qrCodeData.id)
-    .eq('userId', userId)
-    .select()
-    .single()
 
   if (error) {
-    throw new Error(`Failed to update QR code: ${error.message}`)
+    throw new Error(`Failed to update QR codes: ${error.message}`)
   }
 
-  return qrCode
+  const updatedIds = ((data || []) as Array<{ id: string }>).map(row => row.id)
+  await invalidateServableQrCode(updatedIds)
+
+  return new Map<string, unknown>(updatedIds.map(id => [id, { id, updated: true }]))
 }
 
 // Bulk delete QR codes
-async function deleteBulkQRCode(qrCodeId: string, userId: string) {
-  const { error } = await supabaseAdmin!
+async function deleteBulkQRCodes(qrCodeIds: string[], userId: string) {
+  const { data, error } = await supabaseAdmin!
     .from('QrCode')
     .delete()
-    .eq('id', qrCodeId)
+    .in('id', qrCodeIds)
     .eq('userId', userId)
+    .select('id')
 
   if (error) {
-    throw new Error(`Failed to delete QR code: ${error.message}`)
+    throw new Error(`Failed to delete QR codes: ${error.message}`)
   }
 
-  return { id: qrCodeId, deleted: true }
+  const deletedIds = ((data || []) as Array<{ id: string }>).map(row => row.id)
+  await invalidateServableQrCode(deletedIds)
+
+  return new Map<string, unknown>(deletedIds.map(id => [id, { id, deleted: true }]))
 }
 
 // Bulk export QR codes
-async function exportBulkQRCode(qrCodeData: Record<string, unknown> & { id: string }, userId: string) {
-  // Get full QR code data with analytics
-  const { data: qrCode, error } = await supabaseAdmin!
+async function exportBulkQRCodes(qrCodeIds: string[], userId: string) {
+  const { data: qrCodes, error } = await supabaseAdmin!
     .from('QrCode')
-    .select(`
-      *,
-      QrCodeScan(*)
-    `)
-    .eq('id', qrCodeData.id)
+    .select('*')
+    .in('id', qrCodeIds)
     .eq('userId', userId)
-    .single()
 
   if (error) {
-    throw new Error(`Failed to export QR code: ${error.message}`)
+    throw new Error(`Failed to export QR codes: ${error.message}`)
   }
 
-  // Calculate analytics summary
-  const scans = qrCode.QrCodeScan || []
-  const analytics = {
-    totalScans: scans.length,
-    uniqueDevices: new Set(scans.map((s: { device?: string }) => s.device)).size,
-    uniqueCountries: new Set(scans.map((s: { country?: string }) => s.country).filter(Boolean)).size,
-    uniqueCities: new Set(scans.map((s: { city?: string }) => s.city).filter(Boolean)).size,
-    scansByDevice: scans.reduce((acc: Record<string, number>, scan: { device?: string }) => {
-      acc[scan.device || 'Unknown'] = (acc[scan.device || 'Unknown'] || 0) + 1
-      return acc
-    }, {}),
-    scansByCountry: scans.reduce((acc: Record<string, number>, scan: { country?: string }) => {
-      if (scan.country) {
-        acc[scan.country] = (acc[scan.country] || 0) + 1
-      }
-      return acc
-    }, {})
-  }
-
-  return {
-    ...qrCode,
-    analytics,
-    exportDate: new Date().toISOString()
-  }
+  // Analytics summaries from the daily rollups plus today's raw scans
+  const summaries = await getScanSummaries((qrCodes || []).map(qrCode => qrCode.id as string))
+  const exportDate = new Date().toISOString()
+
+  return new Map<string, unknown>((qrCodes || []).map(qrCode => {
+    const summary = summaries.get(qrCode.id)
+    return [qrCode.id as string, {
+      ...qrCode,
+      analytics: {
+        totalScans: summary?.totalScans || 0,
+        uniqueDevices: summary?.uniqueDevices || 0,
+        uniqueCountries: summary?.uniqueCountries || 0,
+        uniqueCities: summary?.uniqueCities || 0,
+        scansByDevice: summary?.scansByDevice || {},
+        scansByCountry: summary?.scansByCountry || {}
+      },
+      exportDate
+    }]
+  }))
 }
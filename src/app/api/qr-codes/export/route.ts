@@ -2,6 +2,8 @@ import { NextRequest, NextResponse } from "next/server"
 import { getServerSession } from "next-auth/next"
 import { authOptions } from "@/lib/auth"
 import { supabaseAdmin } from "@/lib/supabase"
+import { getScanSummaries, emptyScanSummary, type ScanSummary } from "@/lib/scan-analytics"
+import { iterateScanPages, createExportStream, toCsvLine, type ExportScanRow, type ExportDateRange } from "@/lib/scan-export"
 
 // Analytics export endpoints
 export async function POST(request: NextRequest) {
@@ -18,10 +20,11 @@ export async function POST(request: NextRequest) {
     const body = await request.json()
     const { 
       qrCodeIds, // Array of QR code IDs to export
-      format = 'json', // 'json', 'csv', 'xlsx'
+      format = 'json', // 'json', 'csv', 'xlsx', 'ndjson'
       dateRange, // { start: '2024-01-01', end: '2024-12-31' }
       includeAnalytics = true,
-      includeScans = false
+      includeScans = false,
+      stream = false // Stream CSV / NDJSON rows instead of building the file in memory
     } = body
 
     if (!qrCodeIds || !Array.isArray(qrCodeIds) || qrCodeIds.length === 0) {
@@ -31,26 +34,18 @@ export async function POST(request: NextRequest) {
       )
     }
 
-    // Get QR codes with analytics
+    // JSON and XLSX are whole documents and can only be built in memory
+    if (stream && format !== 'csv' && format !== 'ndjson') {
+      return NextResponse.json(
+        { error: "Streaming exports support the csv and ndjson formats" },
+        { status: 400 }
+      )
+    }
+
+    // Get QR codes (scans are aggregated separately)
     const { data: qrCodes, error: qrError } = await supabaseAdmin!
       .from('QrCode')
-      .select(`
-        *,
-        QrCodeScan(
-          id,
-          scannedAt,
-          userAgent,
-          ipAddress,
-          country,
-          city,
-          device,
-          browser,
-          os,
-          latitude,
-          longitude,
-          abTestVariant
-        )
-      `)
+      .select('*')
       .in('id', qrCodeIds)
       .eq('userId', session.user.id)
 
@@ -62,22 +57,50 @@ export async function POST(request: NextRequest) {
       )
     }
 
-    // Filter scans by date range if provided
-    let filteredQrCodes = qrCodes
-    if (dateRange && dateRange.start && dateRange.end) {
-      filteredQrCodes = qrCodes.map(qrCode => ({
-        ...qrCode,
-        QrCodeScan: qrCode.QrCodeScan.filter((scan: { scannedAt: string }) => {
-          const scanDate = new Date(scan.scannedAt)
-          const startDate = new Date(dateRange.start)
-          const endDate = new Date(dateRange.end)
-          return scanDate >= startDate && scanDate <= endDate
-        })
-      }))
+    // Date range is an inclusive range of UTC days
+    const range = dateRange && dateRange.start && dateRange.end
+      ? { start: String(dateRange.start).slice(0, 10), end: String(dateRange.end).slice(0, 10) }
+      : undefined
+    const ownedIds = qrCodes.map(qrCode => qrCode.id as string)
+
+    // Raw scans are part of the analytics, in every output mode
+    const withScans = Boolean(includeAnalytics && includeScans)
+
+    // Streaming mode: rows are written as pages of scans arrive
+    if (stream || format === 'ndjson') {
+      const streamFormat = format === 'csv' ? 'csv' : 'ndjson'
+      const lines = streamFormat === 'csv'
+        ? streamCSV(qrCodes, range, includeAnalytics, withScans)
+        : streamNDJSON(qrCodes, range, includeAnalytics, withScans)
+
+      // No Content-Length: the body is chunked as it is produced
+      return new NextResponse(createExportStream(lines), {
+        status: 200,
+        headers: {
+          'Content-Type': streamFormat === 'csv' ? 'text/csv; charset=utf-8' : 'application/x-ndjson; charset=utf-8',
+          'Content-Disposition': `attachment; filename="qr-codes-analytics-${new Date().toISOString().split('T')[0]}.${streamFormat}"`,
+          'Cache-Control': 'no-store'
+        }
+      })
+    }
+
+    // Summaries come from the daily rollups for closed days and raw scans for today
+    const summaries = includeAnalytics ? await getScanSummaries(ownedIds, range) : new Map<string, ScanSummary>()
+
+    // Raw scans are only loaded when they are part of the export
+    const scansByQrCode = new Map<string, ExportScan[]>()
+    if (withScans && ownedIds.length > 0) {
+      for await (const page of iterateScanPages(ownedIds, { range })) {
+        for (const scan of page) {
+          const list = scansByQrCode.get(scan.qrCodeId) || []
+          list.push(scan)
+          scansByQrCode.set(scan.qrCodeId, list)
+        }
+      }
     }
 
     // Generate export data
-    const exportData = generateExportData(filteredQrCodes, includeAnalytics, includeScans)
+    const exportData = generateExportData(qrCodes, summaries, scansByQrCode, includeAnalytics, withScans)
 
     // Generate file based on format
     let fileContent: string | Buffer
@@ -119,7 +142,7 @@ export async function POST(request: NextRequest) {
   }
 }
 
-type QrCodeWithScans = {
+type ExportQrCode = {
   id: string
   title: string
   url: string
@@ -129,22 +152,96 @@ type QrCodeWithScans = {
   lastScannedAt?: string
   customDomain?: string
   redirectUrl?: string
-  QrCodeScan?: Array<{
-    scannedAt: string
-    device?: string
-    browser?: string
-    os?: string
-    country?: string
-    city?: string
-    abTestVariant?: string
-  }>
+}
+
+type ExportScan = ExportScanRow
+
+const SCAN_CSV_HEADERS = [
+  'QR Code ID',
+  'QR Code Title',
+  'Scanned At',
+  'Device',
+  'Browser',
+  'OS',
+  'Country',
+  'City',
+  'AB Test Variant'
+]
+
+// Streamed CSV: one line per scan, or one summary line per QR code when scans are not included
+async function* streamCSV(
+  qrCodes: ExportQrCode[],
+  range: ExportDateRange | undefined,
+  includeAnalytics: boolean,
+  includeScans: boolean
+): AsyncGenerator<string> {
+  if (!includeScans) {
+    yield toCsvLine(CSV_HEADERS)
+    for (const qrCode of qrCodes) {
+      const summaries = includeAnalytics ? await getScanSummaries([qrCode.id], range) : new Map<string, ScanSummary>()
+      const [record] = generateExportData([qrCode], summaries, new Map(), includeAnalytics, false)
+      yield toCsvLine(toCSVFields(record))
+    }
+    return
+  }
+
+  const titles = new Map(qrCodes.map(qrCode => [qrCode.id, qrCode.title] as const))
+  yield toCsvLine(SCAN_CSV_HEADERS)
+  for await (const page of iterateScanPages(qrCodes.map(qrCode => qrCode.id), { range })) {
+    yield page.map(scan => toCsvLine([
+      scan.qrCodeId,
+      titles.get(scan.qrCodeId),
+      scan.scannedAt,
+      scan.device,
+      scan.browser,
+      scan.os,
+      scan.country,
+      scan.city,
+      scan.abTestVariant
+    ])).join('')
+  }
+}
+
+// Streamed NDJSON: a "qrCode" record per QR code followed by its "scan" records
+async function* streamNDJSON(
+  qrCodes: ExportQrCode[],
+  range: ExportDateRange | undefined,
+  includeAnalytics: boolean,
+  includeScans: boolean
+): AsyncGenerator<string> {
+  for (const qrCode of [...qrCodes].sort((a, b) => a.id.localeCompare(b.id))) {
+    const summaries = includeAnalytics ? await getScanSummaries([qrCode.id], range) : new Map<string, ScanSummary>()
+    const [record] = generateExportData([qrCode], summaries, new Map(), includeAnalytics, false)
+    yield JSON.stringify({ type: 'qrCode', ...record }) + '\n'
+
+    if (includeScans) {
+      for await (const page of iterateScanPages([qrCode.id], { range })) {
+        yield page.map(scan => JSON.stringify({
+          type: 'scan',
+          qrCodeId: scan.qrCodeId,
+          scannedAt: scan.scannedAt,
+          device: scan.device,
+          browser: scan.browser,
+          os: scan.os,
+          country: scan.country,
+          city: scan.city,
+          ipAddress: scan.ipAddress,
+          abTestVariant: scan.abTestVariant
+        }) + '\n').join('')
+      }
+    }
+  }
 }
 
 // Generate export data structure
-function generateExportData(qrCodes: QrCodeWithScans[], includeAnalytics: boolean, includeScans: boolean) {
+function generateExportData(
+  qrCodes: ExportQrCode[],
+  summaries: Map<string, ScanSummary>,
+  scansByQrCode: Map<string, ExportScan[]>,
+  includeAnalytics: boolean,
+  includeScans: boolean
+) {
   return qrCodes.map(qrCode => {
-    const scans = qrCode.QrCodeScan || []
-    
     const baseData = {
       id: qrCode.id,
       title: qrCode.title,
@@ -158,46 +255,24 @@ function generateExportData(qrCodes: QrCodeWithScans[], includeAnalytics: boolea
     }
 
     if (includeAnalytics) {
+      const summary = summaries.get(qrCode.id) || emptyScanSummary()
       const analytics = {
-        totalScans: scans.length,
-        uniqueDevices: new Set(scans.map((s: { device?: string }) => s.device)).size,
-        uniqueCountries: new Set(scans.map((s: { country?: string }) => s.country).filter(Boolean)).size,
-        uniqueCities: new Set(scans.map((s: { city?: string }) => s.city).filter(Boolean)).size,
-        scansByDevice: scans.reduce((acc: Record<string, number>, scan: { device?: string }) => {
-          acc[scan.device || 'Unknown'] = (acc[scan.device || 'Unknown'] || 0) + 1
-          return acc
-        }, {}),
-        scansByCountry: scans.reduce((acc: Record<string, number>, scan: { country?: string }) => {
-          if (scan.country) {
-            acc[scan.country] = (acc[scan.country] || 0) + 1
-          }
-          return acc
-        }, {}),
-        scansByBrowser: scans.reduce((acc: Record<string, number>, scan: { browser?: string }) => {
-          acc[scan.browser || 'Unknown'] = (acc[scan.browser || 'Unknown'] || 0) + 1
-          return acc
-        }, {}),
-        scansByOS: scans.reduce((acc: Record<string, number>, scan: { os?: string }) => {
-          acc[scan.os || 'Unknown'] = (acc[scan.os || 'Unknown'] || 0) + 1
-          return acc
-        }, {}),
-        scansByDate: scans.reduce((acc: Record<string, number>, scan: { scannedAt: string }) => {
-          const date = new Date(scan.scannedAt).toISOString().split('T')[0]
-          acc[date] = (acc[date] || 0) + 1
-          return acc
-        }, {}),
-        abTestResults: scans.reduce((acc: Record<string, number>, scan: { abTestVariant?: string }) => {
-          if (scan.abTestVariant) {
-            acc[scan.abTestVariant] = (acc[scan.abTestVariant] || 0) + 1
-          }
-          return acc
-        }, {})
+        totalScans: summary.totalScans,
+        uniqueDevices: summary.uniqueDevices,
+        uniqueCountries: summary.uniqueCountries,
+        uniqueCities: summary.uniqueCities,
+        scansByDevice: summary.scansByDevice,
+        scansByCountry: summary.scansByCountry,
+        scansByBrowser: summary.scansByBrowser,
+        scansByOS: summary.scansByOS,
+        scansByDate: summary.scansByDate,
+        abTestResults: summary.abTestResults
       }
 
       return {
         ...baseData,
         analytics,
-        ...(includeScans && { scans: scans.map((scan: { scannedAt: string; device?: string; browser?: string; os?: string; country?: string; city?: string; ipAddress?: string; abTestVariant?: string }) => ({
+        ...(includeScans && { scans: (scansByQrCode.get(qrCode.id) || []).map(scan => ({
           scannedAt: scan.scannedAt,
           device: scan.device,
           browser: scan.browser,
@@ -226,47 +301,49 @@ type AnalyticsSummary = {
   scansByOS?: Record<string, number>
 }
 
-function generateCSV(exportData: Array<Record<string, unknown>>): string {
-  const headers = [
-    'QR Code ID',
-    'Title',
-    'URL',
-    'Is Dynamic',
-    'Is Active',
-    'Created At',
-    'Last Scanned At',
-    'Total Scans',
-    'Unique Devices',
-    'Unique Countries',
-    'Unique Cities',
-    'Top Device',
-    'Top Country',
-    'Top Browser',
-    'Top OS'
+const CSV_HEADERS = [
+  'QR Code ID',
+  'Title',
+  'URL',
+  'Is Dynamic',
+  'Is Active',
+  'Created At',
+  'Last Scanned At',
+  'Total Scans',
+  'Unique Devices',
+  'Unique Countries',
+  'Unique Cities',
+  'Top Device',
+  'Top Country',
+  'Top Browser',
+  'Top OS'
+]
+
+function toCSVFields(qrCode: Record<string, unknown>): unknown[] {
+  const analytics = (qrCode.analytics as AnalyticsSummary | undefined) || ({} as AnalyticsSummary)
+  return [
+    qrCode.id,
+    qrCode.title,
+    qrCode.url,
+    qrCode.isDynamic,
+    qrCode.isActive,
+    qrCode.createdAt,
+    qrCode.lastScannedAt || 'Never',
+    analytics.totalScans ?? 0,
+    analytics.uniqueDevices ?? 0,
+    analytics.uniqueCountries ?? 0,
+    analytics.uniqueCities ?? 0,
+    getTopItem(analytics.scansByDevice),
+    getTopItem(analytics.scansByCountry),
+    getTopItem(analytics.scansByBrowser),
+    getTopItem(analytics.scansByOS)
   ]
+}
 
-  const rows = exportData.map(qrCode => {
-    const analytics = (qrCode.analytics as AnalyticsSummary | undefined) || ({} as AnalyticsSummary)
-    return [
-      qrCode.id,
-      qrCode.title,
-      qrCode.url,
-      qrCode.isDynamic,
-      qrCode.isActive,
-      qrCode.createdAt,
-      qrCode.lastScannedAt || 'Never',
-      analytics.totalScans ?? 0,
-      analytics.uniqueDevices ?? 0,
-      analytics.uniqueCountries ?? 0,
-      analytics.uniqueCities ?? 0,
-      getTopItem(analytics.scansByDevice),
-      getTopItem(analytics.scansByCountry),
-      getTopItem(analytics.scansByBrowser),
-      getTopItem(analytics.scansByOS)
-    ]
-  })
+function generateCSV(exportData: Array<Record<string, unknown>>): string {
+  const rows = exportData.map(toCSVFields)
 
-  const csvContent = [headers, ...rows]
+  const csvContent = [CSV_HEADERS, ...rows]
     .map(row => row.map(field => `"${String(field).replace(/"/g, '""')}"`).join(','))
     .join('\n')
 
@@ -3,7 +3,7 @@ import { getServerSession } from "next-auth/next"
 import { authOptions } from "@/lib/auth"
 import { supabaseAdmin } from "@/lib/supabase"
 import { randomUUID } from "crypto"
-import { rateLimit } from "@/lib/rate-limit"
+import { rateLimit, applyRateLimitHeaders } from "@/lib/rate-limit"
 import { canAccessOrgResource } from "@/lib/rbac"
 import { ApiErrors, handleApiError, createdResponse } from "@/lib/api-errors"
 import { QRCodeCache } from "@/lib/cache"
@@ -42,7 +42,7 @@ export async function POST(request: NextRequest) {
       maxRequests: 30,
     })
     if (!limit.allowed) {
-      return ApiErrors.rateLimited(limit.retryAfter).toResponse()
+      return applyRateLimitHeaders(ApiErrors.rateLimited(limit.retryAfter).toResponse(), limit)
     }
 
     // Credit check will be done atomically in the database function
@@ -348,10 +348,11 @@ export async function POST(request: NextRequest) {
     console.log("QR code created successfully:", qrCode)
 
 
-    // Invalidate caches after successful creation
+    // Invalidate caches after successful creation (including any negative entry for this id)
     await QRCodeCache.invalidateUserList(session.user.id)
+    await QRCodeCache.invalidate(qrCode.id)
 
-    return createdResponse(qrCode)
+    return applyRateLimitHeaders(createdResponse(qrCode), limit)
   } catch (error) {
     console.error("=== CRITICAL ERROR in QR Code API ===")
     console.error("Error type:", typeof error)
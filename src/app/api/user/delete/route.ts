@@ -2,6 +2,7 @@ import { NextRequest, NextResponse } from 'next/server'
 import { getServerSession } from 'next-auth/next'
 import { authOptions } from '@/lib/auth'
 import { supabaseAdmin } from '@/lib/supabase'
+import { invalidateServableQrCode } from '@/lib/qr-resolution'
 import { validateJsonBody } from '@/lib/validation'
 import { z } from 'zod'
 
@@ -254,6 +255,7 @@ async function performAccountDeletion(userId: string, deletionRequestId: string)
     // Delete QR codes (and associated scans via cascade)
     const { data: qrCodes } = await supabaseAdmin!.from('QrCode').select('id').eq('userId', userId)
     await supabaseAdmin!.from('QrCode').delete().eq('userId', userId)
+    await invalidateServableQrCode((qrCodes || []).map((qrCode: { id: string }) => qrCode.id))
     deletionMetadata.deletedItems.push({ type: 'qr_codes', count: qrCodes?.length || 0 })
 
     // Anonymize user record (keep for audit trail but remove PII)
@@ -1,13 +1,14 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { withUsageMetering } from '@/lib/api-usage'
+import { withUsageMetering, type UsageAuthContext } from '@/lib/api-usage'
 import { supabaseAdmin } from '@/lib/supabase'
 import { hasScope } from '@/lib/api-keys'
+import { invalidateServableQrCode } from '@/lib/qr-resolution'
 
 // GET - Get QR code by ID
 async function handleGet(
   request: NextRequest,
   context: { id: string },
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { id } = context
 
@@ -47,7 +48,7 @@ async function handleGet(
 async function handlePut(
   request: NextRequest,
   context: { id: string },
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { id } = context
   const body = await request.json()
@@ -123,6 +124,8 @@ async function handlePut(
     return NextResponse.json({ error: 'Failed to update QR code' }, { status: 500 })
   }
 
+  await invalidateServableQrCode(id)
+
   return NextResponse.json({ qrCode })
 }
 
@@ -130,7 +133,7 @@ async function handlePut(
 async function handleDelete(
   request: NextRequest,
   context: { id: string },
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { id } = context
 
@@ -170,13 +173,14 @@ async function handleDelete(
     return NextResponse.json({ error: 'Failed to delete QR code' }, { status: 500 })
   }
 
+  await invalidateServableQrCode(id)
+
   return NextResponse.json({ success: true })
 }
 
 export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'qr:read')) {
+  if (!hasScope(authContext.apiKey, 'qr:read')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: qr:read' }, { status: 403 })
   }
 
@@ -187,8 +191,7 @@ export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
 
 export const PUT = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'qr:write')) {
+  if (!hasScope(authContext.apiKey, 'qr:write')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: qr:write' }, { status: 403 })
   }
 
@@ -199,8 +202,7 @@ export const PUT = withUsageMetering(async (req, ctx: unknown, authContext) => {
 
 export const DELETE = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'qr:delete')) {
+  if (!hasScope(authContext.apiKey, 'qr:delete')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: qr:delete' }, { status: 403 })
   }
 
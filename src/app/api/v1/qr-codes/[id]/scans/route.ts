@@ -1,5 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { withUsageMetering } from '@/lib/api-usage'
+import { withUsageMetering, type UsageAuthContext } from '@/lib/api-usage'
 import { supabaseAdmin } from '@/lib/supabase'
 import { hasScope } from '@/lib/api-keys'
 
@@ -7,7 +7,7 @@ import { hasScope } from '@/lib/api-keys'
 async function handleGet(
   request: NextRequest,
   context: { id: string },
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { id: qrCodeId } = context
   const { searchParams } = new URL(request.url)
@@ -77,8 +77,7 @@ async function handleGet(
 
 export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'scan:read')) {
+  if (!hasScope(authContext.apiKey, 'scan:read')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: scan:read' }, { status: 403 })
   }
 
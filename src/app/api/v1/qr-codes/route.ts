@@ -1,5 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { withUsageMetering } from '@/lib/api-usage'
+import { withUsageMetering, type UsageAuthContext } from '@/lib/api-usage'
 import { supabaseAdmin } from '@/lib/supabase'
 import { hasScope } from '@/lib/api-keys'
 
@@ -7,7 +7,7 @@ import { hasScope } from '@/lib/api-keys'
 async function handleGet(
   request: NextRequest,
   _context: unknown,
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { searchParams } = new URL(request.url)
   const limit = parseInt(searchParams.get('limit') || '50', 10)
@@ -63,7 +63,7 @@ async function handleGet(
 async function handlePost(
   request: NextRequest,
   _context: unknown,
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const body = await request.json()
   const {
@@ -144,8 +144,7 @@ async function handlePost(
 // Export with usage metering
 export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'qr:read')) {
+  if (!hasScope(authContext.apiKey, 'qr:read')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: qr:read' }, { status: 403 })
   }
 
@@ -154,8 +153,7 @@ export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
 
 export const POST = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'qr:write')) {
+  if (!hasScope(authContext.apiKey, 'qr:write')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: qr:write' }, { status: 403 })
   }
 
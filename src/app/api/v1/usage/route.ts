@@ -1,12 +1,12 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { withUsageMetering } from '@/lib/api-usage'
+import { withUsageMetering, type UsageAuthContext } from '@/lib/api-usage'
 import { getApiUsageStats } from '@/lib/api-keys'
 
 // GET - Get API usage statistics
 async function handleGet(
   request: NextRequest,
   context: unknown,
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { searchParams } = new URL(request.url)
   const apiKeyId = searchParams.get('apiKeyId')
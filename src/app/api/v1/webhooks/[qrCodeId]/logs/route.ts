@@ -1,5 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { withUsageMetering } from '@/lib/api-usage'
+import { withUsageMetering, type UsageAuthContext } from '@/lib/api-usage'
 import { supabaseAdmin } from '@/lib/supabase'
 import { hasScope } from '@/lib/api-keys'
 
@@ -7,13 +7,14 @@ import { hasScope } from '@/lib/api-keys'
 async function handleGet(
   request: NextRequest,
   context: { qrCodeId: string },
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { qrCodeId } = context
   const { searchParams } = new URL(request.url)
   const limit = parseInt(searchParams.get('limit') || '50', 10)
   const offset = parseInt(searchParams.get('offset') || '0', 10)
-  const status = searchParams.get('status') // 'success', 'failed'
+  const status = searchParams.get('status') // 'success', 'failed', 'retrying'
+  const eventId = searchParams.get('eventId') // Delivery status of one event (e.g. a scanId)
 
   // Verify QR code exists and user has access
   const { data: qrCode, error: qrCodeError } = await supabaseAdmin!
@@ -44,7 +45,7 @@ async function handleGet(
     }
   }
 
-  // Query webhook logs
+  // Query webhook logs (one row per event; events delivered in a batch share an outboxId)
   let query = supabaseAdmin!
     .from('QrCodeWebhookLog')
     .select('*', { count: 'exact' })
@@ -55,6 +56,12 @@ async function handleGet(
     query = query.eq('isSuccessful', true)
   } else if (status === 'failed') {
     query = query.eq('isSuccessful', false)
+  } else if (status === 'retrying') {
+    query = query.eq('status', 'retrying')
+  }
+
+  if (eventId) {
+    query = query.eq('eventId', eventId)
   }
 
   const { data: logs, error, count } = await query
@@ -77,7 +84,7 @@ async function handleGet(
 async function handlePost(
   request: NextRequest,
   context: { qrCodeId: string },
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { qrCodeId } = context
   const body = await request.json()
@@ -152,8 +159,7 @@ async function handlePost(
 
 export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'webhook:read')) {
+  if (!hasScope(authContext.apiKey, 'webhook:read')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: webhook:read' }, { status: 403 })
   }
 
@@ -164,8 +170,7 @@ export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
 
 export const POST = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'webhook:write')) {
+  if (!hasScope(authContext.apiKey, 'webhook:write')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: webhook:write' }, { status: 403 })
   }
 
@@ -1,14 +1,16 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { withUsageMetering } from '@/lib/api-usage'
+import { withUsageMetering, type UsageAuthContext } from '@/lib/api-usage'
 import { supabaseAdmin } from '@/lib/supabase'
 import { hasScope } from '@/lib/api-keys'
+import { invalidateServableQrCode } from '@/lib/qr-resolution'
+import { WEBHOOK_BATCH_LIMITS, type WebhookBatchConfig } from '@/lib/webhook-outbox'
 import crypto from 'crypto'
 
 // GET - List webhooks for user/org's QR codes
 async function handleGet(
   request: NextRequest,
   context: unknown,
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { searchParams } = new URL(request.url)
   const qrCodeId = searchParams.get('qrCodeId')
@@ -47,7 +49,7 @@ async function handleGet(
   // Get webhook logs grouped by QR code
   const { data: webhooks, error } = await supabaseAdmin!
     .from('QrCode')
-    .select('id, webhookUrl, webhookSecret, title, "createdAt"')
+    .select('id, webhookUrl, webhookSecret, webhookBatchConfig, title, "createdAt"')
     .in('id', qrCodeIds)
     .not('webhookUrl', 'is', null)
 
@@ -62,6 +64,7 @@ async function handleGet(
     qrCodeTitle: w.title,
     webhookUrl: w.webhookUrl,
     hasSecret: !!w.webhookSecret,
+    batch: w.webhookBatchConfig?.enabled ? w.webhookBatchConfig : null,
     createdAt: w.createdAt,
   }))
 
@@ -72,10 +75,10 @@ async function handleGet(
 async function handlePost(
   request: NextRequest,
   context: unknown,
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const body = await request.json()
-  const { qrCodeId, webhookUrl, regenerateSecret } = body
+  const { qrCodeId, webhookUrl, regenerateSecret, batch } = body
 
   if (!qrCodeId || !webhookUrl) {
     return NextResponse.json(
@@ -91,6 +94,22 @@ async function handlePost(
     return NextResponse.json({ error: 'Invalid webhook URL' }, { status: 400 })
   }
 
+  // Optional batching: { maxBatchSize, maxLingerMs } to coalesce scan events, false/null to turn off
+  let webhookBatchConfig: WebhookBatchConfig | null | undefined
+  if (batch !== undefined) {
+    const batchError = validateBatchConfig(batch)
+    if (batchError) {
+      return NextResponse.json({ error: batchError }, { status: 400 })
+    }
+    webhookBatchConfig = batch
+      ? {
+          enabled: true,
+          maxBatchSize: batch.maxBatchSize ?? WEBHOOK_BATCH_LIMITS.maxBatchSize.default,
+          maxLingerMs: batch.maxLingerMs ?? WEBHOOK_BATCH_LIMITS.maxLingerMs.default,
+        }
+      : null
+  }
+
   // Verify QR code exists and user has access
   const { data: qrCode, error: qrCodeError } = await supabaseAdmin!
     .from('QrCode')
@@ -132,6 +151,7 @@ async function handlePost(
     .update({
       webhookUrl,
       webhookSecret,
+      ...(webhookBatchConfig !== undefined && { webhookBatchConfig }),
       updatedAt: new Date().toISOString(),
     })
     .eq('id', qrCodeId)
@@ -143,19 +163,40 @@ async function handlePost(
     return NextResponse.json({ error: 'Failed to update webhook' }, { status: 500 })
   }
 
+  await invalidateServableQrCode(qrCodeId)
+
   return NextResponse.json({
     qrCodeId: updatedQrCode.id,
     webhookUrl: updatedQrCode.webhookUrl,
+    batch: updatedQrCode.webhookBatchConfig?.enabled ? updatedQrCode.webhookBatchConfig : null,
     secret: webhookSecret, // Only returned on creation/update
     warning: 'Save this webhook secret now. You will not be able to see it again.',
   })
 }
 
+function validateBatchConfig(batch: unknown): string | null {
+  if (batch === false || batch === null) return null
+  if (typeof batch !== 'object' || Array.isArray(batch)) {
+    return 'batch must be an object with maxBatchSize and/or maxLingerMs, or false'
+  }
+
+  for (const field of ['maxBatchSize', 'maxLingerMs'] as const) {
+    const value = (batch as Record<string, unknown>)[field]
+    if (value === undefined) continue
+    const { min, max } = WEBHOOK_BATCH_LIMITS[field]
+    if (typeof value !== 'number' || !Number.isInteger(value) || value < min || value > max) {
+      return `batch.${field} must be an integer between ${min} and ${max}`
+    }
+  }
+
+  return null
+}
+
 // DELETE - Remove webhook from QR code
 async function handleDelete(
   request: NextRequest,
   context: unknown,
-  authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+  authContext: UsageAuthContext
 ) {
   const { searchParams } = new URL(request.url)
   const qrCodeId = searchParams.get('qrCodeId')
@@ -199,6 +240,7 @@ async function handleDelete(
     .update({
       webhookUrl: null,
       webhookSecret: null,
+      webhookBatchConfig: null,
       updatedAt: new Date().toISOString(),
     })
     .eq('id', qrCodeId)
@@ -208,13 +250,14 @@ async function handleDelete(
     return NextResponse.json({ error: 'Failed to remove webhook' }, { status: 500 })
   }
 
+  await invalidateServableQrCode(qrCodeId)
+
   return NextResponse.json({ success: true })
 }
 
 export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'webhook:read')) {
+  if (!hasScope(authContext.apiKey, 'webhook:read')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: webhook:read' }, { status: 403 })
   }
 
@@ -223,8 +266,7 @@ export const GET = withUsageMetering(async (req, ctx: unknown, authContext) => {
 
 export const POST = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'webhook:write')) {
+  if (!hasScope(authContext.apiKey, 'webhook:write')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: webhook:write' }, { status: 403 })
   }
 
@@ -233,8 +275,7 @@ export const POST = withUsageMetering(async (req, ctx: unknown, authContext) =>
 
 export const DELETE = withUsageMetering(async (req, ctx: unknown, authContext) => {
   // Check scope
-  const { data: apiKey } = await supabaseAdmin!.from('ApiKey').select('*').eq('id', authContext.apiKeyId).single()
-  if (!apiKey || !hasScope(apiKey, 'webhook:delete')) {
+  if (!hasScope(authContext.apiKey, 'webhook:delete')) {
     return NextResponse.json({ error: 'Forbidden', message: 'Missing required scope: webhook:delete' }, { status: 403 })
   }
 
@@ -3,6 +3,7 @@ import { getServerSession } from "next-auth/next"
 import { authOptions } from "@/lib/auth"
 import { supabaseAdmin } from "@/lib/supabase"
 import { checkVanityUrlAvailability } from "@/lib/domain-routing"
+import { invalidateDomainSlugs } from "@/lib/domain-resolution"
 
 /**
  * POST - Create or update vanity URL for a QR code
@@ -152,6 +153,12 @@ export async function POST(request: NextRequest) {
       result = newMapping
     }
 
+    // Custom domain routing caches slug lookups (including misses)
+    if (existingMapping) {
+      invalidateDomainSlugs(existingMapping.domainId, [existingMapping.vanityUrl, existingMapping.customSlug])
+    }
+    invalidateDomainSlugs(result.domainId, [result.vanityUrl, result.customSlug])
+
     // Update QR code with vanity URL
     await supabaseAdmin!
       .from('QrCode')
@@ -331,7 +338,7 @@ export async function DELETE(request: NextRequest) {
       query = query.eq('qrCodeId', qrCodeId)
     }
 
-    const { error } = await query
+    const { data: deletedMappings, error } = await query.select('vanityUrl, customSlug, domainId')
 
     if (error) {
       console.error("Error deleting vanity URL:", error)
@@ -341,6 +348,10 @@ export async function DELETE(request: NextRequest) {
       )
     }
 
+    for (const mapping of deletedMappings || []) {
+      invalidateDomainSlugs(mapping.domainId, [mapping.vanityUrl, mapping.customSlug])
+    }
+
     // Clear vanity URL from QR code
     if (qrCodeId) {
       await supabaseAdmin!
@@ -55,6 +55,9 @@ interface SystemHealth {
     requestCount: number
     errorCount: number
     avgResponseTime: number
+    p50ResponseTime: number
+    p95ResponseTime: number
+    p99ResponseTime: number
   }
   timestamp: string
 }
@@ -347,6 +350,20 @@ export default function SystemHealthPage() {
               <div className="text-2xl font-bold">{Math.round(health.metrics.avgResponseTime)}ms</div>
             </div>
           </div>
+          <div className="grid grid-cols-1 md:grid-cols-3 gap-4 mt-4">
+            <div className="p-4 bg-muted rounded-lg">
+              <div className="text-sm text-muted-foreground mb-1">p50 Response Time</div>
+              <div className="text-2xl font-bold">{Math.round(health.metrics.p50ResponseTime)}ms</div>
+            </div>
+            <div className="p-4 bg-muted rounded-lg">
+              <div className="text-sm text-muted-foreground mb-1">p95 Response Time</div>
+              <div className="text-2xl font-bold">{Math.round(health.metrics.p95ResponseTime)}ms</div>
+            </div>
+            <div className="p-4 bg-muted rounded-lg">
+              <div className="text-sm text-muted-foreground mb-1">p99 Response Time</div>
+              <div className="text-2xl font-bold">{Math.round(health.metrics.p99ResponseTime)}ms</div>
+            </div>
+          </div>
         </CardContent>
       </Card>
 
@@ -1,6 +1,6 @@
 "use client"
 import { useRouter } from "next/navigation"
-import { useEffect, useState, useRef, useCallback } from "react"
+import { useEffect, useState, useCallback } from "react"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import { Button } from "@/components/ui/button"
 import { Badge } from "@/components/ui/badge"
@@ -16,13 +16,10 @@ import {
   Zap
 } from "lucide-react"
 import Link from "next/link"
+import Image from "next/image"
 import { toast } from "sonner"
-import type QRCodeStyling from "qr-code-styling"
-import { loadQRCodeStyling } from "@/lib/qr-loader"
 import DynamicQRManager from "@/components/dynamic-qr-manager"
 import { ConfirmationDialog } from "@/components/ui/confirmation-dialog"
-import { addBotrixLogoToQR } from "@/lib/qr-watermark"
-import { getSocialMediaLogoDataUrl, isSocialMediaTemplate } from "@/lib/social-media-logos"
 import { Dialog, DialogContent, DialogDescription, DialogFooter, DialogHeader, DialogTitle } from "@/components/ui/dialog"
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import FolderManager from "@/components/folder-manager"
@@ -65,96 +62,27 @@ interface QRCodeData {
   customStyling?: Record<string, unknown>
 }
 
-// QR Code Preview Component
+// QR Code Preview Component (server-rendered, cached by content hash)
 function QRCodePreview({ qrCode }: { qrCode: QRCodeData }) {
-  const qrRef = useRef<HTMLDivElement>(null)
-  const qrCodeRef = useRef<QRCodeStyling | null>(null)
-  const [isClient, setIsClient] = useState(false)
-
-  useEffect(() => {
-    setIsClient(true)
-  }, [])
+  const [failed, setFailed] = useState(false)
 
-  useEffect(() => {
-    if (isClient && qrRef.current) {
-      const formattedBackgroundColor = qrCode.backgroundColor.startsWith('#') 
-        ? qrCode.backgroundColor 
-        : `#${qrCode.backgroundColor}`
-      const resolvedLogo = isSocialMediaTemplate(qrCode.template)
-        ? getSocialMediaLogoDataUrl(qrCode.template)
-        : qrCode.logoUrl
-      
-      if (qrCodeRef.current) {
-        qrCodeRef.current = null
-      }
-      
-      qrRef.current.innerHTML = ""
-      
-      // Load QRCodeStyling dynamically
-      loadQRCodeStyling()
-        .then((QRCodeStylingClass) => {
-          if (!QRCodeStylingClass) {
-            throw new Error('QRCodeStyling not available on server')
-          }
-          
-          // For dynamic QR codes, use the redirect URL if available, otherwise use the QR code URL
-          const qrData = qrCode.isDynamic 
-            ? (qrCode.redirectUrl || `${window.location.origin}/qr/${qrCode.id}`)
-            : qrCode.url
-
-          qrCodeRef.current = new QRCodeStylingClass({
-            width: 80,
-            height: 80,
-            type: "svg",
-            data: qrData,
-            image: resolvedLogo || undefined,
-            dotsOptions: {
-              color: qrCode.foregroundColor,
-              type: qrCode.dotType as 'rounded' | 'dots' | 'classy' | 'classy-rounded' | 'square' | 'extra-rounded',
-            },
-            backgroundOptions: {
-              color: formattedBackgroundColor,
-            },
-            cornersSquareOptions: {
-              color: qrCode.foregroundColor,
-              type: qrCode.cornerType as 'square' | 'dot' | 'extra-rounded',
-            },
-            cornersDotOptions: {
-              color: qrCode.foregroundColor,
-              type: qrCode.dotType as 'square' | 'dot',
-            },
-          })
-          
-          if (qrCodeRef.current && qrRef.current) {
-            qrCodeRef.current.append(qrRef.current)
-            
-            // Add watermark after QR code is rendered
-            setTimeout(() => {
-              if (qrRef.current && qrCode.hasWatermark) {
-                const svg = qrRef.current.querySelector('svg')
-                if (svg) {
-                  addBotrixLogoToQR(svg)
-                }
-              }
-            }, 200)
-          }
-        })
-        .catch((error) => {
-          console.error("Error creating QR code preview:", error)
-          if (qrRef.current) {
-            qrRef.current.innerHTML = `<div style="display: flex; align-items: center; justify-content: center; height: 80px; color: #666; font-size: 12px;">Error</div>`
-          }
-        })
-    }
-  }, [isClient, qrCode])
-
-  if (!isClient) {
-    return <div className="w-20 h-20 bg-gray-100 dark:bg-gray-800 rounded animate-pulse" />
+  if (failed) {
+    return (
+      <div className="w-20 h-20 border border-border rounded bg-card flex-shrink-0 flex items-center justify-center text-xs text-muted-foreground">
+        Error
+      </div>
+    )
   }
 
   return (
-    <div 
-      ref={qrRef}
+    <Image
+      src={`/api/qr-codes/${qrCode.id}/image.svg`}
+      alt={`QR code for ${qrCode.title}`}
+      width={80}
+      height={80}
+      unoptimized
+      loading="lazy"
+      onError={() => setFailed(true)}
       className="w-20 h-20 border border-border rounded bg-card flex-shrink-0"
     />
   )
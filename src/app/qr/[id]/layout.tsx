@@ -1,4 +1,5 @@
 import { Metadata } from "next"
+import { resolveServableQrCode } from "@/lib/qr-resolution"
 
 interface Props {
   params: Promise<{ id: string }>
@@ -8,14 +9,11 @@ interface Props {
 export async function generateMetadata({ params }: Props): Promise<Metadata> {
   const { id } = await params
   
-  // Fetch QR code data via API to avoid direct DB dependency
+  // Resolve through the servable QR cache (shared with the scan endpoints)
   try {
-    const baseUrl = process.env.NEXT_PUBLIC_APP_URL || "https://qr-generator.botrixai.com"
-    const response = await fetch(`${baseUrl}/api/qr-codes/${id}`, {
-      cache: "no-store",
-    })
+    const qrCode = await resolveServableQrCode(id)
     
-    if (!response.ok) {
+    if (!qrCode) {
       return {
         title: "QR Code - BotrixAI QR Generator",
         description: "View and manage your QR code with BotrixAI QR Generator.",
@@ -23,7 +21,6 @@ export async function generateMetadata({ params }: Props): Promise<Metadata> {
       }
     }
     
-    const qrCode = await response.json()
     const title = qrCode.title || "QR Code"
     
     return {
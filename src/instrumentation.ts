@@ -6,6 +6,13 @@
 export async function register() {
   if (process.env.NEXT_RUNTIME === 'nodejs') {
     await import('../sentry.server.config')
+
+    // Flush write-behind scan buffer, pending webhook batches, API usage and metrics on shutdown
+    const { registerScanBufferShutdownHook } = await import('./lib/scan-ingestion')
+    const { drainWebhookBatches } = await import('./lib/webhook-outbox')
+    const { drainApiUsageBuffer } = await import('./lib/api-usage')
+    const { flushMetrics } = await import('./lib/metrics-registry')
+    registerScanBufferShutdownHook(drainWebhookBatches, drainApiUsageBuffer, flushMetrics)
   }
 
   if (process.env.NEXT_RUNTIME === 'edge') {
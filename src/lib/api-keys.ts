@@ -1,5 +1,6 @@
 import crypto from 'crypto'
 import { supabaseAdmin } from './supabase'
+import { ApiKeyCache } from './cache'
 import bcrypt from 'bcryptjs'
 
 export interface ApiKeyData {
@@ -13,6 +14,35 @@ export interface ApiKeyData {
   expiresAt: string | null
   isActive: boolean
   createdAt: string
+  keyLookupHash?: string | null
+}
+
+type VerifiedApiKey = {
+  apiKey: ApiKeyData
+  userId: string
+  organizationId: string | null
+}
+
+// lastUsedAt is written at most this often per key, in batches
+const LAST_USED_WRITE_INTERVAL_MS = 60000
+const LAST_USED_FLUSH_INTERVAL_MS = 10000
+
+/**
+ * Keyed SHA-256 of a full API key, stored in ApiKey.keyLookupHash so a key
+ * can be found with one indexed query. Keys are 256-bit random values, so a
+ * fast hash is enough for lookup; the bcrypt hash is still checked once per
+ * cache miss. Changing API_KEY_LOOKUP_SECRET is safe but costs one prefix
+ * lookup and bcrypt per key on its next use.
+ */
+export function getApiKeyLookupHash(key: string): string {
+  return crypto
+    .createHmac('sha256', process.env.API_KEY_LOOKUP_SECRET || 'qr-generator-api-key')
+    .update(key)
+    .digest('hex')
+}
+
+function getDisplayPrefix(key: string): string {
+  return key.substring(0, 12) + '...'
 }
 
 // Generate a new API key
@@ -36,7 +66,7 @@ export async function generateApiKey(
   })}`
 
   // Get prefix for display
-  const keyPrefix = key.substring(0, 12) + '...'
+  const keyPrefix = getDisplayPrefix(key)
 
   // Hash the full key for storage
   const keyHash = await bcrypt.hash(key, 12)
@@ -50,6 +80,7 @@ export async function generateApiKey(
       name,
       keyPrefix,
       keyHash,
+      keyLookupHash: getApiKeyLookupHash(key),
       scopes,
       expiresAt: expiresAt || null,
       isActive: true,
@@ -65,51 +96,152 @@ export async function generateApiKey(
 }
 
 // Verify API key and return user/org info
-export async function verifyApiKey(key: string): Promise<{
-  apiKey: ApiKeyData
-  userId: string
-  organizationId: string | null
-} | null> {
-  // Get all active API keys (we need to check all since keys are hashed)
-  const { data: apiKeys, error } = await supabaseAdmin!
+export async function verifyApiKey(key: string): Promise<VerifiedApiKey | null> {
+  const lookupHash = getApiKeyLookupHash(key)
+
+  let apiKey = await ApiKeyCache.getVerified<ApiKeyData>(lookupHash)
+  if (!apiKey) {
+    apiKey = await loadApiKey(key, lookupHash)
+    if (!apiKey) {
+      return null
+    }
+    await ApiKeyCache.setVerified(lookupHash, apiKey)
+  }
+
+  // Re-checked on cache hits so a key never outlives its expiry
+  if (apiKey.expiresAt && new Date(apiKey.expiresAt) < new Date()) {
+    return null
+  }
+
+  trackApiKeyUsage(apiKey.id)
+
+  return {
+    apiKey,
+    userId: apiKey.userId || '',
+    organizationId: apiKey.organizationId || null,
+  }
+}
+
+/**
+ * Find the one row a key can belong to and check it against the bcrypt hash
+ */
+async function loadApiKey(key: string, lookupHash: string): Promise<ApiKeyData | null> {
+  const { data: candidate, error } = await supabaseAdmin!
     .from('ApiKey')
     .select('*')
+    .eq('keyLookupHash', lookupHash)
     .eq('isActive', true)
+    .maybeSingle()
 
-  if (error || !apiKeys) {
+  if (error) {
+    console.error('Error looking up API key:', error)
     return null
   }
 
-  // Check if key has expired
-  const now = new Date()
+  if (candidate) {
+    return (await bcrypt.compare(key, candidate.keyHash)) ? withoutKeyHash(candidate) : null
+  }
 
-  // Try to match the key against all active keys
-  for (const apiKey of apiKeys) {
-    // Check expiration
-    if (apiKey.expiresAt && new Date(apiKey.expiresAt) < now) {
-      continue
-    }
+  return loadApiKeyByPrefix(key, lookupHash)
+}
+
+/**
+ * Keys created before keyLookupHash existed (or hashed with an older secret):
+ * match on the display prefix, then store the lookup hash so later requests
+ * take the indexed path
+ */
+async function loadApiKeyByPrefix(key: string, lookupHash: string): Promise<ApiKeyData | null> {
+  const { data: candidates, error } = await supabaseAdmin!
+    .from('ApiKey')
+    .select('*')
+    .eq('keyPrefix', getDisplayPrefix(key))
+    .eq('isActive', true)
+
+  if (error || !candidates) {
+    return null
+  }
 
-    // Verify the key hash
-    const isValid = await bcrypt.compare(key, apiKey.keyHash)
-    if (isValid) {
-      // Update last used timestamp
-      await supabaseAdmin!
+  for (const candidate of candidates) {
+    if (await bcrypt.compare(key, candidate.keyHash)) {
+      const { error: updateError } = await supabaseAdmin!
         .from('ApiKey')
-        .update({ lastUsedAt: new Date().toISOString() })
-        .eq('id', apiKey.id)
+        .update({ keyLookupHash: lookupHash })
+        .eq('id', candidate.id)
 
-      return {
-        apiKey,
-        userId: apiKey.userId || '',
-        organizationId: apiKey.organizationId || null,
+      if (updateError) {
+        console.error('Error storing API key lookup hash:', updateError)
       }
+
+      return withoutKeyHash({ ...candidate, keyLookupHash: lookupHash })
     }
   }
 
   return null
 }
 
+function withoutKeyHash(row: ApiKeyData & { keyHash?: string }): ApiKeyData {
+  // eslint-disable-next-line @typescript-eslint/no-unused-vars
+  const { keyHash, ...apiKey } = row
+  return apiKey
+}
+
+/**
+ * Drop a key from the verification cache (call after rotate, revoke, update or delete)
+ */
+export async function invalidateApiKey(apiKey: { keyLookupHash?: string | null }): Promise<void> {
+  if (apiKey.keyLookupHash) {
+    await ApiKeyCache.invalidate(apiKey.keyLookupHash)
+  }
+}
+
+// Pending lastUsedAt writes and when each key was last written
+const pendingLastUsed = new Map<string, string>()
+const lastUsedWrittenAt = new Map<string, number>()
+let lastUsedTimer: NodeJS.Timeout | null = null
+
+/**
+ * Note that a key was used. Writes are throttled per key and flushed in batches.
+ */
+function trackApiKeyUsage(apiKeyId: string, now = Date.now()): void {
+  const writtenAt = lastUsedWrittenAt.get(apiKeyId)
+  if (writtenAt !== undefined && now - writtenAt < LAST_USED_WRITE_INTERVAL_MS) {
+    return
+  }
+
+  lastUsedWrittenAt.set(apiKeyId, now)
+  pendingLastUsed.set(apiKeyId, new Date(now).toISOString())
+
+  if (!lastUsedTimer) {
+    lastUsedTimer = setTimeout(() => {
+      lastUsedTimer = null
+      flushApiKeyUsage().catch(error => console.error('Error flushing API key usage:', error))
+    }, LAST_USED_FLUSH_INTERVAL_MS)
+    // Don't keep the process alive just for the flush timer
+    lastUsedTimer.unref?.()
+  }
+}
+
+/**
+ * Write pending lastUsedAt timestamps in one statement
+ */
+export async function flushApiKeyUsage(): Promise<void> {
+  if (pendingLastUsed.size === 0) return
+
+  const usage = Object.fromEntries(pendingLastUsed)
+  pendingLastUsed.clear()
+
+  // Forget write times older than the throttle window
+  const cutoff = Date.now() - LAST_USED_WRITE_INTERVAL_MS
+  for (const [apiKeyId, writtenAt] of lastUsedWrittenAt) {
+    if (writtenAt < cutoff) lastUsedWrittenAt.delete(apiKeyId)
+  }
+
+  const { error } = await supabaseAdmin!.rpc('touch_api_keys', { p_usage: usage })
+  if (error) {
+    console.error('Error updating API key lastUsedAt:', error)
+  }
+}
+
 // Rotate API key (create new, optionally deactivate old)
 export async function rotateApiKey(
   oldKeyId: string,
@@ -148,6 +280,8 @@ export async function rotateApiKey(
       .from('ApiKey')
       .update({ isActive: false })
       .eq('id', oldKeyId)
+
+    await invalidateApiKey(oldKey)
   }
 
   return { key, apiKey }
@@ -158,40 +292,6 @@ export function hasScope(apiKey: ApiKeyData, requiredScope: string): boolean {
   return apiKey.scopes.includes(requiredScope) || apiKey.scopes.includes('*')
 }
 
-// Record API usage
-export async function recordApiUsage(
-  apiKeyId: string,
-  userId: string | null,
-  organizationId: string | null,
-  endpoint: string,
-  method: string,
-  statusCode: number,
-  requestSize: number = 0,
-  responseSize: number = 0,
-  responseTime: number = 0,
-  ipAddress?: string,
-  userAgent?: string
-): Promise<void> {
-  try {
-    await supabaseAdmin!.from('ApiUsageLog').insert({
-      apiKeyId,
-      userId,
-      organizationId,
-      endpoint,
-      method,
-      statusCode,
-      requestSize,
-      responseSize,
-      responseTime,
-      ipAddress,
-      userAgent,
-    })
-  } catch (error) {
-    // Don't fail the request if usage logging fails
-    console.error('Failed to record API usage:', error)
-  }
-}
-
 // Get API usage statistics
 export async function getApiUsageStats(
   apiKeyId: string | null,
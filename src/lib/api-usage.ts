@@ -1,27 +1,179 @@
+/**
+ * API Usage Metering
+ * Wraps v1 API handlers: verifies the API key once, counts request and
+ * response bytes without buffering either body, and records usage through a
+ * write-behind buffer flushed as multi-row ApiUsageLog inserts.
+ */
+
 import { NextRequest, NextResponse } from 'next/server'
-import { recordApiUsage } from './api-keys'
+import { supabaseAdmin } from './supabase'
+import { verifyApiKey, type ApiKeyData } from './api-keys'
+import { BatchWriteError, WriteBehindBuffer, type BatchWriter, type WriteBehindBufferConfig } from './write-behind-buffer'
+
+export interface UsageAuthContext {
+  apiKeyId: string
+  userId: string
+  organizationId: string | null
+  apiKey: ApiKeyData // Verified key, including scopes
+}
+
+export interface ApiUsageRecord {
+  apiKeyId: string
+  userId: string | null
+  organizationId: string | null
+  endpoint: string
+  method: string
+  statusCode: number
+  requestSize: number
+  responseSize: number
+  responseTime: number
+  ipAddress?: string
+  userAgent?: string
+  createdAt: string
+}
+
+export type ApiUsageBufferConfig = WriteBehindBufferConfig
+
+/**
+ * Persists a batch of usage records. Injected so the buffer can be exercised without a database.
+ */
+export type ApiUsageWriter = BatchWriter<ApiUsageRecord>
+
+function readIntEnv(name: string, fallback: number): number {
+  const parsed = parseInt(process.env[name] || '', 10)
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : fallback
+}
+
+export function getApiUsageBufferConfig(): ApiUsageBufferConfig {
+  return {
+    flushIntervalMs: readIntEnv('API_USAGE_FLUSH_INTERVAL_MS', 2000),
+    maxBatchSize: readIntEnv('API_USAGE_MAX_BATCH', 500),
+    capacity: readIntEnv('API_USAGE_CAPACITY', 10000),
+  }
+}
+
+export async function writeApiUsageBatch(records: ApiUsageRecord[]): Promise<void> {
+  const { error } = await supabaseAdmin!.from('ApiUsageLog').insert(records)
+  if (error) {
+    throw new BatchWriteError(`Failed to insert API usage batch: ${error.message}`, error.code)
+  }
+}
+
+export class ApiUsageBuffer extends WriteBehindBuffer<ApiUsageRecord> {
+  private recorded = 0
+
+  constructor(config: Partial<ApiUsageBufferConfig> = {}, writer: ApiUsageWriter = writeApiUsageBatch) {
+    super('API usage', { ...getApiUsageBufferConfig(), ...config }, writer)
+  }
+
+  /**
+   * Buffer a usage record. Never blocks: usage is best-effort, so when the
+   * store falls behind the oldest records are dropped.
+   */
+  record(record: ApiUsageRecord): void {
+    this.recorded++
+    this.push(record)
+  }
+
+  getStats() {
+    return { ...super.getStats(), recorded: this.recorded }
+  }
+}
+
+// Process-wide buffer shared by the v1 API routes
+let usageBuffer: ApiUsageBuffer | null = null
+
+export function getApiUsageBuffer(): ApiUsageBuffer {
+  if (!usageBuffer) {
+    usageBuffer = new ApiUsageBuffer()
+  }
+  return usageBuffer
+}
+
+/**
+ * Drain the shared buffer (call on shutdown)
+ */
+export async function drainApiUsageBuffer(): Promise<void> {
+  if (usageBuffer) {
+    await usageBuffer.drain()
+  }
+}
+
+function getContentLength(headers: Headers): number | null {
+  const value = headers.get('content-length')
+  if (value === null) return null
+  const length = parseInt(value, 10)
+  return Number.isFinite(length) && length >= 0 ? length : null
+}
+
+/**
+ * Pass a body through unchanged while counting its bytes. onDone runs once,
+ * when the stream ends, errors or is cancelled by the consumer.
+ */
+export function countBodyBytes(
+  body: ReadableStream<Uint8Array>,
+  onDone: (bytes: number) => void
+): ReadableStream<Uint8Array> {
+  const reader = body.getReader()
+  let bytes = 0
+  let done = false
+  const finish = () => {
+    if (done) return
+    done = true
+    onDone(bytes)
+  }
+
+  return new ReadableStream<Uint8Array>({
+    async pull(controller) {
+      try {
+        const chunk = await reader.read()
+        if (chunk.done) {
+          finish()
+          controller.close()
+          return
+        }
+        bytes += chunk.value.byteLength
+        controller.enqueue(chunk.value)
+      } catch (error) {
+        finish()
+        controller.error(error)
+      }
+    },
+    async cancel(reason) {
+      finish()
+      await reader.cancel(reason)
+    },
+  })
+}
+
+/**
+ * Request whose body is counted as the handler reads it. Bodies with a
+ * Content-Length are left untouched.
+ */
+function meterRequest(request: NextRequest): { request: NextRequest; size: () => number } {
+  const length = getContentLength(request.headers)
+  if (length !== null || !request.body) {
+    return { request, size: () => length || 0 }
+  }
+
+  let counted = 0
+  const body = countBodyBytes(request.body, bytes => {
+    counted = bytes
+  })
+  const metered = new NextRequest(request, { body, duplex: 'half' } as RequestInit)
+  return { request: metered, size: () => counted }
+}
 
 // Middleware wrapper to record API usage
 export function withUsageMetering(
   handler: (
     request: NextRequest,
     context: unknown,
-    authContext: { apiKeyId: string; userId: string; organizationId: string | null }
+    authContext: UsageAuthContext
   ) => Promise<NextResponse>
 ) {
   return async (request: NextRequest, context: unknown) => {
     const startTime = Date.now()
-    let statusCode = 500
-    let requestSize = 0
-    let responseSize = 0
-
-    // Get request size
-    try {
-      const body = await request.clone().text()
-      requestSize = new Blob([body]).size
-    } catch {
-      // Ignore errors
-    }
 
     // Get API key from request
     const authHeader = request.headers.get('authorization')
@@ -31,67 +183,63 @@ export function withUsageMetering(
       return NextResponse.json({ error: 'Unauthorized' }, { status: 401 })
     }
 
-    // Import here to avoid circular dependencies
-    const { verifyApiKey } = await import('./api-keys')
     const verification = await verifyApiKey(key)
 
     if (!verification) {
       return NextResponse.json({ error: 'Unauthorized' }, { status: 401 })
     }
 
-    const authContext = {
+    const authContext: UsageAuthContext = {
       apiKeyId: verification.apiKey.id,
       userId: verification.userId,
       organizationId: verification.organizationId,
+      apiKey: verification.apiKey,
     }
 
+    const metered = meterRequest(request)
+
     // Call the handler
     let response: NextResponse
     try {
-      response = await handler(request, context, authContext)
-      statusCode = response.status
+      response = await handler(metered.request, context, authContext)
     } catch {
-      statusCode = 500
       response = NextResponse.json(
         { error: 'Internal server error' },
         { status: 500 }
       )
     }
 
-    // Calculate response time
+    // Time to response headers; streamed bodies may take longer to finish
     const responseTime = Date.now() - startTime
 
-    // Get response size
-    try {
-      const responseText = await response.clone().text()
-      responseSize = new Blob([responseText]).size
-    } catch {
-      // Ignore errors
+    const record = (responseSize: number) => {
+      getApiUsageBuffer().record({
+        apiKeyId: authContext.apiKeyId,
+        userId: authContext.userId,
+        organizationId: authContext.organizationId,
+        endpoint: request.nextUrl.pathname,
+        method: request.method,
+        statusCode: response.status,
+        requestSize: metered.size(),
+        responseSize,
+        responseTime,
+        ipAddress: request.headers.get('x-forwarded-for') || request.headers.get('x-real-ip') || undefined,
+        userAgent: request.headers.get('user-agent') || undefined,
+        createdAt: new Date().toISOString(),
+      })
     }
 
-    // Extract endpoint from URL
-    const url = new URL(request.url)
-    const endpoint = url.pathname
-
-    // Record usage asynchronously (don't block response)
-    recordApiUsage(
-      authContext.apiKeyId,
-      authContext.userId,
-      authContext.organizationId,
-      endpoint,
-      request.method,
-      statusCode,
-      requestSize,
-      responseSize,
-      responseTime,
-      request.headers.get('x-forwarded-for') || request.headers.get('x-real-ip') || undefined,
-      request.headers.get('user-agent') || undefined
-    ).catch((error) => {
-      // Don't fail if usage logging fails
-      console.error('Failed to record API usage:', error)
-    })
+    const contentLength = getContentLength(response.headers)
+    if (contentLength !== null || !response.body) {
+      record(contentLength || 0)
+      return response
+    }
 
-    return response
+    // Record once the body has been sent, counting bytes as they stream out
+    return new NextResponse(countBodyBytes(response.body, record), {
+      status: response.status,
+      statusText: response.statusText,
+      headers: response.headers,
+    })
   }
 }
-
@@ -65,7 +65,7 @@ export function withObservability(
           responseSize,
         }
         
-        await recordRequestMetric(metric)
+        recordRequestMetric(metric)
       }
       
       // Log successful request
@@ -115,7 +115,7 @@ export function withObservability(
           responseTime,
         }
         
-        await recordRequestMetric(metric)
+        recordRequestMetric(metric)
       }
       
       // Return error response
@@ -1,10 +1,10 @@
 /**
  * Background Job System
- * Handles heavy tasks asynchronously (bulk QR, export, webhook retries)
+ * Handles heavy tasks asynchronously (bulk QR, export, webhook retries).
+ * Jobs are claimed and run by JobWorker (src/lib/job-worker.ts).
  */
 
 import { supabaseAdmin } from "@/lib/supabase"
-import { retryWithTimeout } from "./retry-with-timeout"
 
 export type JobType = 
   | 'bulk_qr_create'
@@ -13,6 +13,7 @@ export type JobType =
   | 'webhook_retry'
   | 'analytics_aggregate'
   | 'image_optimization'
+  | 'bulk_qr_render'
 
 export interface BackgroundJob {
   id: string
@@ -21,12 +22,15 @@ export interface BackgroundJob {
   priority: number
   payload: Record<string, unknown>
   result?: unknown
+  progress?: Record<string, unknown> | null
   error?: string
   retries: number
   maxRetries: number
   runAfter: string
   startedAt?: string
   completedAt?: string
+  lockedBy?: string | null
+  leaseExpiresAt?: string | null
   createdAt: string
   updatedAt: string
 }
@@ -64,140 +68,110 @@ export async function createBackgroundJob(
 }
 
 /**
- * Get next job to process
+ * Claim a batch of runnable jobs for a worker (FOR UPDATE SKIP LOCKED).
+ * slots maps each job type to the number of jobs the worker can still take;
+ * types that are missing or at 0 are not claimed. Claimed jobs are leased to
+ * workerId for leaseSeconds and must be kept alive with heartbeatBackgroundJobs.
  */
-export async function getNextBackgroundJob(): Promise<BackgroundJob | null> {
+export async function claimBackgroundJobs(
+  workerId: string,
+  slots: Partial<Record<JobType, number>>,
+  options: { batchSize?: number; leaseSeconds?: number } = {}
+): Promise<BackgroundJob[]> {
   const { data, error } = await supabaseAdmin!
-    .rpc('get_next_background_job')
+    .rpc('claim_background_jobs', {
+      p_worker_id: workerId,
+      p_slots: slots,
+      p_batch_size: options.batchSize || 10,
+      p_lease_seconds: options.leaseSeconds || 60,
+    })
 
   if (error) {
-    console.error('Error getting next background job:', error)
-    return null
-  }
-
-  if (!data || data.length === 0) {
-    return null
+    throw new Error(`Failed to claim background jobs: ${error.message}`)
   }
 
-  // Get full job details
-  const { data: job, error: jobError } = await supabaseAdmin!
-    .from('BackgroundJob')
-    .select('*')
-    .eq('id', data[0].id)
-    .single()
+  return (data || []) as BackgroundJob[]
+}
 
-  if (jobError || !job) {
-    return null
-  }
+/**
+ * Extend the lease on running jobs. Returns the ids the worker still holds;
+ * any id missing from the result was re-queued after its lease expired.
+ */
+export async function heartbeatBackgroundJobs(
+  workerId: string,
+  jobIds: string[],
+  leaseSeconds = 60
+): Promise<string[]> {
+  if (jobIds.length === 0) return []
 
-  // Update status to processing
-  await supabaseAdmin!
-    .from('BackgroundJob')
-    .update({
-      status: 'processing',
-      startedAt: new Date().toISOString(),
+  const { data, error } = await supabaseAdmin!
+    .rpc('heartbeat_background_jobs', {
+      p_worker_id: workerId,
+      p_job_ids: jobIds,
+      p_lease_seconds: leaseSeconds,
     })
-    .eq('id', job.id)
 
-  return job
+  if (error) {
+    throw new Error(`Failed to heartbeat background jobs: ${error.message}`)
+  }
+
+  return ((data || []) as Array<string | { heartbeat_background_jobs: string }>).map(row =>
+    typeof row === 'string' ? row : row.heartbeat_background_jobs
+  )
 }
 
 /**
- * Update job status
+ * Complete a leased job, or record its failure and schedule a retry after
+ * retryDelaySeconds (failed for good once maxRetries is reached).
+ * Returns the new status, or null if the worker no longer held the lease.
  */
-export async function updateJobStatus(
+export async function finishBackgroundJob(
   jobId: string,
-  status: 'completed' | 'failed',
-  result?: unknown,
-  error?: string
-): Promise<void> {
-  const updateData: Record<string, unknown> = {
-    status,
-    updatedAt: new Date().toISOString(),
-  }
+  workerId: string,
+  outcome: { result?: unknown } | { error: string; retryDelaySeconds?: number }
+): Promise<BackgroundJob['status'] | null> {
+  const failed = 'error' in outcome
+  const { data, error } = await supabaseAdmin!
+    .rpc('finish_background_job', {
+      p_job_id: jobId,
+      p_worker_id: workerId,
+      p_result: failed ? null : outcome.result ?? null,
+      p_error: failed ? outcome.error : null,
+      p_retry_delay_seconds: failed ? outcome.retryDelaySeconds ?? 60 : 0,
+    })
 
-  if (status === 'completed') {
-    updateData.completedAt = new Date().toISOString()
-    updateData.result = result
+  if (error) {
+    console.error('Error finishing background job:', error)
+    return null
   }
 
-  if (status === 'failed') {
-    updateData.error = error
-    // Fetch current retries value to increment it
-    const { data: currentJob } = await supabaseAdmin!
-      .from('BackgroundJob')
-      .select('retries')
-      .eq('id', jobId)
-      .single()
-    
-    if (currentJob) {
-      updateData.retries = (currentJob.retries || 0) + 1
-    }
-  }
+  return (data as BackgroundJob['status'] | null) || null
+}
 
-  const { error: updateError } = await supabaseAdmin!
+/**
+ * Record progress on a leased job while it runs. Returns false if the worker
+ * no longer holds the lease.
+ */
+export async function reportBackgroundJobProgress(
+  jobId: string,
+  workerId: string,
+  progress: Record<string, unknown>
+): Promise<boolean> {
+  const { data, error } = await supabaseAdmin!
     .from('BackgroundJob')
-    .update(updateData)
+    .update({
+      progress,
+      updatedAt: new Date().toISOString(),
+    })
     .eq('id', jobId)
+    .eq('status', 'processing')
+    .eq('lockedBy', workerId)
+    .select('id')
 
-  if (updateError) {
-    console.error('Error updating job status:', updateError)
+  if (error) {
+    console.error('Error reporting background job progress:', error)
+    return false
   }
-}
 
-/**
- * Process background job
- */
-export async function processBackgroundJob<T>(
-  job: BackgroundJob,
-  processor: (payload: Record<string, unknown>) => Promise<T>
-): Promise<T | null> {
-  try {
-    // Update status to processing
-    await supabaseAdmin!
-      .from('BackgroundJob')
-      .update({
-        status: 'processing',
-        startedAt: new Date().toISOString(),
-        updatedAt: new Date().toISOString(),
-      })
-      .eq('id', job.id)
-
-    // Process job with retry logic
-    const result = await retryWithTimeout(
-      () => processor(job.payload),
-      {
-        maxRetries: job.maxRetries,
-        timeout: 300000, // 5 minutes for background jobs
-      }
-    )
-
-    // Update status to completed
-    await updateJobStatus(job.id, 'completed', result)
-
-    return result
-  } catch (error) {
-    // Update status to failed
-    await updateJobStatus(
-      job.id,
-      'failed',
-      undefined,
-      error instanceof Error ? error.message : 'Unknown error'
-    )
-
-    // Retry job if retries available
-    if (job.retries < job.maxRetries) {
-      await supabaseAdmin!
-        .from('BackgroundJob')
-        .update({
-          status: 'pending',
-          retries: job.retries + 1,
-          runAfter: new Date(Date.now() + 60000 * (job.retries + 1)).toISOString(), // Exponential backoff
-        })
-        .eq('id', job.id)
-    }
-
-    throw error
-  }
+  return (data || []).length > 0
 }
-
@@ -0,0 +1,227 @@
+/**
+ * Bulk QR Rendering
+ * Processor for bulk_qr_render jobs: renders a user's QR codes on a thread pool
+ * and streams them into one ZIP archive in storage. Codes are loaded and
+ * rendered a chunk at a time, entries are appended as their renders finish and
+ * the archive is uploaded in fixed-size parts, so memory stays bounded however
+ * many codes are exported. Progress is reported after every chunk.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { ChunkedStorageUpload } from '@/lib/storage-upload'
+import { QrRenderPool } from '@/lib/qr-render-pool'
+import { DEFAULT_RENDER_SIZE, QR_RENDER_COLUMNS, getQrRenderInput, type QrRenderStyle } from '@/lib/qr-render'
+import { ZipWriter } from '@/lib/zip-stream'
+import type { QrImageFormat } from '@/lib/qr-image'
+import type { JobContext } from '@/lib/job-worker'
+
+export const BULK_RENDER_BUCKET = 'qr-renders'
+
+const RENDER_CHUNK_SIZE = 50
+const MAX_REPORTED_FAILURES = 100
+const DOWNLOAD_URL_TTL_SECONDS = 7 * 24 * 60 * 60
+
+export interface BulkQrRenderPayload {
+  userId: string
+  qrCodeIds: string[]
+  format?: QrImageFormat
+  size?: number
+  scale?: number
+  origin?: string // Base URL dynamic codes point at
+  bulkGroupId?: string // QrCodeBulkGroup to keep up to date
+}
+
+export interface BulkQrRenderProgress {
+  total: number
+  rendered: number
+  failed: number
+  zipBytes: number
+  uploadedBytes: number
+}
+
+type RenderOutcome = { body: Buffer } | { error: string }
+
+interface RenderFailure {
+  itemIndex: number // Position in the deduplicated qrCodeIds
+  qrCodeId: string
+  error: string
+}
+
+function clamp(value: number | undefined, fallback: number, min: number, max: number): number {
+  return typeof value === 'number' && Number.isFinite(value) ? Math.min(max, Math.max(min, Math.round(value))) : fallback
+}
+
+// "<title>-<id>.png", reduced to characters every unzip tool handles
+function entryName(qrCode: { id: string; title?: string | null }, format: QrImageFormat): string {
+  const title = (qrCode.title || '').replace(/[^a-zA-Z0-9._-]+/g, '_').replace(/^[._]+|_+$/g, '').slice(0, 80)
+  return `${title ? `${title}-` : ''}${qrCode.id}.${format}`
+}
+
+async function updateBulkGroup(bulkGroupId: string | undefined, fields: Record<string, unknown>) {
+  if (!bulkGroupId) return
+
+  const { error } = await supabaseAdmin!
+    .from('QrCodeBulkGroup')
+    .update({ ...fields, updatedAt: new Date().toISOString() })
+    .eq('id', bulkGroupId)
+
+  if (error) {
+    console.error('Error updating bulk render group:', error)
+  }
+}
+
+// Keyed by (jobId, itemIndex) so a retried job rewrites its earlier attempts' rows
+async function recordFailures(bulkGroupId: string | undefined, jobId: string, failures: RenderFailure[]) {
+  if (!bulkGroupId || failures.length === 0) return
+
+  const { error } = await supabaseAdmin!
+    .from('QrCodeBulkResult')
+    .upsert(failures.map(failure => ({
+      bulkGroupId,
+      jobId,
+      itemIndex: failure.itemIndex,
+      qrCodeId: failure.qrCodeId,
+      status: 'failed',
+      error: failure.error,
+      data: null,
+    })), { onConflict: 'jobId,itemIndex' })
+
+  if (error) {
+    console.error('Error recording bulk render failures:', error)
+  }
+}
+
+/**
+ * Render payload.qrCodeIds (those owned by payload.userId) into
+ * qr-renders/<userId>/<jobId>.zip
+ */
+export async function processBulkQrRender(payload: BulkQrRenderPayload, context: JobContext) {
+  const { job, signal, reportProgress } = context
+  const ids = Array.from(new Set(payload.qrCodeIds || []))
+  const format: QrImageFormat = payload.format === 'svg' ? 'svg' : 'png'
+  const size = clamp(payload.size, DEFAULT_RENDER_SIZE, 64, 2048)
+  const scale = format === 'png' ? clamp(payload.scale, 1, 1, 8) : 1
+  const origin = payload.origin || process.env.NEXTAUTH_URL || 'http://localhost:3000'
+
+  const upload = new ChunkedStorageUpload(BULK_RENDER_BUCKET, `${payload.userId}/${job.id}.zip`, {
+    contentType: 'application/zip',
+    signal,
+  })
+  const zip = new ZipWriter(chunk => upload.write(chunk))
+  const pool = new QrRenderPool()
+
+  const progress: BulkQrRenderProgress = { total: ids.length, rendered: 0, failed: 0, zipBytes: 0, uploadedBytes: 0 }
+  const failures: RenderFailure[] = []
+
+  try {
+    for (let start = 0; start < ids.length; start += RENDER_CHUNK_SIZE) {
+      signal.throwIfAborted()
+      const chunkIds = ids.slice(start, start + RENDER_CHUNK_SIZE)
+
+      const { data, error } = await supabaseAdmin!
+        .from('QrCode')
+        .select(`${QR_RENDER_COLUMNS}, title`)
+        .in('id', chunkIds)
+        .eq('userId', payload.userId)
+
+      if (error) {
+        throw new Error(`Failed to load QR codes: ${error.message}`)
+      }
+
+      const qrCodes = new Map(((data || []) as unknown as Array<QrRenderStyle & { title?: string | null }>)
+        .map(qrCode => [qrCode.id, qrCode]))
+
+      // Queue the whole chunk on the pool; settle to outcomes so nothing rejects unobserved
+      const renders = chunkIds.map(id => {
+        const qrCode = qrCodes.get(id)
+        if (!qrCode) {
+          return Promise.resolve<RenderOutcome>({ error: 'QR code not found or access denied' })
+        }
+        return pool.render(getQrRenderInput(qrCode, origin, size), format, scale).then(
+          (body): RenderOutcome => ({ body }),
+          (renderError: Error): RenderOutcome => ({ error: renderError.message })
+        )
+      })
+
+      // Append in request order while later renders are still running
+      const chunkFailures: RenderFailure[] = []
+      for (let index = 0; index < chunkIds.length; index++) {
+        const outcome = await renders[index]
+        signal.throwIfAborted()
+
+        if ('body' in outcome) {
+          await zip.addFile(entryName(qrCodes.get(chunkIds[index])!, format), outcome.body, {
+            compress: format === 'svg', // PNG is already deflated
+          })
+          progress.rendered++
+        } else {
+          chunkFailures.push({ itemIndex: start + index, qrCodeId: chunkIds[index], error: outcome.error })
+          progress.failed++
+        }
+      }
+
+      failures.push(...chunkFailures.slice(0, MAX_REPORTED_FAILURES - failures.length))
+      progress.zipBytes = zip.bytesWritten
+      progress.uploadedBytes = upload.uploadedBytes
+
+      await recordFailures(payload.bulkGroupId, job.id, chunkFailures)
+      await reportProgress({ ...progress })
+      await updateBulkGroup(payload.bulkGroupId, {
+        processedCount: progress.rendered,
+        failedCount: progress.failed,
+      })
+    }
+
+    await zip.finish()
+    const stored = await upload.finish()
+    progress.zipBytes = zip.bytesWritten
+    progress.uploadedBytes = stored.size
+    await reportProgress({ ...progress })
+
+    const { data: signed, error: signError } = await supabaseAdmin!
+      .storage
+      .from(BULK_RENDER_BUCKET)
+      .createSignedUrl(stored.path, DOWNLOAD_URL_TTL_SECONDS)
+
+    if (signError) {
+      console.error('Error signing bulk render download:', signError)
+    }
+
+    const result = {
+      success: true,
+      bucket: stored.bucket,
+      path: stored.path,
+      fileUrl: signed?.signedUrl || null,
+      format,
+      files: zip.entryCount,
+      failed: progress.failed,
+      bytes: stored.size,
+      failures,
+    }
+
+    await updateBulkGroup(payload.bulkGroupId, {
+      status: 'completed',
+      completedAt: new Date().toISOString(),
+      processedCount: progress.rendered,
+      failedCount: progress.failed,
+      results: { fileUrl: result.fileUrl, bucket: result.bucket, path: result.path, files: result.files, bytes: result.bytes },
+    })
+
+    return result
+  } catch (error) {
+    await upload.abort()
+
+    // Out of retries: the job fails for good, so does the group
+    if (job.retries >= job.maxRetries) {
+      await updateBulkGroup(payload.bulkGroupId, {
+        status: 'failed',
+        completedAt: new Date().toISOString(),
+        processedCount: progress.rendered,
+        failedCount: progress.total - progress.rendered,
+      })
+    }
+    throw error
+  } finally {
+    await pool.destroy()
+  }
+}
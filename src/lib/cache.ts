@@ -77,6 +77,7 @@ export const CacheKeys = {
   qrCodeList: (userId: string, page: number = 1) => `qr:list:${userId}:${page}`,
   userSettings: (userId: string) => `user:${userId}:settings`,
   apiKeyValid: (keyHash: string) => `apikey:${keyHash}`,
+  apiKeyVerified: (lookupHash: string) => `apikey:verified:${lookupHash}`,
   rateLimitKey: (key: string, route: string) => `ratelimit:${key}:${route}`,
   scanStats: (qrCodeId: string) => `stats:${qrCodeId}`,
 } as const
@@ -87,9 +88,12 @@ export const CacheTTL = {
   userPlan: 300, // 5 minutes
   userSession: 3600, // 1 hour
   qrCode: 300, // 5 minutes
+  servableQrCode: 60, // 1 minute (bounds staleness on instances that missed an invalidation)
+  qrCodeNotFound: 30, // 30 seconds (negative cache for unknown ids)
   qrCodeList: 60, // 1 minute
   userSettings: 600, // 10 minutes
   apiKey: 300, // 5 minutes
+  apiKeyVerified: 60, // 1 minute (how long a revoked key can keep working on another instance)
   rateLimit: 60, // 1 minute
   scanStats: 120, // 2 minutes
   short: 30, // 30 seconds
@@ -257,6 +261,9 @@ export const UserPlanCache = {
   },
 }
 
+// Sentinel stored for ids that don't exist, so repeated scans of unknown codes skip the database
+export const QR_CODE_NOT_FOUND = { notFound: true } as const
+
 /**
  * QR Code caching helpers
  */
@@ -269,10 +276,26 @@ export const QRCodeCache = {
     return cacheSet(CacheKeys.qrCode(qrCodeId), qrCode, CacheTTL.qrCode)
   },
 
+  async setServable(qrCodeId: string, qrCode: unknown): Promise<void> {
+    return cacheSet(CacheKeys.qrCode(qrCodeId), qrCode, CacheTTL.servableQrCode)
+  },
+
+  async setNotFound(qrCodeId: string): Promise<void> {
+    return cacheSet(CacheKeys.qrCode(qrCodeId), QR_CODE_NOT_FOUND, CacheTTL.qrCodeNotFound)
+  },
+
+  isNotFound(value: unknown): boolean {
+    return typeof value === 'object' && value !== null && (value as { notFound?: unknown }).notFound === true
+  },
+
   async invalidate(qrCodeId: string): Promise<void> {
     return cacheDel(CacheKeys.qrCode(qrCodeId))
   },
 
+  async invalidateMany(qrCodeIds: string[]): Promise<void> {
+    await Promise.all(qrCodeIds.map(qrCodeId => cacheDel(CacheKeys.qrCode(qrCodeId))))
+  },
+
   async invalidateUserList(userId: string): Promise<void> {
     // Invalidate all pages of user's QR code list
     // In production, track pages or use pattern matching
@@ -294,8 +317,20 @@ export const ApiKeyCache = {
     return cacheSet(CacheKeys.apiKeyValid(keyHash), isValid, CacheTTL.apiKey)
   },
 
+  // Verified key rows, keyed by the key's lookup hash (never the key itself)
+  async getVerified<T>(lookupHash: string): Promise<T | null> {
+    return cacheGet<T>(CacheKeys.apiKeyVerified(lookupHash))
+  },
+
+  async setVerified(lookupHash: string, apiKey: unknown): Promise<void> {
+    return cacheSet(CacheKeys.apiKeyVerified(lookupHash), apiKey, CacheTTL.apiKeyVerified)
+  },
+
   async invalidate(keyHash: string): Promise<void> {
-    return cacheDel(CacheKeys.apiKeyValid(keyHash))
+    await Promise.all([
+      cacheDel(CacheKeys.apiKeyValid(keyHash)),
+      cacheDel(CacheKeys.apiKeyVerified(keyHash)),
+    ])
   },
 }
 
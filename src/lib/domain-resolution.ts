@@ -0,0 +1,283 @@
+/**
+ * Custom Domain Resolution Cache
+ * In-process LRU for the middleware's custom domain lookups: host -> active
+ * domain config and (domain, slug) -> QR code id. Unknown hosts and slugs are
+ * cached negatively; expired entries are served stale while one background
+ * refresh runs. Plain JS only, so it works in the edge and Node.js middleware
+ * runtimes. Domain and vanity URL changes invalidate entries, but only in the
+ * process that handled the change: other instances keep serving what they
+ * cached until it expires, so the TTLs below are the real staleness bound.
+ */
+
+import { getSupabaseAdmin } from "@/lib/supabase"
+
+export interface ResolvedDomainRouting {
+  defaultRedirect?: string
+  custom404Page?: string
+  customExpiryPage?: string
+  allowedPaths?: string[]
+  blockedPaths?: string[]
+}
+
+export interface ResolvedDomain {
+  id: string
+  domain: string
+  routingConfig: ResolvedDomainRouting | null
+  custom404Page: string | null
+  customExpiryPage: string | null
+}
+
+interface CacheEntry<V> {
+  value: V
+  freshUntil: number
+  staleUntil: number
+}
+
+// Fresh / stale-while-revalidate windows (ms). An instance that didn't see an
+// invalidation serves a changed mapping for up to fresh + stale.
+const DOMAIN_TTL = { fresh: 60_000, stale: 10 * 60_000 }
+const DOMAIN_NOT_FOUND_TTL = { fresh: 30_000, stale: 60_000 }
+const SLUG_TTL = { fresh: 60_000, stale: 10 * 60_000 }
+const SLUG_NOT_FOUND_TTL = { fresh: 15_000, stale: 30_000 }
+
+const MAX_DOMAINS = 1000
+const MAX_SLUGS = 10000
+
+/**
+ * Map-backed LRU with fresh and stale deadlines per entry
+ */
+export class ResolutionCache<V> {
+  private entries = new Map<string, CacheEntry<V>>()
+  private maxEntries: number
+
+  constructor(maxEntries: number) {
+    this.maxEntries = maxEntries
+  }
+
+  get(key: string, now = Date.now()): CacheEntry<V> | undefined {
+    const entry = this.entries.get(key)
+    if (!entry) return undefined
+    if (entry.staleUntil <= now) {
+      this.entries.delete(key)
+      return undefined
+    }
+    // Refresh LRU position
+    this.entries.delete(key)
+    this.entries.set(key, entry)
+    return entry
+  }
+
+  set(key: string, value: V, ttl: { fresh: number; stale: number }, now = Date.now()): void {
+    this.entries.delete(key)
+    this.entries.set(key, { value, freshUntil: now + ttl.fresh, staleUntil: now + ttl.fresh + ttl.stale })
+    if (this.entries.size > this.maxEntries) {
+      this.entries.delete(this.entries.keys().next().value as string)
+    }
+  }
+
+  delete(key: string): void {
+    this.entries.delete(key)
+  }
+
+  deleteByPrefix(prefix: string): void {
+    for (const key of this.entries.keys()) {
+      if (key.startsWith(prefix)) this.entries.delete(key)
+    }
+  }
+
+  clear(): void {
+    this.entries.clear()
+  }
+
+  get size(): number {
+    return this.entries.size
+  }
+}
+
+interface ResolutionStore {
+  domains: ResolutionCache<ResolvedDomain | null>
+  slugs: ResolutionCache<string | null>
+  inFlight: Map<string, Promise<unknown>>
+  generation: number // Bumped by every invalidation
+  stats: { hits: number; staleHits: number; misses: number; errors: number }
+}
+
+// Kept on globalThis so the middleware bundle and route handlers share one store
+// when they run in the same process; nothing is shared between processes
+const STORE_KEY = Symbol.for('qr-generator.domain-resolution')
+
+function getStore(): ResolutionStore {
+  const globalStore = globalThis as typeof globalThis & { [STORE_KEY]?: ResolutionStore }
+  if (!globalStore[STORE_KEY]) {
+    globalStore[STORE_KEY] = {
+      domains: new ResolutionCache(MAX_DOMAINS),
+      slugs: new ResolutionCache(MAX_SLUGS),
+      inFlight: new Map(),
+      generation: 0,
+      stats: { hits: 0, staleHits: 0, misses: 0, errors: 0 },
+    }
+  }
+  return globalStore[STORE_KEY]!
+}
+
+/**
+ * Serve from cache, refreshing stale entries in the background and loading
+ * misses once per key however many requests are waiting on it
+ */
+async function resolveCached<V>(
+  kind: 'domain' | 'slug',
+  cache: ResolutionCache<V | null>,
+  key: string,
+  load: () => Promise<V | null>,
+  ttl: (value: V | null) => { fresh: number; stale: number }
+): Promise<V | null> {
+  const store = getStore()
+  const now = Date.now()
+  const entry = cache.get(key, now)
+
+  if (entry && entry.freshUntil > now) {
+    store.stats.hits++
+    return entry.value
+  }
+
+  const flightKey = `${kind}:${key}`
+  let pending = store.inFlight.get(flightKey) as Promise<V | null> | undefined
+  if (!pending) {
+    // A load that started before an invalidation may have read the old row
+    const generation = store.generation
+    pending = load()
+      .then(value => {
+        if (store.generation === generation) {
+          cache.set(key, value, ttl(value))
+        }
+        return value
+      })
+      .catch(error => {
+        // Don't cache transient failures; keep serving whatever we had
+        store.stats.errors++
+        console.error('Error resolving custom domain route:', error)
+        return entry ? entry.value : null
+      })
+      .finally(() => {
+        if (store.inFlight.get(flightKey) === pending) {
+          store.inFlight.delete(flightKey)
+        }
+      })
+    store.inFlight.set(flightKey, pending)
+  }
+
+  if (entry) {
+    store.stats.staleHits++
+    return entry.value
+  }
+
+  store.stats.misses++
+  return pending
+}
+
+async function loadDomain(host: string): Promise<ResolvedDomain | null> {
+  const admin = getSupabaseAdmin()
+  if (!admin) return null
+
+  const { data, error } = await admin
+    .from('QrCodeCustomDomain')
+    .select('id, domain, routingConfig, custom404Page, customExpiryPage, status')
+    .eq('domain', host)
+    .eq('isVerified', true)
+    .maybeSingle()
+
+  if (error) throw error
+  if (!data || data.status !== 'active') return null
+
+  return {
+    id: data.id,
+    domain: data.domain,
+    routingConfig: (data.routingConfig as ResolvedDomainRouting | null) || null,
+    custom404Page: data.custom404Page || null,
+    customExpiryPage: data.customExpiryPage || null,
+  }
+}
+
+async function loadSlug(domainId: string, slug: string): Promise<string | null> {
+  const admin = getSupabaseAdmin()
+  if (!admin) return null
+
+  // One indexed lookup over vanityUrl and customSlug (vanity URLs win)
+  const { data, error } = await admin.rpc('resolve_vanity_qr_code', {
+    p_domain_id: domainId,
+    p_slug: slug,
+  })
+
+  if (error) throw error
+  return (data as string | null) || null
+}
+
+/**
+ * Active, verified custom domain for a host (without port), or null
+ */
+export function resolveCustomDomain(host: string): Promise<ResolvedDomain | null> {
+  const key = host.toLowerCase()
+  return resolveCached('domain', getStore().domains, key, () => loadDomain(key), value =>
+    value ? DOMAIN_TTL : DOMAIN_NOT_FOUND_TTL
+  )
+}
+
+/**
+ * QR code id a vanity URL or custom slug points to on a domain, or null
+ */
+export function resolveDomainSlug(domainId: string, slug: string): Promise<string | null> {
+  const normalized = slug.toLowerCase()
+  return resolveCached('slug', getStore().slugs, `${domainId}:${normalized}`, () => loadSlug(domainId, normalized), value =>
+    value ? SLUG_TTL : SLUG_NOT_FOUND_TTL
+  )
+}
+
+// Loads already running may have read the pre-change rows: stop them from being
+// cached or joined by new requests
+function startNewGeneration(store: ResolutionStore): void {
+  store.generation++
+  store.inFlight.clear()
+}
+
+/**
+ * Drop a domain (and its cached slugs) after it is added, verified, updated or
+ * removed. Affects this process only.
+ */
+export function invalidateCustomDomain(host: string): void {
+  const store = getStore()
+  startNewGeneration(store)
+  const key = host.toLowerCase()
+  const entry = store.domains.get(key)
+  if (entry?.value) {
+    store.slugs.deleteByPrefix(`${entry.value.id}:`)
+  }
+  store.domains.delete(key)
+}
+
+/**
+ * Drop cached vanity URL / custom slug lookups after a mapping changes. Affects
+ * this process only.
+ */
+export function invalidateDomainSlugs(domainId: string | null | undefined, slugs: Array<string | null | undefined>): void {
+  if (!domainId) return
+  const store = getStore()
+  startNewGeneration(store)
+  for (const slug of slugs) {
+    if (slug) store.slugs.delete(`${domainId}:${slug.toLowerCase()}`)
+  }
+}
+
+export function getDomainResolutionStats() {
+  const store = getStore()
+  return { ...store.stats, domains: store.domains.size, slugs: store.slugs.size }
+}
+
+/**
+ * Empty both caches (tests and manual resets)
+ */
+export function clearDomainResolutionCache(): void {
+  const store = getStore()
+  startNewGeneration(store)
+  store.domains.clear()
+  store.slugs.clear()
+}
@@ -6,6 +6,7 @@
 import { getSupabaseAdmin } from "@/lib/supabase"
 import { NextRequest, NextResponse } from "next/server"
 import { getErrorPage } from "@/lib/error-pages"
+import { resolveCustomDomain, resolveDomainSlug } from "@/lib/domain-resolution"
 
 export interface RoutingConfig {
   defaultRedirect?: string
@@ -20,17 +21,8 @@ export interface RoutingConfig {
  */
 export async function getDomainRoutingConfig(domain: string): Promise<RoutingConfig | null> {
   try {
-    const admin = getSupabaseAdmin()
-    if (!admin) return null
-    const { data: customDomain, error } = await admin
-      .from('QrCodeCustomDomain')
-      .select('routingConfig, custom404Page, customExpiryPage')
-      .eq('domain', domain)
-      .eq('isVerified', true)
-      .eq('status', 'active')
-      .single()
-    
-    if (error || !customDomain) {
+    const customDomain = await resolveCustomDomain(domain)
+    if (!customDomain) {
       return null
     }
     
@@ -158,6 +150,17 @@ export async function checkVanityUrlAvailability(
   }
 }
 
+/**
+ * Internal URL of the server-side scan redirect handler for a QR code
+ */
+export function getScanRedirectUrl(request: NextRequest, qrCodeId: string, domainId?: string): URL {
+  const target = new URL(`/api/qr-codes/${encodeURIComponent(qrCodeId)}/redirect`, request.url)
+  if (domainId) {
+    target.searchParams.set('domainId', domainId)
+  }
+  return target
+}
+
 /**
  * Handle custom domain routing
  * This is called by middleware to route requests from custom domains
@@ -168,17 +171,9 @@ export async function handleCustomDomainRequest(
   pathname: string
 ): Promise<NextResponse | null> {
   try {
-    // Get domain configuration
-    const admin = getSupabaseAdmin()
-    if (!admin) return null
-    const { data: customDomain, error: domainError } = await admin
-      .from('QrCodeCustomDomain')
-      .select('id, routingConfig, custom404Page, customExpiryPage, status')
-      .eq('domain', domain)
-      .eq('isVerified', true)
-      .single()
-    
-    if (domainError || !customDomain || customDomain.status !== 'active') {
+    // Get domain configuration (cached, including unknown hosts)
+    const customDomain = await resolveCustomDomain(domain)
+    if (!customDomain) {
       return null // Domain not found or not active
     }
     
@@ -204,20 +199,12 @@ export async function handleCustomDomainRequest(
     // Extract slug/vanity URL from pathname (remove leading slash)
     const slug = pathname.slice(1)
     
-    // Try to resolve as vanity URL first
-    const vanityMapping = await resolveVanityUrl(slug, customDomain.id)
-    if (vanityMapping) {
-      // Redirect to QR code scan endpoint
-      const baseUrl = request.nextUrl.origin
-      return NextResponse.redirect(`${baseUrl}/qr/${vanityMapping.qrCodeId}`)
-    }
-    
-    // Try to resolve as custom slug
-    const slugMapping = await getQrCodeBySlug(slug, customDomain.id)
-    if (slugMapping) {
-      // Redirect to QR code scan endpoint
-      const baseUrl = request.nextUrl.origin
-      return NextResponse.redirect(`${baseUrl}/qr/${slugMapping.qrCodeId}`)
+    // Resolve as vanity URL or custom slug
+    const qrCodeId = await resolveDomainSlug(customDomain.id, slug)
+    if (qrCodeId) {
+      // Hand the scan to the redirect handler in-process; the visitor gets a
+      // single 302 to the final destination
+      return NextResponse.rewrite(getScanRedirectUrl(request, qrCodeId, customDomain.id))
     }
     
     // Not found - return custom 404 if available
@@ -10,14 +10,16 @@ interface SharpInstance {
   jpeg: (options?: { quality?: number; progressive?: boolean }) => SharpInstance
   png: (options?: { quality?: number; progressive?: boolean }) => SharpInstance
   avif: (options?: { quality?: number }) => SharpInstance
+  flatten: (options?: { background?: string }) => SharpInstance
+  metadata: () => Promise<{ width?: number; height?: number; format?: string }>
   toBuffer: () => Promise<Buffer>
 }
 
-type SharpConstructor = (input?: Buffer) => SharpInstance
+type SharpConstructor = (input?: Buffer, options?: { density?: number }) => SharpInstance
 
 let sharpInstance: SharpConstructor | null = null
 
-async function getSharp(): Promise<SharpConstructor> {
+export async function getSharp(): Promise<SharpConstructor> {
   if (typeof window !== 'undefined') {
     throw new Error('Image optimization is only available server-side')
   }
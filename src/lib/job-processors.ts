@@ -0,0 +1,111 @@
+/**
+ * Background Job Processors
+ * One processor per JobType, run by the job worker (src/lib/job-worker.ts)
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { invalidateServableQrCode } from '@/lib/qr-resolution'
+import { advanceScanRollups, backfillScanRollups } from '@/lib/scan-rollups'
+import { processBulkQrRender, type BulkQrRenderPayload } from '@/lib/bulk-render'
+import type { JobType } from '@/lib/background-jobs'
+import type { JobProcessor } from '@/lib/job-worker'
+
+type BulkQrCreatePayload = { userId: string; qrCodes: Array<Record<string, unknown>> }
+async function processBulkQRCreate(payload: BulkQrCreatePayload) {
+  const { userId, qrCodes } = payload
+
+  const results = []
+  for (const qrData of qrCodes) {
+    const { data, error } = await supabaseAdmin!
+      .from('QrCode')
+      .insert({
+        ...qrData,
+        userId,
+      })
+      .select()
+      .single()
+
+    if (error) {
+      results.push({ error: error.message, data: qrData })
+    } else {
+      results.push({ success: true, id: data.id })
+    }
+  }
+
+  return results
+}
+
+type BulkQrUpdatePayload = { updates: Array<Record<string, unknown> & { id: string }> }
+async function processBulkQRUpdate(payload: BulkQrUpdatePayload) {
+  const { updates } = payload
+
+  const results = []
+  for (const update of updates) {
+    const { id, ...data } = update
+    const { error } = await supabaseAdmin!
+      .from('QrCode')
+      .update(data)
+      .eq('id', id)
+
+    if (error) {
+      results.push({ error: error.message, id })
+    } else {
+      results.push({ success: true, id })
+    }
+  }
+
+  await invalidateServableQrCode(updates.map(update => update.id))
+
+  return results
+}
+
+type QrExportPayload = { userId: string; format: string; filters?: Record<string, unknown> }
+// eslint-disable-next-line @typescript-eslint/no-unused-vars
+async function processQRExport(_payload: QrExportPayload) {
+
+  // Generate export file (implement based on format)
+  // For now, return success
+  return { success: true, fileUrl: null }
+}
+
+// eslint-disable-next-line @typescript-eslint/no-unused-vars
+async function processWebhookRetry(_payload: unknown) {
+  // Webhook retry is handled by processWebhookOutbox
+  return { success: true }
+}
+
+type AnalyticsAggregatePayload = {
+  date?: string // Recompute a single UTC day
+  backfill?: { from: string; to: string; qrCodeIds?: string[] } // Recompute an inclusive range
+}
+async function processAnalyticsAggregate(payload: AnalyticsAggregatePayload) {
+  if (payload.backfill) {
+    return await backfillScanRollups(payload.backfill)
+  }
+
+  if (payload.date) {
+    return await backfillScanRollups({ from: payload.date, to: payload.date })
+  }
+
+  // Incremental: roll up closed days after the watermark
+  return await advanceScanRollups()
+}
+
+type ImageOptimizationPayload = { imageUrl: string; options?: Record<string, unknown> }
+async function processImageOptimization(payload: ImageOptimizationPayload) {
+  const { imageUrl } = payload
+
+  // Optimize image (implement using image optimization utilities)
+  // For now, return success
+  return { success: true, optimizedUrl: imageUrl }
+}
+
+export const backgroundJobProcessors: Record<JobType, JobProcessor> = {
+  bulk_qr_create: payload => processBulkQRCreate(payload as BulkQrCreatePayload),
+  bulk_qr_update: payload => processBulkQRUpdate(payload as BulkQrUpdatePayload),
+  qr_export: payload => processQRExport(payload as QrExportPayload),
+  webhook_retry: payload => processWebhookRetry(payload),
+  analytics_aggregate: payload => processAnalyticsAggregate(payload as AnalyticsAggregatePayload),
+  image_optimization: payload => processImageOptimization(payload as ImageOptimizationPayload),
+  bulk_qr_render: (payload, context) => processBulkQrRender(payload as unknown as BulkQrRenderPayload, context),
+}
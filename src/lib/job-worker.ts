@@ -0,0 +1,363 @@
+/**
+ * Background Job Worker
+ * Claims batches of jobs, runs up to `concurrency` of them at once (with
+ * optional per-JobType limits) and keeps their leases alive with a heartbeat.
+ * Jobs whose worker dies are re-queued once their lease expires.
+ */
+
+import { hostname } from 'os'
+import { randomUUID } from 'crypto'
+import {
+  claimBackgroundJobs,
+  heartbeatBackgroundJobs,
+  finishBackgroundJob,
+  reportBackgroundJobProgress,
+  type BackgroundJob,
+  type JobType,
+} from '@/lib/background-jobs'
+
+export interface JobContext {
+  job: BackgroundJob
+  signal: AbortSignal // Aborted when the job times out or the lease is lost
+  reportProgress: (progress: Record<string, unknown>) => Promise<void>
+}
+
+export type JobProcessor = (payload: Record<string, unknown>, context: JobContext) => Promise<unknown>
+
+export interface JobWorkerOptions {
+  processors: Partial<Record<JobType, JobProcessor>>
+  workerId?: string
+  concurrency?: number
+  perTypeConcurrency?: Partial<Record<JobType, number>>
+  pollIntervalMs?: number
+  leaseSeconds?: number
+  heartbeatIntervalMs?: number
+  jobTimeoutMs?: number
+}
+
+export interface JobWorkerStats {
+  workerId: string
+  running: number
+  runningByType: Partial<Record<JobType, number>>
+  claimed: number
+  completed: number
+  failed: number
+  leasesLost: number
+}
+
+export interface JobRunResult {
+  id: string
+  jobType: JobType
+  status: BackgroundJob['status'] | 'lost'
+  error?: string
+}
+
+interface RunningJob {
+  job: BackgroundJob
+  controller: AbortController
+  done: Promise<JobRunResult>
+}
+
+const DEFAULT_CONCURRENCY = 4
+const DEFAULT_POLL_INTERVAL_MS = 1000
+const DEFAULT_LEASE_SECONDS = 60
+const DEFAULT_JOB_TIMEOUT_MS = 300000 // 5 minutes
+
+/**
+ * Read worker settings from JOB_WORKER_* environment variables
+ */
+export function jobWorkerOptionsFromEnv(): Omit<JobWorkerOptions, 'processors'> {
+  const perTypeConcurrency: Partial<Record<JobType, number>> = {}
+  // e.g. "bulk_qr_create=2,qr_export=1"
+  for (const entry of (process.env.JOB_WORKER_TYPE_CONCURRENCY || '').split(',')) {
+    const [jobType, limit] = entry.split('=').map(part => part.trim())
+    if (jobType && limit) {
+      perTypeConcurrency[jobType as JobType] = parseInt(limit, 10)
+    }
+  }
+
+  const number = (value: string | undefined) => (value ? parseInt(value, 10) : undefined)
+
+  return {
+    workerId: process.env.JOB_WORKER_ID || undefined,
+    concurrency: number(process.env.JOB_WORKER_CONCURRENCY),
+    perTypeConcurrency,
+    pollIntervalMs: number(process.env.JOB_WORKER_POLL_INTERVAL_MS),
+    leaseSeconds: number(process.env.JOB_WORKER_LEASE_SECONDS),
+    jobTimeoutMs: number(process.env.JOB_WORKER_JOB_TIMEOUT_MS),
+  }
+}
+
+export class JobWorker {
+  readonly workerId: string
+  private processors: Partial<Record<JobType, JobProcessor>>
+  private concurrency: number
+  private perTypeConcurrency: Partial<Record<JobType, number>>
+  private pollIntervalMs: number
+  private leaseSeconds: number
+  private heartbeatIntervalMs: number
+  private jobTimeoutMs: number
+
+  private running = new Map<string, RunningJob>()
+  private heartbeatTimer: ReturnType<typeof setInterval> | null = null
+  private loop: Promise<void> | null = null
+  private stopping = false
+  private wake: (() => void) | null = null
+  private stats = { claimed: 0, completed: 0, failed: 0, leasesLost: 0 }
+
+  constructor(options: JobWorkerOptions) {
+    this.processors = options.processors
+    this.workerId = options.workerId || `${hostname()}:${process.pid}:${randomUUID().slice(0, 8)}`
+    this.concurrency = Math.max(1, options.concurrency || DEFAULT_CONCURRENCY)
+    this.perTypeConcurrency = options.perTypeConcurrency || {}
+    this.pollIntervalMs = options.pollIntervalMs || DEFAULT_POLL_INTERVAL_MS
+    this.leaseSeconds = options.leaseSeconds || DEFAULT_LEASE_SECONDS
+    // Three heartbeats per lease so one slow round trip doesn't lose the job
+    this.heartbeatIntervalMs = options.heartbeatIntervalMs || (this.leaseSeconds * 1000) / 3
+    this.jobTimeoutMs = options.jobTimeoutMs || DEFAULT_JOB_TIMEOUT_MS
+  }
+
+  /**
+   * Poll for jobs until stop() is called
+   */
+  start(): void {
+    if (this.loop) return
+    this.stopping = false
+    this.startHeartbeat()
+    this.loop = this.pollLoop()
+  }
+
+  /**
+   * Stop claiming and wait up to timeoutMs for running jobs to finish.
+   * Jobs still running after that keep their lease until it expires, then
+   * get re-queued for another worker.
+   */
+  async stop(timeoutMs = 30000): Promise<void> {
+    this.stopping = true
+    this.wake?.()
+    await this.loop
+    this.loop = null
+
+    const pending = Array.from(this.running.values()).map(entry => entry.done)
+    if (pending.length > 0) {
+      let timer: ReturnType<typeof setTimeout> | undefined
+      await Promise.race([
+        Promise.allSettled(pending),
+        new Promise(resolve => {
+          timer = setTimeout(resolve, timeoutMs)
+        }),
+      ])
+      clearTimeout(timer)
+    }
+
+    for (const entry of this.running.values()) {
+      entry.controller.abort(new Error('Worker shutting down'))
+    }
+    this.stopHeartbeat()
+  }
+
+  /**
+   * Claim and run up to `limit` jobs, then return once they have all
+   * finished. Used by the cron trigger, which has no long-lived process.
+   */
+  async runOnce(limit = 10): Promise<JobRunResult[]> {
+    const pending: Promise<JobRunResult>[] = []
+    let started = 0
+    const ownHeartbeat = !this.heartbeatTimer
+    if (ownHeartbeat) this.startHeartbeat()
+
+    try {
+      while (true) {
+        if (started < limit) {
+          const claimed = await this.fill(limit - started)
+          started += claimed.length
+          for (const job of claimed) {
+            pending.push(this.running.get(job.id)!.done)
+          }
+        }
+
+        if (this.running.size === 0) break
+        // Wait for a slot before claiming more
+        await Promise.race(Array.from(this.running.values()).map(entry => entry.done))
+      }
+    } finally {
+      if (ownHeartbeat) this.stopHeartbeat()
+    }
+
+    return Promise.all(pending)
+  }
+
+  getStats(): JobWorkerStats {
+    return {
+      workerId: this.workerId,
+      running: this.running.size,
+      runningByType: this.countRunningByType(),
+      ...this.stats,
+    }
+  }
+
+  private async pollLoop(): Promise<void> {
+    while (!this.stopping) {
+      let claimed = 0
+      try {
+        claimed = (await this.fill()).length
+      } catch (error) {
+        console.error('Error claiming background jobs:', error)
+      }
+
+      // Busy or queue drained: wait for a slot to free up or the next poll
+      if (claimed === 0 || this.running.size >= this.concurrency) {
+        await new Promise<void>(resolve => {
+          const timer = setTimeout(() => this.wake?.(), this.pollIntervalMs)
+          this.wake = () => {
+            clearTimeout(timer)
+            this.wake = null
+            resolve()
+          }
+        })
+      }
+    }
+  }
+
+  /**
+   * Claim as many jobs as there are free slots (capped at max) and start them
+   */
+  private async fill(max = Infinity): Promise<BackgroundJob[]> {
+    const free = Math.min(this.concurrency - this.running.size, max)
+    if (free <= 0) return []
+
+    const slots = this.freeSlotsByType()
+    if (Object.keys(slots).length === 0) return []
+
+    const jobs = await claimBackgroundJobs(this.workerId, slots, {
+      batchSize: free,
+      leaseSeconds: this.leaseSeconds,
+    })
+
+    this.stats.claimed += jobs.length
+    for (const job of jobs) {
+      this.launch(job)
+    }
+    return jobs
+  }
+
+  private freeSlotsByType(): Partial<Record<JobType, number>> {
+    const runningByType = this.countRunningByType()
+    const free = this.concurrency - this.running.size
+    const slots: Partial<Record<JobType, number>> = {}
+
+    for (const jobType of Object.keys(this.processors) as JobType[]) {
+      const limit = this.perTypeConcurrency[jobType] ?? this.concurrency
+      const available = Math.min(limit - (runningByType[jobType] || 0), free)
+      if (available > 0) {
+        slots[jobType] = available
+      }
+    }
+
+    return slots
+  }
+
+  private countRunningByType(): Partial<Record<JobType, number>> {
+    const counts: Partial<Record<JobType, number>> = {}
+    for (const { job } of this.running.values()) {
+      counts[job.jobType] = (counts[job.jobType] || 0) + 1
+    }
+    return counts
+  }
+
+  private launch(job: BackgroundJob): void {
+    const controller = new AbortController()
+    const done = this.execute(job, controller).finally(() => {
+      this.running.delete(job.id)
+      this.wake?.()
+    })
+    this.running.set(job.id, { job, controller, done })
+  }
+
+  private async execute(job: BackgroundJob, controller: AbortController): Promise<JobRunResult> {
+    const processor = this.processors[job.jobType]
+    let timer: ReturnType<typeof setTimeout> | undefined
+
+    try {
+      if (!processor) {
+        throw new Error(`Unknown job type: ${job.jobType}`)
+      }
+
+      const aborted = new Promise<never>((_, reject) => {
+        timer = setTimeout(() => {
+          controller.abort(new Error(`Job timed out after ${this.jobTimeoutMs}ms`))
+        }, this.jobTimeoutMs)
+        controller.signal.addEventListener('abort', () => reject(controller.signal.reason))
+      })
+      // The lease can be lost after the processor already settled
+      aborted.catch(() => {})
+
+      const result = await Promise.race([
+        processor(job.payload, {
+          job,
+          signal: controller.signal,
+          reportProgress: async progress => {
+            await reportBackgroundJobProgress(job.id, this.workerId, progress)
+          },
+        }),
+        aborted,
+      ])
+
+      const status = await finishBackgroundJob(job.id, this.workerId, { result })
+      if (!status) {
+        this.stats.leasesLost++
+        return { id: job.id, jobType: job.jobType, status: 'lost' }
+      }
+      this.stats.completed++
+      return { id: job.id, jobType: job.jobType, status }
+    } catch (error) {
+      const message = error instanceof Error ? error.message : 'Unknown error'
+      console.error(`Error processing job ${job.id}:`, error)
+
+      const status = await finishBackgroundJob(job.id, this.workerId, {
+        error: message,
+        retryDelaySeconds: 60 * (job.retries + 1), // Linear backoff
+      })
+      if (!status) {
+        this.stats.leasesLost++
+        return { id: job.id, jobType: job.jobType, status: 'lost', error: message }
+      }
+      this.stats.failed++
+      return { id: job.id, jobType: job.jobType, status, error: message }
+    } finally {
+      clearTimeout(timer)
+    }
+  }
+
+  private startHeartbeat(): void {
+    if (this.heartbeatTimer) return
+    this.heartbeatTimer = setInterval(() => {
+      this.heartbeat().catch(error => {
+        console.error('Error sending job heartbeat:', error)
+      })
+    }, this.heartbeatIntervalMs)
+  }
+
+  private stopHeartbeat(): void {
+    if (this.heartbeatTimer) {
+      clearInterval(this.heartbeatTimer)
+      this.heartbeatTimer = null
+    }
+  }
+
+  /**
+   * Extend leases for running jobs; abort any job whose lease was lost
+   */
+  async heartbeat(): Promise<void> {
+    const ids = Array.from(this.running.keys())
+    if (ids.length === 0) return
+
+    const held = new Set(await heartbeatBackgroundJobs(this.workerId, ids, this.leaseSeconds))
+    for (const id of ids) {
+      const entry = this.running.get(id)
+      if (entry && !held.has(id)) {
+        entry.controller.abort(new Error('Job lease lost'))
+      }
+    }
+  }
+}
@@ -0,0 +1,360 @@
+/**
+ * In-process Metrics Registry
+ * Counters, gauges and mergeable histograms aggregated in memory. Recording is
+ * a map update; pre-aggregated rows are flushed to the Metric table in the
+ * background, and cumulative values are exposed in Prometheus text format.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+
+export type MetricLabels = Record<string, string | number>
+export type MetricKind = 'counter' | 'gauge' | 'histogram'
+
+/**
+ * Upper bounds of the histogram buckets (roughly x1.5 apart), shared by every
+ * histogram so histograms from any process or time window can be merged by
+ * adding counts. Values above the last bound land in a final overflow bucket.
+ */
+export const HISTOGRAM_BOUNDS = [
+  1, 2, 3, 5, 8, 12, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750,
+  1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000,
+]
+
+// Beyond this many label sets per metric, new label sets share one overflow series
+const MAX_SERIES_PER_METRIC = 500
+const OVERFLOW_LABELS: MetricLabels = { overflow: 'true' }
+
+/**
+ * Pre-aggregated Metric row: value is the sum of the samples (the latest value
+ * for gauges), count the number of samples
+ */
+export interface MetricRow {
+  name: string
+  value: number
+  count: number
+  min: number | null
+  max: number | null
+  histogram: number[] | null
+  labels: MetricLabels
+  timestamp: string
+}
+
+interface Aggregate {
+  count: number
+  sum: number
+  min: number
+  max: number
+  buckets: number[] | null
+}
+
+interface Series {
+  name: string
+  kind: MetricKind
+  labels: MetricLabels
+  total: Aggregate // Since process start, for Prometheus
+  pending: Aggregate // Since the last flush
+  last: number // Latest gauge value
+}
+
+function emptyAggregate(kind: MetricKind): Aggregate {
+  return {
+    count: 0,
+    sum: 0,
+    min: Infinity,
+    max: -Infinity,
+    buckets: kind === 'histogram' ? new Array(HISTOGRAM_BOUNDS.length + 1).fill(0) : null,
+  }
+}
+
+/**
+ * Index of the histogram bucket a value falls in
+ */
+export function histogramBucketIndex(value: number): number {
+  let low = 0
+  let high = HISTOGRAM_BOUNDS.length
+  while (low < high) {
+    const mid = (low + high) >> 1
+    if (value <= HISTOGRAM_BOUNDS[mid]) high = mid
+    else low = mid + 1
+  }
+  return low
+}
+
+function addSample(aggregate: Aggregate, value: number) {
+  aggregate.count++
+  aggregate.sum += value
+  if (value < aggregate.min) aggregate.min = value
+  if (value > aggregate.max) aggregate.max = value
+  if (aggregate.buckets) aggregate.buckets[histogramBucketIndex(value)]++
+}
+
+function seriesKey(name: string, labels: MetricLabels): string {
+  const keys = Object.keys(labels).sort()
+  let key = name
+  for (const label of keys) key += `|${label}=${labels[label]}`
+  return key
+}
+
+function escapeLabelValue(value: string | number): string {
+  return String(value).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"')
+}
+
+function formatLabels(labels: MetricLabels, extra?: MetricLabels): string {
+  const entries = Object.entries(extra ? { ...labels, ...extra } : labels)
+  if (entries.length === 0) return ''
+  return `{${entries.map(([key, value]) => `${key}="${escapeLabelValue(value)}"`).join(',')}}`
+}
+
+function formatNumber(value: number): string {
+  if (value === Infinity) return '+Inf'
+  if (value === -Infinity) return '-Inf'
+  return String(value)
+}
+
+export type MetricRowWriter = (rows: MetricRow[]) => Promise<void>
+
+export async function writeMetricRows(rows: MetricRow[]): Promise<void> {
+  const { error } = await supabaseAdmin!.from('Metric').insert(rows)
+  if (error) {
+    throw new Error(`Failed to insert metrics: ${error.message}`)
+  }
+}
+
+export class MetricsRegistry {
+  private series = new Map<string, Series>()
+  private seriesPerMetric = new Map<string, number>()
+  private help = new Map<string, string>()
+  private timer: NodeJS.Timeout | null = null
+  private flushing: Promise<number> | null = null
+  private flushIntervalMs: number
+  private writer: MetricRowWriter
+
+  constructor(options: { flushIntervalMs?: number; writer?: MetricRowWriter } = {}) {
+    this.flushIntervalMs = options.flushIntervalMs ?? getMetricsFlushIntervalMs()
+    this.writer = options.writer ?? writeMetricRows
+  }
+
+  /**
+   * Attach a description shown in the Prometheus output
+   */
+  describe(name: string, help: string): void {
+    this.help.set(name, help)
+  }
+
+  increment(name: string, labels: MetricLabels = {}, by = 1): void {
+    const series = this.getSeries(name, 'counter', labels)
+    addSample(series.total, by)
+    addSample(series.pending, by)
+  }
+
+  setGauge(name: string, value: number, labels: MetricLabels = {}): void {
+    const series = this.getSeries(name, 'gauge', labels)
+    series.last = value
+    addSample(series.total, value)
+    addSample(series.pending, value)
+  }
+
+  observe(name: string, value: number, labels: MetricLabels = {}): void {
+    const series = this.getSeries(name, 'histogram', labels)
+    addSample(series.total, value)
+    addSample(series.pending, value)
+  }
+
+  /**
+   * Pre-aggregated rows for everything recorded since the last call, resetting the pending window
+   */
+  collectRows(now = new Date()): MetricRow[] {
+    const rows: MetricRow[] = []
+    const timestamp = now.toISOString()
+
+    for (const series of this.series.values()) {
+      const pending = series.pending
+      if (pending.count === 0) continue
+
+      rows.push({
+        name: series.name,
+        value: series.kind === 'gauge' ? series.last : pending.sum,
+        count: series.kind === 'gauge' ? 1 : pending.count,
+        min: series.kind === 'counter' ? null : pending.min,
+        max: series.kind === 'counter' ? null : pending.max,
+        histogram: pending.buckets,
+        labels: series.labels,
+        timestamp,
+      })
+      series.pending = emptyAggregate(series.kind)
+    }
+
+    return rows
+  }
+
+  /**
+   * Write pending aggregates. Concurrent callers share one in-flight flush.
+   */
+  flush(): Promise<number> {
+    if (this.flushing) return this.flushing
+
+    this.flushing = this.flushRows().finally(() => {
+      this.flushing = null
+    })
+    return this.flushing
+  }
+
+  private async flushRows(): Promise<number> {
+    const rows = this.collectRows()
+    if (rows.length === 0) return 0
+
+    try {
+      await this.writer(rows)
+      return rows.length
+    } catch (error) {
+      // Metrics are best-effort; the window is dropped rather than retried
+      console.error('Error flushing metrics:', error)
+      return 0
+    }
+  }
+
+  stop(): void {
+    if (this.timer) {
+      clearInterval(this.timer)
+      this.timer = null
+    }
+  }
+
+  /**
+   * Cumulative values since process start in the Prometheus text exposition format
+   */
+  renderPrometheus(): string {
+    const byName = new Map<string, Series[]>()
+    for (const series of this.series.values()) {
+      const list = byName.get(series.name)
+      if (list) list.push(series)
+      else byName.set(series.name, [series])
+    }
+
+    const lines: string[] = []
+    for (const [name, list] of byName) {
+      const kind = list[0].kind
+      const help = this.help.get(name)
+      if (help) lines.push(`# HELP ${name} ${help}`)
+      lines.push(`# TYPE ${name} ${kind}`)
+
+      for (const series of list) {
+        if (kind === 'counter') {
+          lines.push(`${name}${formatLabels(series.labels)} ${formatNumber(series.total.sum)}`)
+        } else if (kind === 'gauge') {
+          lines.push(`${name}${formatLabels(series.labels)} ${formatNumber(series.last)}`)
+        } else {
+          let cumulative = 0
+          series.total.buckets!.forEach((count, index) => {
+            cumulative += count
+            const le = index < HISTOGRAM_BOUNDS.length ? String(HISTOGRAM_BOUNDS[index]) : '+Inf'
+            lines.push(`${name}_bucket${formatLabels(series.labels, { le })} ${cumulative}`)
+          })
+          lines.push(`${name}_sum${formatLabels(series.labels)} ${formatNumber(series.total.sum)}`)
+          lines.push(`${name}_count${formatLabels(series.labels)} ${series.total.count}`)
+        }
+      }
+    }
+
+    return lines.join('\n') + '\n'
+  }
+
+  private getSeries(name: string, kind: MetricKind, labels: MetricLabels): Series {
+    this.ensureTimer()
+
+    let key = seriesKey(name, labels)
+    let series = this.series.get(key)
+    if (series) return series
+
+    const seriesCount = this.seriesPerMetric.get(name) || 0
+    if (seriesCount >= MAX_SERIES_PER_METRIC) {
+      labels = OVERFLOW_LABELS
+      key = seriesKey(name, labels)
+      series = this.series.get(key)
+      if (series) return series
+    }
+
+    series = {
+      name,
+      kind,
+      labels,
+      total: emptyAggregate(kind),
+      pending: emptyAggregate(kind),
+      last: 0,
+    }
+    this.series.set(key, series)
+    this.seriesPerMetric.set(name, seriesCount + 1)
+    return series
+  }
+
+  private ensureTimer() {
+    if (this.timer) return
+    this.timer = setInterval(() => {
+      this.flush().catch(error => console.error('Metrics flush error:', error))
+    }, this.flushIntervalMs)
+    // Don't keep the process alive just for the flush timer
+    this.timer.unref?.()
+  }
+}
+
+function getMetricsFlushIntervalMs(): number {
+  const parsed = parseInt(process.env.METRICS_FLUSH_INTERVAL_MS || '', 10)
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : 10000
+}
+
+// Process-wide registry
+let registry: MetricsRegistry | null = null
+
+export function getMetricsRegistry(): MetricsRegistry {
+  if (!registry) {
+    registry = new MetricsRegistry()
+    registry.describe('request_count', 'HTTP requests by endpoint, method and status class')
+    registry.describe('error_count', 'HTTP requests that returned a 5xx status')
+    registry.describe('response_time', 'HTTP response time in milliseconds')
+  }
+  return registry
+}
+
+/**
+ * Write pending aggregates now (call on shutdown)
+ */
+export async function flushMetrics(): Promise<void> {
+  if (registry) {
+    registry.stop()
+    await registry.flush()
+  }
+}
+
+/**
+ * Estimate the q-quantile (0..1) of a histogram by interpolating linearly
+ * within the bucket that holds the target rank. The known min/max tighten the
+ * first and last buckets.
+ */
+export function histogramQuantile(
+  buckets: number[],
+  q: number,
+  range: { min?: number | null; max?: number | null } = {}
+): number {
+  const total = buckets.reduce((sum, count) => sum + count, 0)
+  if (total === 0) return 0
+
+  const rank = Math.min(Math.max(q, 0), 1) * total
+  let cumulative = 0
+
+  for (let index = 0; index < buckets.length; index++) {
+    const count = buckets[index]
+    if (count === 0 || cumulative + count < rank) {
+      cumulative += count
+      continue
+    }
+
+    let lower = index > 0 ? HISTOGRAM_BOUNDS[index - 1] : 0
+    let upper = index < HISTOGRAM_BOUNDS.length ? HISTOGRAM_BOUNDS[index] : (range.max ?? lower)
+    if (range.min != null) lower = Math.max(lower, Math.min(range.min, upper))
+    if (range.max != null) upper = Math.min(upper, Math.max(range.max, lower))
+
+    return lower + ((upper - lower) * (rank - cumulative)) / count
+  }
+
+  return range.max ?? HISTOGRAM_BOUNDS[HISTOGRAM_BOUNDS.length - 1]
+}
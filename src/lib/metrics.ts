@@ -1,9 +1,12 @@
 /**
  * Metrics Collection System
- * Collects and aggregates application metrics (request rate, error rate, latency, payment conversion, churn, LTV)
+ * Collects and aggregates application metrics (request rate, error rate, latency, payment conversion, churn, LTV).
+ * Request metrics are aggregated in process (metrics-registry.ts) and stored as pre-aggregated Metric rows,
+ * which are downsampled into 1m/1h/1d MetricBucket rows for range and percentile queries.
  */
 
 import { supabaseAdmin } from '@/lib/supabase'
+import { getMetricsRegistry, histogramQuantile } from '@/lib/metrics-registry'
 
 export interface MetricValue {
   name: string
@@ -27,67 +30,222 @@ export interface RequestMetric {
 }
 
 /**
- * Record a metric
+ * Record a metric sample. Aggregated in memory and flushed in the background.
  */
 export async function recordMetric(
   name: string,
   value: number,
   labels?: Record<string, string | number>
 ): Promise<void> {
-  try {
-    await supabaseAdmin!.from('Metric').insert({
-      name,
-      value,
-      labels: labels || {},
-      timestamp: new Date().toISOString(),
-    })
-  } catch (error) {
-    // Don't fail the request if metric recording fails
-    console.error('Failed to record metric:', error)
+  getMetricsRegistry().observe(name, value, labels)
+}
+
+// Path segments that identify a resource rather than a route
+const ID_SEGMENT = /^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|(?=.*\d)[A-Za-z0-9_-]{16,})$/i
+
+/**
+ * Route-shaped endpoint label ("/api/qr-codes/:id/scans") so label sets stay bounded
+ */
+export function normalizeEndpoint(pathname: string): string {
+  return pathname
+    .split('/')
+    .map(segment => (ID_SEGMENT.test(segment) ? ':id' : segment))
+    .join('/')
+}
+
+export function getStatusClass(statusCode: number): string {
+  return `${Math.floor(statusCode / 100)}xx`
+}
+
+/**
+ * Record a request metric. Only updates in-memory aggregates, so it is safe
+ * to call on the response path.
+ */
+export function recordRequestMetric(metric: RequestMetric): void {
+  const registry = getMetricsRegistry()
+  const endpoint = normalizeEndpoint(metric.endpoint)
+
+  registry.increment('request_count', {
+    endpoint,
+    method: metric.method,
+    status: getStatusClass(metric.statusCode),
+  })
+
+  if (metric.statusCode >= 500) {
+    registry.increment('error_count', { endpoint, method: metric.method })
   }
+
+  registry.observe('response_time', metric.responseTime, { endpoint, method: metric.method })
+}
+
+export type MetricResolution = '1m' | '1h' | '1d'
+
+export interface MetricSegment {
+  source: MetricResolution | 'raw'
+  from: string
+  to: string
+}
+
+export type MetricRollupWatermarks = Partial<Record<MetricResolution, Date>>
+
+export interface MetricSummary {
+  count: number
+  sum: number
+  avg: number
+  min: number
+  max: number
+  p50: number
+  p95: number
+  p99: number
+  values: Array<{ timestamp: string; value: number }>
 }
 
+const MINUTE_MS = 60 * 1000
+const HOUR_MS = 60 * MINUTE_MS
+const DAY_MS = 24 * HOUR_MS
+
+// Coarsest first; each level only covers time its rollup has completed
+const ROLLUP_LEVELS: Array<{ resolution: MetricResolution; ms: number }> = [
+  { resolution: '1d', ms: DAY_MS },
+  { resolution: '1h', ms: HOUR_MS },
+  { resolution: '1m', ms: MINUTE_MS },
+]
+
 /**
- * Record a request metric
+ * Split [startDate, endDate) into the fewest bucket reads: whole days from
+ * 1-day buckets, the remaining whole hours from 1-hour buckets, minutes from
+ * 1-minute buckets, and raw Metric rows for anything not rolled up yet.
+ * Edges older than the finer levels' retention only count what was kept.
  */
-export async function recordRequestMetric(metric: RequestMetric): Promise<void> {
+export function planMetricSegments(
+  startDate: Date,
+  endDate: Date,
+  watermarks: MetricRollupWatermarks
+): MetricSegment[] {
+  const plan = (from: number, to: number, level: number): MetricSegment[] => {
+    if (from >= to) return []
+    if (level === ROLLUP_LEVELS.length) {
+      return [{ source: 'raw', from: new Date(from).toISOString(), to: new Date(to).toISOString() }]
+    }
+
+    const { resolution, ms } = ROLLUP_LEVELS[level]
+    const start = Math.ceil(from / ms) * ms
+    const end = Math.min(Math.floor(to / ms) * ms, watermarks[resolution]?.getTime() ?? -Infinity)
+    if (end <= start) return plan(from, to, level + 1)
+
+    return [
+      ...plan(from, start, level + 1),
+      { source: resolution, from: new Date(start).toISOString(), to: new Date(end).toISOString() },
+      ...plan(end, to, level + 1),
+    ]
+  }
+
+  return plan(startDate.getTime(), endDate.getTime(), 0)
+}
+
+async function getMetricRollupWatermarks(): Promise<MetricRollupWatermarks> {
+  const { data, error } = await supabaseAdmin!
+    .from('MetricRollupState')
+    .select('resolution, watermark')
+
+  if (error) {
+    console.error('Error reading metric rollup watermarks:', error)
+    return {}
+  }
+
+  const watermarks: MetricRollupWatermarks = {}
+  for (const row of (data || []) as Array<{ resolution: MetricResolution; watermark: string }>) {
+    watermarks[row.resolution] = new Date(row.watermark)
+  }
+  return watermarks
+}
+
+const EMPTY_SUMMARY: MetricSummary = {
+  count: 0,
+  sum: 0,
+  avg: 0,
+  min: 0,
+  max: 0,
+  p50: 0,
+  p95: 0,
+  p99: 0,
+  values: [],
+}
+
+/**
+ * Summarize a metric over [startDate, endDate) from the rollup buckets:
+ * totals, percentiles (for histograms) and one value per bucket
+ */
+export async function getMetricSummary(
+  name: string,
+  startDate: Date,
+  endDate: Date,
+  labels?: Record<string, string | number>
+): Promise<MetricSummary> {
   try {
-    await supabaseAdmin!.from('RequestMetric').insert({
-      correlationId: metric.correlationId,
-      endpoint: metric.endpoint,
-      method: metric.method,
-      statusCode: metric.statusCode,
-      responseTime: metric.responseTime,
-      requestSize: metric.requestSize || 0,
-      responseSize: metric.responseSize || 0,
-      userId: metric.userId || null,
-      organizationId: metric.organizationId || null,
-      ipAddress: metric.ipAddress || null,
-      userAgent: metric.userAgent || null,
-      createdAt: new Date().toISOString(),
-    })
-    
-    // Also record aggregate metrics
-    await recordMetric('request_count', 1, {
-      endpoint: metric.endpoint,
-      method: metric.method,
-      status: metric.statusCode >= 500 ? 'error' : metric.statusCode >= 400 ? 'warning' : 'success',
-    })
-    
-    if (metric.statusCode >= 500) {
-      await recordMetric('error_count', 1, {
-        endpoint: metric.endpoint,
-        method: metric.method,
-      })
+    const segments = planMetricSegments(startDate, endDate, await getMetricRollupWatermarks())
+    if (segments.length === 0) {
+      return { ...EMPTY_SUMMARY }
     }
-    
-    await recordMetric('response_time', metric.responseTime, {
-      endpoint: metric.endpoint,
-      method: metric.method,
+
+    const { data, error } = await supabaseAdmin!.rpc('summarize_metric_buckets', {
+      p_name: name,
+      p_segments: segments,
+      p_labels: labels && Object.keys(labels).length > 0 ? labels : null,
     })
+
+    if (error || !data || data.length === 0) {
+      if (error) console.error('Failed to summarize metric buckets:', error)
+      return { ...EMPTY_SUMMARY }
+    }
+
+    type BucketRow = {
+      bucket_start: string
+      count: number | string
+      sum: number | string
+      min: number | string | null
+      max: number | string | null
+      histogram: number[] | null
+    }
+    const toNumber = (value: number | string) => (typeof value === 'number' ? value : parseFloat(value))
+
+    let count = 0
+    let sum = 0
+    let min = Infinity
+    let max = -Infinity
+    let histogram: number[] | null = null
+    const values: Array<{ timestamp: string; value: number }> = []
+
+    for (const row of data as BucketRow[]) {
+      const rowSum = toNumber(row.sum)
+      count += toNumber(row.count)
+      sum += rowSum
+      if (row.min != null) min = Math.min(min, toNumber(row.min))
+      if (row.max != null) max = Math.max(max, toNumber(row.max))
+      if (row.histogram) {
+        histogram = histogram || new Array(row.histogram.length).fill(0)
+        row.histogram.forEach((bucketCount, index) => {
+          histogram![index] = (histogram![index] || 0) + bucketCount
+        })
+      }
+      values.push({ timestamp: row.bucket_start, value: rowSum })
+    }
+
+    const range = { min: Number.isFinite(min) ? min : null, max: Number.isFinite(max) ? max : null }
+    return {
+      count,
+      sum,
+      avg: count > 0 ? sum / count : 0,
+      min: range.min ?? 0,
+      max: range.max ?? 0,
+      p50: histogram ? histogramQuantile(histogram, 0.5, range) : 0,
+      p95: histogram ? histogramQuantile(histogram, 0.95, range) : 0,
+      p99: histogram ? histogramQuantile(histogram, 0.99, range) : 0,
+      values,
+    }
   } catch (error) {
-    // Don't fail the request if metric recording fails
-    console.error('Failed to record request metric:', error)
+    console.error('Failed to get metric summary:', error)
+    return { ...EMPTY_SUMMARY }
   }
 }
 
@@ -107,62 +265,68 @@ export async function getMetrics(
   max: number
   values: Array<{ timestamp: string; value: number }>
 }> {
-  try {
-    let query = supabaseAdmin!
-      .from('Metric')
-      .select('*')
-      .eq('name', name)
-      .gte('timestamp', startDate.toISOString())
-      .lte('timestamp', endDate.toISOString())
-      .order('timestamp', { ascending: true })
-    
-    // Apply label filters if provided
-    if (labels && Object.keys(labels).length > 0) {
-      // Note: Supabase JSONB filtering may need adjustment based on your setup
-      for (const [key, value] of Object.entries(labels)) {
-        query = query.contains('labels', { [key]: value }) as typeof query
-      }
-    }
-    
-    const { data, error } = await query
-    
-    if (error || !data || data.length === 0) {
-      return {
-        count: 0,
-        sum: 0,
-        avg: 0,
-        min: 0,
-        max: 0,
-        values: [],
-      }
-    }
-    
-    const values = data.map((m: { timestamp: string; value: string | number }) => ({
-      timestamp: m.timestamp,
-      value: typeof m.value === 'number' ? m.value : parseFloat(m.value),
-    }))
-    
-    const numericValues = values.map(v => v.value)
-    
-    return {
-      count: values.length,
-      sum: numericValues.reduce((a, b) => a + b, 0),
-      avg: numericValues.length > 0 ? numericValues.reduce((a, b) => a + b, 0) / numericValues.length : 0,
-      min: numericValues.length > 0 ? Math.min(...numericValues) : 0,
-      max: numericValues.length > 0 ? Math.max(...numericValues) : 0,
-      values,
-    }
-  } catch (error) {
-    console.error('Failed to get metrics:', error)
-    return {
-      count: 0,
-      sum: 0,
-      avg: 0,
-      min: 0,
-      max: 0,
-      values: [],
+  const { count, sum, avg, min, max, values } = await getMetricSummary(name, startDate, endDate, labels)
+  return { count, sum, avg, min, max, values }
+}
+
+/**
+ * Get p50/p95/p99 of a histogram metric (e.g. response_time) over a time period
+ */
+export async function getMetricPercentiles(
+  name: string,
+  startDate: Date,
+  endDate: Date,
+  labels?: Record<string, string | number>
+): Promise<{ count: number; avg: number; p50: number; p95: number; p99: number }> {
+  const { count, avg, p50, p95, p99 } = await getMetricSummary(name, startDate, endDate, labels)
+  return { count, avg, p50, p95, p99 }
+}
+
+/**
+ * Roll up closed raw metrics into 1m/1h/1d buckets, repeating until caught up
+ */
+export async function advanceMetricRollups(options: { maxRuns?: number } = {}) {
+  const maxRuns = options.maxRuns || 10
+  let runs = 0
+  let rows = 0
+  let caughtUp = false
+
+  while (runs < maxRuns && !caughtUp) {
+    const { data, error } = await supabaseAdmin!.rpc('advance_metric_rollups')
+
+    if (error) {
+      throw new Error(`Failed to advance metric rollups: ${error.message}`)
     }
+
+    const levels = Object.values((data || {}) as Record<string, { rows: number; caughtUp: boolean }>)
+    runs++
+    rows += levels.reduce((total, level) => total + (level.rows || 0), 0)
+    caughtUp = levels.every(level => level.caughtUp)
   }
+
+  return { runs, rows, caughtUp }
+}
+
+/**
+ * Delete raw metrics and fine-grained buckets past retention (only once rolled up)
+ */
+export async function pruneMetrics(): Promise<Record<string, number>> {
+  const { data, error } = await supabaseAdmin!.rpc('prune_metrics', {
+    p_raw_retention: `${readIntEnv('METRICS_RAW_RETENTION_HOURS', 48)} hours`,
+    p_minute_retention: `${readIntEnv('METRICS_MINUTE_RETENTION_DAYS', 7)} days`,
+    p_hour_retention: `${readIntEnv('METRICS_HOUR_RETENTION_DAYS', 90)} days`,
+  })
+
+  if (error) {
+    throw new Error(`Failed to prune metrics: ${error.message}`)
+  }
+
+  return data as Record<string, number>
+}
+
+function readIntEnv(name: string, fallback: number): number {
+  const parsed = parseInt(process.env[name] || '', 10)
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : fallback
 }
 
 /**
@@ -173,29 +337,9 @@ export async function getRequestRate(
   endDate: Date,
   endpoint?: string
 ): Promise<number> {
-  try {
-    let query = supabaseAdmin!
-      .from('RequestMetric')
-      .select('id', { count: 'exact', head: true })
-      .gte('createdAt', startDate.toISOString())
-      .lte('createdAt', endDate.toISOString())
-    
-    if (endpoint) {
-      query = query.eq('endpoint', endpoint)
-    }
-    
-    const { count, error } = await query
-    
-    if (error || count === null) {
-      return 0
-    }
-    
-    const timeDiffSeconds = (endDate.getTime() - startDate.getTime()) / 1000
-    return timeDiffSeconds > 0 ? count / timeDiffSeconds : 0
-  } catch (error) {
-    console.error('Failed to get request rate:', error)
-    return 0
-  }
+  const requests = await getMetrics('request_count', startDate, endDate, endpointLabels(endpoint))
+  const timeDiffSeconds = (endDate.getTime() - startDate.getTime()) / 1000
+  return timeDiffSeconds > 0 ? requests.sum / timeDiffSeconds : 0
 }
 
 /**
@@ -206,41 +350,11 @@ export async function getErrorRate(
   endDate: Date,
   endpoint?: string
 ): Promise<number> {
-  try {
-    let baseQuery = supabaseAdmin!
-      .from('RequestMetric')
-      .select('id', { count: 'exact', head: true })
-      .gte('createdAt', startDate.toISOString())
-      .lte('createdAt', endDate.toISOString())
-    
-    if (endpoint) {
-      baseQuery = baseQuery.eq('endpoint', endpoint)
-    }
-    
-    const { count: totalCount } = await baseQuery
-    
-    let errorQuery = supabaseAdmin!
-      .from('RequestMetric')
-      .select('id', { count: 'exact', head: true })
-      .gte('createdAt', startDate.toISOString())
-      .lte('createdAt', endDate.toISOString())
-      .gte('statusCode', 500)
-    
-    if (endpoint) {
-      errorQuery = errorQuery.eq('endpoint', endpoint)
-    }
-    
-    const { count: errorCount } = await errorQuery
-    
-    if (totalCount === null || totalCount === 0) {
-      return 0
-    }
-    
-    return (errorCount || 0) / totalCount
-  } catch (error) {
-    console.error('Failed to get error rate:', error)
-    return 0
-  }
+  const [requests, errors] = await Promise.all([
+    getMetrics('request_count', startDate, endDate, endpointLabels(endpoint)),
+    getMetrics('error_count', startDate, endDate, endpointLabels(endpoint)),
+  ])
+  return requests.sum > 0 ? errors.sum / requests.sum : 0
 }
 
 /**
@@ -251,29 +365,23 @@ export async function getAverageLatency(
   endDate: Date,
   endpoint?: string
 ): Promise<number> {
-  try {
-    let query = supabaseAdmin!
-      .from('RequestMetric')
-      .select('responseTime')
-      .gte('createdAt', startDate.toISOString())
-      .lte('createdAt', endDate.toISOString())
-    
-    if (endpoint) {
-      query = query.eq('endpoint', endpoint)
-    }
-    
-    const { data, error } = await query
-    
-    if (error || !data || data.length === 0) {
-      return 0
-    }
-    
-    const times = data.map((m: { responseTime: number }) => m.responseTime)
-    return times.reduce((a, b) => a + b, 0) / times.length
-  } catch (error) {
-    console.error('Failed to get average latency:', error)
-    return 0
-  }
+  const latency = await getMetrics('response_time', startDate, endDate, endpointLabels(endpoint))
+  return latency.avg
+}
+
+/**
+ * Get latency percentiles
+ */
+export async function getLatencyPercentiles(
+  startDate: Date,
+  endDate: Date,
+  endpoint?: string
+): Promise<{ count: number; avg: number; p50: number; p95: number; p99: number }> {
+  return getMetricPercentiles('response_time', startDate, endDate, endpointLabels(endpoint))
+}
+
+function endpointLabels(endpoint?: string): Record<string, string> | undefined {
+  return endpoint ? { endpoint: normalizeEndpoint(endpoint) } : undefined
 }
 
 /**
@@ -286,12 +394,12 @@ export async function getPaymentConversionRate(
   try {
     // Get total users who visited pricing page (or initiated payment)
     // This is a simplified example - adjust based on your tracking
-    const { count: initiatedCount } = await supabaseAdmin!
-      .from('RequestMetric')
-      .select('id', { count: 'exact', head: true })
-      .eq('endpoint', '/api/billing/subscriptions/create')
-      .gte('createdAt', startDate.toISOString())
-      .lte('createdAt', endDate.toISOString())
+    const { sum: initiatedCount } = await getMetrics(
+      'request_count',
+      startDate,
+      endDate,
+      endpointLabels('/api/billing/subscriptions/create')
+    )
     
     // Get successful payments
     const { count: paidCount } = await supabaseAdmin!
@@ -301,7 +409,7 @@ export async function getPaymentConversionRate(
       .gte('created_at', startDate.toISOString())
       .lte('created_at', endDate.toISOString())
     
-    if (initiatedCount === null || initiatedCount === 0) {
+    if (initiatedCount === 0) {
       return 0
     }
     
@@ -0,0 +1,227 @@
+/**
+ * Rendered QR Image Cache
+ * Content-addressed store for rendered QR images: a byte-bounded in-memory LRU
+ * in front of a byte-bounded directory on local disk. Keys are content hashes,
+ * so entries never go stale and are only evicted for space. Renders of the same
+ * key share one in-flight promise. Disk failures are logged and skipped.
+ */
+
+import { promises as fs } from 'fs'
+import os from 'os'
+import path from 'path'
+
+const MEMORY_MAX_BYTES = 64 * 1024 * 1024
+const DISK_MAX_BYTES = 512 * 1024 * 1024
+const CACHE_DIR = process.env.QR_IMAGE_CACHE_DIR || path.join(os.tmpdir(), 'qr-image-cache')
+
+export const IMAGE_KEY_PATTERN = /^[a-f0-9]{32}$/
+
+/**
+ * Map-backed LRU bounded by total buffer size
+ */
+export class ByteLruCache {
+  private entries = new Map<string, Buffer>()
+  private bytes = 0
+  private maxBytes: number
+
+  constructor(maxBytes: number) {
+    this.maxBytes = maxBytes
+  }
+
+  get(key: string): Buffer | undefined {
+    const value = this.entries.get(key)
+    if (!value) return undefined
+    // Refresh LRU position
+    this.entries.delete(key)
+    this.entries.set(key, value)
+    return value
+  }
+
+  set(key: string, value: Buffer): void {
+    if (value.length > this.maxBytes) return
+    this.delete(key)
+    this.entries.set(key, value)
+    this.bytes += value.length
+    while (this.bytes > this.maxBytes) {
+      this.delete(this.entries.keys().next().value as string)
+    }
+  }
+
+  delete(key: string): void {
+    const value = this.entries.get(key)
+    if (!value) return
+    this.entries.delete(key)
+    this.bytes -= value.length
+  }
+
+  clear(): void {
+    this.entries.clear()
+    this.bytes = 0
+  }
+
+  get size(): number {
+    return this.entries.size
+  }
+
+  get totalBytes(): number {
+    return this.bytes
+  }
+}
+
+/**
+ * Directory of cached files with an in-memory index (key -> size) in LRU order,
+ * rebuilt from the directory by modification time on first use
+ */
+class DiskImageCache {
+  private index = new Map<string, number>()
+  private bytes = 0
+  private ready: Promise<void> | null = null
+  private dir: string
+  private maxBytes: number
+
+  constructor(dir: string, maxBytes: number) {
+    this.dir = dir
+    this.maxBytes = maxBytes
+  }
+
+  private load(): Promise<void> {
+    if (!this.ready) {
+      this.ready = (async () => {
+        await fs.mkdir(this.dir, { recursive: true })
+        const files = await fs.readdir(this.dir)
+        const entries = await Promise.all(files
+          .filter(file => IMAGE_KEY_PATTERN.test(file))
+          .map(async file => {
+            const stat = await fs.stat(path.join(this.dir, file)).catch(() => null)
+            return stat ? { key: file, size: stat.size, mtime: stat.mtimeMs } : null
+          }))
+        for (const entry of entries.filter(Boolean).sort((a, b) => a!.mtime - b!.mtime)) {
+          this.index.set(entry!.key, entry!.size)
+          this.bytes += entry!.size
+        }
+      })().catch(error => {
+        console.error('Error loading QR image cache directory:', error)
+      })
+    }
+    return this.ready
+  }
+
+  async get(key: string): Promise<Buffer | null> {
+    await this.load()
+    const size = this.index.get(key)
+    if (size === undefined) return null
+
+    try {
+      const value = await fs.readFile(path.join(this.dir, key))
+      this.index.delete(key)
+      this.index.set(key, size)
+      return value
+    } catch {
+      this.forget(key)
+      return null
+    }
+  }
+
+  async set(key: string, value: Buffer): Promise<void> {
+    await this.load()
+    if (this.index.has(key) || value.length > this.maxBytes) return
+
+    // Write then rename so readers never see a partial file
+    const file = path.join(this.dir, key)
+    const tmp = `${file}.${process.pid}.tmp`
+    await fs.writeFile(tmp, value)
+    await fs.rename(tmp, file)
+    this.index.set(key, value.length)
+    this.bytes += value.length
+
+    while (this.bytes > this.maxBytes) {
+      const oldest = this.index.keys().next().value as string
+      this.forget(oldest)
+      await fs.unlink(path.join(this.dir, oldest)).catch(() => undefined)
+    }
+  }
+
+  private forget(key: string): void {
+    const size = this.index.get(key)
+    if (size === undefined) return
+    this.index.delete(key)
+    this.bytes -= size
+  }
+
+  get size(): number {
+    return this.index.size
+  }
+
+  get totalBytes(): number {
+    return this.bytes
+  }
+}
+
+const memory = new ByteLruCache(MEMORY_MAX_BYTES)
+const disk = new DiskImageCache(CACHE_DIR, DISK_MAX_BYTES)
+const inFlight = new Map<string, Promise<Buffer>>()
+const stats = { memoryHits: 0, diskHits: 0, renders: 0, errors: 0 }
+
+/**
+ * Cached bytes for a key from memory or disk, or null
+ */
+export async function getCachedQrImage(key: string): Promise<Buffer | null> {
+  const cached = memory.get(key)
+  if (cached) {
+    stats.memoryHits++
+    return cached
+  }
+
+  const stored = await disk.get(key)
+  if (stored) {
+    stats.diskHits++
+    memory.set(key, stored)
+  }
+  return stored
+}
+
+/**
+ * Cached bytes for a key, rendering (once, however many requests wait) and
+ * storing them on a miss
+ */
+export async function getOrRenderQrImage(key: string, render: () => Promise<Buffer>): Promise<Buffer> {
+  const cached = await getCachedQrImage(key)
+  if (cached) return cached
+
+  let pending = inFlight.get(key)
+  if (!pending) {
+    pending = render()
+      .then(value => {
+        stats.renders++
+        memory.set(key, value)
+        disk.set(key, value).catch(error => {
+          stats.errors++
+          console.error('Error writing QR image cache:', error)
+        })
+        return value
+      })
+      .finally(() => {
+        inFlight.delete(key)
+      })
+    inFlight.set(key, pending)
+  }
+  return pending
+}
+
+export function getQrImageCacheStats() {
+  return {
+    ...stats,
+    memoryEntries: memory.size,
+    memoryBytes: memory.totalBytes,
+    diskEntries: disk.size,
+    diskBytes: disk.totalBytes,
+  }
+}
+
+/**
+ * Empty the in-memory tier (tests and manual resets)
+ */
+export function clearQrImageMemoryCache(): void {
+  memory.clear()
+  inFlight.clear()
+}
@@ -0,0 +1,122 @@
+/**
+ * QR Code Image Responses
+ * Serves rendered QR images at content-addressed URLs. The stable URL
+ * (/api/qr-codes/[id]/image.svg) redirects to the current version
+ * (?v=<hash of data + style + size>), which is immutable: it carries a strong
+ * ETag, long-lived CDN cache headers and is answered from the rendered-image
+ * cache without touching the database. Restyling a code changes its hash.
+ */
+
+import { createHash } from 'crypto'
+import { NextRequest, NextResponse } from 'next/server'
+import { supabaseAdmin } from '@/lib/supabase'
+import { getImageCacheHeaders } from '@/lib/image-optimization'
+import { getCachedQrImage, getOrRenderQrImage, IMAGE_KEY_PATTERN } from '@/lib/qr-image-cache'
+import {
+  DEFAULT_RENDER_SIZE,
+  QR_RENDER_COLUMNS,
+  getQrRenderInput,
+  renderQrPng,
+  renderQrSvg,
+  type QrRenderInput,
+} from '@/lib/qr-render'
+
+export type QrImageFormat = 'svg' | 'png'
+
+// Bump when the drawing changes so every URL rolls over to a fresh render
+const RENDERER_VERSION = 2
+
+const CONTENT_TYPES: Record<QrImageFormat, string> = {
+  svg: 'image/svg+xml',
+  png: 'image/png',
+}
+
+/**
+ * Content hash identifying one rendered image
+ */
+export function getQrImageKey(input: QrRenderInput, format: QrImageFormat, scale = 1): string {
+  return createHash('sha256')
+    .update(JSON.stringify([RENDERER_VERSION, format, scale, input]))
+    .digest('hex')
+    .slice(0, 32)
+}
+
+/**
+ * Cache entry for a version of one code's image in one format. A version
+ * copied from another code's or format's URL maps to a different entry, so
+ * it misses and falls through to the lookup instead of serving those bytes.
+ */
+export function getQrImageCacheKey(id: string, format: QrImageFormat, version: string): string {
+  return createHash('sha256')
+    .update(JSON.stringify([id, format, version]))
+    .digest('hex')
+    .slice(0, 32)
+}
+
+function clampParam(value: string | null, fallback: number, min: number, max: number): number {
+  const parsed = value ? parseInt(value, 10) : NaN
+  return Number.isFinite(parsed) ? Math.min(max, Math.max(min, parsed)) : fallback
+}
+
+function imageResponse(body: Buffer, key: string, format: QrImageFormat): NextResponse {
+  return new NextResponse(new Uint8Array(body), {
+    headers: {
+      ...getImageCacheHeaders(),
+      'Content-Type': CONTENT_TYPES[format],
+      'Content-Length': String(body.length),
+      'ETag': `"${key}"`,
+      // Rendered SVGs only embed data: images and inline styles
+      ...(format === 'svg' ? { 'Content-Security-Policy': "default-src 'none'; img-src data:; style-src 'unsafe-inline'" } : {}),
+    },
+  })
+}
+
+/**
+ * Answer a QR image request: 304 / cached bytes for a known version, otherwise
+ * look up the code's style and redirect to (or render) its current version
+ */
+export async function serveQrImage(request: NextRequest, id: string, format: QrImageFormat): Promise<NextResponse> {
+  const params = request.nextUrl.searchParams
+  const version = params.get('v')
+
+  // A version already rendered for this code and format is answered without the database
+  if (version && IMAGE_KEY_PATTERN.test(version)) {
+    if (request.headers.get('if-none-match') === `"${version}"`) {
+      return new NextResponse(null, {
+        status: 304,
+        headers: { 'Cache-Control': getImageCacheHeaders()['Cache-Control'], 'ETag': `"${version}"` },
+      })
+    }
+    const cached = await getCachedQrImage(getQrImageCacheKey(id, format, version))
+    if (cached) return imageResponse(cached, version, format)
+  }
+
+  const { data: qrCode, error } = await supabaseAdmin!
+    .from('QrCode')
+    .select(QR_RENDER_COLUMNS)
+    .eq('id', id)
+    .maybeSingle()
+
+  if (error) throw error
+  if (!qrCode) {
+    return NextResponse.json({ error: 'QR code not found' }, { status: 404 })
+  }
+
+  const size = clampParam(params.get('size'), DEFAULT_RENDER_SIZE, 64, 2048)
+  const scale = format === 'png' ? clampParam(params.get('scale'), 1, 1, 8) : 1
+  const input = getQrRenderInput(qrCode, request.nextUrl.origin, size)
+  const key = getQrImageKey(input, format, scale)
+
+  if (version !== key) {
+    const url = request.nextUrl.clone()
+    url.searchParams.set('v', key)
+    const response = NextResponse.redirect(url, 302)
+    response.headers.set('Cache-Control', 'private, no-cache')
+    return response
+  }
+
+  const body = await getOrRenderQrImage(getQrImageCacheKey(id, format, key), async () =>
+    format === 'svg' ? Buffer.from(await renderQrSvg(input)) : renderQrPng(input, scale)
+  )
+  return imageResponse(body, key, format)
+}
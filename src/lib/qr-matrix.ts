@@ -0,0 +1,114 @@
+/**
+ * QR Code Matrix Encoding
+ * Encodes data into a module matrix with qrcode-generator, the encoder
+ * qr-code-styling uses, with the same mode detection, so every render draws the
+ * same modules. Matrices are bit-packed and memoized by (data, error correction
+ * level, version) in a small LRU: restyling a code only redraws, it never
+ * re-runs Reed-Solomon encoding and mask selection.
+ */
+
+import qrcode from 'qrcode-generator'
+
+export type ErrorCorrectionLevel = 'L' | 'M' | 'Q' | 'H'
+
+export interface QrMatrix {
+  size: number
+  isDark(row: number, col: number): boolean
+}
+
+type QrTypeNumber = Parameters<typeof qrcode>[0]
+
+const MATRIX_CACHE_MAX_ENTRIES = 256
+
+qrcode.stringToBytes = qrcode.stringToBytesFuncs['UTF-8']
+
+// Same mode detection as qr-code-styling
+function getMode(data: string): 'Numeric' | 'Alphanumeric' | 'Byte' {
+  if (/^[0-9]*$/.test(data)) return 'Numeric'
+  if (/^[0-9A-Z $%*+\-./:]*$/.test(data)) return 'Alphanumeric'
+  return 'Byte'
+}
+
+/**
+ * Module matrix stored one bit per module, row-major
+ */
+export class PackedQrMatrix implements QrMatrix {
+  readonly size: number
+  private bits: Uint8Array
+
+  constructor(size: number, bits: Uint8Array = new Uint8Array(Math.ceil((size * size) / 8))) {
+    this.size = size
+    this.bits = bits
+  }
+
+  static from(matrix: QrMatrix): PackedQrMatrix {
+    const packed = new PackedQrMatrix(matrix.size)
+    for (let row = 0; row < matrix.size; row++) {
+      for (let col = 0; col < matrix.size; col++) {
+        if (matrix.isDark(row, col)) {
+          const index = row * matrix.size + col
+          packed.bits[index >> 3] |= 1 << (index & 7)
+        }
+      }
+    }
+    return packed
+  }
+
+  isDark(row: number, col: number): boolean {
+    const index = row * this.size + col
+    return (this.bits[index >> 3] & (1 << (index & 7))) !== 0
+  }
+
+  get byteLength(): number {
+    return this.bits.length
+  }
+}
+
+/**
+ * Encode data into a QR module matrix (typeNumber 0 picks the smallest version)
+ */
+export function encodeQrMatrix(
+  data: string,
+  errorCorrectionLevel: ErrorCorrectionLevel = 'H',
+  typeNumber = 0
+): PackedQrMatrix {
+  const qr = qrcode(typeNumber as QrTypeNumber, errorCorrectionLevel)
+  qr.addData(data, getMode(data))
+  qr.make()
+
+  return PackedQrMatrix.from({
+    size: qr.getModuleCount(),
+    isDark: (row, col) => qr.isDark(row, col),
+  })
+}
+
+const matrixCache = new Map<string, PackedQrMatrix>()
+
+/**
+ * Memoized encodeQrMatrix; the style layers draw from this
+ */
+export function getQrMatrix(
+  data: string,
+  errorCorrectionLevel: ErrorCorrectionLevel = 'H',
+  typeNumber = 0
+): PackedQrMatrix {
+  const key = `${errorCorrectionLevel}:${typeNumber}:${data}`
+  const cached = matrixCache.get(key)
+  if (cached) {
+    // Refresh LRU position
+    matrixCache.delete(key)
+    matrixCache.set(key, cached)
+    return cached
+  }
+
+  const matrix = encodeQrMatrix(data, errorCorrectionLevel, typeNumber)
+  matrixCache.set(key, matrix)
+  if (matrixCache.size > MATRIX_CACHE_MAX_ENTRIES) {
+    matrixCache.delete(matrixCache.keys().next().value as string)
+  }
+  return matrix
+}
+
+export function clearQrMatrixCache(): void {
+  matrixCache.clear()
+}
@@ -0,0 +1,353 @@
+/**
+ * Per-QR-Code Rate Limiting
+ * In-process keyed counters for rateLimitConfig (windowSize/maxRequests) on
+ * advanced scans, replacing per-scan QrCodeRateLimit reads and writes.
+ * - Exact (qrCodeId, ip) counters with idle eviction and an LRU cap
+ * - Count-min sketch per code once it sees too many distinct IPs
+ * - Optional periodic persistence of blocked clients to QrCodeRateLimit for audit
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+
+export interface QrRateLimitConfig {
+  windowSize?: number // seconds
+  maxRequests?: number
+}
+
+export interface QrRateLimitResult {
+  allowed: boolean
+  retryAfter?: number
+  remaining: number
+}
+
+export interface QrRateLimiterOptions {
+  maxKeys: number // Max exact (code, ip) counters held in memory
+  sketchThreshold: number // Distinct IPs per code before switching that code to a sketch
+  sketchWidth: number
+  sketchDepth: number
+}
+
+const DEFAULT_WINDOW_SIZE = 3600 // 1 hour
+const DEFAULT_MAX_REQUESTS = 100
+
+interface ExactCounter {
+  qrCodeId: string
+  ipAddress: string
+  windowStart: number
+  windowMs: number
+  count: number
+  lastRequestAt: number
+}
+
+interface BlockedEntry {
+  qrCodeId: string
+  ipAddress: string
+  requestCount: number
+  windowStart: number
+  lastRequestAt: number
+}
+
+/**
+ * Count-min sketch over 32-bit FNV-1a hashes. Overestimates, never underestimates,
+ * so a code in sketch mode can only be limited slightly early.
+ */
+export class CountMinSketch {
+  private rows: Uint32Array[]
+  private width: number
+
+  constructor(width: number, depth: number) {
+    this.width = width
+    this.rows = Array.from({ length: depth }, () => new Uint32Array(width))
+  }
+
+  private index(item: string, seed: number): number {
+    let hash = (0x811c9dc5 ^ seed) >>> 0
+    for (let i = 0; i < item.length; i++) {
+      hash ^= item.charCodeAt(i)
+      hash = Math.imul(hash, 0x01000193) >>> 0
+    }
+    return hash % this.width
+  }
+
+  /**
+   * Add to the item's counters and return its new estimate
+   */
+  add(item: string, amount: number = 1): number {
+    let estimate = Infinity
+    for (let row = 0; row < this.rows.length; row++) {
+      const i = this.index(item, row * 0x9e3779b1)
+      this.rows[row][i] += amount
+      estimate = Math.min(estimate, this.rows[row][i])
+    }
+    return estimate
+  }
+
+  estimate(item: string): number {
+    let estimate = Infinity
+    for (let row = 0; row < this.rows.length; row++) {
+      estimate = Math.min(estimate, this.rows[row][this.index(item, row * 0x9e3779b1)])
+    }
+    return estimate
+  }
+
+  clear(): void {
+    for (const row of this.rows) row.fill(0)
+  }
+}
+
+interface SketchWindow {
+  sketch: CountMinSketch
+  windowStart: number
+  windowMs: number
+}
+
+export class QrCodeRateLimiter {
+  private counters = new Map<string, ExactCounter>()
+  private distinctKeys = new Map<string, number>()
+  private sketches = new Map<string, SketchWindow>()
+  private blocked = new Map<string, BlockedEntry>()
+  private options: QrRateLimiterOptions
+  private lastSweep = 0
+
+  constructor(options: Partial<QrRateLimiterOptions> = {}) {
+    this.options = {
+      maxKeys: options.maxKeys || 100000,
+      sketchThreshold: options.sketchThreshold || 5000,
+      sketchWidth: options.sketchWidth || 4096,
+      sketchDepth: options.sketchDepth || 4,
+    }
+  }
+
+  /**
+   * Count a request and decide whether it is within the code's limit
+   */
+  check(
+    qrCodeId: string,
+    ipAddress: string,
+    config: QrRateLimitConfig | null | undefined,
+    now: number = Date.now()
+  ): QrRateLimitResult {
+    if (!config) {
+      return { allowed: true, remaining: Infinity }
+    }
+
+    const windowMs = (config.windowSize || DEFAULT_WINDOW_SIZE) * 1000
+    const maxRequests = config.maxRequests || DEFAULT_MAX_REQUESTS
+
+    this.sweep(now)
+
+    const sketchWindow = this.sketches.get(qrCodeId)
+    if (sketchWindow) {
+      return this.checkSketch(sketchWindow, qrCodeId, ipAddress, windowMs, maxRequests, now)
+    }
+
+    const key = `${qrCodeId}|${ipAddress}`
+    let counter = this.counters.get(key)
+
+    if (counter && now - counter.windowStart >= counter.windowMs) {
+      // Window elapsed: start a new one for this client
+      counter.windowStart = now
+      counter.windowMs = windowMs
+      counter.count = 0
+    }
+
+    if (!counter) {
+      counter = { qrCodeId, ipAddress, windowStart: now, windowMs, count: 0, lastRequestAt: now }
+      this.distinctKeys.set(qrCodeId, (this.distinctKeys.get(qrCodeId) || 0) + 1)
+    } else {
+      // Re-insert so Map order tracks recency for LRU eviction
+      this.counters.delete(key)
+    }
+    this.counters.set(key, counter)
+    counter.lastRequestAt = now
+
+    if (counter.count >= maxRequests) {
+      this.recordBlocked(qrCodeId, ipAddress, counter.count, counter.windowStart, now)
+      return {
+        allowed: false,
+        retryAfter: Math.max(1, Math.ceil((counter.windowStart + counter.windowMs - now) / 1000)),
+        remaining: 0,
+      }
+    }
+
+    counter.count++
+
+    if ((this.distinctKeys.get(qrCodeId) || 0) > this.options.sketchThreshold) {
+      this.promoteToSketch(qrCodeId, windowMs, now)
+    }
+    this.enforceCap()
+
+    return { allowed: true, remaining: maxRequests - counter.count }
+  }
+
+  private checkSketch(
+    window: SketchWindow,
+    qrCodeId: string,
+    ipAddress: string,
+    windowMs: number,
+    maxRequests: number,
+    now: number
+  ): QrRateLimitResult {
+    if (now - window.windowStart >= window.windowMs) {
+      window.sketch.clear()
+      window.windowStart = now
+      window.windowMs = windowMs
+    }
+
+    const retryAfter = Math.max(1, Math.ceil((window.windowStart + window.windowMs - now) / 1000))
+    const current = window.sketch.estimate(ipAddress)
+    if (current >= maxRequests) {
+      this.recordBlocked(qrCodeId, ipAddress, current, window.windowStart, now)
+      return { allowed: false, retryAfter, remaining: 0 }
+    }
+
+    const count = window.sketch.add(ipAddress)
+    return { allowed: true, remaining: Math.max(0, maxRequests - count) }
+  }
+
+  /**
+   * Move a code with too many distinct clients from exact counters to a fixed-size sketch
+   */
+  private promoteToSketch(qrCodeId: string, windowMs: number, now: number) {
+    const window: SketchWindow = {
+      sketch: new CountMinSketch(this.options.sketchWidth, this.options.sketchDepth),
+      windowStart: now,
+      windowMs,
+    }
+
+    for (const [key, counter] of this.counters) {
+      if (counter.qrCodeId !== qrCodeId) continue
+      if (now - counter.windowStart < counter.windowMs) {
+        window.sketch.add(counter.ipAddress, counter.count)
+      }
+      this.counters.delete(key)
+    }
+
+    this.distinctKeys.delete(qrCodeId)
+    this.sketches.set(qrCodeId, window)
+  }
+
+  private removeCounter(key: string, counter: ExactCounter) {
+    this.counters.delete(key)
+    const remaining = (this.distinctKeys.get(counter.qrCodeId) || 1) - 1
+    if (remaining > 0) {
+      this.distinctKeys.set(counter.qrCodeId, remaining)
+    } else {
+      this.distinctKeys.delete(counter.qrCodeId)
+    }
+  }
+
+  private enforceCap() {
+    while (this.counters.size > this.options.maxKeys) {
+      const oldest = this.counters.entries().next().value
+      if (!oldest) break
+      this.removeCounter(oldest[0], oldest[1])
+    }
+  }
+
+  /**
+   * Drop idle counters and sketches whose window has passed (at most once a minute)
+   */
+  private sweep(now: number) {
+    if (now - this.lastSweep < 60000) return
+    this.lastSweep = now
+
+    for (const [key, counter] of this.counters) {
+      if (now - counter.windowStart >= counter.windowMs) {
+        this.removeCounter(key, counter)
+      }
+    }
+
+    for (const [qrCodeId, window] of this.sketches) {
+      // Sketches for codes that went quiet for a full extra window are released
+      if (now - window.windowStart >= window.windowMs * 2) {
+        this.sketches.delete(qrCodeId)
+      }
+    }
+  }
+
+  private recordBlocked(qrCodeId: string, ipAddress: string, requestCount: number, windowStart: number, now: number) {
+    const key = `${qrCodeId}|${ipAddress}|${windowStart}`
+    const existing = this.blocked.get(key)
+    if (existing) {
+      existing.requestCount = Math.max(existing.requestCount, requestCount)
+      existing.lastRequestAt = now
+    } else if (this.blocked.size < 10000) {
+      this.blocked.set(key, { qrCodeId, ipAddress, requestCount, windowStart, lastRequestAt: now })
+    }
+  }
+
+  /**
+   * Hand over blocked (code, ip, window) entries accumulated since the last call
+   */
+  takeBlocked(): BlockedEntry[] {
+    const entries = Array.from(this.blocked.values())
+    this.blocked.clear()
+    return entries
+  }
+
+  getStats() {
+    return {
+      exactKeys: this.counters.size,
+      sketchCodes: this.sketches.size,
+      pendingBlocked: this.blocked.size,
+    }
+  }
+}
+
+// Process-wide limiter shared by the scan endpoints
+let limiter: QrCodeRateLimiter | null = null
+let persistTimer: NodeJS.Timeout | null = null
+
+/**
+ * Write blocked clients to QrCodeRateLimit so abuse stays auditable
+ */
+export async function persistBlockedClients(target: QrCodeRateLimiter = getQrCodeRateLimiter()): Promise<number> {
+  const entries = target.takeBlocked()
+  if (entries.length === 0) return 0
+
+  const { error } = await supabaseAdmin!
+    .from('QrCodeRateLimit')
+    .insert(entries.map(entry => ({
+      qrCodeId: entry.qrCodeId,
+      ipAddress: entry.ipAddress,
+      requestCount: entry.requestCount,
+      windowStart: new Date(entry.windowStart).toISOString(),
+      lastRequestAt: new Date(entry.lastRequestAt).toISOString(),
+      isBlocked: true,
+    })))
+
+  if (error) {
+    console.error('Error persisting QR rate limit audit rows:', error)
+    return 0
+  }
+
+  return entries.length
+}
+
+export function getQrCodeRateLimiter(): QrCodeRateLimiter {
+  if (!limiter) {
+    limiter = new QrCodeRateLimiter()
+
+    // Optional audit persistence (QR_RATE_LIMIT_PERSIST_INTERVAL_MS)
+    const interval = parseInt(process.env.QR_RATE_LIMIT_PERSIST_INTERVAL_MS || '', 10)
+    if (Number.isFinite(interval) && interval > 0 && typeof window === 'undefined') {
+      persistTimer = setInterval(() => {
+        persistBlockedClients().catch(error => console.error('QR rate limit persistence error:', error))
+      }, interval)
+      persistTimer.unref?.()
+    }
+  }
+  return limiter
+}
+
+/**
+ * Check a scan against the QR code's rateLimitConfig
+ */
+export function checkQrCodeRateLimit(
+  qrCodeId: string,
+  ipAddress: string,
+  config: QrRateLimitConfig | null | undefined
+): QrRateLimitResult {
+  return getQrCodeRateLimiter().check(qrCodeId, ipAddress, config)
+}
@@ -0,0 +1,192 @@
+/**
+ * QR Render Thread Pool
+ * Fans QR renders out over worker_threads (one per available core by default,
+ * QR_RENDER_POOL_SIZE to override) so batch jobs use every core instead of
+ * serializing encoding and rasterization on the event loop. Threads start on
+ * demand, take one task at a time and are replaced if they die. If no thread
+ * can start at all (e.g. the worker entry is missing from a build), the pool
+ * falls back to rendering on the calling thread.
+ */
+
+import os from 'os'
+import { Worker } from 'worker_threads'
+import { renderQrPng, renderQrSvg, type QrRenderInput } from '@/lib/qr-render'
+import type { QrImageFormat } from '@/lib/qr-image'
+
+export interface QrRenderTask {
+  id: number
+  input: QrRenderInput
+  format: QrImageFormat
+  scale: number
+}
+
+export type QrRenderTaskResult =
+  | { id: number; bytes: Uint8Array }
+  | { id: number; error: string }
+
+// Posted once by a thread whose entry module loaded
+export type QrRenderWorkerMessage = QrRenderTaskResult | { ready: true }
+
+interface PendingTask {
+  task: QrRenderTask
+  resolve: (value: Buffer) => void
+  reject: (error: Error) => void
+}
+
+interface PoolThread {
+  worker: Worker
+  task: PendingTask | null
+  ready: boolean
+}
+
+/**
+ * Render one task on the current thread, exactly as a pool thread would
+ */
+export async function renderQrTask(task: QrRenderTask): Promise<Buffer> {
+  return task.format === 'svg'
+    ? Buffer.from(await renderQrSvg(task.input))
+    : renderQrPng(task.input, task.scale)
+}
+
+/**
+ * Threads to use: QR_RENDER_POOL_SIZE, or the cores available to the process
+ */
+export function defaultRenderPoolSize(): number {
+  const configured = parseInt(process.env.QR_RENDER_POOL_SIZE || '', 10)
+  if (configured > 0) return configured
+  return typeof os.availableParallelism === 'function' ? os.availableParallelism() : os.cpus().length
+}
+
+export class QrRenderPool {
+  private size: number
+  private workerUrl?: URL
+  private threads: PoolThread[] = []
+  private queue: PendingTask[] = []
+  private nextId = 0
+  private destroyed = false
+  private inProcess = false
+
+  constructor(size = defaultRenderPoolSize(), workerUrl?: URL) {
+    this.size = Math.max(1, size)
+    this.workerUrl = workerUrl
+  }
+
+  /**
+   * Render one QR code on the next free thread
+   */
+  render(input: QrRenderInput, format: QrImageFormat, scale = 1): Promise<Buffer> {
+    if (this.destroyed) {
+      return Promise.reject(new Error('Render pool is destroyed'))
+    }
+
+    return new Promise((resolve, reject) => {
+      this.queue.push({ task: { id: this.nextId++, input, format, scale }, resolve, reject })
+      this.dispatch()
+    })
+  }
+
+  /**
+   * Terminate every thread, rejecting queued and running renders
+   */
+  async destroy(): Promise<void> {
+    this.destroyed = true
+    const error = new Error('Render pool is destroyed')
+
+    for (const pending of this.queue.splice(0)) {
+      pending.reject(error)
+    }
+    const threads = this.threads.splice(0)
+    for (const thread of threads) {
+      thread.task?.reject(error)
+      thread.task = null
+    }
+    await Promise.all(threads.map(thread => thread.worker.terminate()))
+  }
+
+  get threadCount(): number {
+    return this.threads.length
+  }
+
+  /**
+   * Whether renders run on the calling thread because no worker could start
+   */
+  get isInProcess(): boolean {
+    return this.inProcess
+  }
+
+  private dispatch(): void {
+    if (this.inProcess) {
+      for (const pending of this.queue.splice(0)) {
+        renderQrTask(pending.task).then(pending.resolve, pending.reject)
+      }
+      return
+    }
+
+    while (this.queue.length > 0) {
+      let thread = this.threads.find(candidate => !candidate.task)
+      if (!thread) {
+        if (this.threads.length >= this.size) return
+        thread = this.spawn()
+      }
+
+      const pending = this.queue.shift()!
+      thread.task = pending
+      thread.worker.postMessage(pending.task)
+    }
+  }
+
+  private spawn(): PoolThread {
+    // Bundled as its own entry by Next.js, which needs this literal form; loaded
+    // through tsx by the standalone worker
+    const worker = this.workerUrl
+      ? new Worker(this.workerUrl)
+      : new Worker(new URL('./qr-render-worker.ts', import.meta.url))
+    const thread: PoolThread = { worker, task: null, ready: false }
+
+    worker.on('message', (reply: QrRenderWorkerMessage) => {
+      if ('ready' in reply) {
+        thread.ready = true
+        return
+      }
+
+      const pending = thread.task
+      thread.task = null
+
+      if (pending) {
+        if ('error' in reply) {
+          pending.reject(new Error(reply.error))
+        } else {
+          pending.resolve(Buffer.from(reply.bytes.buffer, reply.bytes.byteOffset, reply.bytes.byteLength))
+        }
+      }
+      this.dispatch()
+    })
+
+    const fail = (error: Error) => {
+      const index = this.threads.indexOf(thread)
+      if (index === -1) return
+      this.threads.splice(index, 1)
+
+      const pending = thread.task
+      thread.task = null
+
+      // The worker entry couldn't even load, so respawning won't help: keep the
+      // task (it never ran) and render everything on this thread from now on
+      if (!thread.ready) {
+        if (!this.inProcess) {
+          console.warn('QR render worker failed to start, rendering in-process:', error.message)
+          this.inProcess = true
+        }
+        if (pending) this.queue.unshift(pending)
+      } else {
+        pending?.reject(error)
+      }
+      this.dispatch()
+    }
+    worker.on('error', fail)
+    worker.on('exit', code => fail(new Error(`Render worker exited with code ${code}`)))
+
+    this.threads.push(thread)
+    return thread
+  }
+}
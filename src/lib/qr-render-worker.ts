@@ -0,0 +1,26 @@
+/**
+ * QR Render Worker Thread
+ * Entry point for the threads of QrRenderPool (src/lib/qr-render-pool.ts):
+ * renders one QR code per message and transfers the bytes back. Says it's
+ * ready once its imports have loaded, so the pool can tell a thread that
+ * can't start from one that died mid-task.
+ */
+
+import { parentPort } from 'worker_threads'
+import { renderQrTask, type QrRenderTask, type QrRenderTaskResult, type QrRenderWorkerMessage } from '@/lib/qr-render-pool'
+
+parentPort?.on('message', async (task: QrRenderTask) => {
+  let reply: QrRenderTaskResult
+  try {
+    const body = await renderQrTask(task)
+    // Copy out of sharp's / Buffer's shared pool so the memory can be transferred
+    const bytes = new Uint8Array(body)
+    reply = { id: task.id, bytes }
+    parentPort!.postMessage(reply, [bytes.buffer])
+  } catch (error) {
+    reply = { id: task.id, error: error instanceof Error ? error.message : 'Unknown error' }
+    parentPort!.postMessage(reply)
+  }
+})
+
+parentPort?.postMessage({ ready: true } satisfies QrRenderWorkerMessage)
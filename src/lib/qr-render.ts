@@ -0,0 +1,202 @@
+/**
+ * Server-side QR Code Rendering
+ * Renders a QR code's persisted style to SVG and PNG without a browser: the
+ * matrix comes from the same encoder as qr-code-styling, the drawing from
+ * qr-svg, and PNGs are rasterized with sharp. Logos and the watermark are
+ * inlined as data URIs so the output is self-contained.
+ */
+
+import { promises as fs } from 'fs'
+import path from 'path'
+import { getSharp } from '@/lib/image-optimization'
+import { getQrMatrix } from '@/lib/qr-matrix'
+import { fetchRemoteImage } from '@/lib/remote-image'
+import { buildQrSvg, type QrSvgLogo, type QrSvgOptions } from '@/lib/qr-svg'
+import { getSocialMediaLogoDataUrl, isSocialMediaTemplate } from '@/lib/social-media-logos'
+import type { AdvancedQROptions } from '@/types/qr-code-advanced'
+
+// Size of the browser preview
+export const DEFAULT_RENDER_SIZE = 300
+
+// QrCode columns getQrRenderInput reads
+export const QR_RENDER_COLUMNS = 'id, url, isDynamic, redirectUrl, foregroundColor, backgroundColor, dotType, cornerType, eyePattern, template, shape, gradient, sticker, effects, logoUrl, hasWatermark'
+
+const WATERMARK_PATH = '/botrix-logo01.png'
+
+export interface QrRenderInput extends Omit<QrSvgOptions, 'logo' | 'watermarkHref'> {
+  data: string
+  logo?: { image: string; size?: number; margin?: number } // data URI, public path or URL
+}
+
+export interface QrRenderStyle {
+  id: string
+  url: string
+  isDynamic?: boolean | null
+  redirectUrl?: string | null
+  foregroundColor?: string | null
+  backgroundColor?: string | null
+  dotType?: string | null
+  cornerType?: string | null
+  eyePattern?: string | null
+  template?: string | null
+  shape?: string | null
+  gradient?: unknown
+  sticker?: unknown
+  effects?: unknown
+  logoUrl?: string | null
+  hasWatermark?: boolean | null
+}
+
+const MIME_TYPES: Record<string, string> = {
+  png: 'image/png',
+  jpg: 'image/jpeg',
+  jpeg: 'image/jpeg',
+  webp: 'image/webp',
+  gif: 'image/gif',
+  svg: 'image/svg+xml',
+}
+
+let watermarkDataUri: string | null = null
+
+/**
+ * Render options for a stored QR code, the same ones the QR code page builds
+ * for its preview
+ */
+export function getQrRenderInput(qrCode: QrRenderStyle, origin: string, size = DEFAULT_RENDER_SIZE): QrRenderInput {
+  const backgroundColor = qrCode.backgroundColor?.startsWith('#')
+    ? qrCode.backgroundColor
+    : `#${qrCode.backgroundColor || 'FFFFFF'}`
+
+  let logo: string | null = null
+  if (isSocialMediaTemplate(qrCode.template)) {
+    logo = getSocialMediaLogoDataUrl(qrCode.template)
+  }
+  if (!logo && qrCode.logoUrl) {
+    logo = qrCode.logoUrl
+  }
+
+  return {
+    data: qrCode.isDynamic ? (qrCode.redirectUrl || `${origin}/qr/${qrCode.id}`) : qrCode.url,
+    width: size,
+    height: size,
+    foregroundColor: qrCode.foregroundColor || '#000000',
+    backgroundColor,
+    dotType: (qrCode.dotType as AdvancedQROptions['dotType']) || 'square',
+    cornerType: (qrCode.cornerType as AdvancedQROptions['cornerType']) || 'square',
+    eyePattern: (qrCode.eyePattern as AdvancedQROptions['eyePattern']) || 'square',
+    template: (qrCode.template as AdvancedQROptions['template']) || undefined,
+    shape: (qrCode.shape as AdvancedQROptions['shape']) || undefined,
+    gradient: (qrCode.gradient as AdvancedQROptions['gradient']) || undefined,
+    sticker: (qrCode.sticker as AdvancedQROptions['sticker']) || undefined,
+    effects: (qrCode.effects as AdvancedQROptions['effects']) || undefined,
+    logo: logo ? { image: logo, size: 0.25, margin: 5 } : undefined,
+    watermark: !!qrCode.hasWatermark,
+  }
+}
+
+function mimeTypeFor(file: string): string {
+  return MIME_TYPES[path.extname(file).slice(1).toLowerCase()] || 'application/octet-stream'
+}
+
+async function readPublicFile(publicPath: string): Promise<{ buffer: Buffer; mimeType: string }> {
+  const publicDir = path.join(process.cwd(), 'public')
+  const file = path.join(publicDir, publicPath)
+  if (!file.startsWith(publicDir + path.sep)) {
+    throw new Error(`Invalid public path: ${publicPath}`)
+  }
+  return { buffer: await fs.readFile(file), mimeType: mimeTypeFor(file) }
+}
+
+// Logos uploaded to our own storage; exempt from the public-address checks so a local Supabase works
+function getTrustedImageOrigins(): string[] {
+  const storageUrl = process.env.SUPABASE_URL || process.env.NEXT_PUBLIC_SUPABASE_URL
+  try {
+    return storageUrl ? [new URL(storageUrl).origin] : []
+  } catch {
+    return []
+  }
+}
+
+async function loadImageSource(source: string): Promise<{ buffer: Buffer; mimeType: string }> {
+  const dataUri = source.match(/^data:([^;,]+)(;base64)?,([\s\S]*)$/)
+  if (dataUri) {
+    const [, mimeType, base64, payload] = dataUri
+    return {
+      buffer: base64 ? Buffer.from(payload, 'base64') : Buffer.from(decodeURIComponent(payload)),
+      mimeType,
+    }
+  }
+
+  if (source.startsWith('/')) {
+    return readPublicFile(source)
+  }
+
+  const { buffer, mimeType } = await fetchRemoteImage(source, { trustedOrigins: getTrustedImageOrigins() })
+  return { buffer, mimeType: mimeType || mimeTypeFor(new URL(source).pathname) }
+}
+
+/**
+ * Inline a logo and read its intrinsic size; a logo that can't be loaded is
+ * left out, as in the browser preview
+ */
+async function resolveLogo(logo: NonNullable<QrRenderInput['logo']>): Promise<QrSvgLogo | undefined> {
+  try {
+    const { buffer, mimeType } = await loadImageSource(logo.image)
+    const sharp = await getSharp()
+    const { width, height } = await sharp(buffer).metadata()
+    if (!width || !height) return undefined
+
+    return {
+      image: `data:${mimeType};base64,${buffer.toString('base64')}`,
+      width,
+      height,
+      size: logo.size,
+      margin: logo.margin,
+    }
+  } catch (error) {
+    console.warn('Unable to load logo for QR render:', error)
+    return undefined
+  }
+}
+
+async function getWatermarkHref(): Promise<string> {
+  if (!watermarkDataUri) {
+    const { buffer, mimeType } = await readPublicFile(WATERMARK_PATH)
+    watermarkDataUri = `data:${mimeType};base64,${buffer.toString('base64')}`
+  }
+  return watermarkDataUri
+}
+
+/**
+ * Render a styled QR code as a self-contained SVG document
+ */
+export async function renderQrSvg(input: QrRenderInput): Promise<string> {
+  const { data, logo, ...style } = input
+  const matrix = getQrMatrix(data, 'H')
+
+  return buildQrSvg(matrix, {
+    ...style,
+    logo: logo ? await resolveLogo(logo) : undefined,
+    watermarkHref: style.watermark ? await getWatermarkHref() : undefined,
+  })
+}
+
+/**
+ * Render a styled QR code as a PNG, `scale` times the SVG size (the preview's
+ * web / print / ultra-hd downloads use 2, 4 and 8)
+ */
+export async function renderQrPng(input: QrRenderInput, scale = 1): Promise<Buffer> {
+  return rasterizeQrSvg(await renderQrSvg(input), scale, input.backgroundColor)
+}
+
+/**
+ * Rasterize a rendered SVG, flattened onto the background like the canvas
+ * download so shaped codes aren't transparent
+ */
+export async function rasterizeQrSvg(svg: string, scale = 1, backgroundColor = '#ffffff'): Promise<Buffer> {
+  const sharp = await getSharp()
+  return sharp(Buffer.from(svg), { density: 72 * scale })
+    .flatten({ background: backgroundColor })
+    .png()
+    .toBuffer()
+}
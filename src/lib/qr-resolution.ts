@@ -0,0 +1,128 @@
+/**
+ * Servable QR Code Resolution
+ * Resolves the compact projection the scan path needs (status, limits,
+ * destination, redirect rules, webhook config) through QRCodeCache, with
+ * negative caching for unknown ids and single-flight loading on misses.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { QRCodeCache, CacheStats } from '@/lib/cache'
+
+export interface ServableQrCode {
+  id: string
+  userId: string
+  title: string | null
+  isActive: boolean
+  isDynamic: boolean
+  expiresAt: string | null
+  maxScans: number | null
+  scanCount: number
+  url: string
+  redirectUrl: string | null
+  customDomain: string | null
+  deviceRedirection: Record<string, string> | null
+  geoRedirection: { cities?: Record<string, string>; countries?: Record<string, string> } | null
+  abTestConfig: { variants?: Record<string, { url?: string; weight?: number }> } | null
+  rateLimitConfig: { windowSize?: number; maxRequests?: number } | null
+  marketingPixels: { facebook?: string; googleAnalytics?: string } | null
+  webhookUrl: string | null
+  webhookSecret: string | null
+  webhookBatchConfig: { enabled?: boolean; maxBatchSize?: number; maxLingerMs?: number } | null
+  version: number | null
+  updatedAt: string | null
+}
+
+export const SERVABLE_QR_COLUMNS = [
+  'id',
+  'userId',
+  'title',
+  'isActive',
+  'isDynamic',
+  'expiresAt',
+  'maxScans',
+  'scanCount',
+  'url',
+  'redirectUrl',
+  'customDomain',
+  'deviceRedirection',
+  'geoRedirection',
+  'abTestConfig',
+  'rateLimitConfig',
+  'marketingPixels',
+  'webhookUrl',
+  'webhookSecret',
+  'webhookBatchConfig',
+  'version',
+  'updatedAt',
+].join(', ')
+
+// In-flight loads, so a burst of scans on a cold code triggers one query
+const inFlight = new Map<string, Promise<ServableQrCode | null>>()
+
+// Bumped by every invalidation; a load that started before one may have read
+// the old row and must not write it back to the cache
+let generation = 0
+
+async function loadServableQrCode(qrCodeId: string): Promise<ServableQrCode | null> {
+  const startedAt = generation
+  const { data, error } = await supabaseAdmin!
+    .from('QrCode')
+    .select(SERVABLE_QR_COLUMNS)
+    .eq('id', qrCodeId)
+    .maybeSingle()
+
+  if (error) {
+    // Don't negatively cache transient failures
+    console.error('Error resolving QR code:', error)
+    return null
+  }
+
+  if (!data) {
+    if (generation === startedAt) {
+      await QRCodeCache.setNotFound(qrCodeId)
+    }
+    return null
+  }
+
+  const qrCode = data as unknown as ServableQrCode
+  if (generation === startedAt) {
+    await QRCodeCache.setServable(qrCodeId, qrCode)
+  }
+  return qrCode
+}
+
+/**
+ * Resolve the servable projection of a QR code, or null if it doesn't exist
+ */
+export async function resolveServableQrCode(qrCodeId: string): Promise<ServableQrCode | null> {
+  const cached = await QRCodeCache.get(qrCodeId)
+  if (cached !== null) {
+    CacheStats.recordHit()
+    return QRCodeCache.isNotFound(cached) ? null : (cached as ServableQrCode)
+  }
+  CacheStats.recordMiss()
+
+  const pending = inFlight.get(qrCodeId)
+  if (pending) return pending
+
+  const load = loadServableQrCode(qrCodeId).finally(() => {
+    if (inFlight.get(qrCodeId) === load) {
+      inFlight.delete(qrCodeId)
+    }
+  })
+  inFlight.set(qrCodeId, load)
+  return load
+}
+
+/**
+ * Drop cached projections after a QR code is updated or deleted
+ */
+export async function invalidateServableQrCode(qrCodeIds: string | string[]): Promise<void> {
+  const ids = Array.isArray(qrCodeIds) ? qrCodeIds : [qrCodeIds]
+  // Loads already running can't cache, and later scans don't join them
+  generation++
+  for (const id of ids) {
+    inFlight.delete(id)
+  }
+  await QRCodeCache.invalidateMany(ids)
+}
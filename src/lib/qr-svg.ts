@@ -0,0 +1,786 @@
+/**
+ * QR Code SVG Drawing
+ * Builds a styled QR code SVG from a module matrix without a DOM. Dots, finder
+ * patterns, background and logo follow qr-code-styling's geometry, with the
+ * shape, gradient, sticker, effect and watermark layers on top. The browser
+ * preview (AdvancedQRCodeGenerator) and server renders both draw with this, so
+ * they paint the same image.
+ */
+
+import {
+  QR_TEMPLATES,
+  type AdvancedQROptions,
+  type QRGradient,
+  type QRStickerConfig
+} from '@/types/qr-code-advanced'
+import type { QrMatrix } from '@/lib/qr-matrix'
+
+type DotType = 'square' | 'rounded' | 'extra-rounded' | 'classy' | 'classy-rounded' | 'dots'
+type CornerSquareType = 'square' | 'rounded' | 'extra-rounded'
+type Neighbor = (xOffset: number, yOffset: number) => boolean
+
+export interface QrSvgLogo {
+  image: string // href (data URI for server renders)
+  width: number // intrinsic size, used for the aspect ratio
+  height: number
+  size?: number
+  margin?: number
+}
+
+export interface QrSvgOptions extends Omit<AdvancedQROptions, 'data' | 'type' | 'logo'> {
+  logo?: QrSvgLogo
+  watermarkHref?: string
+}
+
+const SVG_NS = 'http://www.w3.org/2000/svg'
+const XLINK_NS = 'http://www.w3.org/1999/xlink'
+const DEFAULT_WATERMARK_HREF = '/botrix-logo01.png'
+
+// Share of modules error correction level H can recover (logo sizing)
+const ERROR_CORRECTION_PERCENT = 0.3
+
+// Coordinates are rounded to 1/100 px
+const COORDINATE_PRECISION = 100
+
+const SQUARE_MASK = [
+  [1, 1, 1, 1, 1, 1, 1],
+  [1, 0, 0, 0, 0, 0, 1],
+  [1, 0, 0, 0, 0, 0, 1],
+  [1, 0, 0, 0, 0, 0, 1],
+  [1, 0, 0, 0, 0, 0, 1],
+  [1, 0, 0, 0, 0, 0, 1],
+  [1, 1, 1, 1, 1, 1, 1],
+]
+
+const DOT_MASK = [
+  [0, 0, 0, 0, 0, 0, 0],
+  [0, 0, 0, 0, 0, 0, 0],
+  [0, 0, 1, 1, 1, 0, 0],
+  [0, 0, 1, 1, 1, 0, 0],
+  [0, 0, 1, 1, 1, 0, 0],
+  [0, 0, 0, 0, 0, 0, 0],
+  [0, 0, 0, 0, 0, 0, 0],
+]
+
+/**
+ * Map custom dot types to the drawable dot types
+ */
+export function mapDotType(dotType: string): DotType {
+  const mapping: Record<string, DotType> = {
+    'square': 'square',
+    'rounded': 'rounded',
+    'extra-rounded': 'extra-rounded',
+    'classy': 'classy',
+    'classy-rounded': 'classy-rounded',
+    'dots': 'dots',
+    'circles': 'dots',
+    'diamonds': 'dots',
+    'stars': 'dots',
+    'custom': 'square'
+  }
+  return mapping[dotType] || 'square'
+}
+
+/**
+ * Map custom corner types to the drawable corner square types
+ */
+export function mapCornerType(cornerType: string): CornerSquareType {
+  const mapping: Record<string, CornerSquareType> = {
+    'square': 'square',
+    'rounded': 'rounded',
+    'extra-rounded': 'extra-rounded',
+    'diamond': 'square',
+    'star': 'square',
+    'heart': 'square',
+    'classy': 'rounded',
+    'classy-rounded': 'extra-rounded',
+    'circle': 'rounded',
+    'custom': 'square'
+  }
+  return mapping[cornerType] || 'square'
+}
+
+/**
+ * Shortest decimal for a coordinate rounded to COORDINATE_PRECISION
+ */
+function num(value: number): string {
+  const rounded = Math.round(value * COORDINATE_PRECISION) / COORDINATE_PRECISION
+  return String(rounded === 0 ? 0 : rounded)
+}
+
+function escapeAttr(value: string): string {
+  return value
+    .replace(/&/g, '&amp;')
+    .replace(/"/g, '&quot;')
+    .replace(/</g, '&lt;')
+    .replace(/>/g, '&gt;')
+}
+
+/**
+ * Serialize one element; attributes keep insertion order, undefined ones are
+ * skipped and numbers are quantized
+ */
+export function svgElement(
+  name: string,
+  attrs: Record<string, string | number | undefined>,
+  children = ''
+): string {
+  let result = `<${name}`
+  for (const [key, value] of Object.entries(attrs)) {
+    if (value !== undefined) result += ` ${key}="${typeof value === 'number' ? num(value) : escapeAttr(value)}"`
+  }
+  return children ? `${result}>${children}</${name}>` : `${result}/>`
+}
+
+// --- Module figures (qr-code-styling QRDot / QRCornerSquare / QRCornerDot) ---
+
+// Figures are outlines in a unit cell: moves are relative to the cell's top-left
+// corner, lines and arcs relative to the current point
+type Segment =
+  | ['M', number, number]
+  | ['l', number, number]
+  | ['a', number, 0 | 1, 0 | 1, number, number] // radius, large-arc, sweep, dx, dy
+  | ['z']
+
+type Figure = Segment[]
+
+const DOT: Figure = [['M', 0, 0.5], ['a', 0.5, 1, 0, 1, 0], ['a', 0.5, 1, 0, -1, 0], ['z']]
+const SQUARE: Figure = [['M', 0, 0], ['l', 0, 1], ['l', 1, 0], ['l', 0, -1], ['z']]
+// Rounded on one side
+const SIDE_ROUNDED: Figure = [['M', 0, 0], ['l', 0, 1], ['l', 0.5, 0], ['a', 0.5, 0, 0, 0, -1], ['z']]
+// One rounded corner
+const CORNER_ROUNDED: Figure = [['M', 0, 0], ['l', 0, 1], ['l', 1, 0], ['l', 0, -0.5], ['a', 0.5, 0, 0, -0.5, -0.5], ['z']]
+const CORNER_EXTRA_ROUNDED: Figure = [['M', 0, 0], ['l', 0, 1], ['l', 1, 0], ['a', 1, 0, 0, -1, -1], ['z']]
+// Two opposite rounded corners
+const CORNERS_ROUNDED: Figure = [
+  ['M', 0, 0], ['l', 0, 0.5], ['a', 0.5, 0, 0, 0.5, 0.5], ['l', 0.5, 0], ['l', 0, -0.5], ['a', 0.5, 0, 0, -0.5, -0.5], ['z'],
+]
+
+// Finder outlines over the 7 x 7 block, drawn even-odd
+const M7 = 1 / 7
+const CORNER_SQUARE: Figure = [
+  ...SQUARE,
+  ['M', M7, M7], ['l', 1 - 2 * M7, 0], ['l', 0, 1 - 2 * M7], ['l', -1 + 2 * M7, 0], ['z'],
+]
+const CORNER_SQUARE_EXTRA_ROUNDED: Figure = [
+  ['M', 0, 2.5 * M7],
+  ['l', 0, 2 * M7],
+  ['a', 2.5 * M7, 0, 0, 2.5 * M7, 2.5 * M7],
+  ['l', 2 * M7, 0],
+  ['a', 2.5 * M7, 0, 0, 2.5 * M7, -2.5 * M7],
+  ['l', 0, -2 * M7],
+  ['a', 2.5 * M7, 0, 0, -2.5 * M7, -2.5 * M7],
+  ['l', -2 * M7, 0],
+  ['a', 2.5 * M7, 0, 0, -2.5 * M7, 2.5 * M7],
+  ['M', 2.5 * M7, M7],
+  ['l', 2 * M7, 0],
+  ['a', 1.5 * M7, 0, 1, 1.5 * M7, 1.5 * M7],
+  ['l', 0, 2 * M7],
+  ['a', 1.5 * M7, 0, 1, -1.5 * M7, 1.5 * M7],
+  ['l', -2 * M7, 0],
+  ['a', 1.5 * M7, 0, 1, -1.5 * M7, -1.5 * M7],
+  ['l', 0, -2 * M7],
+  ['a', 1.5 * M7, 0, 1, 1.5 * M7, -1.5 * M7],
+]
+
+interface PlacedFigure {
+  figure: Figure
+  angle: number // Quarter turns about the cell centre, as qr-code-styling's rotate()
+}
+
+/**
+ * Path data for a figure scaled to a size x size cell at (x, y), turned by
+ * angle (a multiple of 90 degrees) about the cell centre
+ */
+function figurePath(figure: Figure, x: number, y: number, size: number, angle = 0): string {
+  const quarters = ((Math.round(angle / (Math.PI / 2)) % 4) + 4) % 4
+  const turn = (dx: number, dy: number): [number, number] => {
+    for (let i = 0; i < quarters; i++) [dx, dy] = [-dy, dx]
+    return [dx * size, dy * size]
+  }
+
+  let d = ''
+  for (const segment of figure) {
+    switch (segment[0]) {
+      case 'M': {
+        const [dx, dy] = turn(segment[1] - 0.5, segment[2] - 0.5)
+        d += `M${num(x + size / 2 + dx)} ${num(y + size / 2 + dy)}`
+        break
+      }
+      case 'l': {
+        const [dx, dy] = turn(segment[1], segment[2])
+        if (num(dy) === '0') d += `h${num(dx)}`
+        else if (num(dx) === '0') d += `v${num(dy)}`
+        else d += `l${num(dx)} ${num(dy)}`
+        break
+      }
+      case 'a': {
+        const [, radius, largeArc, sweep] = segment
+        const [dx, dy] = turn(segment[4], segment[5])
+        d += `a${num(radius * size)} ${num(radius * size)} 0 ${largeArc} ${sweep} ${num(dx)} ${num(dy)}`
+        break
+      }
+      default:
+        d += 'z'
+    }
+  }
+  return d
+}
+
+function placeRounded(getNeighbor: Neighbor, extra: boolean): PlacedFigure {
+  const left = +getNeighbor(-1, 0)
+  const right = +getNeighbor(1, 0)
+  const top = +getNeighbor(0, -1)
+  const bottom = +getNeighbor(0, 1)
+  const neighbors = left + right + top + bottom
+
+  if (neighbors === 0) return { figure: DOT, angle: 0 }
+  if (neighbors > 2 || (left && right) || (top && bottom)) return { figure: SQUARE, angle: 0 }
+
+  if (neighbors === 2) {
+    let angle = 0
+    if (left && top) angle = Math.PI / 2
+    else if (top && right) angle = Math.PI
+    else if (right && bottom) angle = -Math.PI / 2
+    return { figure: extra ? CORNER_EXTRA_ROUNDED : CORNER_ROUNDED, angle }
+  }
+
+  let angle = 0
+  if (top) angle = Math.PI / 2
+  else if (right) angle = Math.PI
+  else if (bottom) angle = -Math.PI / 2
+  return { figure: SIDE_ROUNDED, angle }
+}
+
+function placeClassy(getNeighbor: Neighbor, rounded: boolean): PlacedFigure {
+  const left = +getNeighbor(-1, 0)
+  const right = +getNeighbor(1, 0)
+  const top = +getNeighbor(0, -1)
+  const bottom = +getNeighbor(0, 1)
+
+  if (left + right + top + bottom === 0) return { figure: CORNERS_ROUNDED, angle: Math.PI / 2 }
+
+  const corner = rounded ? CORNER_EXTRA_ROUNDED : CORNER_ROUNDED
+  if (!left && !top) return { figure: corner, angle: -Math.PI / 2 }
+  if (!right && !bottom) return { figure: corner, angle: Math.PI / 2 }
+  return { figure: SQUARE, angle: 0 }
+}
+
+function placeDot(type: DotType, getNeighbor: Neighbor): PlacedFigure {
+  switch (type) {
+    case 'dots':
+      return { figure: DOT, angle: 0 }
+    case 'rounded':
+      return placeRounded(getNeighbor, false)
+    case 'extra-rounded':
+      return placeRounded(getNeighbor, true)
+    case 'classy':
+      return placeClassy(getNeighbor, false)
+    case 'classy-rounded':
+      return placeClassy(getNeighbor, true)
+    default:
+      return { figure: SQUARE, angle: 0 }
+  }
+}
+
+/**
+ * Path data for a grid of modules. Runs of square modules along a row are
+ * merged into one rectangle; other figures are emitted per module.
+ */
+function modulesPath(
+  type: DotType,
+  rows: number,
+  cols: number,
+  x: number,
+  y: number,
+  dotSize: number,
+  isOn: (row: number, col: number) => boolean
+): string {
+  let d = ''
+  for (let row = 0; row < rows; row++) {
+    let run = 0
+    for (let col = 0; col <= cols; col++) {
+      const placed = col < cols && isOn(row, col)
+        ? placeDot(type, (xOffset, yOffset) => isOn(row + yOffset, col + xOffset))
+        : null
+
+      if (placed?.figure === SQUARE) {
+        run++
+        continue
+      }
+      if (run) {
+        d += `M${num(x + (col - run) * dotSize)} ${num(y + row * dotSize)}h${num(run * dotSize)}v${num(dotSize)}h${num(-run * dotSize)}z`
+        run = 0
+      }
+      if (placed) {
+        d += figurePath(placed.figure, x + col * dotSize, y + row * dotSize, dotSize, placed.angle)
+      }
+    }
+  }
+  return d
+}
+
+function maskPath(mask: number[][], type: DotType, x: number, y: number, dotSize: number): string {
+  return modulesPath(type, mask.length, mask[0].length, x, y, dotSize, (row, col) => !!mask[row]?.[col])
+}
+
+function isFinderModule(row: number, col: number, count: number): boolean {
+  return !!(
+    SQUARE_MASK[row]?.[col] || SQUARE_MASK[row - count + 7]?.[col] || SQUARE_MASK[row]?.[col - count + 7] ||
+    DOT_MASK[row]?.[col] || DOT_MASK[row - count + 7]?.[col] || DOT_MASK[row]?.[col - count + 7]
+  )
+}
+
+/**
+ * Logo box and hidden module counts, keeping the logo's aspect ratio within the
+ * share of modules error correction can recover
+ */
+export function calculateImageSize(
+  originalWidth: number,
+  originalHeight: number,
+  maxHiddenDots: number,
+  maxHiddenAxisDots: number,
+  dotSize: number
+): { width: number; height: number; hideXDots: number; hideYDots: number } {
+  if (originalHeight <= 0 || originalWidth <= 0 || maxHiddenDots <= 0 || dotSize <= 0) {
+    return { width: 0, height: 0, hideXDots: 0, hideYDots: 0 }
+  }
+
+  const k = originalHeight / originalWidth
+  let hideXDots = Math.floor(Math.sqrt(maxHiddenDots / k))
+  if (hideXDots <= 0) hideXDots = 1
+  if (maxHiddenAxisDots && maxHiddenAxisDots < hideXDots) hideXDots = maxHiddenAxisDots
+  if (hideXDots % 2 === 0) hideXDots--
+
+  let width = hideXDots * dotSize
+  let hideYDots = 1 + 2 * Math.ceil((hideXDots * k - 1) / 2)
+  let height = Math.round(width * k)
+
+  if (hideYDots * hideXDots > maxHiddenDots || (maxHiddenAxisDots && maxHiddenAxisDots < hideYDots)) {
+    if (maxHiddenAxisDots && maxHiddenAxisDots < hideYDots) {
+      hideYDots = maxHiddenAxisDots
+      if (hideYDots % 2 === 0) hideXDots--
+    } else {
+      hideYDots -= 2
+    }
+    height = hideYDots * dotSize
+    hideXDots = 1 + 2 * Math.ceil((hideYDots / k - 1) / 2)
+    width = Math.round(height / k)
+  }
+
+  return { width, height, hideXDots, hideYDots }
+}
+
+// --- AdvancedQRCodeGenerator layers ---
+
+function shapeElement(shape: string, width: number, height: number): string | null {
+  const cx = width / 2
+  const cy = height / 2
+
+  switch (shape) {
+    case 'circle':
+      return svgElement('circle', { cx, cy, r: Math.min(width, height) / 2 })
+    case 'heart': {
+      const s = Math.min(width, height) / 512
+      return svgElement('path', {
+        d: `M${num(cx)} ${num(height * 0.85)}` +
+          `C${num(cx - 180 * s)} ${num(height * 0.55)} ${num(cx - 220 * s)} ${num(height * 0.15)} ${num(cx)} ${num(height * 0.35)}` +
+          `C${num(cx + 220 * s)} ${num(height * 0.15)} ${num(cx + 180 * s)} ${num(height * 0.55)} ${num(cx)} ${num(height * 0.85)}Z`
+      })
+    }
+    case 'star': {
+      const outerRadius = Math.min(width, height) / 2
+      const innerRadius = outerRadius * 0.38
+      let d = ''
+      for (let i = 0; i < 10; i++) {
+        const radius = i % 2 === 0 ? outerRadius : innerRadius
+        const angle = (i * Math.PI / 5) - Math.PI / 2
+        d += `${i === 0 ? 'M' : 'L'}${num(cx + radius * Math.cos(angle))} ${num(cy + radius * Math.sin(angle))}`
+      }
+      return svgElement('path', { d: d + 'Z' })
+    }
+    case 'hexagon': {
+      const radius = Math.min(width, height) / 2
+      let d = ''
+      for (let i = 0; i < 6; i++) {
+        const angle = (i * Math.PI / 3) - Math.PI / 2
+        d += `${i === 0 ? 'M' : 'L'}${num(cx + radius * Math.cos(angle))} ${num(cy + radius * Math.sin(angle))}`
+      }
+      return svgElement('path', { d: d + 'Z' })
+    }
+    case 'diamond': {
+      const size = Math.min(width, height) / 2
+      return svgElement('path', { d: `M${num(cx)} ${num(cy - size)}L${num(cx + size)} ${num(cy)}L${num(cx)} ${num(cy + size)}L${num(cx - size)} ${num(cy)}Z` })
+    }
+    default:
+      return null
+  }
+}
+
+function gradientElement(gradient: QRGradient): string {
+  const stops = gradient.colors.map((color, index) =>
+    svgElement('stop', { offset: `${num((index / (gradient.colors.length - 1)) * 100)}%`, 'stop-color': color })
+  ).join('')
+
+  if (gradient.type === 'linear') {
+    let x2 = '100%'
+    let y2 = '100%'
+    if (gradient.direction) {
+      const angle = gradient.direction * Math.PI / 180
+      x2 = `${num(Math.cos(angle) * 100)}%`
+      y2 = `${num(Math.sin(angle) * 100)}%`
+    }
+    return svgElement('linearGradient', { x1: '0%', y1: '0%', x2, y2, id: 'qr-gradient' }, stops)
+  }
+
+  const center = { cx: `${gradient.centerX || 50}%`, cy: `${gradient.centerY || 50}%` }
+  if (gradient.type === 'radial') {
+    return svgElement('radialGradient', { ...center, r: '50%', id: 'qr-gradient' }, stops)
+  }
+  // Not an SVG paint server; kept so servers render what browsers render
+  return svgElement('conicGradient', { ...center, id: 'qr-gradient' }, stops)
+}
+
+function stickerShape(type: string, size: number): string | null {
+  const s = (factor: number) => num(size * factor)
+
+  switch (type) {
+    case 'heart-frame':
+      return svgElement('path', {
+        d: `M${s(0.5)},${s(0.7)} C${s(0.5)},${s(0.7)} ${s(0.1)},${s(0.3)} ${s(0.1)},${s(0.5)} C${s(0.1)},${s(0.6)} ${s(0.2)},${s(0.7)} ${s(0.3)},${s(0.7)} C${s(0.4)},${s(0.7)} ${s(0.5)},${s(0.9)} ${s(0.5)},${s(0.9)} C${s(0.5)},${s(0.9)} ${s(0.6)},${s(0.7)} ${s(0.7)},${s(0.7)} C${s(0.8)},${s(0.7)} ${s(0.9)},${s(0.6)} ${s(0.9)},${s(0.5)} C${s(0.9)},${s(0.3)} ${s(0.5)},${s(0.7)} ${s(0.5)},${s(0.7)} Z`,
+        fill: 'none', stroke: '#ff6b6b', 'stroke-width': '3',
+      })
+    case 'star-frame':
+      return svgElement('path', {
+        d: `M${s(0.5)},0 L${s(0.6)},${s(0.4)} L${size},${s(0.4)} L${s(0.7)},${s(0.6)} L${s(0.8)},${size} L${s(0.5)},${s(0.8)} L${s(0.2)},${size} L${s(0.3)},${s(0.6)} L0,${s(0.4)} L${s(0.4)},${s(0.4)} Z`,
+        fill: 'none', stroke: '#ffd93d', 'stroke-width': '3',
+      })
+    case 'circle-frame':
+      return svgElement('circle', { cx: size / 2, cy: size / 2, r: size / 2 - 5, fill: 'none', stroke: '#4ecdc4', 'stroke-width': '4' })
+    case 'gold-frame':
+    case 'silver-frame':
+      return svgElement('rect', {
+        x: '5', y: '5', width: size - 10, height: size - 10,
+        fill: 'none', stroke: type === 'gold-frame' ? '#ffd700' : '#c0c0c0', 'stroke-width': '4',
+      })
+    case 'rainbow-frame': {
+      const colors = ['#ff0000', '#ff8000', '#ffff00', '#80ff00', '#00ffff', '#8000ff', '#ff0080']
+      const stops = colors.map((color, index) =>
+        svgElement('stop', { offset: `${num((index / (colors.length - 1)) * 100)}%`, 'stop-color': color })
+      ).join('')
+      return svgElement('rect', {
+        x: '5', y: '5', width: size - 10, height: size - 10,
+        fill: 'none', stroke: 'url(#rainbow-gradient)', 'stroke-width': '4',
+      }) + svgElement('defs', {}, svgElement('linearGradient', { id: 'rainbow-gradient', x1: '0%', y1: '0%', x2: '100%', y2: '0%' }, stops))
+    }
+    case 'christmas-tree':
+      return svgElement('g', {},
+        svgElement('path', { d: `M${s(0.5)},${s(0.1)} L${s(0.2)},${s(0.4)} L${s(0.8)},${s(0.4)} Z`, fill: '#228B22' }) +
+        svgElement('path', { d: `M${s(0.5)},${s(0.3)} L${s(0.15)},${s(0.6)} L${s(0.85)},${s(0.6)} Z`, fill: '#228B22' }) +
+        svgElement('path', { d: `M${s(0.5)},${s(0.5)} L${s(0.1)},${s(0.8)} L${s(0.9)},${s(0.8)} Z`, fill: '#228B22' }) +
+        svgElement('rect', { x: s(0.4), y: s(0.8), width: s(0.2), height: s(0.2), fill: '#8B4513' })
+      )
+    case 'santa':
+      return svgElement('g', {},
+        svgElement('path', { d: `M${s(0.2)},${s(0.3)} L${s(0.5)},${s(0.1)} L${s(0.8)},${s(0.3)} L${s(0.7)},${s(0.4)} L${s(0.3)},${s(0.4)} Z`, fill: '#ff0000' }) +
+        svgElement('circle', { cx: s(0.5), cy: s(0.1), r: s(0.05), fill: '#ffffff' }) +
+        svgElement('circle', { cx: s(0.5), cy: s(0.6), r: s(0.2), fill: '#ffdbac' })
+      )
+    case 'snowman':
+      return svgElement('g', {},
+        svgElement('circle', { cx: s(0.5), cy: s(0.7), r: s(0.25), fill: '#ffffff', stroke: '#cccccc', 'stroke-width': '2' }) +
+        svgElement('circle', { cx: s(0.5), cy: s(0.4), r: s(0.2), fill: '#ffffff', stroke: '#cccccc', 'stroke-width': '2' }) +
+        svgElement('circle', { cx: s(0.45), cy: s(0.35), r: s(0.02), fill: '#000000' }) +
+        svgElement('circle', { cx: s(0.55), cy: s(0.35), r: s(0.02), fill: '#000000' })
+      )
+    case 'gift-box':
+      return svgElement('g', {},
+        svgElement('rect', { x: s(0.2), y: s(0.3), width: s(0.6), height: s(0.5), fill: '#ff6b6b' }) +
+        svgElement('rect', { x: s(0.2), y: s(0.45), width: s(0.6), height: s(0.1), fill: '#ffffff' })
+      )
+    case 'pumpkin':
+      return svgElement('g', {},
+        svgElement('path', { d: `M${s(0.5)},${s(0.1)} C${s(0.3)},${s(0.1)} ${s(0.1)},${s(0.3)} ${s(0.1)},${s(0.6)} C${s(0.1)},${s(0.8)} ${s(0.3)},${s(0.9)} ${s(0.5)},${s(0.9)} C${s(0.7)},${s(0.9)} ${s(0.9)},${s(0.8)} ${s(0.9)},${s(0.6)} C${s(0.9)},${s(0.3)} ${s(0.7)},${s(0.1)} ${s(0.5)},${s(0.1)} Z`, fill: '#ff8c00' }) +
+        svgElement('path', { d: `M${s(0.35)},${s(0.4)} L${s(0.4)},${s(0.35)} L${s(0.35)},${s(0.3)} L${s(0.3)},${s(0.35)} Z`, fill: '#000000' }) +
+        svgElement('path', { d: `M${s(0.65)},${s(0.4)} L${s(0.7)},${s(0.35)} L${s(0.65)},${s(0.3)} L${s(0.6)},${s(0.35)} Z`, fill: '#000000' }) +
+        svgElement('path', { d: `M${s(0.3)},${s(0.6)} Q${s(0.5)},${s(0.7)} ${s(0.7)},${s(0.6)}`, fill: 'none', stroke: '#000000', 'stroke-width': '2' })
+      )
+    case 'bat':
+      return svgElement('g', {},
+        svgElement('ellipse', { cx: s(0.5), cy: s(0.6), rx: s(0.15), ry: s(0.2), fill: '#2c2c2c' }) +
+        svgElement('path', { d: `M${s(0.35)},${s(0.6)} Q${s(0.1)},${s(0.4)} ${s(0.1)},${s(0.6)} Q${s(0.1)},${s(0.8)} ${s(0.35)},${s(0.6)} Z`, fill: '#2c2c2c' }) +
+        svgElement('path', { d: `M${s(0.65)},${s(0.6)} Q${s(0.9)},${s(0.4)} ${s(0.9)},${s(0.6)} Q${s(0.9)},${s(0.8)} ${s(0.65)},${s(0.6)} Z`, fill: '#2c2c2c' })
+      )
+    case 'skull':
+      return svgElement('g', {},
+        svgElement('circle', { cx: s(0.5), cy: s(0.5), r: s(0.3), fill: '#ffffff', stroke: '#cccccc', 'stroke-width': '2' }) +
+        svgElement('circle', { cx: s(0.4), cy: s(0.45), r: s(0.05), fill: '#000000' }) +
+        svgElement('circle', { cx: s(0.6), cy: s(0.45), r: s(0.05), fill: '#000000' }) +
+        svgElement('path', { d: `M${s(0.5)},${s(0.5)} L${s(0.45)},${s(0.55)} L${s(0.55)},${s(0.55)} Z`, fill: '#000000' }) +
+        svgElement('path', { d: `M${s(0.35)},${s(0.6)} Q${s(0.5)},${s(0.7)} ${s(0.65)},${s(0.6)}`, fill: 'none', stroke: '#000000', 'stroke-width': '2' })
+      )
+    default:
+      return null
+  }
+}
+
+function stickerElement(sticker: QRStickerConfig, width: number, height: number): string {
+  const size = (Math.min(width, height) * sticker.size) / 100
+  let x = 0
+  let y = 0
+
+  switch (sticker.position) {
+    case 'top-left':
+      x = 10
+      y = 10
+      break
+    case 'top-right':
+      x = width - size - 10
+      y = 10
+      break
+    case 'bottom-left':
+      x = 10
+      y = height - size - 10
+      break
+    case 'bottom-right':
+      x = width - size - 10
+      y = height - size - 10
+      break
+    case 'center':
+      x = (width - size) / 2
+      y = (height - size) / 2
+      break
+  }
+
+  let content = ''
+  if (sticker.type === 'custom' && sticker.customImage) {
+    content = svgElement('image', { href: sticker.customImage, x, y, width: size, height: size })
+  } else {
+    // x / y sit on a <g>, where they have no effect (as in the browser preview)
+    const shape = stickerShape(sticker.type, size)
+    if (shape) content = svgElement('g', { x, y }, shape)
+  }
+
+  return svgElement('g', {
+    opacity: sticker.opacity,
+    transform: sticker.rotation ? `rotate(${sticker.rotation} ${num(x + size / 2)} ${num(y + size / 2)})` : undefined,
+  }, content)
+}
+
+function effectsFilter(effects: NonNullable<AdvancedQROptions['effects']>): string | null {
+  let primitives = ''
+  let lastResult = 'SourceGraphic'
+
+  if (effects.shadow) {
+    primitives += svgElement('feDropShadow', {
+      in: lastResult, dx: '4', dy: '4', stdDeviation: '4',
+      'flood-color': 'rgba(0,0,0,0.4)', 'flood-opacity': '0.4', result: 'shadow',
+    })
+    lastResult = 'shadow'
+  }
+
+  if (effects.glow) {
+    primitives += svgElement('feGaussianBlur', { in: 'SourceGraphic', stdDeviation: '3', result: 'blur' })
+    primitives += svgElement('feColorMatrix', {
+      in: 'blur', type: 'matrix', values: '1 0 0 0 0  0 1 0 0 0  0 0 1 0 0  0 0 0 18 -7', result: 'glow',
+    })
+    primitives += svgElement('feMerge', { result: 'glowMerge' },
+      svgElement('feMergeNode', { in: 'glow' }) +
+      svgElement('feMergeNode', { in: lastResult === 'shadow' ? 'shadow' : 'SourceGraphic' })
+    )
+    lastResult = 'glowMerge'
+  }
+
+  if (effects.threeD) {
+    primitives += svgElement('feConvolveMatrix', { in: lastResult, order: '3', kernelMatrix: '-2 -1 0 -1 1 1 0 1 2', result: 'emboss' })
+    primitives += svgElement('feBlend', { in: 'SourceGraphic', in2: 'emboss', mode: 'multiply', result: 'threeD' })
+  }
+
+  if (!primitives) return null
+  return svgElement('filter', { id: 'qr-effects', x: '-50%', y: '-50%', width: '200%', height: '200%' }, primitives)
+}
+
+function watermarkLayer(width: number, height: number, href: string): { filter: string; layer: string } {
+  const baseSize = Math.min(width, height)
+  const logoSize = Math.max(36, Math.min(80, baseSize * 0.18))
+  const padding = Math.max(4, baseSize * 0.02)
+  const logoX = width - logoSize - padding
+  const logoY = height - logoSize - padding
+
+  const filter = svgElement('filter', { id: 'botrix-shadow', x: '-50%', y: '-50%', width: '200%', height: '200%' },
+    svgElement('feDropShadow', { dx: '1', dy: '1', stdDeviation: '2', 'flood-color': 'rgba(0,0,0,0.1)' })
+  )
+  const layer = svgElement('g', { id: 'botrix-watermark-layer', 'data-role': 'botrix-watermark' },
+    svgElement('circle', {
+      id: 'botrix-watermark-bg',
+      cx: logoX + logoSize / 2, cy: logoY + logoSize / 2, r: logoSize / 2 + 3,
+      fill: '#ffffff', opacity: '0.95', stroke: '#e5e7eb', 'stroke-width': '0.5',
+      filter: 'url(#botrix-shadow)',
+    }) +
+    svgElement('image', {
+      id: 'botrix-watermark',
+      href,
+      x: logoX + 2, y: logoY + 2, width: logoSize - 2, height: logoSize - 2,
+      preserveAspectRatio: 'xMidYMid meet',
+      'clip-path': 'circle(50%)',
+    })
+  )
+  return { filter, layer }
+}
+
+/**
+ * Draw a styled QR code as an SVG document
+ */
+export function buildQrSvg(matrix: QrMatrix, options: QrSvgOptions): string {
+  const { width, height } = options
+  const count = matrix.size
+  if (count > width || count > height) {
+    throw new Error('The canvas is too small.')
+  }
+
+  // Template styles only fill in unset dot / corner types
+  const template = options.template ? QR_TEMPLATES[options.template] : undefined
+  const dotType = mapDotType(options.dotType || template?.styles.dotType || 'square')
+  const cornerType = mapCornerType(options.cornerType || template?.styles.cornerType || 'square')
+  const foreground = options.foregroundColor || '#000000'
+  const background = options.backgroundColor || '#ffffff'
+  const fill = (color: string) => (options.gradient && color !== options.backgroundColor ? 'url(#qr-gradient)' : color)
+
+  const dotSize = Math.floor(Math.min(width, height) / count)
+  const xBeginning = Math.floor((width - count * dotSize) / 2)
+  const yBeginning = Math.floor((height - count * dotSize) / 2)
+
+  // Defs are keyed by id so a layer can never be defined twice
+  const defs = new Map<string, string>()
+  const define = (id: string, markup: string) => {
+    if (!defs.has(id)) defs.set(id, markup)
+  }
+  let body = ''
+
+  // Logo: hide the modules under it, within what error correction can recover
+  let image = { width: 0, height: 0, hideXDots: 0, hideYDots: 0 }
+  const logo = options.logo
+  const logoSize = logo ? Math.max(0.05, Math.min(0.9, logo.size || 0.25)) : 0.25
+  const logoMargin = typeof logo?.margin === 'number' ? logo.margin : (logo ? 6 : 0)
+  if (logo) {
+    const maxHiddenDots = Math.floor(logoSize * ERROR_CORRECTION_PERCENT * count * count)
+    image = calculateImageSize(logo.width, logo.height, maxHiddenDots, count - 14, dotSize)
+  }
+
+  const isDrawn = (row: number, col: number) => {
+    if (logo &&
+      row >= (count - image.hideYDots) / 2 && row < (count + image.hideYDots) / 2 &&
+      col >= (count - image.hideXDots) / 2 && col < (count + image.hideXDots) / 2) {
+      return false
+    }
+    return !isFinderModule(row, col, count)
+  }
+
+  // One <path> per layer. A gradient fills the box each layer had in
+  // qr-code-styling (its objectBoundingBox), so gradient layers keep a box
+  // clipped to the path instead.
+  const layer = (name: string, color: string, box: [number, number, number, number], d: string, evenOdd = false) => {
+    const paint = fill(color)
+    if (paint === color) {
+      return svgElement('path', { fill: color, 'fill-rule': evenOdd ? 'evenodd' : undefined, d })
+    }
+    const [x, y, w, h] = box
+    define(`clip-path-${name}`, svgElement('clipPath', { id: `clip-path-${name}` },
+      svgElement('path', { 'clip-rule': evenOdd ? 'evenodd' : undefined, d })
+    ))
+    return svgElement('rect', { x, y, width: w, height: h, 'clip-path': `url('#clip-path-${name}')`, fill: paint })
+  }
+
+  // Background
+  body += svgElement('rect', { width, height, fill: fill(background) })
+
+  // Data modules
+  const dots = modulesPath(dotType, count, count, xBeginning, yBeginning, dotSize, (row, col) =>
+    row >= 0 && col >= 0 && row < count && col < count && isDrawn(row, col) && matrix.isDark(row, col)
+  )
+  if (dots) {
+    body += layer('dot-color-0', foreground, [0, 0, width, height], dots)
+  }
+
+  // Finder patterns: one layer for the three squares and one for the three dots,
+  // or one per finder when a gradient has to span each of them
+  const corners: Array<[number, number, number]> = [[0, 0, 0], [1, 0, Math.PI / 2], [0, 1, -Math.PI / 2]]
+  const squares: string[] = []
+  const centers: string[] = []
+  for (const [column, row, angle] of corners) {
+    const x = xBeginning + column * dotSize * (count - 7)
+    const y = yBeginning + row * dotSize * (count - 7)
+
+    squares.push(cornerType === 'rounded'
+      ? maskPath(SQUARE_MASK, 'rounded', x, y, dotSize)
+      : figurePath(cornerType === 'square' ? CORNER_SQUARE : CORNER_SQUARE_EXTRA_ROUNDED, x, y, dotSize * 7, angle))
+    centers.push(dotType === 'square'
+      ? figurePath(SQUARE, x + dotSize * 2, y + dotSize * 2, dotSize * 3)
+      : maskPath(DOT_MASK, dotType, x, y, dotSize))
+  }
+
+  if (fill(foreground) === foreground) {
+    body += layer('corners-square-color-0', foreground, [0, 0, width, height], squares.join(''), true)
+    body += layer('corners-dot-color-0', foreground, [0, 0, width, height], centers.join(''))
+  } else {
+    corners.forEach(([column, row], index) => {
+      const x = xBeginning + column * dotSize * (count - 7)
+      const y = yBeginning + row * dotSize * (count - 7)
+      body += layer(`corners-square-color-${column}-${row}-0`, foreground, [x, y, dotSize * 7, dotSize * 7], squares[index], true)
+      body += layer(`corners-dot-color-${column}-${row}-0`, foreground, [x + dotSize * 2, y + dotSize * 2, dotSize * 3, dotSize * 3], centers[index])
+    })
+  }
+
+  if (logo && image.width > 0) {
+    const dx = xBeginning + Math.floor(logoMargin + (count * dotSize - image.width) / 2)
+    const dy = yBeginning + Math.floor(logoMargin + (count * dotSize - image.height) / 2)
+    body += svgElement('image', {
+      href: logo.image,
+      x: dx,
+      y: dy,
+      width: `${image.width - logoMargin * 2}px`,
+      height: `${image.height - logoMargin * 2}px`,
+    })
+  }
+
+  // Advanced layers, in the order the browser generator applies them
+  let clipStyle: string | undefined
+  if (options.shape && options.shape !== 'square') {
+    const shape = shapeElement(options.shape, width, height)
+    if (shape) {
+      define(`shape-clip-${options.shape}`, svgElement('clipPath', { id: `shape-clip-${options.shape}` }, shape))
+      clipStyle = `clip-path: url(#shape-clip-${options.shape})`
+    }
+  }
+
+  if (options.gradient) {
+    define('qr-gradient', gradientElement(options.gradient))
+  }
+
+  if (options.sticker) {
+    body += stickerElement(options.sticker, width, height)
+  }
+
+  let filter: string | undefined
+  const effects = options.effects ? effectsFilter(options.effects) : null
+  if (effects) {
+    define('qr-effects', effects)
+    filter = 'url(#qr-effects)'
+  }
+
+  if (options.watermark) {
+    const watermark = watermarkLayer(width, height, options.watermarkHref || DEFAULT_WATERMARK_HREF)
+    define('botrix-shadow', watermark.filter)
+    body += watermark.layer
+  }
+
+  return svgElement('svg', {
+    width,
+    height,
+    xmlns: SVG_NS,
+    'xmlns:xlink': XLINK_NS,
+    viewBox: `0 0 ${width} ${height}`,
+    style: clipStyle,
+    filter,
+  }, (defs.size ? svgElement('defs', {}, Array.from(defs.values()).join('')) : '') + body)
+}
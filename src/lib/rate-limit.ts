@@ -1,4 +1,13 @@
+/**
+ * Rate Limiting
+ * Pluggable limiter with three backends:
+ * - memory: in-process GCRA, no I/O on the request path
+ * - redis: shared sliding-window counters over the Redis protocol (Upstash / Vercel KV REST)
+ * - database: the original ApiRateLimit table, also used as fallback when another backend fails
+ */
+
 import { supabaseAdmin } from '@/lib/supabase'
+import { CacheKeys } from '@/lib/cache'
 
 export interface RateLimitOptions {
   key: string // user:<id> or ip:<ip>
@@ -7,39 +16,312 @@ export interface RateLimitOptions {
   maxRequests: number
 }
 
-export async function rateLimit(options: RateLimitOptions): Promise<{ allowed: boolean; retryAfter?: number }> {
-  const { key, route, windowSeconds, maxRequests } = options
+export interface RateLimitResult {
+  allowed: boolean
+  retryAfter?: number // seconds until the next request would be allowed (only when denied)
+  limit: number
+  remaining: number
+  reset: number // seconds until the limit is fully replenished
+}
+
+export interface RateLimitBackend {
+  name: 'memory' | 'redis' | 'database'
+  consume(options: RateLimitOptions): Promise<RateLimitResult>
+}
+
+/**
+ * In-process GCRA (generic cell rate algorithm).
+ * Stores one "theoretical arrival time" per key, so memory is O(active keys).
+ */
+export class MemoryRateLimitBackend implements RateLimitBackend {
+  readonly name = 'memory' as const
+  private arrivals = new Map<string, number>()
+  private maxKeys: number
+  private lastSweep = 0
+
+  constructor(options: { maxKeys?: number } = {}) {
+    this.maxKeys = options.maxKeys || 50000
+  }
+
+  async consume(options: RateLimitOptions): Promise<RateLimitResult> {
+    return this.consumeAt(options, Date.now())
+  }
+
+  consumeAt(options: RateLimitOptions, now: number): RateLimitResult {
+    const { windowSeconds, maxRequests } = options
+    const storeKey = CacheKeys.rateLimitKey(options.key, options.route)
+    const windowMs = windowSeconds * 1000
+    const interval = windowMs / maxRequests
+
+    const tat = Math.max(this.arrivals.get(storeKey) ?? now, now)
+    const newTat = tat + interval
+    const allowAt = newTat - windowMs
+
+    if (now < allowAt) {
+      return {
+        allowed: false,
+        retryAfter: Math.max(1, Math.ceil((allowAt - now) / 1000)),
+        limit: maxRequests,
+        remaining: 0,
+        reset: Math.ceil((tat - now) / 1000),
+      }
+    }
+
+    // Re-insert so Map order tracks recency for eviction
+    this.arrivals.delete(storeKey)
+    this.arrivals.set(storeKey, newTat)
+    this.evict(now)
+
+    return {
+      allowed: true,
+      limit: maxRequests,
+      remaining: Math.max(0, Math.floor((windowMs - (newTat - now)) / interval)),
+      reset: Math.ceil((newTat - now) / 1000),
+    }
+  }
+
+  get size(): number {
+    return this.arrivals.size
+  }
+
+  private evict(now: number) {
+    // Keys whose arrival time has passed are equivalent to absent keys
+    if (now - this.lastSweep > 60000) {
+      this.lastSweep = now
+      for (const [key, tat] of this.arrivals) {
+        if (tat <= now) this.arrivals.delete(key)
+      }
+    }
+
+    // Hard cap: drop least recently used keys
+    while (this.arrivals.size > this.maxKeys) {
+      const oldest = this.arrivals.keys().next().value
+      if (oldest === undefined) break
+      this.arrivals.delete(oldest)
+    }
+  }
+}
+
+/**
+ * Minimal Redis command interface: runs commands in one round-trip and
+ * returns their results in order
+ */
+export interface RedisPipelineClient {
+  pipeline(commands: Array<Array<string | number>>): Promise<unknown[]>
+}
+
+/**
+ * Redis client over the Upstash / Vercel KV REST protocol (works in Node and Edge)
+ */
+export function createRestRedisClient(url: string, token: string): RedisPipelineClient {
+  return {
+    async pipeline(commands) {
+      const response = await fetch(`${url.replace(/\/$/, '')}/pipeline`, {
+        method: 'POST',
+        headers: {
+          Authorization: `Bearer ${token}`,
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(commands),
+        signal: AbortSignal.timeout(2000),
+      })
+
+      if (!response.ok) {
+        throw new Error(`Redis pipeline failed: ${response.status} ${response.statusText}`)
+      }
+
+      const results = await response.json() as Array<{ result?: unknown; error?: string }>
+      return results.map(entry => {
+        if (entry.error) throw new Error(`Redis command failed: ${entry.error}`)
+        return entry.result
+      })
+    },
+  }
+}
+
+/**
+ * Shared sliding-window limiter: two fixed-window counters weighted by how far
+ * into the current window we are. One pipelined round-trip per request.
+ */
+export class RedisRateLimitBackend implements RateLimitBackend {
+  readonly name = 'redis' as const
+  private client: RedisPipelineClient
+
+  constructor(client: RedisPipelineClient) {
+    this.client = client
+  }
+
+  async consume(options: RateLimitOptions): Promise<RateLimitResult> {
+    return this.consumeAt(options, Date.now())
+  }
+
+  async consumeAt(options: RateLimitOptions, now: number): Promise<RateLimitResult> {
+    const { windowSeconds, maxRequests } = options
+    const windowMs = windowSeconds * 1000
+    const windowIndex = Math.floor(now / windowMs)
+    const baseKey = CacheKeys.rateLimitKey(options.key, options.route)
+    const currentKey = `${baseKey}:${windowIndex}`
+    const previousKey = `${baseKey}:${windowIndex - 1}`
 
-  const windowStart = new Date(Date.now() - windowSeconds * 1000).toISOString()
+    const [current, , previous] = await this.client.pipeline([
+      ['INCR', currentKey],
+      ['PEXPIRE', currentKey, windowMs * 2],
+      ['GET', previousKey],
+    ])
 
-  // Try to find an existing record in the current window
-  const { data: existing } = await supabaseAdmin!
-    .from('ApiRateLimit')
-    .select('*')
-    .eq('key', key)
-    .eq('route', route)
-    .gte('windowStart', windowStart)
-    .order('windowStart', { ascending: false })
-    .limit(1)
-    .maybeSingle()
+    const elapsed = now - windowIndex * windowMs
+    const previousWeight = 1 - elapsed / windowMs
+    const count = Math.floor(Number(previous || 0) * previousWeight) + Number(current || 0)
+    const untilWindowEnd = Math.max(1, Math.ceil((windowMs - elapsed) / 1000))
+
+    if (count > maxRequests) {
+      return {
+        allowed: false,
+        retryAfter: untilWindowEnd,
+        limit: maxRequests,
+        remaining: 0,
+        reset: untilWindowEnd,
+      }
+    }
 
-  if (existing) {
-    if (existing.requestCount >= maxRequests) {
-      const retryAfter = Math.ceil((new Date(existing.windowStart).getTime() + windowSeconds * 1000 - Date.now()) / 1000)
-      return { allowed: false, retryAfter }
+    return {
+      allowed: true,
+      limit: maxRequests,
+      remaining: Math.max(0, maxRequests - count),
+      reset: untilWindowEnd,
     }
+  }
+}
+
+/**
+ * Fixed-window limiter backed by the ApiRateLimit table
+ */
+export class DatabaseRateLimitBackend implements RateLimitBackend {
+  readonly name = 'database' as const
+
+  async consume(options: RateLimitOptions): Promise<RateLimitResult> {
+    const { key, route, windowSeconds, maxRequests } = options
+
+    const windowStart = new Date(Date.now() - windowSeconds * 1000).toISOString()
+
+    // Try to find an existing record in the current window
+    const { data: existing, error } = await supabaseAdmin!
+      .from('ApiRateLimit')
+      .select('*')
+      .eq('key', key)
+      .eq('route', route)
+      .gte('windowStart', windowStart)
+      .order('windowStart', { ascending: false })
+      .limit(1)
+      .maybeSingle()
+
+    if (error) {
+      throw new Error(`Failed to read rate limit: ${error.message}`)
+    }
+
+    if (existing) {
+      const reset = Math.max(0, Math.ceil((new Date(existing.windowStart).getTime() + windowSeconds * 1000 - Date.now()) / 1000))
+      if (existing.requestCount >= maxRequests) {
+        return { allowed: false, retryAfter: reset, limit: maxRequests, remaining: 0, reset }
+      }
+      await supabaseAdmin!
+        .from('ApiRateLimit')
+        .update({ requestCount: existing.requestCount + 1, lastRequestAt: new Date().toISOString() })
+        .eq('id', existing.id)
+      return { allowed: true, limit: maxRequests, remaining: maxRequests - existing.requestCount - 1, reset }
+    }
+
     await supabaseAdmin!
       .from('ApiRateLimit')
-      .update({ requestCount: existing.requestCount + 1, lastRequestAt: new Date().toISOString() })
-      .eq('id', existing.id)
-    return { allowed: true }
+      .insert({ key, route, requestCount: 1, windowStart: new Date().toISOString(), lastRequestAt: new Date().toISOString() })
+
+    return { allowed: true, limit: maxRequests, remaining: maxRequests - 1, reset: windowSeconds }
+  }
+}
+
+const databaseBackend = new DatabaseRateLimitBackend()
+let activeBackend: RateLimitBackend | null = null
+
+/**
+ * Select the backend from RATE_LIMIT_BACKEND, defaulting to Redis when KV
+ * credentials are configured and the in-process limiter otherwise
+ */
+function createBackend(): RateLimitBackend {
+  const configured = process.env.RATE_LIMIT_BACKEND
+  const kvUrl = process.env.KV_REST_API_URL
+  const kvToken = process.env.KV_REST_API_TOKEN
+
+  if (configured === 'database') {
+    return databaseBackend
   }
 
-  await supabaseAdmin!
-    .from('ApiRateLimit')
-    .insert({ key, route, requestCount: 1, windowStart: new Date().toISOString(), lastRequestAt: new Date().toISOString() })
+  if ((configured === 'redis' || !configured) && kvUrl && kvToken) {
+    return new RedisRateLimitBackend(createRestRedisClient(kvUrl, kvToken))
+  }
 
-  return { allowed: true }
+  if (configured === 'redis') {
+    console.warn('RATE_LIMIT_BACKEND=redis but KV_REST_API_URL/KV_REST_API_TOKEN are not set, using memory backend')
+  }
+
+  return new MemoryRateLimitBackend()
+}
+
+export function getRateLimitBackend(): RateLimitBackend {
+  if (!activeBackend) {
+    activeBackend = createBackend()
+  }
+  return activeBackend
+}
+
+/**
+ * Override the backend (tests, custom deployments). Pass null to re-read the environment.
+ */
+export function setRateLimitBackend(backend: RateLimitBackend | null): void {
+  activeBackend = backend
 }
 
+export async function rateLimit(options: RateLimitOptions): Promise<RateLimitResult> {
+  const backend = getRateLimitBackend()
+
+  try {
+    return await backend.consume(options)
+  } catch (error) {
+    console.error(`Rate limit backend "${backend.name}" failed:`, error)
+  }
 
+  if (backend !== databaseBackend) {
+    try {
+      return await databaseBackend.consume(options)
+    } catch (error) {
+      console.error('Rate limit database fallback failed:', error)
+    }
+  }
+
+  // Fail open: limiter outages shouldn't take the endpoint down
+  return { allowed: true, limit: options.maxRequests, remaining: options.maxRequests, reset: options.windowSeconds }
+}
+
+/**
+ * RateLimit-* response headers (IETF draft) plus Retry-After when denied
+ */
+export function getRateLimitHeaders(result: RateLimitResult): Record<string, string> {
+  const headers: Record<string, string> = {
+    'RateLimit-Limit': String(result.limit),
+    'RateLimit-Remaining': String(result.remaining),
+    'RateLimit-Reset': String(result.reset),
+  }
+  if (!result.allowed && result.retryAfter !== undefined) {
+    headers['Retry-After'] = String(result.retryAfter)
+  }
+  return headers
+}
+
+/**
+ * Attach rate limit headers to a response
+ */
+export function applyRateLimitHeaders<T extends { headers: Headers }>(response: T, result: RateLimitResult): T {
+  for (const [name, value] of Object.entries(getRateLimitHeaders(result))) {
+    response.headers.set(name, value)
+  }
+  return response
+}
@@ -0,0 +1,239 @@
+/**
+ * Redirect Rule Engine
+ * Compiles a QR code's deviceRedirection / geoRedirection / abTestConfig into an
+ * immutable decision structure once per QR version:
+ * - Hash lookups for device, country and city targets
+ * - Alias table for O(1) weighted A/B variant sampling
+ * - LRU-cached user agent classification
+ */
+
+import type { ServableQrCode } from '@/lib/qr-resolution'
+
+export type DeviceClass = 'ios' | 'android' | 'desktop'
+
+export interface RedirectContext {
+  userAgent?: string | null
+  country?: string | null
+  city?: string | null
+}
+
+export interface RedirectDecision {
+  url: string
+  abTestVariant: string | null
+}
+
+/**
+ * Walker/Vose alias table: O(n) to build, O(1) per sample
+ */
+export class AliasTable {
+  readonly keys: readonly string[]
+  private probability: Float64Array
+  private alias: Uint32Array
+
+  constructor(keys: string[], weights: number[]) {
+    const n = keys.length
+    this.keys = Object.freeze([...keys])
+    this.probability = new Float64Array(n)
+    this.alias = new Uint32Array(n)
+
+    const total = weights.reduce((sum, w) => sum + w, 0)
+    const scaled = weights.map(w => (w * n) / total)
+    const small: number[] = []
+    const large: number[] = []
+    scaled.forEach((p, i) => (p < 1 ? small : large).push(i))
+
+    while (small.length > 0 && large.length > 0) {
+      const less = small.pop()!
+      const more = large.pop()!
+      this.probability[less] = scaled[less]
+      this.alias[less] = more
+      scaled[more] = scaled[more] + scaled[less] - 1
+      ;(scaled[more] < 1 ? small : large).push(more)
+    }
+
+    // Whatever is left is (up to rounding) exactly 1
+    for (const i of large) this.probability[i] = 1
+    for (const i of small) this.probability[i] = 1
+  }
+
+  sample(random: () => number = Math.random): string {
+    const r = random() * this.keys.length
+    const column = Math.min(Math.floor(r), this.keys.length - 1)
+    return r - column < this.probability[column] ? this.keys[column] : this.keys[this.alias[column]]
+  }
+}
+
+export interface CompiledRedirectRules {
+  readonly defaultUrl: string
+  readonly devices: ReadonlyMap<string, string> | null
+  readonly cities: ReadonlyMap<string, string> | null
+  readonly countries: ReadonlyMap<string, string> | null
+  readonly variants: AliasTable | null
+  readonly variantUrls: ReadonlyMap<string, string> | null
+}
+
+type RuleSource = Pick<ServableQrCode, 'url' | 'redirectUrl' | 'deviceRedirection' | 'geoRedirection' | 'abTestConfig'>
+
+function toLookup(config: Record<string, string> | null | undefined): ReadonlyMap<string, string> | null {
+  if (!config || typeof config !== 'object') return null
+  const lookup = new Map<string, string>()
+  for (const [key, url] of Object.entries(config)) {
+    if (url) lookup.set(key, url)
+  }
+  return lookup.size > 0 ? lookup : null
+}
+
+/**
+ * Compile the redirect configuration of a QR code
+ */
+export function compileRedirectRules(qrCode: RuleSource): CompiledRedirectRules {
+  let variants: AliasTable | null = null
+  let variantUrls: Map<string, string> | null = null
+
+  const definedVariants = qrCode.abTestConfig?.variants
+  if (definedVariants && typeof definedVariants === 'object') {
+    const entries = Object.entries(definedVariants)
+    if (entries.length > 0) {
+      const keys = entries.map(([key]) => key)
+      const weights = entries.map(([, cfg]) => Math.max(0, cfg?.weight ?? 1))
+      // No usable weights: always serve the first variant
+      variants = weights.some(w => w > 0)
+        ? new AliasTable(keys, weights)
+        : new AliasTable([keys[0]], [1])
+
+      variantUrls = new Map()
+      for (const [key, cfg] of entries) {
+        if (cfg?.url) variantUrls.set(key, cfg.url)
+      }
+    }
+  }
+
+  return Object.freeze({
+    defaultUrl: qrCode.redirectUrl || qrCode.url,
+    devices: toLookup(qrCode.deviceRedirection),
+    cities: toLookup(qrCode.geoRedirection?.cities),
+    countries: toLookup(qrCode.geoRedirection?.countries),
+    variants,
+    variantUrls,
+  })
+}
+
+// Recently seen user agents; real traffic is dominated by a small set of strings
+const UA_CACHE_SIZE = 1000
+const uaCache = new Map<string, DeviceClass>()
+
+/**
+ * Classify a user agent into the device classes used by deviceRedirection
+ */
+export function classifyUserAgent(userAgent: string): DeviceClass {
+  const cached = uaCache.get(userAgent)
+  if (cached) {
+    // Refresh recency
+    uaCache.delete(userAgent)
+    uaCache.set(userAgent, cached)
+    return cached
+  }
+
+  let deviceClass: DeviceClass = 'desktop'
+  if (userAgent.includes('iPhone') || userAgent.includes('iPad')) {
+    deviceClass = 'ios'
+  } else if (userAgent.includes('Android')) {
+    deviceClass = 'android'
+  }
+
+  uaCache.set(userAgent, deviceClass)
+  if (uaCache.size > UA_CACHE_SIZE) {
+    const oldest = uaCache.keys().next().value
+    if (oldest !== undefined) uaCache.delete(oldest)
+  }
+  return deviceClass
+}
+
+/**
+ * Pick the destination for a scan. Precedence matches the original handler:
+ * A/B variant over city, city over country, geo over device.
+ */
+export function evaluateRedirect(
+  rules: CompiledRedirectRules,
+  context: RedirectContext,
+  random: () => number = Math.random
+): RedirectDecision {
+  let url = rules.defaultUrl
+
+  if (rules.devices && context.userAgent) {
+    url = rules.devices.get(classifyUserAgent(context.userAgent)) || url
+  }
+
+  if (context.country) {
+    const geoUrl = (context.city && rules.cities?.get(context.city)) || rules.countries?.get(context.country)
+    if (geoUrl) url = geoUrl
+  }
+
+  let abTestVariant: string | null = null
+  if (rules.variants) {
+    abTestVariant = rules.variants.sample(random)
+    url = rules.variantUrls?.get(abTestVariant) || url
+  }
+
+  return { url, abTestVariant }
+}
+
+// Compiled rules per QR code, tagged with the version they were built from
+const COMPILED_CACHE_SIZE = 5000
+const compiledCache = new Map<string, { version: string; rules: CompiledRedirectRules }>()
+
+function versionTag(qrCode: Pick<ServableQrCode, 'version' | 'updatedAt'>): string {
+  return `${qrCode.version ?? ''}:${qrCode.updatedAt ?? ''}`
+}
+
+/**
+ * Compiled rules for a resolved QR code, rebuilt only when its version changes
+ */
+export function getCompiledRedirectRules(qrCode: ServableQrCode): CompiledRedirectRules {
+  const version = versionTag(qrCode)
+  const cached = compiledCache.get(qrCode.id)
+  if (cached && cached.version === version) {
+    return cached.rules
+  }
+
+  const rules = compileRedirectRules(qrCode)
+  compiledCache.delete(qrCode.id)
+  compiledCache.set(qrCode.id, { version, rules })
+  if (compiledCache.size > COMPILED_CACHE_SIZE) {
+    const oldest = compiledCache.keys().next().value
+    if (oldest !== undefined) compiledCache.delete(oldest)
+  }
+  return rules
+}
+
+/**
+ * Run N synthetic scans through the engine (benchmarks, config previews).
+ * Contexts are cycled in order; returns hit counts per destination and variant.
+ */
+export function simulateRedirects(
+  rules: CompiledRedirectRules,
+  contexts: RedirectContext[],
+  scans: number,
+  random: () => number = Math.random
+) {
+  const urls = new Map<string, number>()
+  const variants = new Map<string, number>()
+  const start = performance.now()
+
+  for (let i = 0; i < scans; i++) {
+    const decision = evaluateRedirect(rules, contexts[i % contexts.length] || {}, random)
+    urls.set(decision.url, (urls.get(decision.url) || 0) + 1)
+    if (decision.abTestVariant) {
+      variants.set(decision.abTestVariant, (variants.get(decision.abTestVariant) || 0) + 1)
+    }
+  }
+
+  const durationMs = performance.now() - start
+  return {
+    scans,
+    durationMs,
+    scansPerSecond: durationMs > 0 ? Math.round((scans / durationMs) * 1000) : scans,
+    urls: Object.fromEntries(urls),
+    variants: Object.fromEntries(variants),
+  }
+}
@@ -0,0 +1,169 @@
+/**
+ * Remote Image Fetching
+ * Fetches user-supplied image URLs (QR code logos) on the server without
+ * letting them reach internal services: https only, public addresses only
+ * (checked on the address actually connected to, so DNS rebinding can't slip
+ * past), no redirects, a deadline and a size cap enforced while streaming.
+ */
+
+import dns from 'dns'
+import http from 'http'
+import https from 'https'
+import net from 'net'
+
+// Same limit as logo uploads
+export const REMOTE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+export const REMOTE_IMAGE_TIMEOUT_MS = 5000
+
+export interface RemoteImageOptions {
+  maxBytes?: number
+  timeoutMs?: number
+  trustedOrigins?: string[] // Origins exempt from the scheme and address checks, e.g. our own storage
+}
+
+export interface RemoteImage {
+  buffer: Buffer
+  mimeType: string | null
+}
+
+// Loopback, private, shared, link-local, multicast and reserved ranges
+const blockedAddresses = new net.BlockList()
+for (const [network, prefix] of [
+  ['0.0.0.0', 8],
+  ['10.0.0.0', 8],
+  ['100.64.0.0', 10],
+  ['127.0.0.0', 8],
+  ['169.254.0.0', 16],
+  ['172.16.0.0', 12],
+  ['192.0.0.0', 24],
+  ['192.168.0.0', 16],
+  ['198.18.0.0', 15],
+  ['224.0.0.0', 3],
+] as const) {
+  blockedAddresses.addSubnet(network, prefix, 'ipv4')
+}
+for (const [network, prefix] of [
+  ['::', 127], // Unspecified and loopback
+  ['fc00::', 7],
+  ['fe80::', 10],
+  ['ff00::', 8],
+] as const) {
+  blockedAddresses.addSubnet(network, prefix, 'ipv6')
+}
+
+/**
+ * Whether an IP address is publicly routable
+ */
+export function isPublicAddress(address: string): boolean {
+  const family = net.isIP(address)
+  if (family === 0) return false
+  // IPv4-mapped IPv6 (::ffff:a.b.c.d) is checked against the IPv4 ranges
+  const mapped = family === 6 ? address.match(/^::ffff:([0-9a-f]{1,4}):([0-9a-f]{1,4})$/i) : null
+  if (mapped) {
+    const high = parseInt(mapped[1], 16)
+    const low = parseInt(mapped[2], 16)
+    return isPublicAddress(`${high >> 8}.${high & 255}.${low >> 8}.${low & 255}`)
+  }
+  if (family === 6 && /^::ffff:\d/i.test(address)) {
+    return isPublicAddress(address.slice(7))
+  }
+  return !blockedAddresses.check(address, family === 4 ? 'ipv4' : 'ipv6')
+}
+
+// Resolve as usual, but refuse to connect when any resolved address is not public
+function publicLookup(
+  hostname: string,
+  options: dns.LookupOptions,
+  callback: (error: Error | null, address: string | dns.LookupAddress[], family?: number) => void
+) {
+  dns.lookup(hostname, { ...options, all: true }, (error, addresses) => {
+    if (error) return callback(error, '')
+    if (addresses.length === 0 || addresses.some(entry => !isPublicAddress(entry.address))) {
+      return callback(new Error(`Image host ${hostname} resolves to a non-public address`), '')
+    }
+    if (options.all) {
+      callback(null, addresses)
+    } else {
+      callback(null, addresses[0].address, addresses[0].family)
+    }
+  })
+}
+
+/**
+ * Download an image from a user-supplied URL
+ */
+export function fetchRemoteImage(source: string, options: RemoteImageOptions = {}): Promise<RemoteImage> {
+  const maxBytes = options.maxBytes ?? REMOTE_IMAGE_MAX_BYTES
+  const timeoutMs = options.timeoutMs ?? REMOTE_IMAGE_TIMEOUT_MS
+
+  let url: URL
+  try {
+    url = new URL(source)
+  } catch {
+    return Promise.reject(new Error('Invalid image URL'))
+  }
+
+  const trusted = (options.trustedOrigins || []).includes(url.origin)
+  if (!trusted) {
+    if (url.protocol !== 'https:') {
+      return Promise.reject(new Error(`Image URL must use https, got ${url.protocol}`))
+    }
+    // IP literals never go through the lookup
+    const literal = url.hostname.replace(/^\[|\]$/g, '')
+    if (net.isIP(literal) && !isPublicAddress(literal)) {
+      return Promise.reject(new Error(`Image host ${url.hostname} is not a public address`))
+    }
+  }
+
+  return new Promise((resolve, reject) => {
+    let settled = false
+    const fail = (error: Error) => {
+      if (settled) return
+      settled = true
+      clearTimeout(deadline)
+      reject(error)
+      request.destroy()
+    }
+
+    const client = url.protocol === 'https:' ? https : http
+    const request = client.get(url, {
+      headers: { accept: 'image/*' },
+      lookup: trusted ? undefined : (publicLookup as unknown as net.LookupFunction),
+    }, response => {
+      const status = response.statusCode || 0
+      if (status >= 300 && status < 400) {
+        return fail(new Error(`Image URL redirects (${status}); redirects are not followed`))
+      }
+      if (status !== 200) {
+        return fail(new Error(`Image fetch failed: ${status}`))
+      }
+      if (Number(response.headers['content-length']) > maxBytes) {
+        return fail(new Error(`Image is larger than ${maxBytes} bytes`))
+      }
+
+      const chunks: Buffer[] = []
+      let received = 0
+      response.on('data', (chunk: Buffer) => {
+        received += chunk.length
+        if (received > maxBytes) {
+          return fail(new Error(`Image is larger than ${maxBytes} bytes`))
+        }
+        chunks.push(chunk)
+      })
+      response.on('end', () => {
+        if (settled) return
+        settled = true
+        clearTimeout(deadline)
+        resolve({
+          buffer: Buffer.concat(chunks),
+          mimeType: response.headers['content-type']?.split(';')[0].trim() || null,
+        })
+      })
+      response.on('error', fail)
+    })
+    request.on('error', fail)
+
+    // Covers connecting, slow headers and slow bodies alike
+    const deadline = setTimeout(() => fail(new Error(`Image fetch timed out after ${timeoutMs}ms`)), timeoutMs)
+  })
+}
@@ -0,0 +1,117 @@
+/**
+ * Scan Analytics
+ * Per-QR-code scan aggregates computed in the database, so the analytics
+ * endpoints transfer grouped counts instead of every QrCodeScan row. Closed
+ * days are read from the daily rollups (src/lib/scan-rollups.ts).
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+
+export interface ScanAnalytics {
+  totalScans: number
+  uniqueDevices: number
+  uniqueCountries: number
+  uniqueCities: number
+  scansByDate: Record<string, number>
+  scansByDevice: Record<string, number>
+  scansByCountry: Record<string, number>
+  recentScans: Array<Record<string, unknown>>
+}
+
+const RECENT_SCANS_LIMIT = 10
+
+/**
+ * Load the aggregates and the most recent scans for a QR code
+ */
+export async function getScanAnalytics(qrCodeId: string): Promise<ScanAnalytics> {
+  const [aggregates, recent] = await Promise.all([
+    supabaseAdmin!.rpc('get_qr_scan_analytics', { p_qr_code_id: qrCodeId }),
+    supabaseAdmin!
+      .from('QrCodeScan')
+      .select('*')
+      .eq('qrCodeId', qrCodeId)
+      .order('scannedAt', { ascending: false })
+      .limit(RECENT_SCANS_LIMIT),
+  ])
+
+  if (aggregates.error) {
+    throw new Error(`Failed to aggregate scans: ${aggregates.error.message}`)
+  }
+  if (recent.error) {
+    throw new Error(`Failed to fetch recent scans: ${recent.error.message}`)
+  }
+
+  const data = (aggregates.data || {}) as Partial<ScanAnalytics>
+
+  return {
+    totalScans: Number(data.totalScans) || 0,
+    uniqueDevices: Number(data.uniqueDevices) || 0,
+    uniqueCountries: Number(data.uniqueCountries) || 0,
+    uniqueCities: Number(data.uniqueCities) || 0,
+    scansByDate: data.scansByDate || {},
+    scansByDevice: data.scansByDevice || {},
+    scansByCountry: data.scansByCountry || {},
+    recentScans: recent.data || [],
+  }
+}
+
+export interface ScanSummary {
+  totalScans: number
+  uniqueDevices: number
+  uniqueCountries: number
+  uniqueCities: number
+  scansByDate: Record<string, number>
+  scansByDevice: Record<string, number>
+  scansByCountry: Record<string, number>
+  scansByCity: Record<string, number>
+  scansByBrowser: Record<string, number>
+  scansByOS: Record<string, number>
+  abTestResults: Record<string, number>
+}
+
+export function emptyScanSummary(): ScanSummary {
+  return {
+    totalScans: 0,
+    uniqueDevices: 0,
+    uniqueCountries: 0,
+    uniqueCities: 0,
+    scansByDate: {},
+    scansByDevice: {},
+    scansByCountry: {},
+    scansByCity: {},
+    scansByBrowser: {},
+    scansByOS: {},
+    abTestResults: {},
+  }
+}
+
+/**
+ * Scan summaries for several QR codes over an optional inclusive UTC date range.
+ * Closed days come from the daily rollups, the open tail from raw scans.
+ */
+export async function getScanSummaries(
+  qrCodeIds: string[],
+  dateRange?: { start?: string | null; end?: string | null }
+): Promise<Map<string, ScanSummary>> {
+  const summaries = new Map<string, ScanSummary>()
+  if (qrCodeIds.length === 0) return summaries
+
+  const { data, error } = await supabaseAdmin!.rpc('get_scan_summaries', {
+    p_qr_code_ids: qrCodeIds,
+    p_start_date: dateRange?.start || null,
+    p_end_date: dateRange?.end || null,
+  })
+
+  if (error) {
+    throw new Error(`Failed to summarise scans: ${error.message}`)
+  }
+
+  for (const row of (data || []) as Array<{ qr_code_id: string; summary: Partial<ScanSummary> }>) {
+    summaries.set(row.qr_code_id, { ...emptyScanSummary(), ...row.summary })
+  }
+  for (const id of qrCodeIds) {
+    if (!summaries.has(id)) summaries.set(id, emptyScanSummary())
+  }
+
+  return summaries
+}
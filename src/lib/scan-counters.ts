@@ -0,0 +1,92 @@
+/**
+ * Sharded Scan Counters
+ * Atomic scan counting without a hot QrCode row. Increments land on one of N
+ * QrCodeScanCounter shards via RPC, reads sum QrCode.scanCount plus the
+ * shards, and a periodic fold moves shard totals back into QrCode.scanCount.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+
+export interface ScanCountDelta {
+  qrCodeId: string
+  count: number
+  lastScannedAt: string
+}
+
+const DEFAULT_SHARD_COUNT = 8
+
+/**
+ * Number of counter shards per QR code (SCAN_COUNTER_SHARDS)
+ */
+export function getScanCounterShardCount(): number {
+  const parsed = parseInt(process.env.SCAN_COUNTER_SHARDS || '', 10)
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : DEFAULT_SHARD_COUNT
+}
+
+/**
+ * Atomically add scan deltas to a random shard per QR code
+ */
+export async function incrementScanCounters(deltas: ScanCountDelta[]): Promise<void> {
+  if (deltas.length === 0) return
+
+  const { error } = await supabaseAdmin!
+    .rpc('increment_scan_counters', {
+      p_counts: deltas,
+      p_shards: getScanCounterShardCount(),
+    })
+
+  if (error) {
+    throw new Error(`Failed to increment scan counters: ${error.message}`)
+  }
+}
+
+/**
+ * Get total scan counts (folded + unfolded shards) for several QR codes
+ */
+export async function getScanCounts(qrCodeIds: string[]): Promise<Map<string, number>> {
+  const totals = new Map<string, number>()
+  if (qrCodeIds.length === 0) return totals
+
+  const { data, error } = await supabaseAdmin!
+    .rpc('get_scan_counts', { p_qr_code_ids: qrCodeIds })
+
+  if (error) {
+    throw new Error(`Failed to read scan counters: ${error.message}`)
+  }
+
+  for (const row of (data || []) as Array<{ qrCodeId: string; total: number | string }>) {
+    totals.set(row.qrCodeId, Number(row.total) || 0)
+  }
+
+  return totals
+}
+
+/**
+ * Get the total scan count for one QR code.
+ * Falls back to the folded value if the counter read fails.
+ */
+export async function getScanCount(qrCodeId: string, foldedCount: number = 0): Promise<number> {
+  try {
+    const totals = await getScanCounts([qrCodeId])
+    return totals.get(qrCodeId) ?? foldedCount
+  } catch (error) {
+    console.error('Error reading scan counters:', error)
+    return foldedCount
+  }
+}
+
+/**
+ * Fold shard totals into QrCode.scanCount/lastScannedAt.
+ * Returns the number of QR codes updated.
+ */
+export async function foldScanCounters(limit: number = 1000): Promise<number> {
+  const { data, error } = await supabaseAdmin!
+    .rpc('fold_scan_counters', { p_limit: limit })
+
+  if (error) {
+    console.error('Error folding scan counters:', error)
+    return 0
+  }
+
+  return typeof data === 'number' ? data : 0
+}
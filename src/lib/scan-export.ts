@@ -0,0 +1,122 @@
+/**
+ * Streaming Scan Export
+ * Pages through QrCodeScan with keyset pagination on (qrCodeId, scannedAt, id)
+ * and feeds CSV / NDJSON lines into a pull-based ReadableStream, so at most one
+ * page is held in memory no matter how many scans an account has.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+
+export interface ExportScanRow {
+  id: string
+  qrCodeId: string
+  scannedAt: string
+  ipAddress?: string | null
+  device?: string | null
+  browser?: string | null
+  os?: string | null
+  country?: string | null
+  city?: string | null
+  abTestVariant?: string | null
+}
+
+export interface ExportDateRange {
+  start: string // Inclusive UTC day (YYYY-MM-DD)
+  end: string // Inclusive UTC day (YYYY-MM-DD)
+}
+
+const EXPORT_SCAN_COLUMNS = 'id, qrCodeId, scannedAt, ipAddress, device, browser, os, country, city, abTestVariant'
+const DEFAULT_PAGE_SIZE = 1000
+
+/**
+ * Yield pages of scans, one QR code at a time in scannedAt order.
+ * Each page resumes after the last (scannedAt, id) seen, so every query is an
+ * index range scan on idx_qrcodescan_qrcode_scanned_at rather than an OFFSET.
+ */
+export async function* iterateScanPages(
+  qrCodeIds: string[],
+  options: { range?: ExportDateRange; pageSize?: number } = {}
+): AsyncGenerator<ExportScanRow[]> {
+  const pageSize = options.pageSize || DEFAULT_PAGE_SIZE
+
+  for (const qrCodeId of [...qrCodeIds].sort()) {
+    let cursor: { scannedAt: string; id: string } | null = null
+
+    while (true) {
+      let query = supabaseAdmin!
+        .from('QrCodeScan')
+        .select(EXPORT_SCAN_COLUMNS)
+        .eq('qrCodeId', qrCodeId)
+
+      if (options.range) {
+        query = query
+          .gte('scannedAt', `${options.range.start}T00:00:00.000Z`)
+          .lte('scannedAt', `${options.range.end}T23:59:59.999Z`)
+      }
+
+      if (cursor) {
+        // Quoted so timestamp offsets survive PostgREST filter parsing
+        const after = `"${cursor.scannedAt}"`
+        query = query.or(`scannedAt.gt.${after},and(scannedAt.eq.${after},id.gt."${cursor.id}")`)
+      }
+
+      const { data, error } = await query
+        .order('scannedAt', { ascending: true })
+        .order('id', { ascending: true })
+        .limit(pageSize)
+
+      if (error) {
+        throw new Error(`Failed to fetch scans for export: ${error.message}`)
+      }
+
+      const rows = (data || []) as unknown as ExportScanRow[]
+      if (rows.length > 0) {
+        yield rows
+      }
+      if (rows.length < pageSize) break
+
+      const last = rows[rows.length - 1]
+      cursor = { scannedAt: last.scannedAt, id: last.id }
+    }
+  }
+}
+
+/**
+ * Quote a row of fields as one CSV line
+ */
+export function toCsvLine(fields: unknown[]): string {
+  return fields.map(field => `"${String(field ?? '').replace(/"/g, '""')}"`).join(',') + '\n'
+}
+
+/**
+ * Wrap an async source of text chunks in a ReadableStream. The next chunk is
+ * only produced when the consumer pulls, so a slow client slows the queries
+ * down instead of growing a buffer.
+ */
+export function createExportStream(source: AsyncIterable<string>): ReadableStream<Uint8Array> {
+  const encoder = new TextEncoder()
+  const iterator = source[Symbol.asyncIterator]()
+
+  return new ReadableStream<Uint8Array>(
+    {
+      async pull(controller) {
+        try {
+          const { value, done } = await iterator.next()
+          if (done) {
+            controller.close()
+          } else if (value) {
+            controller.enqueue(encoder.encode(value))
+          }
+        } catch (error) {
+          console.error('Error streaming export:', error)
+          controller.error(error)
+        }
+      },
+      async cancel() {
+        // Client went away: stop paging
+        await iterator.return?.(undefined)
+      },
+    },
+    { highWaterMark: 1 }
+  )
+}
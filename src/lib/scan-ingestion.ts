@@ -0,0 +1,232 @@
+/**
+ * Scan Ingestion Buffer
+ * Write-behind buffer for scan events. Scan endpoints acknowledge the redirect
+ * immediately and scans are persisted in batches: one multi-row QrCodeScan
+ * insert and one aggregated counter increment per QR code.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { incrementScanCounters, type ScanCountDelta } from '@/lib/scan-counters'
+import { BatchWriteError, WriteBehindBuffer, type WriteBehindBufferConfig } from '@/lib/write-behind-buffer'
+
+export type { ScanCountDelta }
+
+export interface ScanEvent {
+  id: string
+  qrCodeId: string
+  scannedAt: string
+  userAgent?: string | null
+  ipAddress?: string | null
+  country?: string | null
+  city?: string | null
+  device?: string | null
+  browser?: string | null
+  os?: string | null
+  latitude?: number | null
+  longitude?: number | null
+  abTestVariant?: string | null
+  finalRedirectUrl?: string | null
+}
+
+export interface ScanBufferConfig extends WriteBehindBufferConfig {
+  enqueueTimeoutMs: number // Max time enqueue waits for room when the buffer is full
+}
+
+/**
+ * Persists a batch of scans. Injected so the buffer can be exercised without a database.
+ */
+export type ScanBatchWriter = (events: ScanEvent[], deltas: ScanCountDelta[]) => Promise<void>
+
+function readIntEnv(name: string, fallback: number): number {
+  const parsed = parseInt(process.env[name] || '', 10)
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : fallback
+}
+
+export function getScanBufferConfig(): ScanBufferConfig {
+  return {
+    flushIntervalMs: readIntEnv('SCAN_BUFFER_FLUSH_INTERVAL_MS', 1000),
+    maxBatchSize: readIntEnv('SCAN_BUFFER_MAX_BATCH', 500),
+    capacity: readIntEnv('SCAN_BUFFER_CAPACITY', 10000),
+    enqueueTimeoutMs: readIntEnv('SCAN_BUFFER_ENQUEUE_TIMEOUT_MS', 250),
+  }
+}
+
+/**
+ * Collapse a batch into one counter delta per QR code
+ */
+export function aggregateScanCounts(events: ScanEvent[]): ScanCountDelta[] {
+  const deltas = new Map<string, ScanCountDelta>()
+  for (const event of events) {
+    const existing = deltas.get(event.qrCodeId)
+    if (existing) {
+      existing.count++
+      if (event.scannedAt > existing.lastScannedAt) {
+        existing.lastScannedAt = event.scannedAt
+      }
+    } else {
+      deltas.set(event.qrCodeId, {
+        qrCodeId: event.qrCodeId,
+        count: 1,
+        lastScannedAt: event.scannedAt,
+      })
+    }
+  }
+  return Array.from(deltas.values())
+}
+
+/**
+ * Default writer: multi-row scan insert followed by a single sharded counter RPC
+ */
+export async function writeScanBatch(events: ScanEvent[], deltas: ScanCountDelta[]): Promise<void> {
+  if (events.length === 0) return
+
+  const { error: insertError } = await supabaseAdmin!
+    .from('QrCodeScan')
+    .insert(events)
+
+  if (insertError) {
+    throw new BatchWriteError(`Failed to insert scan batch: ${insertError.message}`, insertError.code)
+  }
+
+  try {
+    await incrementScanCounters(deltas)
+  } catch (error) {
+    // Scans are already persisted; counters can be recomputed from QrCodeScan
+    console.error('Error incrementing scan counts:', error)
+  }
+}
+
+export class ScanIngestionBuffer extends WriteBehindBuffer<ScanEvent> {
+  private pending = new Map<string, number>()
+  private enqueueTimeoutMs: number
+  private stats = { enqueued: 0, rejected: 0 }
+
+  constructor(config: Partial<ScanBufferConfig> = {}, writer: ScanBatchWriter = writeScanBatch) {
+    const { enqueueTimeoutMs, ...bufferConfig } = { ...getScanBufferConfig(), ...config }
+    super('Scan buffer', bufferConfig, events => writer(events, aggregateScanCounts(events)))
+    this.enqueueTimeoutMs = enqueueTimeoutMs
+  }
+
+  /**
+   * Buffer a scan event. Resolves false when the buffer stays full for longer
+   * than enqueueTimeoutMs, in which case the caller should write synchronously.
+   */
+  async enqueue(event: ScanEvent): Promise<boolean> {
+    if (this.queue.length >= this.config.capacity) {
+      const deadline = Date.now() + this.enqueueTimeoutMs
+      while (this.queue.length >= this.config.capacity && Date.now() < deadline) {
+        const written = await Promise.race([
+          this.flush(),
+          new Promise<number>(resolve => setTimeout(() => resolve(0), Math.max(0, deadline - Date.now()))),
+        ])
+        // Nothing written means the store is failing or we ran out of time
+        if (written === 0) break
+      }
+      if (this.queue.length >= this.config.capacity) {
+        this.stats.rejected++
+        return false
+      }
+    }
+
+    this.pending.set(event.qrCodeId, (this.pending.get(event.qrCodeId) || 0) + 1)
+    this.stats.enqueued++
+    this.push(event)
+    return true
+  }
+
+  /**
+   * Scans for a QR code that are buffered but not yet counted in the database
+   */
+  pendingCount(qrCodeId: string): number {
+    return this.pending.get(qrCodeId) || 0
+  }
+
+  getStats() {
+    return { ...super.getStats(), ...this.stats }
+  }
+
+  protected onSettled(events: ScanEvent[]) {
+    for (const event of events) {
+      const remaining = (this.pending.get(event.qrCodeId) || 0) - 1
+      if (remaining > 0) {
+        this.pending.set(event.qrCodeId, remaining)
+      } else {
+        this.pending.delete(event.qrCodeId)
+      }
+    }
+  }
+}
+
+// Process-wide buffer shared by the scan endpoints
+let scanBuffer: ScanIngestionBuffer | null = null
+
+export function getScanBuffer(): ScanIngestionBuffer {
+  if (!scanBuffer) {
+    scanBuffer = new ScanIngestionBuffer()
+  }
+  return scanBuffer
+}
+
+/**
+ * Record a scan through the buffer, falling back to a direct write when the
+ * buffer is disabled or applying backpressure
+ */
+export async function ingestScan(event: ScanEvent): Promise<void> {
+  if (process.env.SCAN_BUFFER_DISABLED === 'true') {
+    await writeScanBatch([event], aggregateScanCounts([event]))
+    return
+  }
+
+  const accepted = await getScanBuffer().enqueue(event)
+  if (!accepted) {
+    await writeScanBatch([event], aggregateScanCounts([event]))
+  }
+}
+
+/**
+ * Scans for a QR code still sitting in this process's buffer
+ */
+export function getPendingScanCount(qrCodeId: string): number {
+  return scanBuffer ? scanBuffer.pendingCount(qrCodeId) : 0
+}
+
+/**
+ * Drain the shared buffer (call on shutdown)
+ */
+export async function drainScanBuffer(): Promise<void> {
+  if (scanBuffer) {
+    await scanBuffer.drain()
+  }
+}
+
+let shutdownHookRegistered = false
+
+/**
+ * Flush buffered scans before the Node.js process exits. Other write-behind
+ * buffers can be drained in the same hook so the exit waits for all of them.
+ */
+export function registerScanBufferShutdownHook(...otherDrains: Array<() => Promise<void>>): void {
+  if (shutdownHookRegistered || typeof process === 'undefined' || typeof process.once !== 'function') {
+    return
+  }
+  shutdownHookRegistered = true
+
+  const drainAll = () =>
+    Promise.all([drainScanBuffer(), ...otherDrains.map(drain => drain())])
+
+  const drainAndExit = (signal: NodeJS.Signals) => {
+    // If the server registered its own handler it owns the exit; otherwise exit once drained
+    const othersHandleExit = process.listenerCount(signal) > 0
+    drainAll()
+      .catch(error => console.error('Error draining scan buffer:', error))
+      .finally(() => {
+        if (!othersHandleExit) process.exit(0)
+      })
+  }
+
+  process.once('SIGTERM', drainAndExit)
+  process.once('SIGINT', drainAndExit)
+  process.once('beforeExit', () => {
+    drainAll().catch(error => console.error('Error draining scan buffer:', error))
+  })
+}
@@ -0,0 +1,220 @@
+/**
+ * Server-side Scan Redirects
+ * Resolves a scanned QR code from the servable cache, applies the status,
+ * expiry, scan limit and per-code rate limit checks, picks the destination with
+ * the compiled redirect rules and records the scan in the background, so scan
+ * traffic gets its 302 without rendering a page or waiting on the database.
+ */
+
+import type { NextRequest } from "next/server"
+import { supabaseAdmin } from "@/lib/supabase"
+import { resolveServableQrCode, type ServableQrCode } from "@/lib/qr-resolution"
+import { ingestScan, getPendingScanCount, type ScanEvent } from "@/lib/scan-ingestion"
+import { getScanCount } from "@/lib/scan-counters"
+import { checkQrCodeRateLimit } from "@/lib/qr-rate-limit"
+import { getCompiledRedirectRules, evaluateRedirect } from "@/lib/redirect-rules"
+
+export interface ScanRequestContext {
+  userAgent: string | null
+  ipAddress: string
+  country: string | null
+  city: string | null
+  device: string
+  browser: string
+  os: string
+}
+
+export type ScanRedirectResult =
+  | { outcome: 'redirect'; qrCode: ServableQrCode; url: string; scanId: string; abTestVariant: string | null }
+  | { outcome: 'not_found' }
+  | { outcome: 'inactive' | 'expired' | 'scan_limit'; qrCode: ServableQrCode }
+  | { outcome: 'rate_limited'; qrCode: ServableQrCode; retryAfter?: number }
+  | { outcome: 'invalid_url'; qrCode: ServableQrCode }
+
+// Destinations are stored as typed, often without a scheme ("example.com/menu").
+// Schemes with an authority ("https://", app links like "whatsapp://") and the
+// opaque ones QR codes commonly use are kept; anything else is taken as a host.
+const SCHEME_WITH_AUTHORITY = /^[a-z][a-z0-9+.-]*:\/\//i
+const OPAQUE_SCHEME = /^(mailto|tel|sms|smsto|geo):/i
+const BLOCKED_PROTOCOLS = new Set(['javascript:', 'data:', 'vbscript:', 'file:'])
+
+/**
+ * Absolute URL to send a scan to, adding https:// to scheme-less destinations,
+ * or null when the destination still isn't a usable URL
+ */
+export function normalizeRedirectUrl(destination: string | null | undefined): string | null {
+  const value = destination?.trim()
+  if (!value) return null
+
+  const candidate = value.startsWith('//')
+    ? `https:${value}`
+    : SCHEME_WITH_AUTHORITY.test(value) || OPAQUE_SCHEME.test(value) ? value : `https://${value}`
+
+  let url: URL
+  try {
+    url = new URL(candidate)
+  } catch {
+    return null
+  }
+  return BLOCKED_PROTOCOLS.has(url.protocol) ? null : url.href
+}
+
+function getBrowserName(userAgent: string): string {
+  if (userAgent.includes('Edg')) return 'Edge'
+  if (userAgent.includes('Chrome') || userAgent.includes('CriOS')) return 'Chrome'
+  if (userAgent.includes('Firefox') || userAgent.includes('FxiOS')) return 'Firefox'
+  if (userAgent.includes('Safari')) return 'Safari'
+  return 'Unknown'
+}
+
+function getOSName(userAgent: string): string {
+  if (userAgent.includes('Android')) return 'Android'
+  if (/iPhone|iPad|iPod/.test(userAgent)) return 'iOS'
+  if (userAgent.includes('Windows')) return 'Windows'
+  if (userAgent.includes('Mac')) return 'macOS'
+  if (userAgent.includes('Linux')) return 'Linux'
+  return 'Unknown'
+}
+
+function decodeHeader(value: string | null): string | null {
+  if (!value) return null
+  try {
+    return decodeURIComponent(value)
+  } catch {
+    return value
+  }
+}
+
+/**
+ * Client details for a scan, taken from the request headers (user agent,
+ * forwarded IP and the platform's geo headers)
+ */
+export function getScanRequestContext(request: NextRequest): ScanRequestContext {
+  const userAgent = request.headers.get('user-agent')
+  const forwarded = request.headers.get('x-forwarded-for') || request.headers.get('x-real-ip') || 'unknown'
+  const ua = userAgent || ''
+
+  return {
+    userAgent,
+    ipAddress: forwarded.split(',')[0].trim(),
+    country: request.headers.get('x-vercel-ip-country') || request.headers.get('cf-ipcountry'),
+    city: decodeHeader(request.headers.get('x-vercel-ip-city')),
+    device: /Mobile|Android|iPhone|iPad/.test(ua) ? 'Mobile' : 'Desktop',
+    browser: getBrowserName(ua),
+    os: getOSName(ua),
+  }
+}
+
+/**
+ * Decide where a scan goes. On a redirect the scan (plus webhook and threshold
+ * checks) is recorded in the background; the caller only sends the 302.
+ */
+export async function processScanRedirect(
+  qrCodeId: string,
+  context: ScanRequestContext
+): Promise<ScanRedirectResult> {
+  const qrCode = await resolveServableQrCode(qrCodeId)
+  if (!qrCode) {
+    return { outcome: 'not_found' }
+  }
+
+  if (!qrCode.isActive) {
+    return { outcome: 'inactive', qrCode }
+  }
+
+  if (qrCode.expiresAt && new Date(qrCode.expiresAt) < new Date()) {
+    return { outcome: 'expired', qrCode }
+  }
+
+  // Sharded total plus locally buffered scans
+  if (qrCode.maxScans) {
+    const totalScans = await getScanCount(qrCodeId, qrCode.scanCount) + getPendingScanCount(qrCodeId)
+    if (totalScans >= qrCode.maxScans) {
+      return { outcome: 'scan_limit', qrCode }
+    }
+  }
+
+  const rateLimitResult = checkQrCodeRateLimit(qrCodeId, context.ipAddress, qrCode.rateLimitConfig)
+  if (!rateLimitResult.allowed) {
+    return { outcome: 'rate_limited', qrCode, retryAfter: rateLimitResult.retryAfter }
+  }
+
+  const decision = evaluateRedirect(getCompiledRedirectRules(qrCode), context)
+  const url = normalizeRedirectUrl(decision.url)
+  if (!url) {
+    return { outcome: 'invalid_url', qrCode }
+  }
+  const scanId = crypto.randomUUID()
+
+  recordScan(qrCode, {
+    id: scanId,
+    qrCodeId,
+    scannedAt: new Date().toISOString(),
+    userAgent: context.userAgent,
+    ipAddress: context.ipAddress,
+    country: context.country,
+    city: context.city,
+    device: context.device,
+    browser: context.browser,
+    os: context.os,
+    abTestVariant: decision.abTestVariant,
+    finalRedirectUrl: url,
+  })
+
+  return { outcome: 'redirect', qrCode, url, scanId, abTestVariant: decision.abTestVariant }
+}
+
+// Fire-and-forget: the visitor is already on their way when these run
+function recordScan(qrCode: ServableQrCode, event: ScanEvent) {
+  ingestScan(event).catch(error => console.error('Error recording scan:', error))
+
+  if (qrCode.webhookUrl) {
+    enqueueScanWebhook(qrCode.webhookUrl, qrCode.webhookSecret, qrCode.webhookBatchConfig, {
+      qrCodeId: event.qrCodeId,
+      eventId: event.id,
+      scanId: event.id,
+      userAgent: event.userAgent,
+      device: event.device,
+      country: event.country,
+      city: event.city,
+      redirectUrl: event.finalRedirectUrl,
+      abTestVariant: event.abTestVariant,
+      timestamp: event.scannedAt,
+    }).catch(error => console.error('Error enqueueing scan webhook:', error))
+  }
+
+  import('@/lib/threshold-monitoring')
+    .then(({ checkScanThreshold }) => checkScanThreshold(event.qrCodeId, qrCode.userId))
+    .catch(error => console.error('Error checking scan threshold:', error))
+}
+
+/**
+ * Queue a scan webhook through the outbox (coalesced into batches when the
+ * webhook opts in), logging a failed delivery if the outbox is unavailable
+ */
+export async function enqueueScanWebhook(
+  webhookUrl: string,
+  secret: string | null,
+  batchConfig: ServableQrCode['webhookBatchConfig'],
+  payload: { qrCodeId: string; [key: string]: unknown }
+): Promise<void> {
+  try {
+    const { enqueueWebhookEvent } = await import('@/lib/webhook-outbox')
+    await enqueueWebhookEvent(payload.qrCodeId, webhookUrl, payload, {
+      secret: secret || undefined,
+      batch: batchConfig,
+    })
+  } catch (error) {
+    console.error('Error adding webhook to outbox:', error)
+    await supabaseAdmin!
+      .from('QrCodeWebhookLog')
+      .insert({
+        qrCodeId: payload.qrCodeId,
+        webhookUrl,
+        payload,
+        responseStatus: 0,
+        responseBody: error instanceof Error ? error.message : 'Failed to add to outbox',
+        isSuccessful: false
+      })
+  }
+}
@@ -0,0 +1,90 @@
+/**
+ * Daily Scan Rollups
+ * Maintains QrCodeScanDaily (per-QR, per-day totals and breakdowns) from
+ * QrCodeScan. Incremental runs advance a watermark one batch of closed UTC
+ * days at a time; backfills recompute explicit ranges. Both rebuild whole
+ * days, so re-running is idempotent.
+ */
+
+import { supabaseAdmin } from '@/lib/supabase'
+
+export interface ScanRollupAdvance {
+  from: string
+  to: string
+  rows: number
+  caughtUp: boolean
+}
+
+const DAY_MS = 24 * 60 * 60 * 1000
+
+function toDateString(date: Date): string {
+  return date.toISOString().split('T')[0]
+}
+
+function addDays(date: string, days: number): string {
+  return toDateString(new Date(new Date(`${date}T00:00:00.000Z`).getTime() + days * DAY_MS))
+}
+
+/**
+ * Roll up the next closed days after the watermark, repeating until caught up
+ */
+export async function advanceScanRollups(options: { maxDaysPerRun?: number; maxRuns?: number } = {}) {
+  const maxDaysPerRun = options.maxDaysPerRun || 7
+  const maxRuns = options.maxRuns || 10
+  const runs: ScanRollupAdvance[] = []
+
+  for (let i = 0; i < maxRuns; i++) {
+    const { data, error } = await supabaseAdmin!.rpc('advance_scan_rollups', {
+      p_max_days: maxDaysPerRun,
+    })
+
+    if (error) {
+      throw new Error(`Failed to advance scan rollups: ${error.message}`)
+    }
+
+    const run = data as ScanRollupAdvance
+    runs.push(run)
+    if (run.caughtUp) break
+  }
+
+  return {
+    runs: runs.length,
+    rows: runs.reduce((sum, run) => sum + (run.rows || 0), 0),
+    watermark: runs.length > 0 ? runs[runs.length - 1].to : null,
+    caughtUp: runs.length > 0 && runs[runs.length - 1].caughtUp,
+  }
+}
+
+/**
+ * Recompute rollups for the inclusive UTC day range [from, to], in chunks.
+ * Does not move the watermark; days at or after it are served from raw scans anyway.
+ */
+export async function backfillScanRollups(options: {
+  from: string
+  to: string
+  qrCodeIds?: string[]
+  chunkDays?: number
+}) {
+  const chunkDays = options.chunkDays || 7
+  const end = addDays(options.to, 1)
+  let rows = 0
+  let chunks = 0
+
+  for (let start = options.from; start < end; start = addDays(start, chunkDays)) {
+    const chunkEnd = addDays(start, chunkDays) < end ? addDays(start, chunkDays) : end
+    const { data, error } = await supabaseAdmin!.rpc('rollup_scan_days', {
+      p_from: start,
+      p_to: chunkEnd,
+      p_qr_code_ids: options.qrCodeIds || null,
+    })
+
+    if (error) {
+      throw new Error(`Failed to roll up scans for ${start}..${chunkEnd}: ${error.message}`)
+    }
+
+    rows += Number(data) || 0
+    chunks++
+  }
+
+  return { from: options.from, to: options.to, chunks, rows }
+}
@@ -0,0 +1,159 @@
+/**
+ * Chunked Storage Uploads
+ * Streams an object of unknown length into Supabase Storage over its TUS
+ * resumable upload endpoint: bytes are buffered into fixed-size chunks and each
+ * full chunk is sent as soon as it is ready, so only one chunk is held in
+ * memory. The length is declared with the last chunk (creation-defer-length).
+ */
+
+// Supabase Storage requires every chunk but the last to be exactly 6 MB
+export const UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+
+const TUS_VERSION = '1.0.0'
+
+function getStorageConfig() {
+  const url = (process.env.SUPABASE_URL || process.env.NEXT_PUBLIC_SUPABASE_URL || '').trim()
+  const key = (process.env.SUPABASE_SERVICE_ROLE_KEY || '').trim()
+  if (!url || !key) {
+    throw new Error('Supabase Storage not configured. Check SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY')
+  }
+  return { url: url.replace(/\/$/, ''), key }
+}
+
+function encodeMetadata(metadata: Record<string, string>): string {
+  return Object.entries(metadata)
+    .map(([name, value]) => `${name} ${Buffer.from(value, 'utf8').toString('base64')}`)
+    .join(',')
+}
+
+export class ChunkedStorageUpload {
+  readonly bucket: string
+  readonly path: string
+  private contentType: string
+  private signal?: AbortSignal
+
+  private location: string | null = null
+  private buffer = Buffer.alloc(UPLOAD_CHUNK_SIZE)
+  private buffered = 0
+  private uploaded = 0
+  private finished = false
+
+  constructor(
+    bucket: string,
+    path: string,
+    options: {
+      contentType?: string
+      signal?: AbortSignal
+    } = {}
+  ) {
+    this.bucket = bucket
+    this.path = path
+    this.contentType = options.contentType || 'application/octet-stream'
+    this.signal = options.signal
+  }
+
+  /**
+   * Append bytes, sending every chunk that fills up
+   */
+  async write(data: Buffer): Promise<void> {
+    if (this.finished) throw new Error('Upload is already finished')
+
+    let position = 0
+    while (position < data.length) {
+      const copied = data.copy(this.buffer, this.buffered, position)
+      this.buffered += copied
+      position += copied
+      if (this.buffered === UPLOAD_CHUNK_SIZE) {
+        await this.sendChunk(false)
+      }
+    }
+  }
+
+  /**
+   * Send the remaining bytes and declare the final length
+   */
+  async finish(): Promise<{ bucket: string; path: string; size: number }> {
+    if (!this.finished) {
+      await this.sendChunk(true)
+      this.finished = true
+    }
+    return { bucket: this.bucket, path: this.path, size: this.uploaded }
+  }
+
+  /**
+   * Discard a partial upload (TUS termination). Errors are logged, not thrown.
+   */
+  async abort(): Promise<void> {
+    this.finished = true
+    if (!this.location) return
+
+    try {
+      const { key } = getStorageConfig()
+      await fetch(this.location, {
+        method: 'DELETE',
+        headers: { 'Authorization': `Bearer ${key}`, 'Tus-Resumable': TUS_VERSION },
+      })
+    } catch (error) {
+      console.error('Error aborting storage upload:', error)
+    }
+  }
+
+  get uploadedBytes(): number {
+    return this.uploaded
+  }
+
+  private async create(): Promise<string> {
+    const { url, key } = getStorageConfig()
+    const response = await fetch(`${url}/storage/v1/upload/resumable`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${key}`,
+        'Tus-Resumable': TUS_VERSION,
+        'Upload-Defer-Length': '1',
+        'Upload-Metadata': encodeMetadata({
+          bucketName: this.bucket,
+          objectName: this.path,
+          contentType: this.contentType,
+        }),
+        'x-upsert': 'true',
+      },
+      signal: this.signal,
+    })
+
+    const location = response.headers.get('location')
+    if (response.status !== 201 || !location) {
+      throw new Error(`Failed to start storage upload: ${response.status} ${await response.text()}`)
+    }
+    return new URL(location, url).toString()
+  }
+
+  private async sendChunk(last: boolean): Promise<void> {
+    if (!this.location) {
+      this.location = await this.create()
+    }
+
+    const { key } = getStorageConfig()
+    const headers: Record<string, string> = {
+      'Authorization': `Bearer ${key}`,
+      'Tus-Resumable': TUS_VERSION,
+      'Upload-Offset': String(this.uploaded),
+      'Content-Type': 'application/offset+octet-stream',
+    }
+    if (last) {
+      headers['Upload-Length'] = String(this.uploaded + this.buffered)
+    }
+
+    const response = await fetch(this.location, {
+      method: 'PATCH',
+      headers,
+      body: new Uint8Array(this.buffer.buffer, this.buffer.byteOffset, this.buffered),
+      signal: this.signal,
+    })
+    if (response.status !== 204) {
+      throw new Error(`Failed to upload chunk at offset ${this.uploaded}: ${response.status} ${await response.text()}`)
+    }
+
+    this.uploaded += this.buffered
+    this.buffered = 0
+  }
+}
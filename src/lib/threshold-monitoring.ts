@@ -7,6 +7,7 @@ import { supabaseAdmin } from './supabase'
 import { createNotification } from './notifications'
 import { sendUsageAlertEmail } from './transactional-emails'
 import { getNotificationPreferences } from './notifications'
+import { getScanCount } from './scan-counters'
 
 export type ThresholdType = 'credits_low' | 'scan_threshold' | 'domain_verification'
 
@@ -108,8 +109,11 @@ export async function checkScanThreshold(qrCodeId: string, userId: string): Prom
 
     if (!qrCode || !qrCode.maxScans) return
 
+    // Include scans still sitting in counter shards
+    const scanCount = await getScanCount(qrCodeId, qrCode.scanCount)
+
     // Check if scan count is approaching or at max
-    const percentageUsed = (qrCode.scanCount / qrCode.maxScans) * 100
+    const percentageUsed = (scanCount / qrCode.maxScans) * 100
 
     // Alert at 80% and 100%
     if (percentageUsed >= 80 && percentageUsed < 100) {
@@ -128,7 +132,7 @@ export async function checkScanThreshold(qrCodeId: string, userId: string): Prom
           userId,
           thresholdType: 'scan_threshold',
           thresholdValue: Math.floor(qrCode.maxScans * 0.8),
-          currentValue: qrCode.scanCount,
+          currentValue: scanCount,
           metadata: {
             qrCodeId,
             qrCodeTitle: qrCode.title,
@@ -52,6 +52,30 @@ export const qrCodeQuerySchema = z.object({
   search: z.string().max(200).optional(),
 })
 
+// One item of a bulk update, checked against the casts bulk_update_qr_codes applies
+const jsonColumnSchema = z.union([z.record(z.string(), z.unknown()), z.array(z.unknown())]).nullable()
+
+export const bulkQrCodeUpdateSchema = z.object({
+  id: z.string().min(1).max(100),
+  title: z.string().max(200).nullable().optional(),
+  url: urlSchema.optional(),
+  dynamicContent: jsonColumnSchema.optional(),
+  redirectUrl: urlSchema.nullable().optional(),
+  expiresAt: z.string().refine(value => !Number.isNaN(Date.parse(value)), 'Invalid date').nullable().optional(),
+  maxScans: z.number().int().min(0).max(1000000).nullable().optional(),
+  foregroundColor: z.string().max(32).optional(),
+  backgroundColor: z.string().max(32).optional(),
+  dotType: z.string().max(50).optional(),
+  cornerType: z.string().max(50).optional(),
+  hasWatermark: z.boolean().optional(),
+  deviceRedirection: jsonColumnSchema.optional(),
+  geoRedirection: jsonColumnSchema.optional(),
+  marketingPixels: jsonColumnSchema.optional(),
+  abTestConfig: jsonColumnSchema.optional(),
+  webhookUrl: urlSchema.nullable().optional(),
+  customDomain: z.string().max(100).nullable().optional(),
+})
+
 // User/Auth schemas
 export const registerSchema = z.object({
   name: z.string().min(1).max(100),
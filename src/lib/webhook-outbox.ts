@@ -1,11 +1,15 @@
 /**
  * Webhook Outbox Pattern Implementation
- * Guarantees webhook delivery with retry logic
+ * Guarantees webhook delivery with retry logic. Due rows are claimed in batches
+ * and sent over per-host keep-alive pools behind per-host circuit breakers.
  */
 
 import { supabaseAdmin } from "@/lib/supabase"
-import { retryWithTimeout } from "./retry-with-timeout"
+import { getCircuitBreaker } from "./circuit-breaker"
+import { getMetricsRegistry } from "./metrics-registry"
 import crypto from 'crypto'
+import http from 'http'
+import https from 'https'
 
 export interface WebhookOutbox {
   id: string
@@ -57,39 +61,149 @@ export async function addWebhookToOutbox(
   return outbox
 }
 
+export const WEBHOOK_BATCH_TYPE = 'scan.batch'
+
+export interface WebhookBatchConfig {
+  enabled?: boolean
+  maxBatchSize?: number // Events per delivery
+  maxLingerMs?: number // Longest an event waits for its batch to fill
+}
+
+export const WEBHOOK_BATCH_LIMITS = {
+  maxBatchSize: { min: 1, max: 1000, default: 100 },
+  maxLingerMs: { min: 100, max: 60000, default: 5000 },
+}
+
+interface PendingWebhookBatch {
+  qrCodeId: string
+  webhookUrl: string
+  secret?: string
+  events: Record<string, unknown>[]
+  timer: NodeJS.Timeout
+}
+
+type WebhookBatchWriter = (
+  qrCodeId: string,
+  webhookUrl: string,
+  payload: Record<string, unknown>,
+  secret?: string
+) => Promise<unknown>
+
+function clampBatchSetting(value: number | undefined, limits: { min: number; max: number; default: number }): number {
+  if (typeof value !== 'number' || !Number.isFinite(value)) return limits.default
+  return Math.min(Math.max(Math.floor(value), limits.min), limits.max)
+}
+
 /**
- * Get next webhooks to process
+ * Coalesces events for the same QR code and destination into one outbox row
+ * ({ type: 'scan.batch', qrCodeId, count, events }), written when the batch
+ * reaches maxBatchSize or its oldest event has waited maxLingerMs.
  */
-export async function getNextWebhookRetries(limit: number = 10): Promise<WebhookOutbox[]> {
-  const { data, error } = await supabaseAdmin!
-    .rpc('get_next_webhook_retry')
+export class WebhookEventBatcher {
+  private batches = new Map<string, PendingWebhookBatch>()
+  private writer: WebhookBatchWriter
 
-  if (error) {
-    console.error('Error getting next webhook retries:', error)
-    return []
+  constructor(writer: WebhookBatchWriter = addWebhookToOutbox) {
+    this.writer = writer
+  }
+
+  add(
+    qrCodeId: string,
+    webhookUrl: string,
+    event: Record<string, unknown>,
+    secret: string | undefined,
+    config: WebhookBatchConfig
+  ): void {
+    const key = `${qrCodeId}|${webhookUrl}|${secret || ''}`
+    const maxBatchSize = clampBatchSetting(config.maxBatchSize, WEBHOOK_BATCH_LIMITS.maxBatchSize)
+
+    let batch = this.batches.get(key)
+    if (!batch) {
+      const timer = setTimeout(() => {
+        this.flush(key).catch(error => console.error('Webhook batch flush error:', error))
+      }, clampBatchSetting(config.maxLingerMs, WEBHOOK_BATCH_LIMITS.maxLingerMs))
+      // Don't keep the process alive just for the linger timer
+      timer.unref?.()
+      batch = { qrCodeId, webhookUrl, secret, events: [], timer }
+      this.batches.set(key, batch)
+    }
+
+    batch.events.push(event)
+    if (batch.events.length >= maxBatchSize) {
+      this.flush(key).catch(error => console.error('Webhook batch flush error:', error))
+    }
   }
 
-  if (!data || data.length === 0) {
-    return []
+  private async flush(key: string): Promise<void> {
+    const batch = this.batches.get(key)
+    if (!batch) return
+    this.batches.delete(key)
+    clearTimeout(batch.timer)
+
+    try {
+      await this.writer(
+        batch.qrCodeId,
+        batch.webhookUrl,
+        { type: WEBHOOK_BATCH_TYPE, qrCodeId: batch.qrCodeId, count: batch.events.length, events: batch.events },
+        batch.secret
+      )
+    } catch (error) {
+      console.error(`Error adding webhook batch of ${batch.events.length} events to outbox:`, error)
+    }
   }
 
-  // Get full outbox details
-  const ids = data.map((item: { id: string }) => item.id)
-  const { data: outboxes, error: outboxError } = await supabaseAdmin!
-    .from('WebhookOutbox')
-    .select('*')
-    .in('id', ids)
-    .limit(limit)
+  /**
+   * Write out every pending batch (call on shutdown)
+   */
+  async drain(): Promise<void> {
+    await Promise.all(Array.from(this.batches.keys()).map(key => this.flush(key)))
+  }
+
+  get size(): number {
+    return this.batches.size
+  }
+}
+
+// Process-wide batcher shared by the scan endpoints
+let webhookBatcher: WebhookEventBatcher | null = null
+
+export function getWebhookBatcher(): WebhookEventBatcher {
+  if (!webhookBatcher) {
+    webhookBatcher = new WebhookEventBatcher()
+  }
+  return webhookBatcher
+}
 
-  if (outboxError || !outboxes) {
-    return []
+/**
+ * Queue a webhook event: coalesced into a batch when the webhook has batching
+ * enabled, otherwise written straight to the outbox as its own delivery
+ */
+export async function enqueueWebhookEvent(
+  qrCodeId: string,
+  webhookUrl: string,
+  event: Record<string, unknown>,
+  options: { secret?: string; batch?: WebhookBatchConfig | null } = {}
+): Promise<void> {
+  if (options.batch?.enabled) {
+    getWebhookBatcher().add(qrCodeId, webhookUrl, event, options.secret, options.batch)
+    return
   }
 
-  return outboxes
+  await addWebhookToOutbox(qrCodeId, webhookUrl, event, options.secret)
+}
+
+/**
+ * Flush pending webhook batches (call on shutdown)
+ */
+export async function drainWebhookBatches(): Promise<void> {
+  if (webhookBatcher) {
+    await webhookBatcher.drain()
+  }
 }
 
 /**
- * Generate webhook signature
+ * Generate webhook signature. Batches are signed the same way: HMAC-SHA256 of
+ * the exact request body, which for a batch is the whole events envelope.
  */
 function generateWebhookSignature(payload: Record<string, unknown>, secret: string): string {
   const payloadString = JSON.stringify(payload)
@@ -100,87 +214,333 @@ function generateWebhookSignature(payload: Record<string, unknown>, secret: stri
   return signature
 }
 
+export interface WebhookDispatchOptions {
+  batchSize?: number // Rows claimed per round trip
+  maxDurationMs?: number // Stop claiming new batches after this long
+  perHostConcurrency?: number // In-flight requests per destination host
+  timeoutMs?: number // Per request
+}
+
+export interface WebhookDispatchSummary {
+  claimed: number
+  delivered: number
+  failed: number
+  deferred: number // Not sent because the host's circuit breaker was open
+  durationMs: number
+}
+
+type ClaimedWebhook = WebhookOutbox & { dueAt: string }
+
+interface WebhookDeliveryResult {
+  id: string
+  status: 'delivered' | 'failed' | 'deferred'
+  responseStatus?: number
+  responseBody?: string
+  error?: string
+  nextRetryAt?: string
+}
+
+const DEFAULT_DISPATCH_OPTIONS: Required<WebhookDispatchOptions> = {
+  batchSize: 500,
+  maxDurationMs: 25000,
+  perHostConcurrency: 8,
+  timeoutMs: 10000,
+}
+
+const CLAIM_LEASE_SECONDS = 120
+const MAX_RESPONSE_BODY = 1000
+const RETRY_BASE_MS = 60000
+const RETRY_MAX_MS = 6 * 60 * 60 * 1000
+const BREAKER_RESET_MS = 60000
+const MAX_HOST_POOLS = 1000
+
+const dispatcherGauges = {
+  inFlight: 0,
+  delivered: 0,
+  failed: 0,
+  deferred: 0,
+  throughputPerSecond: 0, // Deliveries attempted per second over the last run
+  lagMs: 0, // How far behind nextRetryAt the oldest row of the last batch was
+  lastRunAt: null as string | null,
+}
+
 /**
- * Deliver webhook
+ * Next attempt time after a failed delivery: exponential backoff from one
+ * minute (capped at six hours) with equal jitter, so deliveries that failed
+ * together don't all come back at the same instant.
  */
-export async function deliverWebhook(outbox: WebhookOutbox): Promise<boolean> {
-  try {
-    // Update status to processing
-    await supabaseAdmin!
-      .from('WebhookOutbox')
-      .update({
-        status: 'processing',
-        lastAttemptAt: new Date().toISOString(),
-        attempts: outbox.attempts + 1,
-      })
-      .eq('id', outbox.id)
-
-    // Generate signature if secret provided
-    const signature = outbox.secret
-      ? generateWebhookSignature(outbox.payload, outbox.secret)
-      : null
-
-    // Deliver webhook with retry and timeout
-    const response: Response = await retryWithTimeout(
-      async () => {
-        const fetchResponse = await fetch(outbox.webhookUrl, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            ...(signature && { 'X-Webhook-Signature': signature }),
-            'User-Agent': 'QR-Generator-Webhook/1.0',
-          },
-          body: JSON.stringify(outbox.payload),
-          signal: AbortSignal.timeout(30000), // 30 second timeout
-        })
+export function getWebhookRetryAt(attempts: number, now = Date.now(), random = Math.random): Date {
+  const backoff = Math.min(RETRY_BASE_MS * 2 ** Math.max(attempts - 1, 0), RETRY_MAX_MS)
+  return new Date(now + backoff / 2 + random() * (backoff / 2))
+}
 
-        if (!fetchResponse.ok) {
-          throw new Error(`Webhook delivery failed: ${fetchResponse.status} ${fetchResponse.statusText}`)
-        }
+/**
+ * Per-host keep-alive pool with a cap on in-flight requests
+ */
+class HostPool {
+  readonly agent: http.Agent
+  private limit: number
+  private inFlight = 0
+  private waiters: Array<() => void> = []
 
-        return fetchResponse
-      },
+  constructor(protocol: string, limit: number) {
+    const options = { keepAlive: true, maxSockets: limit }
+    this.agent = protocol === 'http:' ? new http.Agent(options) : new https.Agent(options)
+    this.limit = limit
+  }
+
+  async run<T>(fn: () => Promise<T>): Promise<T> {
+    if (this.inFlight >= this.limit) {
+      await new Promise<void>(resolve => this.waiters.push(resolve))
+    }
+    this.inFlight++
+    dispatcherGauges.inFlight++
+    try {
+      return await fn()
+    } finally {
+      this.inFlight--
+      dispatcherGauges.inFlight--
+      this.waiters.shift()?.()
+    }
+  }
+
+  isIdle(): boolean {
+    return this.inFlight === 0 && this.waiters.length === 0
+  }
+}
+
+const hostPools = new Map<string, HostPool>()
+
+function getHostPool(url: URL, limit: number): HostPool {
+  const key = `${url.protocol}//${url.host}`
+  let pool = hostPools.get(key)
+  if (pool) {
+    // Refresh LRU position
+    hostPools.delete(key)
+    hostPools.set(key, pool)
+    return pool
+  }
+
+  pool = new HostPool(url.protocol, limit)
+  hostPools.set(key, pool)
+
+  if (hostPools.size > MAX_HOST_POOLS) {
+    for (const [oldKey, oldPool] of hostPools) {
+      if (hostPools.size <= MAX_HOST_POOLS) break
+      if (oldPool.isIdle()) {
+        oldPool.agent.destroy()
+        hostPools.delete(oldKey)
+      }
+    }
+  }
+
+  return pool
+}
+
+/**
+ * POST a JSON body over the host's pooled connection
+ */
+function postWebhook(
+  url: URL,
+  agent: http.Agent,
+  body: string,
+  headers: Record<string, string>,
+  timeoutMs: number
+): Promise<{ status: number; body: string }> {
+  const client = url.protocol === 'http:' ? http : https
+
+  return new Promise((resolve, reject) => {
+    const request = client.request(
+      url,
       {
-        maxRetries: 2, // Quick retry for transient errors
-        timeout: 30000, // 30 seconds
+        method: 'POST',
+        agent,
+        headers: { ...headers, 'Content-Length': Buffer.byteLength(body).toString() },
+      },
+      response => {
+        const chunks: Buffer[] = []
+        let size = 0
+        response.on('data', (chunk: Buffer) => {
+          // Keep only what we store; the rest is drained so the socket can be reused
+          if (size < MAX_RESPONSE_BODY) {
+            chunks.push(chunk)
+            size += chunk.length
+          }
+        })
+        response.on('end', () => {
+          clearTimeout(timer)
+          resolve({
+            status: response.statusCode || 0,
+            body: Buffer.concat(chunks).toString('utf8').slice(0, MAX_RESPONSE_BODY),
+          })
+        })
+        response.on('error', reject)
       }
     )
 
-    const responseBody = await response.text()
+    const timer = setTimeout(() => {
+      request.destroy(new Error(`Webhook delivery timed out after ${timeoutMs}ms`))
+    }, timeoutMs)
+
+    request.on('error', error => {
+      clearTimeout(timer)
+      reject(error)
+    })
+    request.end(body)
+  })
+}
+
+/**
+ * Deliver one claimed webhook. Never throws; the outcome is returned for the
+ * batch completion write.
+ */
+async function deliverClaimedWebhook(
+  outbox: ClaimedWebhook,
+  options: Required<WebhookDispatchOptions>
+): Promise<WebhookDeliveryResult> {
+  let url: URL
+  try {
+    url = new URL(outbox.webhookUrl)
+  } catch {
+    // Unparseable URL will never succeed
+    return { id: outbox.id, status: 'failed', error: 'Invalid webhook URL' }
+  }
 
-    // Update status to delivered
-    await supabaseAdmin!
-      .rpc('update_webhook_outbox_status', {
-        outbox_id: outbox.id,
-        new_status: 'delivered',
-        response_status: response.status,
-        response_body: responseBody,
+  const pool = getHostPool(url, options.perHostConcurrency)
+  const breaker = getCircuitBreaker(`webhook:${url.host}`, {
+    failureThreshold: 5,
+    resetTimeout: BREAKER_RESET_MS,
+  })
+
+  const body = JSON.stringify(outbox.payload)
+  const signature = outbox.secret ? generateWebhookSignature(outbox.payload, outbox.secret) : null
+  let sent = false
+
+  try {
+    const response = await pool.run(() =>
+      breaker.execute(async () => {
+        sent = true
+        const result = await postWebhook(
+          url,
+          pool.agent,
+          body,
+          {
+            'Content-Type': 'application/json',
+            ...(signature && { 'X-Webhook-Signature': signature }),
+            ...(outbox.payload.type === WEBHOOK_BATCH_TYPE && {
+              'X-Webhook-Event-Count': String((outbox.payload.events as unknown[]).length),
+            }),
+            'User-Agent': 'QR-Generator-Webhook/1.0',
+          },
+          options.timeoutMs
+        )
+        if (result.status < 200 || result.status >= 300) {
+          throw Object.assign(new Error(`Webhook delivery failed: ${result.status}`), { response: result })
+        }
+        return result
       })
+    )
 
-    return true
+    return {
+      id: outbox.id,
+      status: 'delivered',
+      responseStatus: response.status,
+      responseBody: response.body,
+    }
   } catch (error) {
-    // Update status to failed
-    const errorMessage = error instanceof Error ? error.message : 'Unknown error'
-    
-    await supabaseAdmin!
-      .rpc('update_webhook_outbox_status', {
-        outbox_id: outbox.id,
-        new_status: 'failed',
-        error_message: errorMessage,
-      })
+    if (!sent) {
+      // Breaker open for this host: hand the attempt back and try after it resets
+      return {
+        id: outbox.id,
+        status: 'deferred',
+        nextRetryAt: new Date(Date.now() + BREAKER_RESET_MS * (1 + Math.random())).toISOString(),
+      }
+    }
 
-    return false
+    const response = (error as { response?: { status: number; body: string } }).response
+    return {
+      id: outbox.id,
+      status: 'failed',
+      responseStatus: response?.status,
+      responseBody: response?.body,
+      error: error instanceof Error ? error.message : 'Unknown error',
+      nextRetryAt: outbox.attempts < outbox.maxAttempts
+        ? getWebhookRetryAt(outbox.attempts).toISOString()
+        : undefined,
+    }
   }
 }
 
 /**
- * Process webhook outbox (should be called by background job)
+ * Dispatcher gauges for this instance
+ */
+export function getWebhookDispatcherStats() {
+  return { ...dispatcherGauges, hostPools: hostPools.size }
+}
+
+/**
+ * Process webhook outbox (should be called by background job).
+ * Claims due rows in large batches, delivers them over per-host keep-alive
+ * pools behind per-host circuit breakers and records every outcome of a batch
+ * in a single write.
  */
-export async function processWebhookOutbox(): Promise<void> {
-  const webhooks = await getNextWebhookRetries(10)
+export async function processWebhookOutbox(
+  options: WebhookDispatchOptions = {}
+): Promise<WebhookDispatchSummary> {
+  const config = { ...DEFAULT_DISPATCH_OPTIONS, ...options }
+  const startedAt = Date.now()
+  const summary: WebhookDispatchSummary = { claimed: 0, delivered: 0, failed: 0, deferred: 0, durationMs: 0 }
+
+  while (Date.now() - startedAt < config.maxDurationMs) {
+    const { data, error } = await supabaseAdmin!
+      .rpc('claim_webhook_outbox', {
+        p_limit: config.batchSize,
+        p_lease_seconds: CLAIM_LEASE_SECONDS,
+      })
+
+    if (error) {
+      console.error('Error claiming webhook outbox:', error)
+      break
+    }
+
+    const batch = (data || []) as ClaimedWebhook[]
+    if (batch.length === 0) break
+    summary.claimed += batch.length
+
+    const now = Date.now()
+    dispatcherGauges.lagMs = Math.max(0, ...batch.map(row => now - new Date(row.dueAt).getTime()))
+
+    const results = await Promise.all(batch.map(row => deliverClaimedWebhook(row, config)))
+    for (const result of results) {
+      summary[result.status]++
+      dispatcherGauges[result.status]++
+    }
+
+    const { error: completeError } = await supabaseAdmin!
+      .rpc('complete_webhook_deliveries', { p_results: results })
+
+    if (completeError) {
+      // Rows stay processing and are re-claimed once the lease runs out
+      console.error('Error recording webhook deliveries:', completeError)
+    }
+
+    if (batch.length < config.batchSize) break
+  }
+
+  summary.durationMs = Date.now() - startedAt
+  dispatcherGauges.lastRunAt = new Date().toISOString()
+  dispatcherGauges.throughputPerSecond = summary.durationMs > 0
+    ? ((summary.delivered + summary.failed) * 1000) / summary.durationMs
+    : 0
+  if (summary.claimed === 0) {
+    dispatcherGauges.lagMs = 0
+  }
+
+  const metrics = getMetricsRegistry()
+  metrics.setGauge('webhook_dispatch_throughput', dispatcherGauges.throughputPerSecond)
+  metrics.setGauge('webhook_outbox_lag_ms', dispatcherGauges.lagMs)
 
-  const deliveryPromises = webhooks.map(outbox => deliverWebhook(outbox))
-  await Promise.allSettled(deliveryPromises)
+  return summary
 }
 
 /**
@@ -0,0 +1,187 @@
+/**
+ * Write-Behind Buffer
+ * Batches records in memory and persists them with multi-row writes on a
+ * timer or when a batch fills up. Transient write failures put the batch back
+ * for the next tick; rows the store rejects for good (constraint or data
+ * errors) are isolated by splitting the batch and dead-lettered, so one bad
+ * row never blocks the rows queued behind it.
+ */
+
+export interface WriteBehindBufferConfig {
+  flushIntervalMs: number // Time between background flushes
+  maxBatchSize: number // Max rows per write; reaching it triggers a flush
+  capacity: number // Max buffered rows; the oldest are dropped beyond this
+}
+
+/**
+ * Persists a batch of rows. Injected so buffers can be exercised without a database.
+ */
+export type BatchWriter<T> = (rows: T[]) => Promise<void>
+
+/**
+ * Write failure that keeps the database error code for classification
+ */
+export class BatchWriteError extends Error {
+  readonly code?: string
+
+  constructor(message: string, code?: string) {
+    super(message)
+    this.name = 'BatchWriteError'
+    this.code = code
+  }
+}
+
+/**
+ * Whether retrying the same rows can never succeed: Postgres data exceptions
+ * (SQLSTATE class 22) and integrity constraint violations (class 23, e.g.
+ * 23503 for a row whose parent was deleted while it sat in the buffer)
+ */
+export function isPermanentWriteError(error: unknown): boolean {
+  const code = (error as { code?: unknown } | null)?.code
+  return typeof code === 'string' && /^2[23]/.test(code)
+}
+
+export class WriteBehindBuffer<T> {
+  protected queue: T[] = []
+  protected config: WriteBehindBufferConfig
+  private name: string
+  private writer: BatchWriter<T>
+  private flushing: Promise<number> | null = null
+  private timer: NodeJS.Timeout | null = null
+  private counters = { flushed: 0, dropped: 0, deadLettered: 0, failedBatches: 0 }
+
+  constructor(name: string, config: WriteBehindBufferConfig, writer: BatchWriter<T>) {
+    this.name = name
+    this.config = config
+    this.writer = writer
+  }
+
+  /**
+   * Buffer a row, dropping the oldest when over capacity
+   */
+  protected push(row: T): void {
+    this.queue.push(row)
+    this.trimToCapacity()
+    this.ensureTimer()
+
+    if (this.queue.length >= this.config.maxBatchSize) {
+      this.flush().catch(error => console.error(`${this.name} flush error:`, error))
+    }
+  }
+
+  /**
+   * Called for rows that leave the buffer: written, dead-lettered or dropped
+   */
+  protected onSettled(_rows: T[]): void {}
+
+  /**
+   * Write everything currently buffered. Concurrent callers share one in-flight flush.
+   */
+  flush(): Promise<number> {
+    if (this.flushing) return this.flushing
+
+    this.flushing = this.flushQueue().finally(() => {
+      this.flushing = null
+    })
+    return this.flushing
+  }
+
+  private async flushQueue(): Promise<number> {
+    let written = 0
+
+    while (this.queue.length > 0) {
+      const batch = this.queue.splice(0, this.config.maxBatchSize)
+      const result = await this.writeBatch(batch)
+      written += result.written
+
+      if (result.retry.length > 0) {
+        this.counters.failedBatches++
+        // Retry on the next tick, keeping the newest rows within capacity
+        this.queue.unshift(...result.retry)
+        this.trimToCapacity()
+        break
+      }
+    }
+
+    return written
+  }
+
+  /**
+   * Write a batch, halving it on permanent errors until the failing rows are
+   * isolated. Returns the rows to retry after a transient error.
+   */
+  private async writeBatch(batch: T[]): Promise<{ written: number; retry: T[] }> {
+    try {
+      await this.writer(batch)
+      this.counters.flushed += batch.length
+      this.onSettled(batch)
+      return { written: batch.length, retry: [] }
+    } catch (error) {
+      if (!isPermanentWriteError(error)) {
+        console.error(`Error flushing ${this.name} batch:`, error)
+        return { written: 0, retry: batch }
+      }
+
+      if (batch.length === 1) {
+        console.error(`${this.name} dead-lettered a row rejected by the store:`, error)
+        this.counters.deadLettered++
+        this.onSettled(batch)
+        return { written: 0, retry: [] }
+      }
+
+      const middle = Math.ceil(batch.length / 2)
+      const first = await this.writeBatch(batch.slice(0, middle))
+      if (first.retry.length > 0) {
+        return { written: first.written, retry: [...first.retry, ...batch.slice(middle)] }
+      }
+      const second = await this.writeBatch(batch.slice(middle))
+      return { written: first.written + second.written, retry: second.retry }
+    }
+  }
+
+  /**
+   * Stop the background timer and write out remaining rows
+   */
+  async drain(): Promise<void> {
+    this.stop()
+    if (this.flushing) await this.flushing
+    // One retry round so a transient failure during shutdown doesn't lose the tail
+    for (let attempt = 0; attempt < 2 && this.queue.length > 0; attempt++) {
+      await this.flush()
+    }
+  }
+
+  stop(): void {
+    if (this.timer) {
+      clearInterval(this.timer)
+      this.timer = null
+    }
+  }
+
+  get size(): number {
+    return this.queue.length
+  }
+
+  getStats() {
+    return { ...this.counters, buffered: this.queue.length }
+  }
+
+  private trimToCapacity() {
+    const excess = this.queue.length - this.config.capacity
+    if (excess > 0) {
+      const dropped = this.queue.splice(0, excess)
+      this.counters.dropped += excess
+      this.onSettled(dropped)
+    }
+  }
+
+  private ensureTimer() {
+    if (this.timer) return
+    this.timer = setInterval(() => {
+      if (this.queue.length === 0) return
+      this.flush().catch(error => console.error(`${this.name} flush error:`, error))
+    }, this.config.flushIntervalMs)
+    // Don't keep the process alive just for the flush timer
+    this.timer.unref?.()
+  }
+}
@@ -0,0 +1,173 @@
+/**
+ * Streaming ZIP Writer
+ * Writes a ZIP archive entry by entry to an async sink, so an archive of any
+ * number of files only ever holds the entry being written. Entries are stored
+ * or deflated; sizes and CRCs are known up front, so no data descriptors or
+ * seeking are needed. Limited to the classic (non-ZIP64) format.
+ */
+
+import { deflateRawSync } from 'zlib'
+
+export type ZipSink = (chunk: Buffer) => Promise<void>
+
+interface ZipEntryRecord {
+  name: Buffer
+  crc: number
+  method: number
+  compressedSize: number
+  size: number
+  offset: number
+  time: number
+  date: number
+}
+
+const MAX_ENTRIES = 0xffff
+const MAX_OFFSET = 0xffffffff
+const UTF8_FLAG = 0x0800
+const STORED = 0
+const DEFLATED = 8
+
+const CRC_TABLE = (() => {
+  const table = new Uint32Array(256)
+  for (let n = 0; n < 256; n++) {
+    let c = n
+    for (let k = 0; k < 8; k++) {
+      c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1
+    }
+    table[n] = c >>> 0
+  }
+  return table
+})()
+
+export function crc32(data: Uint8Array): number {
+  let crc = 0xffffffff
+  for (let i = 0; i < data.length; i++) {
+    crc = CRC_TABLE[(crc ^ data[i]) & 0xff] ^ (crc >>> 8)
+  }
+  return (crc ^ 0xffffffff) >>> 0
+}
+
+// MS-DOS time and date fields (local time, 2 second resolution)
+function dosDateTime(date: Date): { time: number; date: number } {
+  return {
+    time: (date.getHours() << 11) | (date.getMinutes() << 5) | Math.floor(date.getSeconds() / 2),
+    date: (Math.max(0, date.getFullYear() - 1980) << 9) | ((date.getMonth() + 1) << 5) | date.getDate(),
+  }
+}
+
+export class ZipWriter {
+  private sink: ZipSink
+  private entries: ZipEntryRecord[] = []
+  private names = new Set<string>()
+  private offset = 0
+  private finished = false
+
+  constructor(sink: ZipSink) {
+    this.sink = sink
+  }
+
+  /**
+   * Append a file. Deflated unless compress is false (already compressed
+   * formats such as PNG) or deflating doesn't make it smaller.
+   */
+  async addFile(name: string, data: Buffer, options: { compress?: boolean; modifiedAt?: Date } = {}): Promise<void> {
+    if (this.finished) throw new Error('ZIP archive is already finished')
+    if (this.names.has(name)) throw new Error(`Duplicate ZIP entry: ${name}`)
+    if (this.entries.length >= MAX_ENTRIES) throw new Error(`ZIP archives are limited to ${MAX_ENTRIES} entries`)
+
+    let body = data
+    let method = STORED
+    if (options.compress !== false) {
+      const deflated = deflateRawSync(data)
+      if (deflated.length < data.length) {
+        body = deflated
+        method = DEFLATED
+      }
+    }
+
+    const encodedName = Buffer.from(name, 'utf8')
+    if (this.offset + 30 + encodedName.length + body.length > MAX_OFFSET) {
+      throw new Error('ZIP archive exceeds 4 GB')
+    }
+
+    const { time, date } = dosDateTime(options.modifiedAt || new Date())
+    const entry: ZipEntryRecord = {
+      name: encodedName,
+      crc: crc32(data),
+      method,
+      compressedSize: body.length,
+      size: data.length,
+      offset: this.offset,
+      time,
+      date,
+    }
+
+    const header = Buffer.alloc(30)
+    header.writeUInt32LE(0x04034b50, 0)
+    header.writeUInt16LE(20, 4) // Version needed to extract
+    header.writeUInt16LE(UTF8_FLAG, 6)
+    header.writeUInt16LE(method, 8)
+    header.writeUInt16LE(time, 10)
+    header.writeUInt16LE(date, 12)
+    header.writeUInt32LE(entry.crc, 14)
+    header.writeUInt32LE(entry.compressedSize, 18)
+    header.writeUInt32LE(entry.size, 22)
+    header.writeUInt16LE(encodedName.length, 26)
+    header.writeUInt16LE(0, 28) // Extra field length
+
+    this.names.add(name)
+    this.entries.push(entry)
+    await this.write(Buffer.concat([header, encodedName]))
+    await this.write(body)
+  }
+
+  /**
+   * Write the central directory. No entries can be added afterwards.
+   */
+  async finish(): Promise<void> {
+    if (this.finished) return
+    this.finished = true
+
+    const directoryOffset = this.offset
+    const records = this.entries.map(entry => {
+      const record = Buffer.alloc(46)
+      record.writeUInt32LE(0x02014b50, 0)
+      record.writeUInt16LE(20, 4) // Version made by
+      record.writeUInt16LE(20, 6) // Version needed to extract
+      record.writeUInt16LE(UTF8_FLAG, 8)
+      record.writeUInt16LE(entry.method, 10)
+      record.writeUInt16LE(entry.time, 12)
+      record.writeUInt16LE(entry.date, 14)
+      record.writeUInt32LE(entry.crc, 16)
+      record.writeUInt32LE(entry.compressedSize, 20)
+      record.writeUInt32LE(entry.size, 24)
+      record.writeUInt16LE(entry.name.length, 28)
+      // Extra field, comment, disk number, internal and external attributes stay 0
+      record.writeUInt32LE(entry.offset, 42)
+      return Buffer.concat([record, entry.name])
+    })
+    const directory = Buffer.concat(records)
+
+    const end = Buffer.alloc(22)
+    end.writeUInt32LE(0x06054b50, 0)
+    end.writeUInt16LE(this.entries.length, 8)
+    end.writeUInt16LE(this.entries.length, 10)
+    end.writeUInt32LE(directory.length, 12)
+    end.writeUInt32LE(directoryOffset, 16)
+
+    await this.write(Buffer.concat([directory, end]))
+  }
+
+  get entryCount(): number {
+    return this.entries.length
+  }
+
+  get bytesWritten(): number {
+    return this.offset
+  }
+
+  private async write(chunk: Buffer): Promise<void> {
+    this.offset += chunk.length
+    await this.sink(chunk)
+  }
+}
@@ -1,13 +1,22 @@
 import { withAuth } from "next-auth/middleware"
 import { NextRequest, NextResponse } from "next/server"
 import { addSecurityHeaders } from "@/lib/security-headers"
-import { handleCustomDomainRequest } from "@/lib/domain-routing"
+import { handleCustomDomainRequest, getScanRedirectUrl } from "@/lib/domain-routing"
 import { getCorrelationIdFromRequest } from "@/lib/logging"
 
 async function handleRequest(req: NextRequest) {
   // Generate or extract correlation ID
   const correlationId = getCorrelationIdFromRequest(req)
   
+  // Scans of dynamic QR codes are resolved and redirected server-side in one
+  // response; owners viewing their code (?preview=true) still get the page
+  const scanMatch = req.nextUrl.pathname.match(/^\/qr\/([\w-]+)\/?$/)
+  if (scanMatch && req.nextUrl.searchParams.get('preview') !== 'true') {
+    const response = NextResponse.rewrite(getScanRedirectUrl(req, scanMatch[1]))
+    response.headers.set('x-correlation-id', correlationId)
+    return addSecurityHeaders(response, req)
+  }
+
   // Check if request is from a custom domain
   const host = req.headers.get('host') || ''
   const pathname = req.nextUrl.pathname
@@ -76,6 +85,10 @@ export default withAuth(
 )
 
 export const config = {
+  // Node.js runtime so the custom domain resolution cache lives on between
+  // requests. It only sees invalidations made in the same process; elsewhere
+  // entries expire on their TTL (see src/lib/domain-resolution.ts).
+  runtime: "nodejs",
   matcher: [
     "/dashboard/:path*",
     "/((?!api|_next/static|_next/image|favicon.ico|.*\\.(?:svg|png|jpg|jpeg|gif|webp)$).*)",
@@ -0,0 +1,136 @@
+/**
+ * Tests for API key verification
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+vi.mock('bcryptjs', () => ({
+  default: {
+    hash: vi.fn(async (key: string) => `hashed:${key}`),
+    compare: vi.fn(async (key: string, hash: string) => hash === `hashed:${key}`),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { verifyApiKey, getApiKeyLookupHash, invalidateApiKey, flushApiKeyUsage } from '@/lib/api-keys'
+
+function makeKeyRow(key: string, overrides: Record<string, unknown> = {}) {
+  return {
+    id: `id-${key}`,
+    userId: 'user-1',
+    organizationId: null,
+    name: 'Key',
+    keyPrefix: key.substring(0, 12) + '...',
+    keyHash: `hashed:${key}`,
+    keyLookupHash: getApiKeyLookupHash(key),
+    scopes: ['qr:read'],
+    lastUsedAt: null,
+    expiresAt: null,
+    isActive: true,
+    createdAt: '2025-01-01T00:00:00.000Z',
+    ...overrides,
+  }
+}
+
+// Chainable query whose awaited result depends on the filters applied
+function mockApiKeyTable(rows: Array<ReturnType<typeof makeKeyRow>>) {
+  const updates: Array<{ values: Record<string, unknown>; id: unknown }> = []
+  vi.mocked(supabaseAdmin!.from).mockImplementation((() => {
+    const filters: Record<string, unknown> = {}
+    let pendingUpdate: Record<string, unknown> | null = null
+    const matching = () => rows.filter(row =>
+      Object.entries(filters).every(([column, value]) => (row as Record<string, unknown>)[column] === value)
+    )
+    const query = {
+      select: vi.fn(() => query),
+      eq: vi.fn((column: string, value: unknown) => {
+        filters[column] = value
+        if (pendingUpdate && column === 'id') {
+          updates.push({ values: pendingUpdate, id: value })
+          return Promise.resolve({ error: null })
+        }
+        return query
+      }),
+      update: vi.fn((values: Record<string, unknown>) => {
+        pendingUpdate = values
+        return query
+      }),
+      maybeSingle: vi.fn(() => Promise.resolve({ data: matching()[0] || null, error: null })),
+      then: (resolve: (value: unknown) => unknown) => resolve({ data: matching(), error: null }),
+    }
+    return query
+  }) as never)
+  return updates
+}
+
+describe('API Key Verification', () => {
+  beforeEach(async () => {
+    // Drop lastUsedAt writes queued by earlier tests
+    vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({ data: 0, error: null } as never)
+    await flushApiKeyUsage()
+    vi.clearAllMocks()
+  })
+
+  it('should find a key by its lookup hash and serve repeats from the cache', async () => {
+    const key = 'sk_indexedkey0000000000'
+    mockApiKeyTable([makeKeyRow('sk_otherkey00000000000'), makeKeyRow(key)])
+
+    const first = await verifyApiKey(key)
+    const second = await verifyApiKey(key)
+
+    expect(first?.apiKey.id).toBe(`id-${key}`)
+    expect(first?.apiKey).not.toHaveProperty('keyHash')
+    expect(second?.apiKey.id).toBe(`id-${key}`)
+    // One lookup query; the second call never reached the database
+    expect(supabaseAdmin!.from).toHaveBeenCalledTimes(1)
+  })
+
+  it('should reject unknown keys', async () => {
+    mockApiKeyTable([makeKeyRow('sk_realkey000000000000')])
+
+    expect(await verifyApiKey('sk_wrongkey00000000000')).toBeNull()
+  })
+
+  it('should match a legacy key by prefix and store its lookup hash', async () => {
+    const key = 'sk_legacykey0000000000'
+    const updates = mockApiKeyTable([makeKeyRow(key, { keyLookupHash: null })])
+
+    const result = await verifyApiKey(key)
+
+    expect(result?.apiKey.id).toBe(`id-${key}`)
+    expect(updates).toEqual([{ values: { keyLookupHash: getApiKeyLookupHash(key) }, id: `id-${key}` }])
+  })
+
+  it('should go back to the database after invalidation', async () => {
+    const key = 'sk_revokedkey000000000'
+    const rows = [makeKeyRow(key)]
+    mockApiKeyTable(rows)
+
+    expect(await verifyApiKey(key)).not.toBeNull()
+
+    rows[0].isActive = false
+    await invalidateApiKey(rows[0])
+
+    expect(await verifyApiKey(key)).toBeNull()
+  })
+
+  it('should batch lastUsedAt writes', async () => {
+    mockApiKeyTable([makeKeyRow('sk_usagekeyaaaaaaaaaaa'), makeKeyRow('sk_usagekeybbbbbbbbbbb')])
+
+    await verifyApiKey('sk_usagekeyaaaaaaaaaaa')
+    await verifyApiKey('sk_usagekeyaaaaaaaaaaa')
+    await verifyApiKey('sk_usagekeybbbbbbbbbbb')
+    await flushApiKeyUsage()
+
+    expect(supabaseAdmin!.rpc).toHaveBeenCalledTimes(1)
+    const usage = vi.mocked(supabaseAdmin!.rpc).mock.calls[0][1] as { p_usage: Record<string, string> }
+    expect(Object.keys(usage.p_usage).sort()).toEqual(['id-sk_usagekeyaaaaaaaaaaa', 'id-sk_usagekeybbbbbbbbbbb'])
+  })
+})
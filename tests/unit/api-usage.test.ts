@@ -0,0 +1,219 @@
+/**
+ * Tests for API usage metering
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+vi.mock('bcryptjs', () => ({
+  default: {
+    hash: vi.fn(async (key: string) => `hashed:${key}`),
+    compare: vi.fn(async (key: string, hash: string) => hash === `hashed:${key}`),
+  },
+}))
+
+import { NextRequest, NextResponse } from 'next/server'
+import { supabaseAdmin } from '@/lib/supabase'
+import { getApiKeyLookupHash } from '@/lib/api-keys'
+import { BatchWriteError } from '@/lib/write-behind-buffer'
+import { ApiUsageBuffer, getApiUsageBuffer, withUsageMetering, type ApiUsageRecord } from '@/lib/api-usage'
+
+const KEY = 'sk_meteredkey000000000'
+
+// ApiKey lookups find the test key; ApiUsageLog inserts are captured
+function mockTables() {
+  const inserted: ApiUsageRecord[][] = []
+  const keyRow = {
+    id: 'key-1',
+    userId: 'user-1',
+    organizationId: null,
+    name: 'Key',
+    keyPrefix: KEY.substring(0, 12) + '...',
+    keyHash: `hashed:${KEY}`,
+    keyLookupHash: getApiKeyLookupHash(KEY),
+    scopes: ['qr:read'],
+    lastUsedAt: null,
+    expiresAt: null,
+    isActive: true,
+    createdAt: '2025-01-01T00:00:00.000Z',
+  }
+  vi.mocked(supabaseAdmin!.from).mockImplementation(((table: string) => {
+    const query = {
+      select: vi.fn(() => query),
+      eq: vi.fn(() => query),
+      maybeSingle: vi.fn(() => Promise.resolve({ data: keyRow, error: null })),
+      insert: vi.fn((rows: ApiUsageRecord[]) => {
+        if (table === 'ApiUsageLog') inserted.push(rows)
+        return Promise.resolve({ error: null })
+      }),
+    }
+    return query
+  }) as never)
+  return inserted
+}
+
+function makeRequest(init: RequestInit = {}) {
+  return new NextRequest('https://example.com/api/v1/qr-codes', {
+    ...init,
+    headers: { authorization: `Bearer ${KEY}`, ...(init.headers as Record<string, string>) },
+  })
+}
+
+function makeRecord(endpoint: string): ApiUsageRecord {
+  return {
+    apiKeyId: 'key-1',
+    userId: 'user-1',
+    organizationId: null,
+    endpoint,
+    method: 'GET',
+    statusCode: 200,
+    requestSize: 0,
+    responseSize: 0,
+    responseTime: 1,
+    createdAt: '2025-01-01T00:00:00.000Z',
+  }
+}
+
+describe('ApiUsageBuffer', () => {
+  it('should write multi-row batches and retry failed ones', async () => {
+    const batches: string[][] = []
+    let fail = true
+    const buffer = new ApiUsageBuffer({ maxBatchSize: 2, flushIntervalMs: 60000 }, async (records) => {
+      if (fail) {
+        fail = false
+        throw new Error('db down')
+      }
+      batches.push(records.map(record => record.endpoint))
+    })
+
+    buffer.record(makeRecord('/a'))
+    buffer.record(makeRecord('/b'))
+    buffer.record(makeRecord('/c'))
+    await buffer.drain()
+
+    expect(batches).toEqual([['/a', '/b'], ['/c']])
+    expect(buffer.getStats()).toMatchObject({ recorded: 3, flushed: 3, failedBatches: 1, buffered: 0 })
+  })
+
+  it('should dead-letter records for deleted keys without blocking other keys', async () => {
+    const written: string[] = []
+    const buffer = new ApiUsageBuffer({ maxBatchSize: 10, flushIntervalMs: 60000 }, async (records) => {
+      if (records.some(record => record.apiKeyId === 'revoked')) {
+        throw new BatchWriteError('violates foreign key constraint "ApiUsageLog_apiKeyId_fkey"', '23503')
+      }
+      written.push(...records.map(record => record.endpoint))
+    })
+    const consoleSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+
+    buffer.record(makeRecord('/a'))
+    buffer.record({ ...makeRecord('/revoked'), apiKeyId: 'revoked' })
+    buffer.record(makeRecord('/b'))
+    await buffer.drain()
+
+    expect(written).toEqual(['/a', '/b'])
+    expect(buffer.getStats()).toMatchObject({ recorded: 3, flushed: 2, deadLettered: 1, buffered: 0 })
+    consoleSpy.mockRestore()
+  })
+
+  it('should drop the oldest records beyond capacity', async () => {
+    const buffer = new ApiUsageBuffer({ capacity: 2, maxBatchSize: 10, flushIntervalMs: 60000 }, async () => {})
+
+    buffer.record(makeRecord('/a'))
+    buffer.record(makeRecord('/b'))
+    buffer.record(makeRecord('/c'))
+
+    expect(buffer.getStats()).toMatchObject({ buffered: 2, dropped: 1 })
+    buffer.stop()
+  })
+})
+
+describe('withUsageMetering', () => {
+  beforeEach(async () => {
+    await getApiUsageBuffer().drain()
+    vi.clearAllMocks()
+  })
+
+  it('should pass the verified key to the handler', async () => {
+    mockTables()
+    let scopes: string[] | undefined
+    const handler = withUsageMetering(async (_req, _ctx, authContext) => {
+      scopes = authContext.apiKey.scopes
+      return NextResponse.json({ ok: true })
+    })
+
+    const response = await handler(makeRequest(), {})
+    await response.text()
+
+    expect(response.status).toBe(200)
+    expect(scopes).toEqual(['qr:read'])
+  })
+
+  it('should count streamed bodies without buffering them', async () => {
+    const inserted = mockTables()
+    const handler = withUsageMetering(async (req) => {
+      const body = await req.text()
+      return new NextResponse(new ReadableStream({
+        start(controller) {
+          controller.enqueue(new TextEncoder().encode(body))
+          controller.enqueue(new TextEncoder().encode('!!'))
+          controller.close()
+        },
+      }), { status: 201 })
+    })
+
+    const request = makeRequest({
+      method: 'POST',
+      body: new ReadableStream({
+        start(controller) {
+          controller.enqueue(new TextEncoder().encode('hello'))
+          controller.close()
+        },
+      }),
+      duplex: 'half',
+    } as RequestInit)
+    const response = await handler(request, {})
+
+    // Nothing is recorded until the response body has been sent
+    await getApiUsageBuffer().flush()
+    expect(inserted).toEqual([])
+
+    expect(await response.text()).toBe('hello!!')
+    await getApiUsageBuffer().flush()
+
+    expect(inserted).toHaveLength(1)
+    expect(inserted[0][0]).toMatchObject({
+      apiKeyId: 'key-1',
+      endpoint: '/api/v1/qr-codes',
+      method: 'POST',
+      statusCode: 201,
+      requestSize: 5,
+      responseSize: 7,
+    })
+  })
+
+  it('should use Content-Length when present', async () => {
+    const inserted = mockTables()
+    const handler = withUsageMetering(async () =>
+      new NextResponse('{"ok":true}', { headers: { 'content-length': '11' } })
+    )
+
+    await handler(makeRequest({ method: 'POST', body: 'abc', headers: { 'content-length': '3' } }), {})
+    await getApiUsageBuffer().flush()
+
+    expect(inserted[0][0]).toMatchObject({ requestSize: 3, responseSize: 11 })
+  })
+
+  it('should reject requests without a key', async () => {
+    const handler = withUsageMetering(async () => NextResponse.json({ ok: true }))
+
+    const response = await handler(new NextRequest('https://example.com/api/v1/qr-codes'), {})
+
+    expect(response.status).toBe(401)
+  })
+})
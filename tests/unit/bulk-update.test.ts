@@ -0,0 +1,163 @@
+/**
+ * Tests for bulk QR code updates
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+vi.mock('next-auth/next', () => ({
+  getServerSession: vi.fn(),
+}))
+
+vi.mock('@/lib/auth', () => ({
+  authOptions: {},
+}))
+
+import { NextRequest } from 'next/server'
+import { getServerSession } from 'next-auth/next'
+import { supabaseAdmin } from '@/lib/supabase'
+import { POST } from '@/app/api/qr-codes/bulk/route'
+
+function mockTables() {
+  const results: Array<Record<string, unknown>> = []
+  const groupUpdates: Array<Record<string, unknown>> = []
+  vi.mocked(supabaseAdmin!.from).mockImplementation(((table: string) => {
+    const query: Record<string, unknown> = {}
+    const result = { data: { id: 'group-1' }, error: null }
+    for (const method of ['select', 'eq']) {
+      query[method] = vi.fn(() => query)
+    }
+    query.single = vi.fn(() => Promise.resolve(result))
+    query.then = (resolve: (value: unknown) => unknown) => Promise.resolve(result).then(resolve)
+    query.insert = vi.fn((rows: unknown) => {
+      if (table === 'QrCodeBulkResult') results.push(...(rows as Array<Record<string, unknown>>))
+      return query
+    })
+    query.update = vi.fn((values: Record<string, unknown>) => {
+      groupUpdates.push(values)
+      return query
+    })
+    return query
+  }) as never)
+  return { results, groupUpdates }
+}
+
+// Updates every owned id it is given, like bulk_update_qr_codes
+function mockUpdateRpc(owned: string[]) {
+  vi.mocked(supabaseAdmin!.rpc).mockImplementation(((_name: string, args: { p_updates: Array<{ id: string }> }) => Promise.resolve({
+    data: args.p_updates.filter(update => owned.includes(update.id)).map(update => ({ id: update.id })),
+    error: null,
+  })) as never)
+}
+
+async function postBulkUpdate(qrCodes: unknown[]) {
+  const request = new NextRequest('https://app.test/api/qr-codes/bulk', {
+    method: 'POST',
+    body: JSON.stringify({ operation: 'update', qrCodes }),
+  })
+  const response = await POST(request)
+  return { status: response.status, body: await response.json() }
+}
+
+// processBulkOperation runs after the response; wait for it to mark the group done
+async function waitForCompletion(groupUpdates: Array<Record<string, unknown>>) {
+  for (let tick = 0; tick < 100 && !groupUpdates.some(update => update.status); tick++) {
+    await new Promise(resolve => setTimeout(resolve, 0))
+  }
+  return groupUpdates.find(update => update.status)!
+}
+
+describe('POST /api/qr-codes/bulk (update)', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+    vi.mocked(getServerSession).mockResolvedValue({ user: { id: 'user-1' } } as never)
+  })
+
+  it('applies the valid items of a mixed chunk and reports the invalid ones', async () => {
+    const { results, groupUpdates } = mockTables()
+    mockUpdateRpc(['qr-1', 'qr-3'])
+
+    const { status, body } = await postBulkUpdate([
+      { id: 'qr-1', title: 'Spring sale', maxScans: 500 },
+      { id: 'qr-2', maxScans: 'lots' },
+      { id: 'qr-3', expiresAt: '2026-01-01T00:00:00Z', hasWatermark: false },
+      { id: 'qr-4', expiresAt: 'next tuesday' },
+      { title: 'No id' },
+    ])
+
+    expect(status).toBe(200)
+    expect(body.failedItems.map((item: { index: number }) => item.index)).toEqual([1, 3, 4])
+    expect(body.failedItems[0]).toMatchObject({ qrCodeId: 'qr-2' })
+    expect(body.failedItems[0].error).toMatch(/^maxScans: /)
+    expect(body.failedItems[1].error).toMatch(/^expiresAt: Invalid date/)
+    expect(body.failedItems[2]).toMatchObject({ qrCodeId: null, error: 'QR code id is required for update operation' })
+
+    const completed = await waitForCompletion(groupUpdates)
+    expect(completed).toMatchObject({ status: 'completed', processedCount: 2, failedCount: 3 })
+
+    // Only validated items reach the RPC, reduced to updatable fields
+    expect(supabaseAdmin!.rpc).toHaveBeenCalledTimes(1)
+    expect(supabaseAdmin!.rpc).toHaveBeenCalledWith('bulk_update_qr_codes', {
+      p_user_id: 'user-1',
+      p_updates: [
+        { id: 'qr-1', title: 'Spring sale', maxScans: 500 },
+        { id: 'qr-3', expiresAt: '2026-01-01T00:00:00Z', hasWatermark: false },
+      ],
+    })
+    expect(results.filter(result => result.status === 'failed').map(result => result.qrCodeId)).toEqual(['qr-2', 'qr-4', null])
+    expect(results.filter(result => result.status === 'succeeded').map(result => result.qrCodeId)).toEqual(['qr-1', 'qr-3'])
+  })
+
+  it('fails every occurrence of a duplicated id instead of picking one', async () => {
+    const { results, groupUpdates } = mockTables()
+    mockUpdateRpc(['qr-1', 'qr-2'])
+
+    const { body } = await postBulkUpdate([
+      { id: 'qr-1', title: 'First' },
+      { id: 'qr-2', title: 'Only' },
+      { id: 'qr-1', title: 'Second' },
+    ])
+
+    expect(body.failedItems).toEqual([
+      { index: 0, qrCodeId: 'qr-1', error: 'Duplicate QR code id in request' },
+      { index: 2, qrCodeId: 'qr-1', error: 'Duplicate QR code id in request' },
+    ])
+
+    const completed = await waitForCompletion(groupUpdates)
+    expect(completed).toMatchObject({ status: 'completed', processedCount: 1, failedCount: 2 })
+    expect(supabaseAdmin!.rpc).toHaveBeenCalledWith('bulk_update_qr_codes', {
+      p_user_id: 'user-1',
+      p_updates: [{ id: 'qr-2', title: 'Only' }],
+    })
+    expect(results.map(result => [result.qrCodeId, result.status])).toEqual([
+      ['qr-1', 'failed'],
+      ['qr-1', 'failed'],
+      ['qr-2', 'succeeded'],
+    ])
+  })
+
+  it('retries a rejected statement item by item so one bad row fails alone', async () => {
+    const { results, groupUpdates } = mockTables()
+    vi.mocked(supabaseAdmin!.rpc).mockImplementation(((_name: string, args: { p_updates: Array<{ id: string }> }) => Promise.resolve(
+      args.p_updates.some(update => update.id === 'qr-2')
+        ? { data: null, error: { message: 'value too long for type character varying' } }
+        : { data: args.p_updates.map(update => ({ id: update.id })), error: null }
+    )) as never)
+
+    await postBulkUpdate([{ id: 'qr-1' }, { id: 'qr-2' }, { id: 'qr-3' }])
+
+    const completed = await waitForCompletion(groupUpdates)
+    expect(completed).toMatchObject({ status: 'completed', processedCount: 2, failedCount: 1 })
+    expect(results.map(result => [result.qrCodeId, result.status])).toEqual([
+      ['qr-1', 'succeeded'],
+      ['qr-2', 'failed'],
+      ['qr-3', 'succeeded'],
+    ])
+  })
+})
@@ -0,0 +1,84 @@
+/**
+ * Tests for the custom domain analytics route
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+vi.mock('next-auth/next', () => ({
+  getServerSession: vi.fn(),
+}))
+
+vi.mock('@/lib/auth', () => ({
+  authOptions: {},
+}))
+
+import { NextRequest } from 'next/server'
+import { getServerSession } from 'next-auth/next'
+import { supabaseAdmin } from '@/lib/supabase'
+import { GET } from '@/app/api/domains/[domainId]/analytics/route'
+
+// Rolled-up scan history runs up to 2025-03-10; the domain counters cover both sides of it
+const domainDays = [
+  { date: '2025-03-12', totalScans: 4, uniqueVisitors: 3, countries: { IN: 4 }, devices: { Mobile: 4 }, browsers: { Chrome: 4 } },
+  { date: '2025-03-09', totalScans: 6, uniqueVisitors: 5, countries: { IN: 2, US: 4 }, devices: { Mobile: 6 }, browsers: { Safari: 6 } },
+]
+
+function mockTables() {
+  const tables: string[] = []
+  const filters: Array<[string, string, unknown]> = []
+  vi.mocked(supabaseAdmin!.from).mockImplementation(((table: string) => {
+    tables.push(table)
+    const result = table === 'QrCodeCustomDomain'
+      ? { data: { id: 'domain-1', userId: 'user-1', domain: 'go.example.com' }, error: null }
+      : { data: domainDays, error: null }
+    const query = {
+      select: vi.fn(() => query),
+      order: vi.fn(() => query),
+      single: vi.fn(() => Promise.resolve(result)),
+      then: (resolve: (value: unknown) => unknown) => Promise.resolve(result).then(resolve),
+    } as Record<string, unknown>
+    for (const operator of ['eq', 'gte', 'lte', 'lt']) {
+      query[operator] = vi.fn((column: string, value: unknown) => {
+        filters.push([operator, column, value])
+        return query
+      })
+    }
+    return query
+  }) as never)
+  return { tables, filters }
+}
+
+describe('GET /api/domains/[domainId]/analytics', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+    vi.mocked(getServerSession).mockResolvedValue({ user: { id: 'user-1' } } as never)
+  })
+
+  it('reads every day in range from the domain counters, before and after the rollup watermark', async () => {
+    const { tables, filters } = mockTables()
+    const request = new NextRequest('https://app.test/api/domains/domain-1/analytics?startDate=2025-03-01&endDate=2025-03-31')
+
+    const response = await GET(request, { params: Promise.resolve({ domainId: 'domain-1' }) })
+    const body = await response.json()
+
+    expect(response.status).toBe(200)
+    expect(tables).toEqual(['QrCodeCustomDomain', 'QrCodeDomainAnalytics'])
+    expect(filters).toContainEqual(['eq', 'domainId', 'domain-1'])
+    expect(filters).toContainEqual(['gte', 'date', '2025-03-01'])
+    expect(filters).toContainEqual(['lte', 'date', '2025-03-31'])
+
+    expect(body.analytics.dailyStats).toEqual([
+      { date: '2025-03-12', scans: 4, uniqueVisitors: 3 },
+      { date: '2025-03-09', scans: 6, uniqueVisitors: 5 },
+    ])
+    expect(body.analytics.totalScans).toBe(10)
+    expect(body.analytics.countries).toEqual({ IN: 6, US: 4 })
+  })
+})
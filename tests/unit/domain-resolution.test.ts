@@ -0,0 +1,151 @@
+/**
+ * Tests for cached custom domain resolution
+ */
+
+import { describe, it, expect, beforeEach, afterEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => {
+  const supabaseAdmin = { from: vi.fn(), rpc: vi.fn() }
+  return { supabaseAdmin, getSupabaseAdmin: () => supabaseAdmin }
+})
+
+import { supabaseAdmin } from '@/lib/supabase'
+import {
+  resolveCustomDomain,
+  resolveDomainSlug,
+  invalidateCustomDomain,
+  invalidateDomainSlugs,
+  clearDomainResolutionCache,
+} from '@/lib/domain-resolution'
+
+const DOMAIN_ROW = {
+  id: 'domain-1',
+  domain: 'go.example.com',
+  routingConfig: null,
+  custom404Page: null,
+  customExpiryPage: null,
+  status: 'active',
+}
+
+// Each domain query or slug RPC resolves with the next queued result
+function mockQueries(results: Array<{ data: unknown; error: unknown }>) {
+  const next = () => Promise.resolve(results.shift() ?? { data: null, error: null })
+  const from = vi.mocked(supabaseAdmin!.from)
+  from.mockImplementation((() => {
+    const query = {
+      select: vi.fn(() => query),
+      eq: vi.fn(() => query),
+      maybeSingle: vi.fn(next),
+    }
+    return query
+  }) as never)
+  const rpc = vi.mocked(supabaseAdmin!.rpc)
+  rpc.mockImplementation(next as never)
+  return { from, rpc, calls: () => from.mock.calls.length + rpc.mock.calls.length }
+}
+
+describe('domain resolution cache', () => {
+  beforeEach(() => {
+    clearDomainResolutionCache()
+    vi.clearAllMocks()
+  })
+
+  afterEach(() => {
+    vi.restoreAllMocks()
+  })
+
+  it('should share one lookup between concurrent requests and cache the result', async () => {
+    const { calls } = mockQueries([{ data: DOMAIN_ROW, error: null }])
+
+    const [first, second] = await Promise.all([
+      resolveCustomDomain('go.example.com'),
+      resolveCustomDomain('GO.example.com'),
+    ])
+    const third = await resolveCustomDomain('go.example.com')
+
+    expect(first).toMatchObject({ id: 'domain-1' })
+    expect(second).toBe(first)
+    expect(third).toBe(first)
+    expect(calls()).toBe(1)
+  })
+
+  it('should cache unknown hosts and slugs', async () => {
+    const { from, rpc } = mockQueries([])
+
+    expect(await resolveCustomDomain('unknown.example.com')).toBeNull()
+    expect(await resolveCustomDomain('unknown.example.com')).toBeNull()
+    expect(await resolveDomainSlug('domain-1', 'missing')).toBeNull()
+    expect(await resolveDomainSlug('domain-1', 'missing')).toBeNull()
+
+    expect(from).toHaveBeenCalledTimes(1)
+    expect(rpc).toHaveBeenCalledTimes(1)
+    expect(rpc).toHaveBeenCalledWith('resolve_vanity_qr_code', { p_domain_id: 'domain-1', p_slug: 'missing' })
+  })
+
+  it('should serve stale entries while refreshing in the background', async () => {
+    const now = vi.spyOn(Date, 'now')
+    now.mockReturnValue(1_000_000)
+    const { calls } = mockQueries([
+      { data: 'qr-1', error: null },
+      { data: 'qr-2', error: null },
+    ])
+
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-1')
+    now.mockReturnValue(1_000_000 + 2 * 60_000)
+
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-1')
+    await new Promise(resolve => setTimeout(resolve, 0))
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-2')
+    expect(calls()).toBe(2)
+  })
+
+  it('should not cache failed lookups', async () => {
+    const errorSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+    const { calls } = mockQueries([
+      { data: null, error: { message: 'db down' } },
+      { data: DOMAIN_ROW, error: null },
+    ])
+
+    expect(await resolveCustomDomain('go.example.com')).toBeNull()
+    expect(await resolveCustomDomain('go.example.com')).toMatchObject({ id: 'domain-1' })
+    expect(calls()).toBe(2)
+    errorSpy.mockRestore()
+  })
+
+  it('should reload after explicit invalidation', async () => {
+    const { calls } = mockQueries([
+      { data: DOMAIN_ROW, error: null },
+      { data: 'qr-1', error: null },
+      { data: 'qr-2', error: null },
+      { data: null, error: null },
+    ])
+
+    await resolveCustomDomain('go.example.com')
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-1')
+
+    invalidateDomainSlugs('domain-1', ['PROMO', null])
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-2')
+
+    invalidateCustomDomain('go.example.com')
+    expect(await resolveCustomDomain('go.example.com')).toBeNull()
+    expect(calls()).toBe(4)
+  })
+  it('should not cache a lookup that was running when the mapping was invalidated', async () => {
+    let finishStaleLoad: (result: { data: unknown; error: unknown }) => void = () => {}
+    const rpc = vi.mocked(supabaseAdmin!.rpc)
+    rpc
+      .mockImplementationOnce((() => new Promise(resolve => { finishStaleLoad = resolve })) as never)
+      .mockImplementation((() => Promise.resolve({ data: 'qr-2', error: null })) as never)
+
+    const staleLoad = resolveDomainSlug('domain-1', 'promo')
+    invalidateDomainSlugs('domain-1', ['promo'])
+
+    // Requests after the invalidation don't join the old load
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-2')
+    finishStaleLoad({ data: 'qr-1', error: null })
+    expect(await staleLoad).toBe('qr-1')
+
+    expect(await resolveDomainSlug('domain-1', 'promo')).toBe('qr-2')
+    expect(rpc).toHaveBeenCalledTimes(2)
+  })
+})
@@ -0,0 +1,190 @@
+/**
+ * Tests for the background job worker
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { JobWorker } from '@/lib/job-worker'
+import type { BackgroundJob, JobType } from '@/lib/background-jobs'
+
+function makeJob(id: string, jobType: JobType, retries = 0): BackgroundJob {
+  return {
+    id,
+    jobType,
+    status: 'processing',
+    priority: 0,
+    payload: { id },
+    retries,
+    maxRetries: 3,
+    runAfter: '2025-01-01T00:00:00.000Z',
+    createdAt: '2025-01-01T00:00:00.000Z',
+    updatedAt: '2025-01-01T00:00:00.000Z',
+  }
+}
+
+// Route rpc calls by function name; claims hand out the queue per the requested slots
+function mockQueue(queue: BackgroundJob[], held: () => string[] = () => []) {
+  vi.mocked(supabaseAdmin!.rpc).mockImplementation((async (fn: string, args: Record<string, unknown>) => {
+    if (fn === 'claim_background_jobs') {
+      const slots = { ...(args.p_slots as Record<string, number>) }
+      const claimed: BackgroundJob[] = []
+      for (const job of [...queue]) {
+        if (claimed.length >= (args.p_batch_size as number)) break
+        if ((slots[job.jobType] || 0) > 0) {
+          slots[job.jobType]--
+          claimed.push(job)
+          queue.splice(queue.indexOf(job), 1)
+        }
+      }
+      return { data: claimed, error: null }
+    }
+    if (fn === 'heartbeat_background_jobs') {
+      return { data: held(), error: null }
+    }
+    if (fn === 'finish_background_job') {
+      return { data: args.p_error ? 'pending' : 'completed', error: null }
+    }
+    return { data: null, error: null }
+  }) as never)
+}
+
+const finishCalls = () =>
+  vi.mocked(supabaseAdmin!.rpc).mock.calls
+    .filter(call => call[0] === 'finish_background_job')
+    .map(call => call[1] as Record<string, unknown>)
+
+describe('JobWorker', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('should run claimed jobs concurrently within per-type limits', async () => {
+    mockQueue([
+      makeJob('1', 'qr_export'),
+      makeJob('2', 'qr_export'),
+      makeJob('3', 'bulk_qr_create'),
+      makeJob('4', 'bulk_qr_create'),
+    ])
+
+    let active = 0
+    let maxActive = 0
+    const exportsActive: number[] = []
+    let exporting = 0
+    const work = async () => {
+      active++
+      maxActive = Math.max(maxActive, active)
+      await new Promise(resolve => setTimeout(resolve, 10))
+      active--
+      return { ok: true }
+    }
+
+    const worker = new JobWorker({
+      workerId: 'worker-1',
+      concurrency: 3,
+      perTypeConcurrency: { qr_export: 1 },
+      processors: {
+        qr_export: async () => {
+          exporting++
+          exportsActive.push(exporting)
+          const result = await work()
+          exporting--
+          return result
+        },
+        bulk_qr_create: work,
+      },
+    })
+
+    const results = await worker.runOnce(10)
+
+    expect(results.map(result => result.status)).toEqual(['completed', 'completed', 'completed', 'completed'])
+    expect(maxActive).toBe(3)
+    expect(Math.max(...exportsActive)).toBe(1)
+
+    const firstClaim = vi.mocked(supabaseAdmin!.rpc).mock.calls.find(call => call[0] === 'claim_background_jobs')
+    expect(firstClaim![1]).toMatchObject({
+      p_worker_id: 'worker-1',
+      p_slots: { qr_export: 1, bulk_qr_create: 3 },
+      p_batch_size: 3,
+    })
+  })
+
+  it('should record failures with a backoff and keep going', async () => {
+    mockQueue([makeJob('1', 'qr_export', 1), makeJob('2', 'qr_export')])
+
+    const worker = new JobWorker({
+      workerId: 'worker-1',
+      processors: {
+        qr_export: async (payload) => {
+          if (payload.id === '1') throw new Error('boom')
+          return { fileUrl: 'x' }
+        },
+      },
+    })
+
+    const results = await worker.runOnce(10)
+
+    expect(results).toEqual([
+      { id: '1', jobType: 'qr_export', status: 'pending', error: 'boom' },
+      { id: '2', jobType: 'qr_export', status: 'completed' },
+    ])
+    expect(finishCalls()).toEqual([
+      { p_job_id: '1', p_worker_id: 'worker-1', p_result: null, p_error: 'boom', p_retry_delay_seconds: 120 },
+      { p_job_id: '2', p_worker_id: 'worker-1', p_result: { fileUrl: 'x' }, p_error: null, p_retry_delay_seconds: 0 },
+    ])
+    expect(worker.getStats()).toMatchObject({ claimed: 2, completed: 1, failed: 1 })
+  })
+
+  it('should abort a job whose lease was lost', async () => {
+    mockQueue([makeJob('1', 'qr_export')], () => [])
+
+    let signal: AbortSignal | undefined
+    const worker = new JobWorker({
+      workerId: 'worker-1',
+      processors: {
+        qr_export: (_payload, context) => {
+          signal = context.signal
+          return new Promise(() => {}) // Never settles on its own
+        },
+      },
+    })
+
+    const run = worker.runOnce(1)
+    await new Promise(resolve => setTimeout(resolve, 0))
+    await worker.heartbeat()
+    const results = await run
+
+    expect(signal!.aborted).toBe(true)
+    expect(results[0].error).toBe('Job lease lost')
+  })
+
+  it('should let running jobs finish on stop', async () => {
+    mockQueue([makeJob('1', 'image_optimization')])
+
+    let finished = false
+    const worker = new JobWorker({
+      workerId: 'worker-1',
+      pollIntervalMs: 5,
+      processors: {
+        image_optimization: async () => {
+          await new Promise(resolve => setTimeout(resolve, 20))
+          finished = true
+        },
+      },
+    })
+
+    worker.start()
+    await new Promise(resolve => setTimeout(resolve, 5))
+    await worker.stop(1000)
+
+    expect(finished).toBe(true)
+    expect(worker.getStats()).toMatchObject({ running: 0, completed: 1 })
+  })
+})
@@ -0,0 +1,203 @@
+/**
+ * Tests for the in-process metrics registry
+ */
+
+import { describe, it, expect, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+import { NextRequest } from 'next/server'
+import { supabaseAdmin } from '@/lib/supabase'
+import { GET } from '@/app/api/metrics/route'
+import { MetricsRegistry, HISTOGRAM_BOUNDS, histogramBucketIndex, histogramQuantile, type MetricRow } from '@/lib/metrics-registry'
+import { normalizeEndpoint, getStatusClass, planMetricSegments, getMetricSummary } from '@/lib/metrics'
+
+describe('MetricsRegistry', () => {
+  it('should flush one pre-aggregated row per series', async () => {
+    const written: MetricRow[][] = []
+    const registry = new MetricsRegistry({ flushIntervalMs: 60000, writer: async (rows) => { written.push(rows) } })
+
+    registry.increment('request_count', { endpoint: '/api/a', status: '2xx' })
+    registry.increment('request_count', { status: '2xx', endpoint: '/api/a' })
+    registry.increment('request_count', { endpoint: '/api/b', status: '5xx' })
+    registry.observe('response_time', 4, { endpoint: '/api/a' })
+    registry.observe('response_time', 120, { endpoint: '/api/a' })
+    registry.setGauge('queue_depth', 7)
+    registry.setGauge('queue_depth', 3)
+
+    expect(await registry.flush()).toBe(4)
+    // Nothing new since the last flush
+    expect(await registry.flush()).toBe(0)
+    registry.stop()
+
+    const rows = written[0]
+    expect(rows.find(row => row.labels.endpoint === '/api/a' && row.name === 'request_count')).toMatchObject({ value: 2, count: 2 })
+    expect(rows.find(row => row.labels.endpoint === '/api/b')).toMatchObject({ value: 1, count: 1 })
+
+    const latency = rows.find(row => row.name === 'response_time')!
+    expect(latency).toMatchObject({ value: 124, count: 2, min: 4, max: 120 })
+    expect(latency.histogram!.reduce((a, b) => a + b, 0)).toBe(2)
+    expect(latency.histogram![histogramBucketIndex(120)]).toBe(1)
+
+    expect(rows.find(row => row.name === 'queue_depth')).toMatchObject({ value: 3, count: 1, min: 3, max: 7 })
+  })
+
+  it('should render cumulative values in Prometheus text format', async () => {
+    const registry = new MetricsRegistry({ flushIntervalMs: 60000, writer: async () => {} })
+    registry.describe('request_count', 'HTTP requests')
+
+    registry.increment('request_count', { endpoint: '/api/a', method: 'GET' })
+    registry.observe('response_time', 10)
+    await registry.flush()
+    registry.increment('request_count', { endpoint: '/api/a', method: 'GET' })
+    registry.observe('response_time', 100000)
+    registry.stop()
+
+    const text = registry.renderPrometheus()
+
+    expect(text).toContain('# HELP request_count HTTP requests\n# TYPE request_count counter\n')
+    expect(text).toContain('request_count{endpoint="/api/a",method="GET"} 2\n')
+    expect(text).toContain('response_time_bucket{le="12"} 1\n')
+    expect(text).toContain(`response_time_bucket{le="${HISTOGRAM_BOUNDS[HISTOGRAM_BOUNDS.length - 1]}"} 1\n`)
+    expect(text).toContain('response_time_bucket{le="+Inf"} 2\n')
+    expect(text).toContain('response_time_sum 100010\n')
+    expect(text).toContain('response_time_count 2\n')
+  })
+
+  it('should cap the number of label sets per metric', async () => {
+    const written: MetricRow[][] = []
+    const registry = new MetricsRegistry({ flushIntervalMs: 60000, writer: async (rows) => { written.push(rows) } })
+
+    for (let i = 0; i < 600; i++) {
+      registry.increment('request_count', { endpoint: `/r/${i}` })
+    }
+    await registry.flush()
+    registry.stop()
+
+    expect(written[0]).toHaveLength(501)
+    expect(written[0].find(row => row.labels.overflow === 'true')).toMatchObject({ value: 100 })
+  })
+})
+
+describe('request metric labels', () => {
+  it('should replace ids in endpoints', () => {
+    expect(normalizeEndpoint('/api/qr-codes/3f2b8c1e-6a4d-4e2f-9b1a-0c7d5e8f9a2b/scans')).toBe('/api/qr-codes/:id/scans')
+    expect(normalizeEndpoint('/api/folders/42')).toBe('/api/folders/:id')
+    expect(normalizeEndpoint('/api/v1/qr-codes')).toBe('/api/v1/qr-codes')
+    expect(getStatusClass(404)).toBe('4xx')
+  })
+})
+
+describe('histogramQuantile', () => {
+  it('should interpolate within the bucket holding the rank', () => {
+    const buckets = new Array(HISTOGRAM_BOUNDS.length + 1).fill(0)
+    // 100 samples in (50, 75], 100 samples in (500, 750]
+    buckets[histogramBucketIndex(60)] = 100
+    buckets[histogramBucketIndex(600)] = 100
+
+    expect(histogramQuantile(buckets, 0.25)).toBe(62.5)
+    expect(histogramQuantile(buckets, 0.99)).toBe(745)
+    // Known extremes tighten the outer buckets
+    expect(histogramQuantile(buckets, 0, { min: 55, max: 700 })).toBe(55)
+    expect(histogramQuantile(buckets, 1, { min: 55, max: 700 })).toBe(700)
+    expect(histogramQuantile(new Array(buckets.length).fill(0), 0.5)).toBe(0)
+  })
+})
+
+describe('planMetricSegments', () => {
+  const at = (iso: string) => new Date(iso)
+
+  it('should read whole days, hours and minutes from buckets and the rest from raw rows', () => {
+    const segments = planMetricSegments(at('2025-01-01T22:30:30Z'), at('2025-01-04T01:10:00Z'), {
+      '1d': at('2025-01-03T00:00:00Z'),
+      '1h': at('2025-01-04T01:00:00Z'),
+      '1m': at('2025-01-04T01:05:00Z'),
+    })
+
+    expect(segments).toEqual([
+      { source: 'raw', from: '2025-01-01T22:30:30.000Z', to: '2025-01-01T22:31:00.000Z' },
+      { source: '1m', from: '2025-01-01T22:31:00.000Z', to: '2025-01-01T23:00:00.000Z' },
+      { source: '1h', from: '2025-01-01T23:00:00.000Z', to: '2025-01-02T00:00:00.000Z' },
+      { source: '1d', from: '2025-01-02T00:00:00.000Z', to: '2025-01-03T00:00:00.000Z' },
+      { source: '1h', from: '2025-01-03T00:00:00.000Z', to: '2025-01-04T01:00:00.000Z' },
+      { source: '1m', from: '2025-01-04T01:00:00.000Z', to: '2025-01-04T01:05:00.000Z' },
+      { source: 'raw', from: '2025-01-04T01:05:00.000Z', to: '2025-01-04T01:10:00.000Z' },
+    ])
+  })
+
+  it('should fall back to raw rows before any rollup has run', () => {
+    expect(planMetricSegments(at('2025-01-01T00:00:00Z'), at('2025-01-01T01:00:00Z'), {})).toEqual([
+      { source: 'raw', from: '2025-01-01T00:00:00.000Z', to: '2025-01-01T01:00:00.000Z' },
+    ])
+  })
+})
+
+describe('getMetricSummary', () => {
+  it('should merge bucket rows into totals and percentiles', async () => {
+    vi.mocked(supabaseAdmin!.from).mockImplementation((() => ({
+      select: vi.fn(() => Promise.resolve({ data: [], error: null })),
+    })) as never)
+
+    const histogram = (value: number, count: number) => {
+      const buckets = new Array(HISTOGRAM_BOUNDS.length + 1).fill(0)
+      buckets[histogramBucketIndex(value)] = count
+      return buckets
+    }
+    vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({
+      data: [
+        { bucket_start: '2025-01-01T00:00:00Z', count: '98', sum: '980', min: '9', max: '11', histogram: histogram(10, 98) },
+        { bucket_start: '2025-01-01T00:01:00Z', count: 2, sum: 1800, min: 700, max: 1100, histogram: histogram(1000, 2) },
+      ],
+      error: null,
+    } as never)
+
+    const summary = await getMetricSummary('response_time', new Date('2025-01-01T00:00:00Z'), new Date('2025-01-01T00:02:00Z'))
+
+    expect(summary).toMatchObject({ count: 100, sum: 2780, min: 9, max: 1100 })
+    expect(summary.avg).toBeCloseTo(27.8)
+    expect(summary.p50).toBeLessThanOrEqual(12)
+    expect(summary.p99).toBeGreaterThan(750)
+    expect(summary.values).toEqual([
+      { timestamp: '2025-01-01T00:00:00Z', value: 980 },
+      { timestamp: '2025-01-01T00:01:00Z', value: 1800 },
+    ])
+  })
+})
+
+describe('GET /api/metrics', () => {
+  const scrape = (authorization?: string) => GET(new NextRequest('https://app.test/api/metrics', {
+    headers: authorization ? { authorization } : {},
+  }))
+
+  it('is not served when METRICS_TOKEN is unset', async () => {
+    const previous = process.env.METRICS_TOKEN
+    delete process.env.METRICS_TOKEN
+    try {
+      expect((await scrape()).status).toBe(404)
+      expect((await scrape('Bearer ')).status).toBe(404)
+    } finally {
+      if (previous !== undefined) process.env.METRICS_TOKEN = previous
+    }
+  })
+
+  it('requires the bearer token when METRICS_TOKEN is set', async () => {
+    const previous = process.env.METRICS_TOKEN
+    process.env.METRICS_TOKEN = 'scrape-secret'
+    try {
+      expect((await scrape()).status).toBe(401)
+      expect((await scrape('Bearer wrong')).status).toBe(401)
+
+      const response = await scrape('Bearer scrape-secret')
+      expect(response.status).toBe(200)
+      expect(response.headers.get('content-type')).toContain('text/plain')
+    } finally {
+      if (previous === undefined) delete process.env.METRICS_TOKEN
+      else process.env.METRICS_TOKEN = previous
+    }
+  })
+})
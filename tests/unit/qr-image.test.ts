@@ -0,0 +1,118 @@
+/**
+ * Tests for content-addressed QR image keys and the rendered-image cache
+ */
+
+import { describe, it, expect, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+  },
+}))
+
+import { NextRequest } from 'next/server'
+import { supabaseAdmin } from '@/lib/supabase'
+import { getQrImageCacheKey, getQrImageKey, serveQrImage } from '@/lib/qr-image'
+import { ByteLruCache, getOrRenderQrImage, getCachedQrImage, clearQrImageMemoryCache } from '@/lib/qr-image-cache'
+import { getQrRenderInput } from '@/lib/qr-render'
+
+const qrCode = {
+  id: 'qr-1',
+  url: 'https://example.com',
+  isDynamic: false,
+  foregroundColor: '#000000',
+  backgroundColor: 'FFFFFF',
+  dotType: 'rounded',
+  cornerType: 'square',
+  hasWatermark: false,
+}
+
+describe('getQrImageKey', () => {
+  it('is stable for the same data and style and changes on restyle', () => {
+    const input = getQrRenderInput(qrCode, 'https://app.test')
+    const key = getQrImageKey(input, 'svg')
+
+    expect(key).toMatch(/^[a-f0-9]{32}$/)
+    expect(getQrImageKey(getQrRenderInput({ ...qrCode }, 'https://app.test'), 'svg')).toBe(key)
+    expect(getQrImageKey(getQrRenderInput({ ...qrCode, foregroundColor: '#ff0000' }, 'https://app.test'), 'svg')).not.toBe(key)
+    expect(getQrImageKey(input, 'png')).not.toBe(key)
+    expect(getQrImageKey(input, 'png', 4)).not.toBe(getQrImageKey(input, 'png'))
+  })
+
+  it('keys dynamic codes on the origin they are served from', () => {
+    const dynamic = { ...qrCode, isDynamic: true }
+    expect(getQrRenderInput(dynamic, 'https://app.test').data).toBe('https://app.test/qr/qr-1')
+    expect(getQrImageKey(getQrRenderInput(dynamic, 'https://app.test'), 'svg'))
+      .not.toBe(getQrImageKey(getQrRenderInput(dynamic, 'https://other.test'), 'svg'))
+  })
+})
+
+describe('ByteLruCache', () => {
+  it('evicts least recently used entries past the byte budget', () => {
+    const cache = new ByteLruCache(10)
+    cache.set('a', Buffer.alloc(4))
+    cache.set('b', Buffer.alloc(4))
+    cache.get('a')
+    cache.set('c', Buffer.alloc(4))
+
+    expect(cache.get('b')).toBeUndefined()
+    expect(cache.get('a')).toBeDefined()
+    expect(cache.totalBytes).toBe(8)
+
+    cache.set('huge', Buffer.alloc(11))
+    expect(cache.get('huge')).toBeUndefined()
+  })
+})
+
+describe('getOrRenderQrImage', () => {
+  it('renders a key once and serves repeats from cache', async () => {
+    clearQrImageMemoryCache()
+    const key = getQrImageKey(getQrRenderInput({ ...qrCode, id: `qr-${Date.now()}`, url: `https://example.com/${Math.random()}` }, 'https://app.test'), 'svg')
+    let renders = 0
+    const render = async () => {
+      renders++
+      return Buffer.from('<svg/>')
+    }
+
+    const [first, second] = await Promise.all([getOrRenderQrImage(key, render), getOrRenderQrImage(key, render)])
+    expect(first.toString()).toBe('<svg/>')
+    expect(second).toBe(first)
+    expect((await getOrRenderQrImage(key, render)).toString()).toBe('<svg/>')
+    expect(renders).toBe(1)
+    expect(await getCachedQrImage(key)).toBe(first)
+  })
+})
+
+describe('serveQrImage', () => {
+  it('only serves cached bytes for the code and format they were rendered for', async () => {
+    clearQrImageMemoryCache()
+    const other = { ...qrCode, id: 'qr-b', url: `https://example.com/b/${Math.random()}` }
+    const version = getQrImageKey(getQrRenderInput(other, 'https://app.test'), 'svg')
+    await getOrRenderQrImage(getQrImageCacheKey('qr-b', 'svg', version), async () => Buffer.from('<svg>b</svg>'))
+
+    vi.mocked(supabaseAdmin!.from).mockImplementation((() => {
+      let id = ''
+      const query = {
+        select: vi.fn(() => query),
+        eq: vi.fn((_column: string, value: string) => {
+          id = value
+          return query
+        }),
+        maybeSingle: vi.fn(() => Promise.resolve({ data: id === 'qr-b' ? other : { ...qrCode, id }, error: null })),
+      }
+      return query
+    }) as never)
+
+    const own = await serveQrImage(new NextRequest(`https://app.test/api/qr-codes/qr-b/image.svg?v=${version}`), 'qr-b', 'svg')
+    expect(own.status).toBe(200)
+    expect(await own.text()).toBe('<svg>b</svg>')
+    expect(supabaseAdmin!.from).not.toHaveBeenCalled()
+
+    // Another code's version, or this code's version in another format, is looked up and redirected
+    for (const [id, format] of [['qr-a', 'svg'], ['qr-a', 'png'], ['qr-b', 'png']] as const) {
+      const response = await serveQrImage(new NextRequest(`https://app.test/api/qr-codes/${id}/image.${format}?v=${version}`), id, format)
+      expect(response.status).toBe(302)
+      expect(response.headers.get('location')).not.toContain(version)
+    }
+  })
+})
@@ -0,0 +1,33 @@
+/**
+ * Tests for the bit-packed, memoized QR module matrix
+ */
+
+import { describe, it, expect } from 'vitest'
+import { PackedQrMatrix, getQrMatrix, clearQrMatrixCache } from '@/lib/qr-matrix'
+
+describe('PackedQrMatrix', () => {
+  it('stores one bit per module', () => {
+    const pattern = (row: number, col: number) => (row * 3 + col * 5) % 7 < 3
+    const packed = PackedQrMatrix.from({ size: 25, isDark: pattern })
+
+    expect(packed.size).toBe(25)
+    expect(packed.byteLength).toBe(Math.ceil((25 * 25) / 8))
+    for (let row = 0; row < 25; row++) {
+      for (let col = 0; col < 25; col++) {
+        expect(packed.isDark(row, col)).toBe(pattern(row, col))
+      }
+    }
+  })
+})
+
+describe('getQrMatrix', () => {
+  it('encodes each (data, level, version) once', () => {
+    clearQrMatrixCache()
+    const matrix = getQrMatrix('https://example.com')
+
+    expect(getQrMatrix('https://example.com')).toBe(matrix)
+    expect(getQrMatrix('https://example.com', 'L')).not.toBe(matrix)
+    expect(getQrMatrix('https://example.com', 'H', 10)).not.toBe(matrix)
+    expect(getQrMatrix('https://example.com', 'H', 10).size).toBe(57)
+  })
+})
@@ -0,0 +1,86 @@
+/**
+ * Tests for per-QR-code rate limiting
+ */
+
+import { describe, it, expect, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { QrCodeRateLimiter, CountMinSketch, persistBlockedClients } from '@/lib/qr-rate-limit'
+
+describe('QR Code Rate Limiting', () => {
+  const config = { windowSize: 60, maxRequests: 3 }
+
+  it('should allow requests when no rateLimitConfig is set', () => {
+    const limiter = new QrCodeRateLimiter()
+    expect(limiter.check('qr-1', '1.1.1.1', null).allowed).toBe(true)
+    expect(limiter.getStats().exactKeys).toBe(0)
+  })
+
+  it('should block a client after maxRequests within the window', () => {
+    const limiter = new QrCodeRateLimiter()
+    const now = 1_000_000
+
+    for (let i = 0; i < 3; i++) {
+      expect(limiter.check('qr-1', '1.1.1.1', config, now + i).allowed).toBe(true)
+    }
+
+    const blocked = limiter.check('qr-1', '1.1.1.1', config, now + 10_000)
+    expect(blocked.allowed).toBe(false)
+    expect(blocked.retryAfter).toBe(50)
+
+    // Other clients and other codes are counted separately
+    expect(limiter.check('qr-1', '2.2.2.2', config, now).allowed).toBe(true)
+    expect(limiter.check('qr-2', '1.1.1.1', config, now).allowed).toBe(true)
+
+    // A new window starts once the old one has elapsed
+    expect(limiter.check('qr-1', '1.1.1.1', config, now + 60_000).allowed).toBe(true)
+  })
+
+  it('should evict least recently used keys beyond maxKeys', () => {
+    const limiter = new QrCodeRateLimiter({ maxKeys: 2 })
+    limiter.check('qr-1', '1.1.1.1', config, 0)
+    limiter.check('qr-1', '2.2.2.2', config, 0)
+    limiter.check('qr-1', '3.3.3.3', config, 0)
+    expect(limiter.getStats().exactKeys).toBe(2)
+  })
+
+  it('should switch a code with many distinct clients to sketch mode', () => {
+    const limiter = new QrCodeRateLimiter({ sketchThreshold: 10 })
+
+    for (let i = 0; i < 20; i++) {
+      limiter.check('qr-hot', `10.0.0.${i}`, config, 0)
+    }
+    expect(limiter.getStats()).toMatchObject({ exactKeys: 0, sketchCodes: 1 })
+
+    limiter.check('qr-hot', '10.0.0.1', config, 1)
+    limiter.check('qr-hot', '10.0.0.1', config, 2)
+    expect(limiter.check('qr-hot', '10.0.0.1', config, 3).allowed).toBe(false)
+    expect(limiter.check('qr-hot', '10.0.0.99', config, 3).allowed).toBe(true)
+  })
+
+  it('should never underestimate counts in the sketch', () => {
+    const sketch = new CountMinSketch(64, 4)
+    for (let i = 0; i < 500; i++) sketch.add(`ip-${i % 50}`)
+    for (let i = 0; i < 50; i++) {
+      expect(sketch.estimate(`ip-${i}`)).toBeGreaterThanOrEqual(10)
+    }
+  })
+
+  it('should persist blocked clients once for audit', async () => {
+    const insert = vi.fn().mockResolvedValue({ error: null })
+    vi.mocked(supabaseAdmin!.from).mockReturnValue({ insert } as never)
+
+    const limiter = new QrCodeRateLimiter()
+    for (let i = 0; i < 5; i++) limiter.check('qr-1', '1.1.1.1', config, i)
+
+    expect(await persistBlockedClients(limiter)).toBe(1)
+    expect(insert.mock.calls[0][0][0]).toMatchObject({ qrCodeId: 'qr-1', ipAddress: '1.1.1.1', isBlocked: true })
+    expect(await persistBlockedClients(limiter)).toBe(0)
+  })
+})
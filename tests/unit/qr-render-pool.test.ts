@@ -0,0 +1,43 @@
+/**
+ * Tests for the QR render thread pool's failure handling
+ */
+
+import { describe, it, expect } from 'vitest'
+import { QrRenderPool, renderQrTask } from '@/lib/qr-render-pool'
+import type { QrRenderInput } from '@/lib/qr-render'
+
+// Worker entries as data: URLs, standing in for a built entry that is broken or flaky
+const workerUrl = (source: string) => new URL(`data:text/javascript,${encodeURIComponent(source)}`)
+
+const input: QrRenderInput = { data: 'https://example.com', width: 200, height: 200 }
+
+describe('QrRenderPool', () => {
+  it('renders in-process when no worker thread can start', async () => {
+    const pool = new QrRenderPool(2, workerUrl("throw new Error('Cannot find module qr-render-worker')"))
+    try {
+      const renders = await Promise.all([1, 2, 3].map(() => pool.render(input, 'svg')))
+      const expected = await renderQrTask({ id: 0, input, format: 'svg', scale: 1 })
+
+      expect(pool.isInProcess).toBe(true)
+      for (const body of renders) {
+        expect(body.toString()).toBe(expected.toString())
+      }
+    } finally {
+      await pool.destroy()
+    }
+  })
+
+  it('fails only the running task when a started thread dies', async () => {
+    const pool = new QrRenderPool(1, workerUrl(`
+      import { parentPort } from 'worker_threads'
+      parentPort.on('message', () => process.exit(3))
+      parentPort.postMessage({ ready: true })
+    `))
+    try {
+      await expect(pool.render(input, 'svg')).rejects.toThrow('Render worker exited with code 3')
+      expect(pool.isInProcess).toBe(false)
+    } finally {
+      await pool.destroy()
+    }
+  })
+})
@@ -0,0 +1,83 @@
+/**
+ * Golden-image tests for server-side QR rendering
+ * Set UPDATE_QR_FIXTURES=1 to rewrite tests/fixtures/qr-render after an
+ * intended drawing change (and bump RENDERER_VERSION in qr-image.ts).
+ */
+
+import { describe, it, expect } from 'vitest'
+import fs from 'fs'
+import path from 'path'
+import sharp from 'sharp'
+import { buildQrSvg, type QrSvgOptions } from '@/lib/qr-svg'
+import { rasterizeQrSvg } from '@/lib/qr-render'
+import type { QrMatrix } from '@/lib/qr-matrix'
+
+const FIXTURES = path.join(process.cwd(), 'tests/fixtures/qr-render')
+const UPDATE = process.env.UPDATE_QR_FIXTURES === '1'
+
+// 25 x 25 (version 2) module pattern standing in for an encoded payload
+const matrix: QrMatrix = { size: 25, isDark: (row, col) => (row * 7 + col * 13 + row * col) % 5 < 2 }
+
+// 4 x 2 solid red PNG
+const LOGO = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAQAAAACCAIAAADwyuo0AAAAEklEQVR4nGO8o6HBAANMDEgAAB0iATCeXvHfAAAAAElFTkSuQmCC'
+
+const CASES: Record<string, QrSvgOptions> = {
+  square: { width: 300, height: 300, foregroundColor: '#000000', backgroundColor: '#ffffff' },
+  'rounded-gradient': {
+    width: 300,
+    height: 300,
+    foregroundColor: '#e53e3e',
+    backgroundColor: '#ffffff',
+    dotType: 'rounded',
+    cornerType: 'extra-rounded',
+    gradient: { type: 'linear', colors: ['#e53e3e', '#3182ce'], direction: 45 },
+  },
+  'dots-circle-logo': {
+    width: 300,
+    height: 300,
+    foregroundColor: '#1a365d',
+    backgroundColor: '#fefcbf',
+    dotType: 'dots',
+    cornerType: 'classy',
+    shape: 'circle',
+    logo: { image: LOGO, width: 4, height: 2, size: 0.25, margin: 5 },
+  },
+}
+
+async function readPixels(png: Buffer) {
+  const { data, info } = await sharp(png).removeAlpha().raw().toBuffer({ resolveWithObject: true })
+  return { data, width: info.width, height: info.height }
+}
+
+describe('QR render fixtures', () => {
+  for (const [name, options] of Object.entries(CASES)) {
+    it(`renders ${name} like its SVG and PNG fixtures`, async () => {
+      const svg = buildQrSvg(matrix, options)
+      const png = await rasterizeQrSvg(svg, 1, options.backgroundColor)
+      const svgFile = path.join(FIXTURES, `${name}.svg`)
+      const pngFile = path.join(FIXTURES, `${name}.png`)
+      if (UPDATE) {
+        fs.writeFileSync(svgFile, svg)
+        fs.writeFileSync(pngFile, png)
+      }
+
+      expect(svg).toBe(fs.readFileSync(svgFile, 'utf8'))
+
+      // Rasterizer versions differ in edge antialiasing, so compare pixels with a tolerance
+      const actual = await readPixels(png)
+      const expected = await readPixels(fs.readFileSync(pngFile))
+      expect([actual.width, actual.height]).toEqual([expected.width, expected.height])
+
+      let differing = 0
+      for (let i = 0; i < actual.data.length; i += 3) {
+        const delta = Math.max(
+          Math.abs(actual.data[i] - expected.data[i]),
+          Math.abs(actual.data[i + 1] - expected.data[i + 1]),
+          Math.abs(actual.data[i + 2] - expected.data[i + 2])
+        )
+        if (delta > 48) differing++
+      }
+      expect(differing / (actual.width * actual.height)).toBeLessThan(0.005)
+    })
+  }
+})
@@ -0,0 +1,115 @@
+/**
+ * Tests for cached servable QR code resolution
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { resolveServableQrCode, invalidateServableQrCode } from '@/lib/qr-resolution'
+
+function mockQrCodeQuery(result: { data: unknown; error: unknown }) {
+  const maybeSingle = vi.fn().mockResolvedValue(result)
+  const query = {
+    select: vi.fn().mockReturnThis(),
+    eq: vi.fn().mockReturnThis(),
+    maybeSingle,
+  }
+  query.select.mockReturnValue(query)
+  query.eq.mockReturnValue(query)
+  vi.mocked(supabaseAdmin!.from).mockReturnValue(query as never)
+  return maybeSingle
+}
+
+describe('Servable QR Code Resolution', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('should serve repeat lookups from the cache', async () => {
+    const maybeSingle = mockQrCodeQuery({
+      data: { id: 'qr-cached', isActive: true, url: 'https://example.com' },
+      error: null,
+    })
+
+    const first = await resolveServableQrCode('qr-cached')
+    const second = await resolveServableQrCode('qr-cached')
+
+    expect(first?.url).toBe('https://example.com')
+    expect(second?.url).toBe('https://example.com')
+    expect(maybeSingle).toHaveBeenCalledTimes(1)
+  })
+
+  it('should coalesce concurrent misses into one query', async () => {
+    const maybeSingle = mockQrCodeQuery({
+      data: { id: 'qr-burst', isActive: true, url: 'https://example.com' },
+      error: null,
+    })
+
+    await Promise.all([
+      resolveServableQrCode('qr-burst'),
+      resolveServableQrCode('qr-burst'),
+      resolveServableQrCode('qr-burst'),
+    ])
+
+    expect(maybeSingle).toHaveBeenCalledTimes(1)
+  })
+
+  it('should negatively cache unknown ids', async () => {
+    const maybeSingle = mockQrCodeQuery({ data: null, error: null })
+
+    expect(await resolveServableQrCode('qr-missing')).toBeNull()
+    expect(await resolveServableQrCode('qr-missing')).toBeNull()
+    expect(maybeSingle).toHaveBeenCalledTimes(1)
+  })
+
+  it('should not cache database errors', async () => {
+    const consoleSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+    const maybeSingle = mockQrCodeQuery({ data: null, error: { message: 'timeout' } })
+
+    expect(await resolveServableQrCode('qr-error')).toBeNull()
+    expect(await resolveServableQrCode('qr-error')).toBeNull()
+    expect(maybeSingle).toHaveBeenCalledTimes(2)
+
+    consoleSpy.mockRestore()
+  })
+
+  it('should reload after invalidation', async () => {
+    mockQrCodeQuery({ data: { id: 'qr-updated', isActive: true, url: 'https://old.example.com' }, error: null })
+    await resolveServableQrCode('qr-updated')
+
+    mockQrCodeQuery({ data: { id: 'qr-updated', isActive: false, url: 'https://new.example.com' }, error: null })
+    await invalidateServableQrCode('qr-updated')
+
+    const reloaded = await resolveServableQrCode('qr-updated')
+    expect(reloaded?.url).toBe('https://new.example.com')
+    expect(reloaded?.isActive).toBe(false)
+  })
+  it('should not cache a load that was running when the code was invalidated', async () => {
+    let finishStaleLoad: (result: { data: unknown; error: unknown }) => void = () => {}
+    const maybeSingle = mockQrCodeQuery({
+      data: { id: 'qr-raced', isActive: false, url: 'https://new.example.com' },
+      error: null,
+    })
+    maybeSingle.mockImplementationOnce(() => new Promise(resolve => { finishStaleLoad = resolve }))
+
+    const staleLoad = resolveServableQrCode('qr-raced')
+    await new Promise(resolve => setTimeout(resolve, 0))
+    await invalidateServableQrCode('qr-raced')
+
+    // Scans after the invalidation start their own load
+    expect((await resolveServableQrCode('qr-raced'))?.isActive).toBe(false)
+    finishStaleLoad({ data: { id: 'qr-raced', isActive: true, url: 'https://old.example.com' }, error: null })
+    expect((await staleLoad)?.url).toBe('https://old.example.com')
+
+    const cached = await resolveServableQrCode('qr-raced')
+    expect(cached?.url).toBe('https://new.example.com')
+    expect(maybeSingle).toHaveBeenCalledTimes(2)
+  })
+})
+
@@ -0,0 +1,100 @@
+/**
+ * Tests for the DOM-free QR code SVG drawing
+ */
+
+import { describe, it, expect } from 'vitest'
+import { buildQrSvg, calculateImageSize } from '@/lib/qr-svg'
+import type { QrMatrix } from '@/lib/qr-matrix'
+
+// Every module dark: 21 x 21 (version 1), 99 of them belong to the finder patterns
+const solid: QrMatrix = { size: 21, isDark: () => true }
+
+function layerPath(svg: string, fill: string): string {
+  const match = svg.match(new RegExp(`<path fill="${fill}" d="([^"]*)"/>`))
+  return match ? match[1] : ''
+}
+
+// Modules covered by the merged square runs of a path
+function runModules(d: string, dotSize: number): number {
+  return Array.from(d.matchAll(/M[\d.]+ [\d.]+h(\d+)v\d+h-\d+z/g))
+    .reduce((total, run) => total + Number(run[1]) / dotSize, 0)
+}
+
+function count(haystack: string, needle: string): number {
+  return haystack.split(needle).length - 1
+}
+
+describe('buildQrSvg', () => {
+  it('lays modules out on the preview grid as one path per layer', () => {
+    const svg = buildQrSvg(solid, { width: 300, height: 300, foregroundColor: '#112233', backgroundColor: '#ffffff' })
+
+    expect(svg.startsWith('<svg width="300" height="300" xmlns="http://www.w3.org/2000/svg"')).toBe(true)
+    expect(svg).toContain('<rect width="300" height="300" fill="#ffffff"/>')
+    // Data modules, finder squares and finder dots
+    expect(count(svg, '<path ')).toBe(3)
+    expect(svg).not.toContain('<clipPath')
+
+    // floor(300 / 21) = 14px modules, centred with a 3px offset; rows merge into runs
+    const dots = layerPath(svg, '#112233')
+    expect(dots.startsWith('M101 3h98v14h-98z')).toBe(true)
+    expect(runModules(dots, 14)).toBe(21 * 21 - 99)
+    expect(svg).toContain('<path fill="#112233" fill-rule="evenodd" d="M3 3v98h98v-98zM17 17h70v70h-70z')
+    expect(svg).not.toContain('<image')
+  })
+
+  it('draws rounded modules into the same single path with quantized coordinates', () => {
+    const svg = buildQrSvg(solid, { width: 317, height: 317, dotType: 'dots', cornerType: 'extra-rounded', shape: 'star' })
+
+    expect(count(svg, '<path fill=')).toBe(3)
+    expect(layerPath(svg, '#000000')).toMatch(/^M[\d.]+ [\d.]+a7\.5 7\.5 0 1 0 15 0a7\.5 7\.5 0 1 0 -15 0z/)
+    expect(svg).not.toMatch(/\d\.\d{3}/)
+    expect(count(svg, 'id="shape-clip-star"')).toBe(1)
+  })
+
+  it('hides the modules under a logo and keeps its aspect ratio', () => {
+    const svg = buildQrSvg(solid, {
+      width: 300,
+      height: 300,
+      logo: { image: 'data:image/png;base64,AAAA', width: 100, height: 100, size: 0.25, margin: 5 },
+    })
+
+    // 25% of what level H recovers: 33 modules -> a 5 x 5 hole in the centre
+    expect(runModules(layerPath(svg, '#000000'), 14)).toBe(21 * 21 - 99 - 25)
+    expect(svg).toContain('<image href="data:image/png;base64,AAAA" x="120" y="120" width="60px" height="60px"/>')
+  })
+
+  it('adds shape, gradient, effects and watermark layers', () => {
+    const svg = buildQrSvg(solid, {
+      width: 300,
+      height: 300,
+      foregroundColor: '#000000',
+      backgroundColor: '#ffffff',
+      shape: 'circle',
+      gradient: { type: 'linear', colors: ['#ff0000', '#0000ff'] },
+      effects: { shadow: true },
+      watermark: true,
+      watermarkHref: 'data:image/png;base64,BBBB',
+    })
+
+    expect(svg).toContain('style="clip-path: url(#shape-clip-circle)" filter="url(#qr-effects)"')
+    expect(svg).toContain('<clipPath id="shape-clip-circle"><circle cx="150" cy="150" r="150"/></clipPath>')
+    expect(svg).toContain('<linearGradient x1="0%" y1="0%" x2="100%" y2="100%" id="qr-gradient">')
+    // Dots and each finder pattern take the gradient over their own box, the background keeps its color
+    expect(count(svg, 'fill="url(#qr-gradient)"')).toBe(7)
+    expect(svg).toContain('<rect x="0" y="0" width="300" height="300" clip-path="url(\'#clip-path-dot-color-0\')" fill="url(#qr-gradient)"/>')
+    expect(svg).toContain('<rect width="300" height="300" fill="#ffffff"/>')
+    expect(svg).toContain('<g id="botrix-watermark-layer"')
+    expect(svg).toContain('href="data:image/png;base64,BBBB"')
+    expect(svg.endsWith('</g></svg>')).toBe(true)
+  })
+
+  it('rejects sizes smaller than the module count', () => {
+    expect(() => buildQrSvg(solid, { width: 20, height: 20 })).toThrow('The canvas is too small.')
+  })
+})
+
+describe('calculateImageSize', () => {
+  it('fits wide logos within the hidden module budget', () => {
+    expect(calculateImageSize(200, 100, 33, 7, 14)).toEqual({ width: 84, height: 42, hideXDots: 7, hideYDots: 3 })
+  })
+})
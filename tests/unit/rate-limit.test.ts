@@ -0,0 +1,148 @@
+/**
+ * Tests for the pluggable rate limiter
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+  },
+}))
+
+import {
+  MemoryRateLimitBackend,
+  RedisRateLimitBackend,
+  rateLimit,
+  setRateLimitBackend,
+  getRateLimitHeaders,
+  type RateLimitBackend,
+} from '@/lib/rate-limit'
+import { MockRedis } from '../utils/mock-redis'
+
+const options = { key: 'ip:1.2.3.4', route: '/api/test:POST', windowSeconds: 10, maxRequests: 5 }
+
+describe('Rate Limiting', () => {
+  beforeEach(() => {
+    setRateLimitBackend(null)
+  })
+
+  describe('MemoryRateLimitBackend', () => {
+    it('should allow a full burst then deny', () => {
+      const backend = new MemoryRateLimitBackend()
+      const now = 1_000_000
+
+      const results = Array.from({ length: 5 }, () => backend.consumeAt(options, now))
+      expect(results.every(result => result.allowed)).toBe(true)
+      expect(results.map(result => result.remaining)).toEqual([4, 3, 2, 1, 0])
+
+      const denied = backend.consumeAt(options, now)
+      expect(denied.allowed).toBe(false)
+      expect(denied.remaining).toBe(0)
+      expect(denied.retryAfter).toBe(2)
+    })
+
+    it('should replenish at the emission interval', () => {
+      const backend = new MemoryRateLimitBackend()
+      const now = 1_000_000
+
+      for (let i = 0; i < 5; i++) backend.consumeAt(options, now)
+      expect(backend.consumeAt(options, now + 1000).allowed).toBe(false)
+      // One request every windowSeconds / maxRequests = 2s
+      expect(backend.consumeAt(options, now + 2000).allowed).toBe(true)
+      expect(backend.consumeAt(options, now + 2000).allowed).toBe(false)
+    })
+
+    it('should keep keys independent', () => {
+      const backend = new MemoryRateLimitBackend()
+      const now = 1_000_000
+
+      for (let i = 0; i < 5; i++) backend.consumeAt(options, now)
+      expect(backend.consumeAt({ ...options, key: 'ip:5.6.7.8' }, now).allowed).toBe(true)
+      expect(backend.consumeAt({ ...options, route: '/api/other:POST' }, now).allowed).toBe(true)
+    })
+
+    it('should evict least recently used keys beyond maxKeys', () => {
+      const backend = new MemoryRateLimitBackend({ maxKeys: 3 })
+      for (let i = 0; i < 10; i++) {
+        backend.consumeAt({ ...options, key: `ip:${i}` }, 1_000_000)
+      }
+      expect(backend.size).toBe(3)
+    })
+  })
+
+  describe('RedisRateLimitBackend', () => {
+    it('should enforce the limit against a Redis stand-in', async () => {
+      const redis = new MockRedis()
+      const backend = new RedisRateLimitBackend(redis)
+      const now = 1_000_000 // aligned to a 10s window boundary
+      redis.now = () => now
+
+      for (let i = 0; i < 5; i++) {
+        expect((await backend.consumeAt(options, now)).allowed).toBe(true)
+      }
+      const denied = await backend.consumeAt(options, now)
+      expect(denied.allowed).toBe(false)
+      expect(denied.retryAfter).toBe(10)
+    })
+
+    it('should weight the previous window by overlap', async () => {
+      const redis = new MockRedis()
+      const backend = new RedisRateLimitBackend(redis)
+      const start = 1_000_000
+      redis.now = () => start
+
+      for (let i = 0; i < 5; i++) await backend.consumeAt(options, start)
+
+      // Halfway into the next window half of the previous window's 5 requests still count
+      redis.now = () => start + 15000
+      const results = []
+      for (let i = 0; i < 4; i++) results.push((await backend.consumeAt(options, start + 15000)).allowed)
+      expect(results).toEqual([true, true, true, false])
+    })
+
+    it('should use one pipelined round-trip per request', async () => {
+      const redis = new MockRedis()
+      const pipeline = vi.spyOn(redis, 'pipeline')
+      const backend = new RedisRateLimitBackend(redis)
+
+      await backend.consume(options)
+      expect(pipeline).toHaveBeenCalledTimes(1)
+    })
+  })
+
+  describe('rateLimit', () => {
+    it('should fail open when every backend fails', async () => {
+      const consoleSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+      const failing: RateLimitBackend = {
+        name: 'redis',
+        consume: async () => {
+          throw new Error('connection refused')
+        },
+      }
+      setRateLimitBackend(failing)
+
+      const result = await rateLimit(options)
+      expect(result.allowed).toBe(true)
+      expect(result.limit).toBe(5)
+
+      consoleSpy.mockRestore()
+    })
+  })
+
+  describe('getRateLimitHeaders', () => {
+    it('should emit RateLimit-* headers and Retry-After when denied', () => {
+      expect(getRateLimitHeaders({ allowed: true, limit: 5, remaining: 3, reset: 4 })).toEqual({
+        'RateLimit-Limit': '5',
+        'RateLimit-Remaining': '3',
+        'RateLimit-Reset': '4',
+      })
+      expect(getRateLimitHeaders({ allowed: false, retryAfter: 2, limit: 5, remaining: 0, reset: 10 })).toEqual({
+        'RateLimit-Limit': '5',
+        'RateLimit-Remaining': '0',
+        'RateLimit-Reset': '10',
+        'Retry-After': '2',
+      })
+    })
+  })
+})
@@ -0,0 +1,93 @@
+/**
+ * Tests for the compiled redirect-rule engine
+ */
+
+import { describe, it, expect } from 'vitest'
+import {
+  AliasTable,
+  classifyUserAgent,
+  compileRedirectRules,
+  evaluateRedirect,
+  getCompiledRedirectRules,
+  simulateRedirects,
+} from '@/lib/redirect-rules'
+import type { ServableQrCode } from '@/lib/qr-resolution'
+
+const IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)'
+const ANDROID = 'Mozilla/5.0 (Linux; Android 14; Pixel 8)'
+
+// Deterministic PRNG so sampling assertions are stable
+function seeded(seed: number) {
+  return () => {
+    seed = (seed * 1664525 + 1013904223) >>> 0
+    return seed / 4294967296
+  }
+}
+
+describe('Redirect Rules', () => {
+  const base = {
+    url: 'https://example.com',
+    redirectUrl: null,
+    deviceRedirection: null,
+    geoRedirection: null,
+    abTestConfig: null,
+  }
+
+  it('should classify user agents', () => {
+    expect(classifyUserAgent(IPHONE)).toBe('ios')
+    expect(classifyUserAgent(ANDROID)).toBe('android')
+    expect(classifyUserAgent('curl/8.0')).toBe('desktop')
+    expect(classifyUserAgent(IPHONE)).toBe('ios')
+  })
+
+  it('should apply device, then country, then city targeting', () => {
+    const rules = compileRedirectRules({
+      ...base,
+      deviceRedirection: { ios: 'https://example.com/ios' },
+      geoRedirection: {
+        countries: { DE: 'https://example.com/de' },
+        cities: { Berlin: 'https://example.com/berlin' },
+      },
+    })
+
+    expect(evaluateRedirect(rules, { userAgent: IPHONE }).url).toBe('https://example.com/ios')
+    expect(evaluateRedirect(rules, { userAgent: IPHONE, country: 'DE' }).url).toBe('https://example.com/de')
+    expect(evaluateRedirect(rules, { userAgent: IPHONE, country: 'DE', city: 'Berlin' }).url).toBe('https://example.com/berlin')
+    expect(evaluateRedirect(rules, { userAgent: ANDROID, country: 'US' }).url).toBe('https://example.com')
+  })
+
+  it('should sample A/B variants in proportion to their weights', () => {
+    const table = new AliasTable(['a', 'b', 'c'], [1, 2, 7])
+    const random = seeded(42)
+    const counts: Record<string, number> = { a: 0, b: 0, c: 0 }
+    for (let i = 0; i < 100000; i++) counts[table.sample(random)]++
+
+    expect(counts.a / 100000).toBeCloseTo(0.1, 1)
+    expect(counts.b / 100000).toBeCloseTo(0.2, 1)
+    expect(counts.c / 100000).toBeCloseTo(0.7, 1)
+  })
+
+  it('should record the variant even when it has no URL of its own', () => {
+    const rules = compileRedirectRules({
+      ...base,
+      abTestConfig: { variants: { control: { weight: 0 }, test: { url: 'https://example.com/test', weight: 0 } } },
+    })
+
+    // All weights zero: the first variant always wins
+    expect(evaluateRedirect(rules, {})).toEqual({ url: 'https://example.com', abTestVariant: 'control' })
+  })
+
+  it('should recompile only when the QR version changes', () => {
+    const qrCode = { ...base, id: 'qr-rules', version: 1, updatedAt: '2025-01-01T00:00:00.000Z' } as ServableQrCode
+    const first = getCompiledRedirectRules(qrCode)
+    expect(getCompiledRedirectRules({ ...qrCode })).toBe(first)
+    expect(getCompiledRedirectRules({ ...qrCode, version: 2, url: 'https://example.com/v2' }).defaultUrl).toBe('https://example.com/v2')
+  })
+
+  it('should simulate a batch of scans', () => {
+    const rules = compileRedirectRules({ ...base, deviceRedirection: { android: 'https://example.com/android' } })
+    const result = simulateRedirects(rules, [{ userAgent: IPHONE }, { userAgent: ANDROID }], 1000)
+
+    expect(result.urls).toEqual({ 'https://example.com': 500, 'https://example.com/android': 500 })
+  })
+})
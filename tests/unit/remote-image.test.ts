@@ -0,0 +1,82 @@
+/**
+ * Tests for fetching user-supplied logo URLs on the server
+ */
+
+import { describe, it, expect, beforeAll, afterAll } from 'vitest'
+import http from 'http'
+import type { AddressInfo } from 'net'
+import { fetchRemoteImage, isPublicAddress } from '@/lib/remote-image'
+
+describe('isPublicAddress', () => {
+  it('rejects loopback, private, link-local and mapped addresses', () => {
+    for (const address of ['127.0.0.1', '10.0.0.5', '172.16.4.1', '192.168.1.1', '169.254.169.254', '100.64.0.1', '0.0.0.0', '::1', '::', 'fd12::1', 'fe80::1', '::ffff:127.0.0.1', '::ffff:a9fe:a9fe']) {
+      expect(isPublicAddress(address)).toBe(false)
+    }
+    expect(isPublicAddress('93.184.216.34')).toBe(true)
+    expect(isPublicAddress('2606:4700::1111')).toBe(true)
+    expect(isPublicAddress('example.com')).toBe(false)
+  })
+})
+
+describe('fetchRemoteImage', () => {
+  // Stands in for our own storage, which is exempt from the address checks
+  let server: http.Server
+  let origin = ''
+
+  beforeAll(async () => {
+    server = http.createServer((req, res) => {
+      if (req.url === '/logo.png') {
+        res.writeHead(200, { 'content-type': 'image/png' })
+        res.end(Buffer.from([0x89, 0x50, 0x4e, 0x47]))
+      } else if (req.url === '/redirect.png') {
+        res.writeHead(302, { location: 'http://169.254.169.254/latest/meta-data' })
+        res.end()
+      } else if (req.url === '/declared.png') {
+        res.writeHead(200, { 'content-type': 'image/png', 'content-length': '4096' })
+        res.end(Buffer.alloc(4096))
+      } else if (req.url === '/streamed.png') {
+        res.writeHead(200, { 'content-type': 'image/png' })
+        res.write(Buffer.alloc(600))
+        res.end(Buffer.alloc(600))
+      } else {
+        // Never answers
+      }
+    })
+    await new Promise<void>(resolve => server.listen(0, '127.0.0.1', resolve))
+    origin = `http://127.0.0.1:${(server.address() as AddressInfo).port}`
+  })
+
+  afterAll(async () => {
+    server.closeAllConnections()
+    await new Promise(resolve => server.close(resolve))
+  })
+
+  it('only fetches https URLs on public hosts', async () => {
+    await expect(fetchRemoteImage('http://example.com/logo.png')).rejects.toThrow('must use https')
+    await expect(fetchRemoteImage('file:///etc/passwd')).rejects.toThrow('must use https')
+    await expect(fetchRemoteImage('https://169.254.169.254/latest/meta-data')).rejects.toThrow('not a public address')
+    await expect(fetchRemoteImage('https://[::1]/logo.png')).rejects.toThrow('not a public address')
+    await expect(fetchRemoteImage('https://localhost/logo.png')).rejects.toThrow('resolves to a non-public address')
+    // The local server is only reachable as a trusted origin
+    await expect(fetchRemoteImage(`${origin}/logo.png`)).rejects.toThrow('must use https')
+  })
+
+  it('reads an image from a trusted origin', async () => {
+    const image = await fetchRemoteImage(`${origin}/logo.png`, { trustedOrigins: [origin] })
+    expect(image.mimeType).toBe('image/png')
+    expect(image.buffer.length).toBe(4)
+  })
+
+  it('does not follow redirects', async () => {
+    await expect(fetchRemoteImage(`${origin}/redirect.png`, { trustedOrigins: [origin] })).rejects.toThrow('redirects are not followed')
+  })
+
+  it('caps the body size, declared or streamed', async () => {
+    await expect(fetchRemoteImage(`${origin}/declared.png`, { trustedOrigins: [origin], maxBytes: 1024 })).rejects.toThrow('larger than 1024 bytes')
+    await expect(fetchRemoteImage(`${origin}/streamed.png`, { trustedOrigins: [origin], maxBytes: 1024 })).rejects.toThrow('larger than 1024 bytes')
+  })
+
+  it('gives up at the deadline', async () => {
+    await expect(fetchRemoteImage(`${origin}/slow.png`, { trustedOrigins: [origin], timeoutMs: 50 })).rejects.toThrow('timed out')
+  })
+})
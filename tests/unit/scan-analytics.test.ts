@@ -0,0 +1,70 @@
+/**
+ * Tests for database-side scan analytics
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { getScanAnalytics } from '@/lib/scan-analytics'
+
+function mockRecentScans(result: { data: unknown; error: unknown }) {
+  const query = {
+    select: vi.fn().mockReturnThis(),
+    eq: vi.fn().mockReturnThis(),
+    order: vi.fn().mockReturnThis(),
+    limit: vi.fn().mockResolvedValue(result),
+  }
+  vi.mocked(supabaseAdmin!.from).mockReturnValue(query as never)
+  return query
+}
+
+describe('Scan Analytics', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('should combine RPC aggregates with the ten most recent scans', async () => {
+    vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({
+      data: {
+        totalScans: 3,
+        uniqueDevices: 2,
+        uniqueCountries: 1,
+        uniqueCities: 0,
+        scansByDate: { '2025-01-01': 3 },
+        scansByDevice: { Mobile: 2, Desktop: 1 },
+        scansByCountry: { US: 3 },
+      },
+      error: null,
+    } as never)
+    const query = mockRecentScans({ data: [{ id: 'scan-1' }], error: null })
+
+    const analytics = await getScanAnalytics('qr-1')
+
+    expect(supabaseAdmin!.rpc).toHaveBeenCalledWith('get_qr_scan_analytics', { p_qr_code_id: 'qr-1' })
+    expect(query.limit).toHaveBeenCalledWith(10)
+    expect(analytics).toEqual({
+      totalScans: 3,
+      uniqueDevices: 2,
+      uniqueCountries: 1,
+      uniqueCities: 0,
+      scansByDate: { '2025-01-01': 3 },
+      scansByDevice: { Mobile: 2, Desktop: 1 },
+      scansByCountry: { US: 3 },
+      recentScans: [{ id: 'scan-1' }],
+    })
+  })
+
+  it('should throw when the aggregation fails', async () => {
+    vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({ data: null, error: { message: 'timeout' } } as never)
+    mockRecentScans({ data: [], error: null })
+
+    await expect(getScanAnalytics('qr-1')).rejects.toThrow('Failed to aggregate scans')
+  })
+})
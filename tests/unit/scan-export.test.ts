@@ -0,0 +1,140 @@
+/**
+ * Tests for the streaming scan export
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+  },
+}))
+
+vi.mock('next-auth/next', () => ({
+  getServerSession: vi.fn(),
+}))
+
+vi.mock('@/lib/auth', () => ({
+  authOptions: {},
+}))
+
+import { NextRequest } from 'next/server'
+import { getServerSession } from 'next-auth/next'
+import { supabaseAdmin } from '@/lib/supabase'
+import { iterateScanPages, createExportStream, toCsvLine } from '@/lib/scan-export'
+import { POST } from '@/app/api/qr-codes/export/route'
+
+function mockScanPages(pages: Array<Array<Record<string, unknown>>>) {
+  const query = {
+    select: vi.fn().mockReturnThis(),
+    eq: vi.fn().mockReturnThis(),
+    gte: vi.fn().mockReturnThis(),
+    lte: vi.fn().mockReturnThis(),
+    or: vi.fn().mockReturnThis(),
+    order: vi.fn().mockReturnThis(),
+    limit: vi.fn(),
+  }
+  for (const page of pages) {
+    query.limit.mockResolvedValueOnce({ data: page, error: null })
+  }
+  vi.mocked(supabaseAdmin!.from).mockReturnValue(query as never)
+  return query
+}
+
+describe('Scan Export', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('should page with a keyset cursor instead of offsets', async () => {
+    const query = mockScanPages([
+      [
+        { id: 'a', qrCodeId: 'qr-1', scannedAt: '2025-01-01T00:00:00+00:00' },
+        { id: 'b', qrCodeId: 'qr-1', scannedAt: '2025-01-01T00:00:01+00:00' },
+      ],
+      [{ id: 'c', qrCodeId: 'qr-1', scannedAt: '2025-01-01T00:00:02+00:00' }],
+    ])
+
+    const pages = []
+    for await (const page of iterateScanPages(['qr-1'], { pageSize: 2, range: { start: '2025-01-01', end: '2025-01-31' } })) {
+      pages.push(page)
+    }
+
+    expect(pages.map(page => page.length)).toEqual([2, 1])
+    expect(query.gte).toHaveBeenCalledWith('scannedAt', '2025-01-01T00:00:00.000Z')
+    expect(query.or).toHaveBeenCalledWith(
+      'scannedAt.gt."2025-01-01T00:00:01+00:00",and(scannedAt.eq."2025-01-01T00:00:01+00:00",id.gt."b")'
+    )
+  })
+
+  it('should only produce chunks as the consumer reads', async () => {
+    let produced = 0
+    async function* source() {
+      for (let i = 0; i < 5; i++) {
+        produced++
+        yield `line ${i}\n`
+      }
+    }
+
+    const reader = createExportStream(source()).getReader()
+    const first = await reader.read()
+    expect(new TextDecoder().decode(first.value)).toBe('line 0\n')
+    expect(produced).toBeLessThan(5)
+
+    await reader.cancel()
+  })
+
+  it('should escape CSV fields', () => {
+    expect(toCsvLine(['a "quoted" value', null, 3])).toBe('"a ""quoted"" value","","3"\n')
+  })
+})
+
+describe('POST /api/qr-codes/export (stream)', () => {
+  const QR_CODE = { id: 'qr-1', title: 'Menu', url: 'https://example.com', isDynamic: true, isActive: true, createdAt: '2025-01-01T00:00:00Z' }
+
+  function exportRequest(body: Record<string, unknown>) {
+    return new NextRequest('https://app.test/api/qr-codes/export', {
+      method: 'POST',
+      body: JSON.stringify({ qrCodeIds: ['qr-1'], ...body }),
+    })
+  }
+
+  function mockTables() {
+    const tables: string[] = []
+    vi.mocked(supabaseAdmin!.from).mockImplementation(((table: string) => {
+      tables.push(table)
+      const query = {
+        select: vi.fn(() => query),
+        in: vi.fn(() => query),
+        eq: vi.fn(() => Promise.resolve({ data: [QR_CODE], error: null })),
+      }
+      return query
+    }) as never)
+    return tables
+  }
+
+  beforeEach(() => {
+    vi.clearAllMocks()
+    vi.mocked(getServerSession).mockResolvedValue({ user: { id: 'user-1' } } as never)
+  })
+
+  it('should reject formats that cannot be streamed', async () => {
+    for (const format of ['json', 'xlsx']) {
+      const response = await POST(exportRequest({ format, stream: true }))
+      expect(response.status).toBe(400)
+    }
+  })
+
+  it('should leave raw scans out when analytics are not included, like the buffered export', async () => {
+    const tables = mockTables()
+
+    const response = await POST(exportRequest({ format: 'csv', stream: true, includeAnalytics: false, includeScans: true }))
+    const csv = await response.text()
+
+    expect(response.status).toBe(200)
+    expect(csv.split('\n')[0]).toContain('"Total Scans"')
+    expect(csv).toContain('"qr-1","Menu"')
+    expect(tables).toEqual(['QrCode'])
+  })
+})
+
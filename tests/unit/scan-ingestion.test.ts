@@ -0,0 +1,178 @@
+/**
+ * Tests for the write-behind scan ingestion buffer
+ */
+
+import { describe, it, expect, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+import { BatchWriteError } from '@/lib/write-behind-buffer'
+import {
+  ScanIngestionBuffer,
+  aggregateScanCounts,
+  type ScanEvent,
+  type ScanCountDelta,
+} from '@/lib/scan-ingestion'
+
+function makeScan(qrCodeId: string, scannedAt: string): ScanEvent {
+  return { id: `${qrCodeId}-${scannedAt}`, qrCodeId, scannedAt, device: 'Mobile' }
+}
+
+describe('Scan Ingestion Buffer', () => {
+  describe('aggregateScanCounts', () => {
+    it('should produce one delta per QR code with the latest scan time', () => {
+      const deltas = aggregateScanCounts([
+        makeScan('qr-1', '2025-01-01T00:00:01.000Z'),
+        makeScan('qr-2', '2025-01-01T00:00:02.000Z'),
+        makeScan('qr-1', '2025-01-01T00:00:03.000Z'),
+      ])
+
+      expect(deltas).toEqual([
+        { qrCodeId: 'qr-1', count: 2, lastScannedAt: '2025-01-01T00:00:03.000Z' },
+        { qrCodeId: 'qr-2', count: 1, lastScannedAt: '2025-01-01T00:00:02.000Z' },
+      ])
+    })
+  })
+
+  describe('ScanIngestionBuffer', () => {
+    it('should flush in batches of maxBatchSize', async () => {
+      const batches: Array<{ events: ScanEvent[]; deltas: ScanCountDelta[] }> = []
+      const buffer = new ScanIngestionBuffer(
+        { maxBatchSize: 2, capacity: 10, flushIntervalMs: 60000 },
+        async (events, deltas) => {
+          batches.push({ events, deltas })
+        }
+      )
+
+      // Stay below maxBatchSize so no automatic flush is triggered
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:01.000Z'))
+      expect(buffer.size).toBe(1)
+
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:02.000Z'))
+      await buffer.enqueue(makeScan('qr-2', '2025-01-01T00:00:03.000Z'))
+      await buffer.drain()
+
+      expect(buffer.size).toBe(0)
+      expect(batches.flatMap(batch => batch.events)).toHaveLength(3)
+      expect(batches.every(batch => batch.events.length <= 2)).toBe(true)
+      expect(batches[0].deltas).toEqual([
+        { qrCodeId: 'qr-1', count: 2, lastScannedAt: '2025-01-01T00:00:02.000Z' },
+      ])
+    })
+
+    it('should track buffered scans per QR code until they are flushed', async () => {
+      const buffer = new ScanIngestionBuffer(
+        { maxBatchSize: 10, capacity: 10, flushIntervalMs: 60000 },
+        async () => {}
+      )
+
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:01.000Z'))
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:02.000Z'))
+      await buffer.enqueue(makeScan('qr-2', '2025-01-01T00:00:03.000Z'))
+      expect(buffer.pendingCount('qr-1')).toBe(2)
+      expect(buffer.pendingCount('qr-2')).toBe(1)
+
+      await buffer.drain()
+      expect(buffer.pendingCount('qr-1')).toBe(0)
+      expect(buffer.pendingCount('qr-2')).toBe(0)
+    })
+
+    it('should requeue a batch when the writer fails', async () => {
+      let fail = true
+      const written: ScanEvent[] = []
+      const buffer = new ScanIngestionBuffer(
+        { maxBatchSize: 10, capacity: 10, flushIntervalMs: 60000 },
+        async events => {
+          if (fail) throw new Error('database unavailable')
+          written.push(...events)
+        }
+      )
+      const consoleSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:01.000Z'))
+      expect(await buffer.flush()).toBe(0)
+      expect(buffer.size).toBe(1)
+
+      fail = false
+      expect(await buffer.flush()).toBe(1)
+      expect(written).toHaveLength(1)
+      expect(buffer.getStats().failedBatches).toBe(1)
+
+      buffer.stop()
+      consoleSpy.mockRestore()
+    })
+
+    it('should dead-letter rows that can never be written and flush the rest', async () => {
+      const written: ScanEvent[] = []
+      const buffer = new ScanIngestionBuffer(
+        { maxBatchSize: 10, capacity: 10, flushIntervalMs: 60000 },
+        async events => {
+          // The QR code was deleted while its scan was buffered
+          if (events.some(event => event.qrCodeId === 'deleted')) {
+            throw new BatchWriteError('insert or update violates foreign key constraint', '23503')
+          }
+          written.push(...events)
+        }
+      )
+      const consoleSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:01.000Z'))
+      await buffer.enqueue(makeScan('deleted', '2025-01-01T00:00:02.000Z'))
+      await buffer.enqueue(makeScan('qr-2', '2025-01-01T00:00:03.000Z'))
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:04.000Z'))
+
+      expect(await buffer.flush()).toBe(3)
+      expect(written.map(event => event.scannedAt)).toEqual([
+        '2025-01-01T00:00:01.000Z',
+        '2025-01-01T00:00:03.000Z',
+        '2025-01-01T00:00:04.000Z',
+      ])
+      expect(buffer.size).toBe(0)
+      expect(buffer.pendingCount('deleted')).toBe(0)
+      expect(buffer.getStats()).toMatchObject({ flushed: 3, deadLettered: 1, failedBatches: 0 })
+
+      buffer.stop()
+      consoleSpy.mockRestore()
+    })
+
+    it('should apply backpressure and reject when full and the writer cannot keep up', async () => {
+      const consoleSpy = vi.spyOn(console, 'error').mockImplementation(() => {})
+      const buffer = new ScanIngestionBuffer(
+        { maxBatchSize: 100, capacity: 2, flushIntervalMs: 60000, enqueueTimeoutMs: 20 },
+        async () => {
+          throw new Error('database unavailable')
+        }
+      )
+
+      expect(await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:01.000Z'))).toBe(true)
+      expect(await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:02.000Z'))).toBe(true)
+      expect(await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:03.000Z'))).toBe(false)
+      expect(buffer.getStats().rejected).toBe(1)
+
+      buffer.stop()
+      consoleSpy.mockRestore()
+    })
+
+    it('should make room by flushing when full and the writer succeeds', async () => {
+      const written: ScanEvent[] = []
+      const buffer = new ScanIngestionBuffer(
+        { maxBatchSize: 100, capacity: 2, flushIntervalMs: 60000, enqueueTimeoutMs: 1000 },
+        async events => {
+          written.push(...events)
+        }
+      )
+
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:01.000Z'))
+      await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:02.000Z'))
+      expect(await buffer.enqueue(makeScan('qr-1', '2025-01-01T00:00:03.000Z'))).toBe(true)
+
+      await buffer.drain()
+      expect(written).toHaveLength(3)
+    })
+  })
+})
@@ -0,0 +1,146 @@
+/**
+ * Tests for the server-side scan redirect path
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+import { NextRequest } from 'next/server'
+import { supabaseAdmin } from '@/lib/supabase'
+import { processScanRedirect, getScanRequestContext, normalizeRedirectUrl } from '@/lib/scan-redirect'
+import { GET } from '@/app/api/qr-codes/[id]/redirect/route'
+import { getPendingScanCount, drainScanBuffer } from '@/lib/scan-ingestion'
+
+function mockQrCode(data: Record<string, unknown> | null) {
+  vi.mocked(supabaseAdmin!.from).mockImplementation((() => {
+    const query = {
+      select: vi.fn(() => query),
+      eq: vi.fn(() => query),
+      maybeSingle: vi.fn(() => Promise.resolve({ data, error: null })),
+      single: vi.fn(() => Promise.resolve({ data, error: null })),
+      insert: vi.fn(() => Promise.resolve({ error: null })),
+    }
+    return query
+  }) as never)
+  vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({ data: null, error: null } as never)
+}
+
+const IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Safari/604.1'
+
+function scanRequest() {
+  return new NextRequest('https://example.com/api/qr-codes/qr-1/redirect', {
+    headers: {
+      'user-agent': IPHONE,
+      'x-forwarded-for': '203.0.113.7, 10.0.0.1',
+      'x-vercel-ip-country': 'DE',
+      'x-vercel-ip-city': 'M%C3%BCnchen',
+    },
+  })
+}
+
+describe('getScanRequestContext', () => {
+  it('should read the client and geo details from headers', () => {
+    expect(getScanRequestContext(scanRequest())).toEqual({
+      userAgent: IPHONE,
+      ipAddress: '203.0.113.7',
+      country: 'DE',
+      city: 'München',
+      device: 'Mobile',
+      browser: 'Safari',
+      os: 'iOS',
+    })
+  })
+})
+
+describe('normalizeRedirectUrl', () => {
+  it('should add https:// to destinations stored without a scheme', () => {
+    expect(normalizeRedirectUrl('example.com/menu?table=4')).toBe('https://example.com/menu?table=4')
+    expect(normalizeRedirectUrl('  www.example.com ')).toBe('https://www.example.com/')
+    expect(normalizeRedirectUrl('//example.com/a')).toBe('https://example.com/a')
+    expect(normalizeRedirectUrl('example.com:8080/a')).toBe('https://example.com:8080/a')
+  })
+
+  it('should keep destinations that already have a scheme', () => {
+    expect(normalizeRedirectUrl('http://example.com/a')).toBe('http://example.com/a')
+    expect(normalizeRedirectUrl('whatsapp://send?phone=123')).toBe('whatsapp://send?phone=123')
+    expect(normalizeRedirectUrl('tel:+4930123456')).toBe('tel:+4930123456')
+    expect(normalizeRedirectUrl('mailto:hi@example.com')).toBe('mailto:hi@example.com')
+  })
+
+  it('should reject destinations that still are not usable URLs', () => {
+    expect(normalizeRedirectUrl('')).toBeNull()
+    expect(normalizeRedirectUrl(null)).toBeNull()
+    expect(normalizeRedirectUrl('exa mple.com')).toBeNull()
+    expect(normalizeRedirectUrl('https://')).toBeNull()
+    expect(normalizeRedirectUrl('javascript://%0aalert(1)')).toBeNull()
+  })
+})
+
+describe('processScanRedirect', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('should pick the destination from the redirect rules and record the scan in the background', async () => {
+    mockQrCode({
+      id: 'qr-redirect',
+      userId: 'user-1',
+      isActive: true,
+      url: 'https://example.com',
+      redirectUrl: null,
+      deviceRedirection: { ios: 'https://apps.apple.com/app' },
+      geoRedirection: null,
+      abTestConfig: null,
+      expiresAt: null,
+      maxScans: null,
+      scanCount: 0,
+    })
+
+    const result = await processScanRedirect('qr-redirect', getScanRequestContext(scanRequest()))
+    await new Promise(resolve => setTimeout(resolve, 0))
+
+    expect(result).toMatchObject({ outcome: 'redirect', url: 'https://apps.apple.com/app' })
+    expect(getPendingScanCount('qr-redirect')).toBe(1)
+    await drainScanBuffer()
+  })
+
+  it('should not redirect expired or unknown codes', async () => {
+    const context = getScanRequestContext(scanRequest())
+
+    mockQrCode({ id: 'qr-expired', isActive: true, url: 'https://example.com', expiresAt: '2020-01-01T00:00:00Z' })
+    expect(await processScanRedirect('qr-expired', context)).toMatchObject({ outcome: 'expired' })
+
+    mockQrCode({ id: 'qr-inactive', isActive: false, url: 'https://example.com' })
+    expect(await processScanRedirect('qr-inactive', context)).toMatchObject({ outcome: 'inactive' })
+
+    mockQrCode(null)
+    expect(await processScanRedirect('qr-missing', context)).toEqual({ outcome: 'not_found' })
+    expect(getPendingScanCount('qr-expired') + getPendingScanCount('qr-inactive')).toBe(0)
+  })
+  it('should redirect scheme-less destinations over https', async () => {
+    mockQrCode({ id: 'qr-bare', isActive: true, url: 'example.com/menu', redirectUrl: null, scanCount: 0 })
+
+    const result = await processScanRedirect('qr-bare', getScanRequestContext(scanRequest()))
+    await new Promise(resolve => setTimeout(resolve, 0))
+
+    expect(result).toMatchObject({ outcome: 'redirect', url: 'https://example.com/menu' })
+    await drainScanBuffer()
+  })
+
+  it('should answer 422 instead of failing when the destination is not a URL', async () => {
+    mockQrCode({ id: 'qr-broken', isActive: true, url: 'not a url', redirectUrl: null, scanCount: 0 })
+
+    expect(await processScanRedirect('qr-broken', getScanRequestContext(scanRequest()))).toMatchObject({ outcome: 'invalid_url' })
+
+    const response = await GET(scanRequest(), { params: Promise.resolve({ id: 'qr-broken' }) })
+    expect(response.status).toBe(422)
+    expect(response.headers.get('location')).toBeNull()
+    expect(getPendingScanCount('qr-broken')).toBe(0)
+  })
+})
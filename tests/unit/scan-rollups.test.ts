@@ -0,0 +1,52 @@
+/**
+ * Tests for daily scan rollups
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(),
+    rpc: vi.fn(),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import { advanceScanRollups, backfillScanRollups } from '@/lib/scan-rollups'
+
+describe('Scan Rollups', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('should keep advancing the watermark until caught up', async () => {
+    vi.mocked(supabaseAdmin!.rpc)
+      .mockResolvedValueOnce({ data: { from: '2025-01-01', to: '2025-01-08', rows: 40, caughtUp: false }, error: null } as never)
+      .mockResolvedValueOnce({ data: { from: '2025-01-08', to: '2025-01-10', rows: 12, caughtUp: true }, error: null } as never)
+
+    const result = await advanceScanRollups()
+
+    expect(supabaseAdmin!.rpc).toHaveBeenCalledTimes(2)
+    expect(result).toEqual({ runs: 2, rows: 52, watermark: '2025-01-10', caughtUp: true })
+  })
+
+  it('should backfill an inclusive range in chunks', async () => {
+    vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({ data: 5, error: null } as never)
+
+    const result = await backfillScanRollups({ from: '2025-01-01', to: '2025-01-10', chunkDays: 4 })
+
+    const ranges = vi.mocked(supabaseAdmin!.rpc).mock.calls.map(call => call[1])
+    expect(ranges).toEqual([
+      { p_from: '2025-01-01', p_to: '2025-01-05', p_qr_code_ids: null },
+      { p_from: '2025-01-05', p_to: '2025-01-09', p_qr_code_ids: null },
+      { p_from: '2025-01-09', p_to: '2025-01-11', p_qr_code_ids: null },
+    ])
+    expect(result.rows).toBe(15)
+  })
+
+  it('should surface RPC failures', async () => {
+    vi.mocked(supabaseAdmin!.rpc).mockResolvedValue({ data: null, error: { message: 'lock timeout' } } as never)
+
+    await expect(advanceScanRollups()).rejects.toThrow('Failed to advance scan rollups')
+  })
+})
@@ -0,0 +1,195 @@
+/**
+ * Tests for the webhook outbox dispatcher
+ */
+
+import { describe, it, expect, beforeEach, afterEach, vi } from 'vitest'
+import http from 'http'
+import type { AddressInfo } from 'net'
+
+vi.mock('@/lib/supabase', () => ({
+  supabaseAdmin: {
+    from: vi.fn(() => ({ insert: vi.fn().mockResolvedValue({ error: null }) })),
+    rpc: vi.fn(),
+  },
+}))
+
+import { supabaseAdmin } from '@/lib/supabase'
+import {
+  processWebhookOutbox,
+  getWebhookRetryAt,
+  getWebhookDispatcherStats,
+  WebhookEventBatcher,
+} from '@/lib/webhook-outbox'
+import crypto from 'crypto'
+
+function makeRow(id: string, webhookUrl: string, attempts = 1) {
+  return {
+    id,
+    qrCodeId: 'qr-1',
+    webhookUrl,
+    payload: { event: 'scan', id },
+    status: 'processing',
+    attempts,
+    maxAttempts: 5,
+    nextRetryAt: '2025-01-01T00:02:00.000Z',
+    dueAt: new Date(Date.now() - 5000).toISOString(),
+    createdAt: '2025-01-01T00:00:00.000Z',
+    updatedAt: '2025-01-01T00:00:00.000Z',
+  }
+}
+
+function mockOutbox(rows: ReturnType<typeof makeRow>[]) {
+  vi.mocked(supabaseAdmin!.rpc).mockImplementation((async (fn: string) => {
+    if (fn === 'claim_webhook_outbox') {
+      return { data: rows.splice(0), error: null }
+    }
+    return { data: null, error: null }
+  }) as never)
+}
+
+const completions = () =>
+  vi.mocked(supabaseAdmin!.rpc).mock.calls
+    .filter(call => call[0] === 'complete_webhook_deliveries')
+    .map(call => (call[1] as { p_results: Array<Record<string, unknown>> }).p_results)
+
+describe('Webhook Outbox Dispatcher', () => {
+  let server: http.Server
+  let baseUrl: string
+  let inFlight = 0
+  let maxInFlight = 0
+
+  beforeEach(async () => {
+    vi.clearAllMocks()
+    inFlight = 0
+    maxInFlight = 0
+    server = http.createServer((req, res) => {
+      inFlight++
+      maxInFlight = Math.max(maxInFlight, inFlight)
+      req.resume()
+      setTimeout(() => {
+        inFlight--
+        res.statusCode = req.url === '/fail' ? 500 : 200
+        res.end(req.url === '/fail' ? 'nope' : 'ok')
+      }, 5)
+    })
+    await new Promise<void>(resolve => server.listen(0, '127.0.0.1', resolve))
+    baseUrl = `http://127.0.0.1:${(server.address() as AddressInfo).port}`
+  })
+
+  afterEach(async () => {
+    await new Promise(resolve => server.close(resolve))
+  })
+
+  it('should deliver a batch with capped per-host concurrency and one completion write', async () => {
+    mockOutbox(Array.from({ length: 12 }, (_, i) => makeRow(`w${i}`, `${baseUrl}/hook`)))
+
+    const summary = await processWebhookOutbox({ batchSize: 50, perHostConcurrency: 3 })
+
+    expect(summary).toMatchObject({ claimed: 12, delivered: 12, failed: 0, deferred: 0 })
+    expect(maxInFlight).toBeLessThanOrEqual(3)
+    expect(completions()).toHaveLength(1)
+    expect(completions()[0][0]).toMatchObject({ id: 'w0', status: 'delivered', responseStatus: 200, responseBody: 'ok' })
+    expect(getWebhookDispatcherStats().lagMs).toBeGreaterThanOrEqual(5000)
+  })
+
+  it('should reschedule failures and defer rows once the host breaker opens', async () => {
+    mockOutbox(Array.from({ length: 8 }, (_, i) => makeRow(`f${i}`, `${baseUrl}/fail`)))
+
+    const summary = await processWebhookOutbox({ batchSize: 50, perHostConcurrency: 1 })
+
+    // Breaker opens after 5 failures; the rest are never sent
+    expect(summary).toMatchObject({ claimed: 8, failed: 5, deferred: 3 })
+    const results = completions()[0]
+    expect(results[0]).toMatchObject({ status: 'failed', responseStatus: 500, responseBody: 'nope' })
+    expect(results[0].nextRetryAt).toBeDefined()
+    expect(results[7]).toMatchObject({ status: 'deferred' })
+  })
+
+  it('should back off exponentially with jitter', () => {
+    const now = 0
+    expect(getWebhookRetryAt(1, now, () => 0).getTime()).toBe(30000)
+    expect(getWebhookRetryAt(1, now, () => 1).getTime()).toBe(60000)
+    expect(getWebhookRetryAt(3, now, () => 1).getTime()).toBe(240000)
+    expect(getWebhookRetryAt(20, now, () => 1).getTime()).toBe(6 * 60 * 60 * 1000)
+  })
+})
+
+describe('Webhook Event Batcher', () => {
+  it('should write one batch once maxBatchSize events are queued', async () => {
+    const writes: Array<{ payload: Record<string, unknown>; secret?: string }> = []
+    const batcher = new WebhookEventBatcher(async (_qrCodeId, _url, payload, secret) => {
+      writes.push({ payload, secret })
+    })
+
+    for (let i = 0; i < 5; i++) {
+      batcher.add('qr-1', 'https://example.com/hook', { eventId: `s${i}` }, 'secret', { enabled: true, maxBatchSize: 3 })
+    }
+    await new Promise(resolve => setTimeout(resolve, 0))
+
+    expect(writes).toHaveLength(1)
+    expect(writes[0].payload).toEqual({
+      type: 'scan.batch',
+      qrCodeId: 'qr-1',
+      count: 3,
+      events: [{ eventId: 's0' }, { eventId: 's1' }, { eventId: 's2' }],
+    })
+    expect(batcher.size).toBe(1)
+
+    await batcher.drain()
+    expect(writes).toHaveLength(2)
+    expect(writes[1].payload.count).toBe(2)
+  })
+
+  it('should flush a partial batch after maxLingerMs', async () => {
+    const writes: Array<Record<string, unknown>> = []
+    const batcher = new WebhookEventBatcher(async (_qrCodeId, _url, payload) => {
+      writes.push(payload)
+    })
+
+    batcher.add('qr-1', 'https://example.com/hook', { eventId: 's0' }, undefined, { enabled: true, maxLingerMs: 100 })
+    expect(writes).toHaveLength(0)
+
+    await new Promise(resolve => setTimeout(resolve, 150))
+    expect(writes).toHaveLength(1)
+    expect(batcher.size).toBe(0)
+  })
+})
+
+describe('Batch delivery signature', () => {
+  let server: http.Server
+  let received: { body: string; headers: http.IncomingHttpHeaders } | null = null
+
+  beforeEach(async () => {
+    vi.clearAllMocks()
+    server = http.createServer((req, res) => {
+      let body = ''
+      req.on('data', chunk => { body += chunk })
+      req.on('end', () => {
+        received = { body, headers: req.headers }
+        res.end('ok')
+      })
+    })
+    await new Promise<void>(resolve => server.listen(0, '127.0.0.1', resolve))
+  })
+
+  afterEach(async () => {
+    await new Promise(resolve => server.close(resolve))
+  })
+
+  it('should sign the batch body so receivers verify it like a single event', async () => {
+    const url = `http://127.0.0.1:${(server.address() as AddressInfo).port}/hook`
+    const row = {
+      ...makeRow('b1', url),
+      secret: 'shh',
+      payload: { type: 'scan.batch', qrCodeId: 'qr-1', count: 2, events: [{ eventId: 's0' }, { eventId: 's1' }] },
+    }
+    mockOutbox([row as unknown as ReturnType<typeof makeRow>])
+
+    await processWebhookOutbox()
+
+    const expected = crypto.createHmac('sha256', 'shh').update(received!.body).digest('hex')
+    expect(received!.headers['x-webhook-signature']).toBe(expected)
+    expect(received!.headers['x-webhook-event-count']).toBe('2')
+    expect(JSON.parse(received!.body).events).toHaveLength(2)
+  })
+})
@@ -0,0 +1,88 @@
+/**
+ * Tests for the streaming ZIP writer
+ */
+
+import { describe, it, expect } from 'vitest'
+import { inflateRawSync } from 'zlib'
+import { crc32, ZipWriter } from '@/lib/zip-stream'
+
+async function buildZip(files: Array<{ name: string; data: Buffer; compress?: boolean }>) {
+  const chunks: Buffer[] = []
+  const zip = new ZipWriter(async chunk => {
+    chunks.push(chunk)
+  })
+  for (const file of files) {
+    await zip.addFile(file.name, file.data, { compress: file.compress })
+  }
+  await zip.finish()
+  return { zip, archive: Buffer.concat(chunks) }
+}
+
+// Read every entry back through the central directory
+function readZip(archive: Buffer) {
+  const end = archive.length - 22
+  expect(archive.readUInt32LE(end)).toBe(0x06054b50)
+  const count = archive.readUInt16LE(end + 10)
+  let position = archive.readUInt32LE(end + 16)
+
+  const entries: Array<{ name: string; method: number; data: Buffer }> = []
+  for (let i = 0; i < count; i++) {
+    expect(archive.readUInt32LE(position)).toBe(0x02014b50)
+    const method = archive.readUInt16LE(position + 10)
+    const crc = archive.readUInt32LE(position + 16)
+    const compressedSize = archive.readUInt32LE(position + 20)
+    const nameLength = archive.readUInt16LE(position + 28)
+    const offset = archive.readUInt32LE(position + 42)
+    const name = archive.toString('utf8', position + 46, position + 46 + nameLength)
+
+    expect(archive.readUInt32LE(offset)).toBe(0x04034b50)
+    const start = offset + 30 + archive.readUInt16LE(offset + 26)
+    const body = archive.subarray(start, start + compressedSize)
+    const data = method === 8 ? inflateRawSync(body) : Buffer.from(body)
+    expect(crc32(data)).toBe(crc)
+
+    entries.push({ name, method, data })
+    position += 46 + nameLength
+  }
+  return entries
+}
+
+describe('crc32', () => {
+  it('matches the standard check value', () => {
+    expect(crc32(Buffer.from('123456789'))).toBe(0xcbf43926)
+    expect(crc32(Buffer.alloc(0))).toBe(0)
+  })
+})
+
+describe('ZipWriter', () => {
+  it('writes entries that read back through the central directory', async () => {
+    const svg = Buffer.from('<svg>' + '<rect/>'.repeat(200) + '</svg>')
+    const png = Buffer.from([0x89, 0x50, 0x4e, 0x47, 1, 2, 3])
+    const { zip, archive } = await buildZip([
+      { name: 'Spring_sale-qr-1.svg', data: svg },
+      { name: 'qr-2.png', data: png, compress: false },
+      { name: 'café.svg', data: Buffer.from('x') },
+    ])
+
+    const entries = readZip(archive)
+    expect(entries.map(entry => entry.name)).toEqual(['Spring_sale-qr-1.svg', 'qr-2.png', 'café.svg'])
+    expect(entries[0].method).toBe(8)
+    expect(entries[0].data.equals(svg)).toBe(true)
+    expect(entries[1].method).toBe(0)
+    expect(entries[1].data.equals(png)).toBe(true)
+    // Not worth deflating
+    expect(entries[2].method).toBe(0)
+
+    expect(zip.entryCount).toBe(3)
+    expect(zip.bytesWritten).toBe(archive.length)
+  })
+
+  it('rejects duplicate names and entries after finish', async () => {
+    const { zip } = await buildZip([{ name: 'a.png', data: Buffer.from('a') }])
+    await expect(zip.addFile('b.png', Buffer.from('b'))).rejects.toThrow('already finished')
+
+    const open = new ZipWriter(async () => {})
+    await open.addFile('a.png', Buffer.from('a'))
+    await expect(open.addFile('a.png', Buffer.from('a'))).rejects.toThrow('Duplicate ZIP entry')
+  })
+})
@@ -0,0 +1,55 @@
+/**
+ * In-memory Redis stand-in for testing
+ * Implements the subset of commands used by the shared rate limiter
+ */
+
+import type { RedisPipelineClient } from '@/lib/rate-limit'
+
+export class MockRedis implements RedisPipelineClient {
+  private store = new Map<string, { value: string; expiresAt: number | null }>()
+  public now: () => number = () => Date.now()
+  public commandCount = 0
+
+  async pipeline(commands: Array<Array<string | number>>): Promise<unknown[]> {
+    return commands.map(command => this.execute(command))
+  }
+
+  private read(key: string) {
+    const entry = this.store.get(key)
+    if (!entry) return null
+    if (entry.expiresAt !== null && entry.expiresAt <= this.now()) {
+      this.store.delete(key)
+      return null
+    }
+    return entry
+  }
+
+  private execute([name, ...args]: Array<string | number>): unknown {
+    this.commandCount++
+    const key = String(args[0])
+
+    switch (String(name).toUpperCase()) {
+      case 'GET':
+        return this.read(key)?.value ?? null
+      case 'SET':
+        this.store.set(key, { value: String(args[1]), expiresAt: null })
+        return 'OK'
+      case 'INCR': {
+        const entry = this.read(key)
+        const value = Number(entry?.value ?? 0) + 1
+        this.store.set(key, { value: String(value), expiresAt: entry?.expiresAt ?? null })
+        return value
+      }
+      case 'PEXPIRE': {
+        const entry = this.read(key)
+        if (!entry) return 0
+        entry.expiresAt = this.now() + Number(args[1])
+        return 1
+      }
+      case 'DEL':
+        return this.store.delete(key) ? 1 : 0
+      default:
+        throw new Error(`MockRedis: unsupported command ${name}`)
+    }
+  }
+}